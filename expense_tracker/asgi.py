@@ -2,6 +2,9 @@
 ASGI config for expense_tracker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The home page, the expense list and the totals API are async views, served
+without tying up a thread while they wait for the database; see
+gunicorn_asgi.py for the deployment profile.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +15,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'expense_tracker.settings')
+# Routes the read-heavy views to their async versions (see SERVER_INTERFACE)
+os.environ.setdefault('SERVER_INTERFACE', 'asgi')
 
 application = get_asgi_application()
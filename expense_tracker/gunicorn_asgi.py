@@ -0,0 +1,40 @@
+"""
+Gunicorn configuration serving the ASGI application with Uvicorn workers.
+
+Usage:
+    gunicorn expense_tracker.asgi:application -c expense_tracker/gunicorn_asgi.py
+    WEB_CONCURRENCY=4 PORT=8000 gunicorn expense_tracker.asgi:application -c expense_tracker/gunicorn_asgi.py
+
+Each worker is one process running an event loop. While the async views
+(home, expense list, totals API) wait for the database, the worker serves
+other requests, so a worker handles many concurrent requests instead of
+one; sync views still work, each on a thread of its own. A worker per CPU
+core is enough, rather than the two or more per core sync workers need to
+hide database latency. Exports and PDF downloads are still sent chunk by
+chunk as they are produced (see async_streaming in expenses/concurrency.py).
+
+Every worker keeps up to ASYNC_QUERY_THREADS database connections open for
+the queries async views run at the same time, and opens one per request in
+progress, closed when it finishes (see expenses/concurrency.py); size the
+database pooler for workers x (ASYNC_QUERY_THREADS + concurrent requests).
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# uvicorn-worker's UvicornWorker (the one formerly bundled with uvicorn)
+worker_class = 'uvicorn_worker.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# Recycle workers now and then to bound memory growth; the jitter keeps them
+# from restarting all at once
+max_requests = 10000
+max_requests_jitter = 1000
+
+# Async workers answer their heartbeat between requests, so this only trips
+# on a worker whose event loop is blocked
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,20 +42,84 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Serves STATIC_ROOT with precompressed copies and far-future cache
+    # headers (see expenses/assets.py); first, so static requests skip the rest
+    'expenses.assets.StaticFilesMiddleware',
+    # SQL/template/PDF/view timings as a Server-Timing header and log lines
+    # (see REQUEST_PROFILING below); right after static file serving, so its
+    # total covers every other middleware and the view
+    'expenses.profiling.RequestProfilingMiddleware',
+    # Request counts and latency per URL name for /metrics (see METRICS_DIR)
+    'expenses.metrics.MetricsMiddleware',
+    # Logs per-view query counts and budget violations (development only)
+    'expenses.instrumentation.QueryBudgetMiddleware',
+    # Brotli/gzip for HTML, JSON, CSV and PDF responses, streaming ones chunk
+    # by chunk (see COMPRESSION_VIEWS below)
+    'expenses.compression.ResponseCompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Keeps users on the primary database right after they write (only
+    # active with a read replica, see DATABASE_REPLICA below)
+    'expenses.routing.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'expense_tracker.urls'
+# Record queries per request and warn when a view exceeds its query budget
+# (see expenses/instrumentation.py). Has no cost when disabled.
+QUERY_INSTRUMENTATION = DEBUG
+
+# Time SQL, template rendering, PDF building and the view for every request,
+# sent as a Server-Timing header and logged on 'expenses.profiling' (see
+# expenses/profiling.py). Has no cost when disabled.
+REQUEST_PROFILING = DEBUG
+# Also profile requests: None, 'cprofile' (every call, slow) or 'sample'
+# (stack samples every REQUEST_SAMPLE_INTERVAL_MS, cheap). Profiles of
+# requests slower than REQUEST_PROFILE_THRESHOLD_MS, which are also logged
+# as warnings, are written to REQUEST_PROFILE_DIR
+REQUEST_PROFILER = None
+REQUEST_PROFILE_THRESHOLD_MS = 500
+REQUEST_SAMPLE_INTERVAL_MS = 5
+REQUEST_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Request, SQL and PDF metrics in the Prometheus text format at /metrics
+# (see expenses/metrics.py). Every process writes its numbers to METRICS_DIR
+# every METRICS_FLUSH_SECONDS and the endpoint adds up all of them, so each
+# gunicorn worker (and the bill worker) is counted whichever one is scraped
+METRICS_ENABLED = True
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'expense-tracker-metrics'))
+METRICS_FLUSH_SECONDS = 5
+# When set, scrapers must send "Authorization: Bearer <token>"; otherwise only
+# addresses in METRICS_ALLOWED_IPS (networks, e.g. '10.0.0.0/8') get the
+# metrics, unless DEBUG is on. Behind a proxy every client has the proxy's
+# address, so set a token there
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = ['127.0.0.1/32', '::1/128']
+
+# Responses smaller than this go out uncompressed (see expenses/compression.py)
+COMPRESSION_MIN_SIZE = 1024
+# Per-view compression overrides by URL name: False, or a dict of
+# 'min_size', 'brotli_quality' and 'gzip_level'
+COMPRESSION_VIEWS = {
+    # Scraped every few seconds over the internal network, where compressing
+    # costs more CPU than it saves
+    'metrics': False,
+}
+
+# 'asgi' when served through expense_tracker/asgi.py (which sets it), e.g.
+# with the gunicorn profile in expense_tracker/gunicorn_asgi.py
+SERVER_INTERFACE = os.environ.get('SERVER_INTERFACE', 'wsgi')
+
+# Under ASGI the read-heavy views are served by their async versions
+ROOT_URLCONF = 'expense_tracker.urls_asgi' if SERVER_INTERFACE == 'asgi' else 'expense_tracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for REQUEST_PROFILING
+        'BACKEND': 'expenses.profiling.ProfiledTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -69,6 +134,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'expense_tracker.wsgi.application'
 
+# Threads (each with its own database connection) on which async views run
+# their independent queries at the same time (see expenses/concurrency.py)
+ASYNC_QUERY_THREADS = 8
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -82,9 +151,28 @@ DATABASES = {
         'USER': 'postgres.utecglxzmlqgmnpepwvn',
         'PASSWORD': 'RDGO@1005',  # Load password from environment variable
         'PORT': '6543',
+        # Reuse connections across requests, checking them before reuse so a
+        # connection dropped by the pooler is replaced instead of failing
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Optional read replica for the list, report and analytics pages (see
+# expenses/routing.py). Set DATABASE_REPLICA_HOST (and DATABASE_REPLICA_PORT
+# if it differs) to enable it; tests read the replica through the primary.
+if os.environ.get('DATABASE_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DATABASE_REPLICA_HOST'],
+        'PORT': os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['expenses.routing.ReplicaRouter']
+DATABASE_REPLICA = 'replica'
+PRIMARY_PIN_SECONDS = 10  # Longer than the replica is expected to lag
+
 
 
 # Password validation
@@ -124,6 +212,20 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic content-hashes file names, minifies the app's stylesheets and
+# writes .br/.gz copies (see expenses/assets.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'expenses.assets.CompressedManifestStaticFilesStorage'},
+}
+# Browser cache lifetime of static files requested without a content hash in
+# their name; hashed names are cached for a year
+STATIC_MAX_AGE = 60 * 60
+
+# Uploaded and generated files (rendered PDF bills)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -133,3 +235,44 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'expenses:expense_list'
 LOGOUT_REDIRECT_URL = 'login'
+
+# Background bill generation (see expenses/jobs.py)
+# Bills are queued and rendered by `python manage.py run_bill_worker`
+BILL_JOBS_ASYNC = True
+BILL_JOB_CONCURRENCY = 2  # Bills rendered at once across all workers
+BILL_JOB_MAX_ATTEMPTS = 3
+BILL_JOB_RESULT_TTL = 24 * 60 * 60  # Keep finished PDFs for a day
+
+# Django's cache (category catalog, primary pins, page fragments). Each worker
+# keeps its own in memory unless CACHE_DIR names a directory shared by all of
+# them, on local disk or tmpfs
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }
+
+# Rendered home page and expense list fragments are cached per user and data
+# version (see expenses/fragments.py) for at most this many seconds; 0 turns
+# the fragment cache off
+FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Category catalog cache (see expenses/catalog.py). Each worker keeps the
+# categories in memory; with a cache shared between workers (CACHES) edits
+# reach every worker within seconds, otherwise after this many seconds
+CATEGORY_CATALOG_TIMEOUT = 5 * 60
+
+# Cold storage for old expenses (see expenses/archive.py). Expenses older than
+# this many months are moved out of the main table by
+# `python manage.py archive_expenses`; None keeps everything in it
+EXPENSE_ARCHIVE_MONTHS = 24
@@ -20,6 +20,7 @@ from django.contrib.auth import views as auth_views
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.views.generic import RedirectView
+from expenses import metrics
 from expenses import views as expense_views
 
 # Main URL patterns for the entire project
@@ -45,4 +46,7 @@ urlpatterns = [
     
     # User registration view
     path('signup/', expense_views.signup, name='signup'),
+
+    # Prometheus metrics of every worker process
+    path('metrics', metrics.metrics_view, name='metrics'),
 ]
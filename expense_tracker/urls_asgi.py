@@ -0,0 +1,20 @@
+"""
+URL configuration used when serving ASGI (ROOT_URLCONF when SERVER_INTERFACE
+is 'asgi').
+
+The same URLs as expense_tracker/urls.py, except that the home page, the
+expense list and the totals API are served by their async versions (see
+expenses/urls.py). Under WSGI every async view would start an event loop per
+request, costing more than it saves, so the sync versions stay in urls.py.
+"""
+from django.urls import include, path
+
+from expenses.urls import async_urlpatterns
+
+from . import urls
+
+urlpatterns = [
+    path('', include((async_urlpatterns, 'expenses'), namespace='expenses'))
+    if getattr(pattern, 'namespace', None) == 'expenses' else pattern
+    for pattern in urls.urlpatterns
+]
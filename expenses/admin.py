@@ -4,7 +4,8 @@ This module customizes how the models are displayed and managed in the Django ad
 """
 
 from django.contrib import admin
-from .models import Category, Expense
+from . import search
+from .models import ArchivedExpense, BillJob, Category, Expense, ExpenseSummary
 
 
 @admin.register(Category)
@@ -38,7 +39,73 @@ class ExpenseAdmin(admin.ModelAdmin):
         search_fields (tuple): Fields searched when using the admin search bar
             - title: Search in expense titles
             - description: Search in expense descriptions
+    
+    Searches go through the full-text index (see expenses/search.py) rather
+    than icontains scans over both columns.
     """
     list_display = ('title', 'amount', 'category', 'user')
     list_filter = ('category', 'user')
     search_fields = ('title', 'description')
+
+    def get_search_results(self, request, queryset, search_term):
+        terms = search.parse_terms(search_term)
+        if not terms:
+            return queryset, False
+        return search.matching(queryset, terms), False
+
+
+@admin.register(ArchivedExpense)
+class ArchivedExpenseAdmin(admin.ModelAdmin):
+    """
+    Read-only admin view of archived expenses.
+    
+    Expenses are moved in and out of the archive by the archive_expenses
+    command, so they cannot be added or edited here. Nor deleted: that
+    would bypass the monthly summaries and data versions, leaving totals and
+    cached pages out of date.
+    """
+    list_display = ('title', 'amount', 'category', 'user', 'date')
+    list_filter = ('category',)
+    search_fields = ('title', 'description')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BillJob)
+class BillJobAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for background bill jobs.
+    
+    Attributes:
+        list_display (tuple): Job owner, state, attempts and timestamps
+        list_filter (tuple): Filter jobs by status
+    """
+    list_display = ('id', 'user', 'status', 'attempts', 'created_at', 'finished_at', 'expires_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+
+
+@admin.register(ExpenseSummary)
+class ExpenseSummaryAdmin(admin.ModelAdmin):
+    """
+    Read-only admin view of the per-user monthly/category summaries.
+    
+    Rows are maintained automatically from expense changes, so they cannot
+    be added or edited here; use the rebuild_expense_summaries command to
+    repair them.
+    """
+    list_display = ('user', 'month', 'category', 'count', 'total', 'min_amount', 'max_amount')
+    list_filter = ('month', 'category')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
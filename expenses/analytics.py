@@ -0,0 +1,321 @@
+"""
+Spending analytics computed with NumPy.
+
+A user's ``(date, amount, category_id)`` columns are read with a single
+``values_list`` query into three NumPy arrays; every figure on the
+analytics dashboard is then derived from those arrays with vectorized
+operations (bincount, cumsum, diff) instead of per-expense Python loops or
+one aggregate query per series:
+
+* daily, weekly (Monday to Sunday) and monthly totals;
+* 7 and 30 day rolling averages of daily spending;
+* each category's share of the total;
+* month-over-month changes;
+* a projection of this month's total at month end.
+
+Amounts are read and held as integer paise, so sums are exact; they are turned into
+rupees only when the results are rendered. Dates are day numbers since
+1970-01-01 (``datetime64[D]``), so bucketing into weeks and months is
+integer arithmetic.
+
+Five years of history (a couple of thousand days and, typically, under ten
+thousand expenses) take tens of milliseconds, most of it in the query.
+"""
+
+import calendar
+from datetime import date, timedelta
+
+import numpy as np
+
+from django.utils import timezone
+
+from . import archive, catalog
+from .money import Paise
+
+# Windows of the rolling averages, in days
+ROLLING_WINDOWS = (7, 30)
+
+# Window of the trailing daily average used for the month-end projection
+PROJECTION_WINDOW = 30
+
+# Periods offered on the dashboard, in months (None = all history)
+PERIOD_CHOICES = (3, 6, 12, 24, 60, None)
+DEFAULT_MONTHS = 12
+# Longest period accepted as a number of months; longer histories are asked
+# for as 'all', which starts at the first expense instead of centuries back
+MAX_MONTHS = max(months for months in PERIOD_CHOICES if months)
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def day_number(value):
+    """Returns the number of days between 1970-01-01 and ``value``."""
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def from_day_number(number):
+    """Inverse of day_number."""
+    return date.fromordinal(int(number) + _EPOCH_ORDINAL)
+
+
+def month_number(value):
+    """Returns the number of months between January 1970 and ``value``'s month."""
+    return (value.year - 1970) * 12 + value.month - 1
+
+
+def from_month_number(number):
+    """Returns the first day of the month ``number`` months after January 1970."""
+    year, month = divmod(int(number), 12)
+    return date(1970 + year, month + 1, 1)
+
+
+def week_number(days):
+    """
+    Maps day numbers to Monday-based week numbers.
+
+    1970-01-01 was a Thursday, so shifting by three days puts every Monday
+    at a multiple of seven.
+    """
+    return (days + 3) // 7
+
+
+def first_day_of_week(week):
+    """Returns the Monday starting week number ``week``."""
+    return from_day_number(week * 7 - 3)
+
+
+def rupees(paise):
+    """Converts paise (an int or an array) to rupees as floats."""
+    return np.round(np.asarray(paise, dtype=np.float64) / 100, 2)
+
+
+def rolling_mean(values, window):
+    """
+    Trailing mean of ``values`` over ``window`` elements, via a cumulative sum.
+
+    The first ``window - 1`` elements are averaged over the elements
+    available so far.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return values
+    totals = np.cumsum(values)
+    totals[window:] = totals[window:] - totals[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return totals / counts
+
+
+class SpendingColumns:
+    """
+    One user's expenses as parallel NumPy arrays.
+
+    Attributes:
+        days (ndarray): int64 day numbers (see day_number)
+        amounts (ndarray): int64 amounts in paise
+        categories (ndarray): int64 category ids, 0 for uncategorized
+    """
+
+    def __init__(self, days, amounts, categories):
+        self.days = days
+        self.amounts = amounts
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def load(cls, user, start=None, end=None):
+        """
+        Reads the user's expenses dated from ``start`` to ``end`` (inclusive,
+        both optional) with a single query, which only includes the archive
+        when ``start`` reaches past the archive horizon.
+        """
+        queryset = archive.expenses_for(user, start, whole_history=True)
+        if start is not None:
+            queryset = queryset.filter(date__gte=start)
+        if end is not None:
+            queryset = queryset.filter(date__lte=end)
+        # Amounts are read as the stored integer paise, not as Decimals
+        rows = list(queryset.order_by().values_list('date', Paise('amount'), 'category_id'))
+        count = len(rows)
+        days = np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=count)
+        amounts = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+        categories = np.fromiter((row[2] or 0 for row in rows), dtype=np.int64, count=count)
+        return cls(days - _EPOCH_ORDINAL, amounts, categories)
+
+    def between(self, first_day, last_day):
+        """Returns the expenses dated between two day numbers (inclusive)."""
+        mask = (self.days >= first_day) & (self.days <= last_day)
+        return SpendingColumns(self.days[mask], self.amounts[mask], self.categories[mask])
+
+
+class SpendingAnalytics:
+    """
+    Spending series and indicators for one period ending ``today``.
+
+    Args:
+        columns: SpendingColumns covering at least ``start - PROJECTION_WINDOW``
+            days to ``today``, so rolling averages are complete from ``start``
+        start: First date of the period
+        today: Last date of the period; expenses dated later are ignored
+
+    Attributes (amounts in paise):
+        start, today (date): The period
+        daily (ndarray): Total per day from start to today
+        rolling (dict): window -> rolling mean per day, aligned with daily
+        weeks / weekly: Week numbers and their totals
+        months / monthly: Month numbers and their totals
+        month_deltas (ndarray): monthly[i] - monthly[i - 1] (first is 0)
+        category_totals (list): (category id, total) by decreasing total
+        total (int), count (int): Over the period
+        month_to_date (int), daily_rate (float), projected_month_end (float):
+            This month's spending so far, the trailing average daily spend and
+            the projected total at month end
+    """
+
+    def __init__(self, columns, start, today):
+        self.start = start
+        self.today = today
+        first, last = day_number(start), day_number(today)
+        lead = max(ROLLING_WINDOWS + (PROJECTION_WINDOW,)) - 1
+
+        # Daily totals from `lead` days before the period, for the rolling means
+        history = columns.between(first - lead, last)
+        padded = np.bincount(history.days - (first - lead), weights=history.amounts,
+                             minlength=last - first + lead + 1)
+        self.daily = padded[lead:]
+        self.rolling = {window: rolling_mean(padded, window)[lead:] for window in ROLLING_WINDOWS}
+
+        period = columns.between(first, last)
+        self.count = len(period)
+        self.total = int(period.amounts.sum())
+
+        # Weekly and monthly buckets, including empty ones inside the period
+        period_days = np.arange(first, last + 1)
+        weeks = week_number(period_days)
+        self.weeks = np.arange(weeks[0], weeks[-1] + 1)
+        self.weekly = np.bincount(weeks - weeks[0], weights=self.daily, minlength=len(self.weeks))
+
+        months = period_days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        self.months = np.arange(months[0], months[-1] + 1)
+        self.monthly = np.bincount(months - months[0], weights=self.daily, minlength=len(self.months))
+        self.month_deltas = np.diff(self.monthly, prepend=self.monthly[:1])
+
+        ids, inverse = np.unique(period.categories, return_inverse=True)
+        totals = np.bincount(inverse, weights=period.amounts, minlength=len(ids))
+        order = np.argsort(-totals, kind='stable')
+        self.category_totals = [(int(ids[i]), int(totals[i])) for i in order]
+
+        # This month so far, plus the recent daily average for the days left
+        month_start = day_number(today.replace(day=1))
+        days_in_month = calendar.monthrange(today.year, today.month)[1]
+        self.month_to_date = int(padded[month_start - (first - lead):].sum())
+        self.daily_rate = float(padded[-PROJECTION_WINDOW:].mean())
+        self.projected_month_end = self.month_to_date + self.daily_rate * (days_in_month - today.day)
+
+    def category_shares(self):
+        """Returns [{'category', 'category_id', 'total', 'share'}] in rupees and percent."""
+        return [
+            {
+                'category_id': category_id or None,
+                'category': catalog.name(category_id or None, 'Uncategorized'),
+                'total': float(rupees(total)),
+                'share': round(total * 100 / self.total, 2) if self.total else 0.0,
+            }
+            for category_id, total in self.category_totals
+        ]
+
+    def month_rows(self):
+        """Returns one dict per month with its total and change from the month before."""
+        rows = []
+        for index, month in enumerate(self.months):
+            previous = self.monthly[index - 1] if index else None
+            delta = self.month_deltas[index] if index else None
+            rows.append({
+                'month': from_month_number(month).strftime('%Y-%m'),
+                'total': float(rupees(self.monthly[index])),
+                'change': None if delta is None else float(rupees(delta)),
+                'change_percent': round(float(delta * 100 / previous), 2) if previous else None,
+            })
+        return rows
+
+    def as_dict(self):
+        """Returns all results as a JSON-serialisable dictionary, amounts in rupees."""
+        return {
+            'start': self.start.isoformat(),
+            'end': self.today.isoformat(),
+            'total': float(rupees(self.total)),
+            'count': self.count,
+            'daily': {
+                'start': self.start.isoformat(),
+                'totals': rupees(self.daily).tolist(),
+                **{f'rolling_{window}': rupees(values).tolist() for window, values in self.rolling.items()},
+            },
+            'weekly': [
+                {'week_start': first_day_of_week(week).isoformat(), 'total': total}
+                for week, total in zip(self.weeks.tolist(), rupees(self.weekly).tolist())
+            ],
+            'monthly': self.month_rows(),
+            'categories': self.category_shares(),
+            'projection': {
+                'month': self.today.strftime('%Y-%m'),
+                'month_to_date': float(rupees(self.month_to_date)),
+                'daily_rate': float(rupees(self.daily_rate)),
+                'projected_total': float(rupees(self.projected_month_end)),
+            },
+        }
+
+
+def parse_months(value):
+    """
+    Parses the ``months`` query parameter: a number of months from 1 to
+    MAX_MONTHS, or 'all' for the whole history. Blank means DEFAULT_MONTHS.
+
+    Raises:
+        ValueError: If the value is neither
+    """
+    value = (value or '').strip().lower()
+    if not value:
+        return DEFAULT_MONTHS
+    if value == 'all':
+        return None
+    months = int(value)
+    if not 1 <= months <= MAX_MONTHS:
+        raise ValueError(f'months must be from 1 to {MAX_MONTHS}')
+    return months
+
+
+def period_start(today, months=None, first_expense=None):
+    """
+    Returns the first day of a period of ``months`` calendar months ending
+    with today's month, or of all history (from ``first_expense``) if
+    ``months`` is None.
+    """
+    if months is None:
+        return min(first_expense or today, today)
+    return from_month_number(month_number(today) - months + 1)
+
+
+def analyze(user, months=DEFAULT_MONTHS, today=None):
+    """
+    Computes the spending analytics of ``user``.
+
+    Args:
+        user: Whose expenses to analyse
+        months: Number of calendar months to cover, ending with the current
+            one, or None for the user's whole history
+        today: End of the period (defaults to the current local date)
+
+    Returns:
+        SpendingAnalytics
+    """
+    today = today or timezone.localdate()
+    lead = max(ROLLING_WINDOWS + (PROJECTION_WINDOW,)) - 1
+    if months is None:
+        columns = SpendingColumns.load(user, end=today)
+        first = from_day_number(columns.days.min()) if len(columns) else None
+        start = period_start(today, first_expense=first)
+    else:
+        start = period_start(today, months)
+        columns = SpendingColumns.load(user, start=start - timedelta(days=lead), end=today)
+    return SpendingAnalytics(columns, start, today)
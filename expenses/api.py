@@ -0,0 +1,472 @@
+"""
+JSON API for expenses, categories and totals.
+
+Endpoints (all under /api/, session authenticated; unsafe methods need the
+usual CSRF token in the X-CSRFToken header):
+
+    GET    /api/expenses/            Keyset-paginated list (sort, cursor, limit,
+                                     fields and the ExpenseFilters parameters)
+    POST   /api/expenses/            Create an expense from a JSON body
+    GET    /api/expenses/<id>/       One expense
+    DELETE /api/expenses/<id>/       Delete an expense
+    GET    /api/categories/          All categories
+    GET    /api/totals/              Overall total and per-category breakdown,
+                                     optionally for one month (month=YYYY-MM)
+    GET    /api/analytics/           Spending series, category shares and the
+                                     month-end projection (months=N or all)
+    POST   /api/calculators/<name>/  EMI, amortization schedule, prepayment,
+                                     GST or split calculation (see finance.py)
+
+Every GET response carries an ETag (and, for user data, a Last-Modified
+date) derived from the user's data version (see expenses/versions.py).
+A client revalidating with If-None-Match or If-Modified-Since gets a 304
+after a single primary key lookup, without the list or aggregate query
+behind the response ever running.
+
+GET requests on expenses, totals and analytics read from the read replica
+when one is configured (see expenses/routing.py).
+
+Under ASGI the totals endpoint is served by its async version, ``atotals``
+(see expense_tracker/urls_asgi.py); api_login_required and
+conditional_on_user_data work on both kinds of views.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django import forms
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import condition, require_http_methods
+
+from . import analytics, archive, catalog, concurrency, finance, pagination, routing, search, summaries, versions
+from .filters import ExpenseFilters
+from .models import Expense
+
+# Part of every ETag, so changing the serialisation invalidates cached responses
+API_VERSION = 1
+
+# Largest page a client may request
+MAX_PAGE_SIZE = 200
+
+# API field name -> model fields needed to produce it
+API_FIELDS = {
+    'id': ('id',),
+    'title': ('title',),
+    'amount': ('amount',),
+    'description': ('description',),
+    'date': ('date',),
+    'time': ('time',),
+    'category': ('category',),
+    'category_name': ('category',),
+}
+
+
+class ExpenseForm(forms.ModelForm):
+    """Validates the JSON body of a new expense."""
+
+    # Optional, as in the add expense form, and checked against the
+    # category catalog instead of a query
+    category = forms.IntegerField(required=False)
+
+    class Meta:
+        model = Expense
+        fields = ['title', 'amount', 'category', 'description', 'date', 'time']
+
+    def clean_category(self):
+        category_id = self.cleaned_data['category']
+        if category_id is None:
+            return None
+        category = catalog.get(category_id)
+        if category is None:
+            raise ValidationError('Select a valid category.')
+        return category
+
+
+def api_error(message, status, **extra):
+    """Returns a JSON error response."""
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def api_login_required(view):
+    """Like login_required, but answers 401 with JSON instead of redirecting."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            user = await concurrency.authenticated_user(request)
+            if not user.is_authenticated:
+                return api_error('Authentication required', 401)
+            response = await view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return async_wrapper
+
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api_error('Authentication required', 401)
+        response = view(request, *args, **kwargs)
+        # Clients may keep responses but must revalidate them (cheaply, see above)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
+
+
+def user_etag(request, *args, **kwargs):
+    """ETag for responses built from the requesting user's expenses."""
+    return versions.etag(request, API_VERSION)
+
+
+def user_last_modified(request, *args, **kwargs):
+    """Last-Modified date for responses built from the requesting user's expenses."""
+    return versions.last_modified(request)
+
+
+def conditional_on_user_data(view):
+    """
+    Answers 304 when the client's copy of the user's data is current (see
+    versions.etag).
+
+    Django's condition decorator calls the ETag functions synchronously,
+    even around async views, so for those the data version is looked up
+    beforehand through sync_to_async; the functions then find it on the
+    request. Apply it below api_login_required.
+    """
+    conditional = condition(etag_func=user_etag, last_modified_func=user_last_modified)(view)
+    if not iscoroutinefunction(view):
+        return conditional
+
+    @wraps(view)
+    async def async_wrapper(request, *args, **kwargs):
+        await sync_to_async(versions.for_request)(request)
+        return await conditional(request, *args, **kwargs)
+    return async_wrapper
+
+
+def dated_user_etag(request, *args, **kwargs):
+    """Like user_etag, for responses that also depend on today's date."""
+    return versions.etag(request, API_VERSION, timezone.localdate().isoformat())
+
+
+def parse_fields(value):
+    """
+    Parses the ``fields`` query parameter into a list of API field names.
+
+    Raises:
+        ValidationError: If an unknown field is requested
+    """
+    if not value:
+        return list(API_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in API_FIELDS]
+    if unknown:
+        raise ValidationError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def serialize_expense(expense, fields):
+    """Returns the requested API fields of ``expense`` as a dict."""
+    values = {
+        'id': lambda: expense.pk,
+        'title': lambda: expense.title,
+        'amount': lambda: str(expense.amount),
+        'description': lambda: expense.description,
+        'date': lambda: expense.date.isoformat(),
+        'time': lambda: expense.time.strftime('%H:%M:%S'),
+        'category': lambda: expense.category_id,
+        'category_name': lambda: catalog.name(expense.category_id),
+    }
+    return {name: values[name]() for name in fields}
+
+
+def expense_queryset(user, fields, sort_by, date_from=None):
+    """
+    Returns the user's expenses loading only what ``fields`` and the
+    pagination keys of ``sort_by`` need, including archived expenses when
+    ``date_from`` reaches past the archive horizon.
+    """
+    # Annotated sort keys are added by the paginator and search, not loaded
+    sort_keys = {key.lstrip('-') for key in pagination.SORT_ORDERINGS[sort_by]} - set(pagination.ANNOTATED_KEYS)
+    needed = {model_field for name in fields for model_field in API_FIELDS[name]} | sort_keys
+    return archive.expenses_for(user, date_from).only(*needed)
+
+
+@api_login_required
+@routing.read_replica
+@require_http_methods(['GET', 'HEAD', 'POST'])
+def expenses(request):
+    """
+    List (GET) or create (POST) the current user's expenses.
+
+    Query Parameters (GET, all optional):
+        - sort: One of pagination.SORT_ORDERINGS (default -date, or
+          relevance when searching)
+        - cursor: next_cursor of the previous page
+        - limit: Page size, 1 to MAX_PAGE_SIZE (default 50)
+        - fields: Comma-separated subset of API_FIELDS
+        - date_from, date_to, category, min_amount, max_amount: Filters;
+          archived expenses are only listed when date_from reaches them
+        - q: Full-text search over titles and descriptions
+
+    Returns:
+        - GET: {"results": [...], "next_cursor": str|null, "has_more": bool},
+          or 304 if the client's copy is current
+        - POST: 201 with the created expense, or 400 with field errors
+
+    Security:
+        - Requires user authentication
+        - Only lists and creates expenses of the current user
+    """
+    if request.method == 'POST':
+        return create_expense(request)
+    return list_expenses(request)
+
+
+@conditional_on_user_data
+def list_expenses(request):
+    """GET handler of ``expenses``; only runs when the client's copy is stale."""
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+        filters = ExpenseFilters.from_query(request.GET)
+        limit = int(request.GET.get('limit') or pagination.DEFAULT_PAGE_SIZE)
+    except ValidationError as e:
+        return api_error(' '.join(e.messages), 400)
+    except ValueError:
+        return api_error('limit must be a number', 400)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return api_error(f'limit must be between 1 and {MAX_PAGE_SIZE}', 400)
+
+    sort_by = pagination.normalize_sort(request.GET.get('sort'), searching=bool(filters.search_terms))
+    queryset = filters.apply(expense_queryset(request.user, fields, sort_by, filters.date_from))
+    if sort_by == pagination.RELEVANCE_SORT:
+        queryset = search.with_rank(queryset, filters.search_terms)
+    try:
+        page = pagination.paginate(queryset, sort_by, request.GET.get('cursor'), page_size=limit)
+    except pagination.InvalidCursor as e:
+        return api_error(str(e), 400)
+
+    return JsonResponse({
+        'results': [serialize_expense(expense, fields) for expense in page],
+        'next_cursor': page.next_cursor,
+        'has_more': page.has_more,
+    })
+
+
+def create_expense(request):
+    """POST handler of ``expenses``."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return api_error('Request body must be JSON', 400)
+    if not isinstance(data, dict):
+        return api_error('Request body must be a JSON object', 400)
+
+    # Same defaults as the add expense form
+    now = timezone.localtime()
+    data.setdefault('date', now.date().isoformat())
+    data.setdefault('time', now.strftime('%H:%M'))
+    form = ExpenseForm(data)
+    if not form.is_valid():
+        return api_error('Invalid expense', 400, errors=form.errors.get_json_data())
+
+    expense = form.save(commit=False)
+    expense.user = request.user
+    expense.save()
+    response = JsonResponse(serialize_expense(expense, list(API_FIELDS)), status=201)
+    response['Location'] = reverse('expenses:api_expense_detail', args=[expense.pk])
+    return response
+
+
+@api_login_required
+@routing.read_replica
+@require_http_methods(['GET', 'HEAD', 'DELETE'])
+def expense_detail(request, expense_id):
+    """
+    Read (GET) or delete (DELETE) one of the current user's expenses.
+
+    Args:
+        request: HttpRequest object containing metadata about the request
+        expense_id: Integer ID of the expense
+
+    Returns:
+        - GET: The expense, or 304 if the client's copy is current
+        - DELETE: 204 No Content
+        - 404 if the expense does not exist or belongs to another user
+
+    Security:
+        - Requires user authentication
+        - Verifies expense ownership
+    """
+    if request.method == 'DELETE':
+        expense = get_object_or_404(Expense, pk=expense_id, user=request.user)
+        expense.delete()
+        return HttpResponse(status=204)
+    return read_expense(request, expense_id)
+
+
+@conditional_on_user_data
+def read_expense(request, expense_id):
+    """GET handler of ``expense_detail``."""
+    expense = get_object_or_404(Expense, pk=expense_id, user=request.user)
+    return JsonResponse(serialize_expense(expense, list(API_FIELDS)))
+
+
+@api_login_required
+@require_http_methods(['GET', 'HEAD'])
+def categories(request):
+    """
+    List every category.
+
+    Served from the in-memory category catalog. Categories are shared by
+    all users, so the ETag is a hash of the list itself; a 304 still saves
+    the client from downloading and parsing it.
+
+    Returns:
+        {"results": [{"id": int, "name": str}, ...]}, or 304
+    """
+    results = [{'id': category.pk, 'name': category.name} for category in catalog.categories()]
+    body = json.dumps({'results': results}).encode()
+    etag = '"%s"' % hashlib.md5(body, usedforsecurity=False).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+@api_login_required
+@routing.read_replica
+@require_http_methods(['GET', 'HEAD'])
+@conditional_on_user_data
+def totals(request):
+    """
+    The current user's total spending and per-category breakdown.
+
+    Read from the summary table, so the cost does not depend on how many
+    expenses the user has.
+
+    Query Parameters:
+        - month: Optional YYYY-MM to restrict the totals to one month
+
+    Returns:
+        {"month": str|null, "total": str, "count": int,
+         "categories": [{"category": str, "count": int, "total": str}, ...]},
+        or 304 if the client's copy is current
+    """
+    try:
+        month = parse_month(request)
+    except ValueError:
+        return api_error('month must be in YYYY-MM format', 400)
+    return totals_response(month, summaries.category_breakdown(request.user, month=month))
+
+
+@api_login_required
+@routing.read_replica
+@require_http_methods(['GET', 'HEAD'])
+@conditional_on_user_data
+async def atotals(request):
+    """
+    Async version of ``totals``, served under ASGI (see
+    expense_tracker/urls_asgi.py): the worker serves other requests while
+    the data version and the breakdown are read.
+    """
+    try:
+        month = parse_month(request)
+    except ValueError:
+        return api_error('month must be in YYYY-MM format', 400)
+    breakdown = await sync_to_async(summaries.category_breakdown)(request.user, month=month)
+    return totals_response(month, breakdown)
+
+
+def parse_month(request):
+    """
+    Returns the ``month`` query parameter (YYYY-MM) as the date of its first
+    day, or None if it is missing. Raises ValueError if it is malformed.
+    """
+    month = request.GET.get('month')
+    return datetime.strptime(month, '%Y-%m').date() if month else None
+
+
+def totals_response(month, breakdown):
+    """Serialises a category breakdown for the totals endpoint."""
+    return JsonResponse({
+        'month': month.strftime('%Y-%m') if month else None,
+        'total': str(sum((row['total'] for row in breakdown), summaries.ZERO)),
+        'count': sum(row['count'] for row in breakdown),
+        'categories': [
+            {'category': row['category'], 'count': row['count'], 'total': str(row['total'])}
+            for row in breakdown
+        ],
+    })
+
+
+@api_login_required
+@routing.read_replica
+@require_http_methods(['GET', 'HEAD'])
+@condition(etag_func=dated_user_etag)
+def spending_analytics(request):
+    """
+    The current user's spending analytics (see expenses/analytics.py).
+
+    The projection depends on the current date, so the ETag changes daily
+    as well as with the user's data; there is no Last-Modified date.
+
+    Query Parameters:
+        - months: Number of months to cover, ending with the current one
+          (default 12), or 'all'
+
+    Returns:
+        {"start", "end", "total", "count",
+         "daily": {"start", "totals", "rolling_7", "rolling_30"},
+         "weekly": [{"week_start", "total"}], "monthly": [{"month", "total",
+         "change", "change_percent"}], "categories": [{"category_id",
+         "category", "total", "share"}], "projection": {"month",
+         "month_to_date", "daily_rate", "projected_total"}},
+        with amounts in rupees as numbers, or 304 if the client's copy is current
+    """
+    try:
+        months = analytics.parse_months(request.GET.get('months'))
+    except ValueError:
+        return api_error(f"months must be a number from 1 to {analytics.MAX_MONTHS} or 'all'", 400)
+    return JsonResponse(analytics.analyze(request.user, months=months).as_dict())
+
+
+@api_login_required
+@require_http_methods(['POST'])
+def calculate(request, name):
+    """
+    Runs one of the financial calculators on a JSON body.
+
+    Inputs may be numbers or lists of numbers, which are evaluated together
+    (e.g. many loans in one prepayment call); see finance.CALCULATORS for
+    the fields each calculator takes.
+
+    Args:
+        request: HttpRequest object containing metadata about the request
+        name: Key of finance.CALCULATORS
+
+    Returns:
+        The calculator's result, 400 for invalid input or 404 for an unknown
+        calculator
+    """
+    calculator = finance.CALCULATORS.get(name)
+    if calculator is None:
+        return api_error(f"Unknown calculator '{name}'", 404, calculators=sorted(finance.CALCULATORS))
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return api_error('Request body must be JSON', 400)
+    if not isinstance(data, dict):
+        return api_error('Request body must be a JSON object', 400)
+    try:
+        return JsonResponse(calculator(data))
+    except finance.CalculatorError as e:
+        return api_error(str(e), 400)
@@ -18,6 +18,17 @@ class ExpensesConfig(AppConfig):
         
         name (str): The Python package name of the application.
             This must match the name of the app's directory.
+
+    The ready() hook registers the model signal receivers used by the app.
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'expenses'
+
+    def ready(self):
+        """
+        Connects the signal receivers that keep derived tables in sync, the
+        one timing SQL statements on every new connection and the one
+        closing ASGI requests' connections, and registers the replica
+        routing's system check.
+        """
+        from . import archive, catalog, concurrency, profiling, routing, search, summaries, versions  # noqa: F401
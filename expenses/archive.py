@@ -0,0 +1,185 @@
+"""
+Hot and cold expense storage.
+
+Expenses dated before the archive horizon (the start of the month
+EXPENSE_ARCHIVE_MONTHS months ago) are moved from the main expense table
+into the compact ArchivedExpense table by the ``archive_expenses``
+management command, so the main table and its indexes - which every list,
+dashboard and write touches - only hold recent data.
+
+Reads pick their source with ``expenses_for``:
+
+* Views of recent data (the expense list, home page, default dashboard
+  period and the JSON list without a date range) read the main table only.
+* Queries whose date range starts before the horizon, and whole-history
+  reports (bills, exports, all-time analytics), read ExpenseHistory, a
+  UNION ALL view of both tables that behaves like Expense.
+
+Archiving changes neither the summaries (archived expenses still count
+towards every total) nor the ids of the moved rows; it does bump the
+owners' data versions. Archived expenses are read-only and are not in the
+full-text index, so searches only reach them through the slower substring
+fallback, and only for date ranges that reach the archive.
+
+Settings:
+    EXPENSE_ARCHIVE_MONTHS: Months of expenses kept in the main table
+        (default None: nothing is archived, and running the command moves
+        everything back)
+"""
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models.signals import post_migrate, pre_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import versions
+from .models import ArchivedExpense, Expense, ExpenseHistory
+
+# Columns copied between the tables and exposed by the history view
+COLUMNS = ('id', 'title', 'amount', 'description', 'user_id', 'category_id', 'date', 'time')
+
+
+def cutoff(today=None):
+    """
+    Returns the first date kept in the main table, or None if archiving is off.
+
+    Cutoffs are whole months, so a month is either entirely in the main
+    table or entirely archived.
+    """
+    months = getattr(settings, 'EXPENSE_ARCHIVE_MONTHS', None)
+    if not months:
+        return None
+    today = today or timezone.localdate()
+    index = today.year * 12 + today.month - 1 - months
+    return today.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def reaches_archive(date_from=None, whole_history=False):
+    """
+    Whether a query starting at ``date_from`` may need archived expenses.
+
+    Args:
+        date_from: First date of the requested range, None if unbounded
+        whole_history: Whether an unbounded range means "everything" (a
+            report) rather than "the recent expenses" (a list)
+    """
+    horizon = cutoff()
+    if horizon is None:
+        return False
+    if date_from is None:
+        return whole_history
+    return date_from < horizon
+
+
+def expenses_for(user, date_from=None, whole_history=False):
+    """
+    Returns ``user``'s expenses from the main table, or from ExpenseHistory
+    when the range reaches the archive (see ``reaches_archive``).
+    """
+    model = ExpenseHistory if reaches_archive(date_from, whole_history) else Expense
+    return model.objects.filter(user=user)
+
+
+def _move(cursor, connection, source, target, user_id, date_condition=None, boundary=None):
+    """
+    Moves one user's rows from table ``source`` to ``target``, optionally
+    only those whose date satisfies ``date_condition`` (e.g. '<') ``boundary``.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in COLUMNS)
+    where, params = f'{quote("user_id")} = %s', [user_id]
+    if date_condition:
+        where += f' AND {quote("date")} {date_condition} %s'
+        params.append(boundary)
+    cursor.execute(
+        f'INSERT INTO {quote(target)} ({columns}) SELECT {columns} FROM {quote(source)} WHERE {where}', params
+    )
+    moved = cursor.rowcount
+    cursor.execute(f'DELETE FROM {quote(source)} WHERE {where}', params)
+    return moved
+
+
+def archive_user(user_id, today=None):
+    """
+    Moves one user's expenses to the side of the horizon they belong on.
+
+    Expenses before the cutoff go to the archive; archived expenses on or
+    after it (after the horizon was lengthened, or archiving switched off)
+    come back. Runs in one transaction with raw SQL, so no model signals
+    fire and the summaries stay as they are.
+
+    Returns:
+        tuple: (archived, restored) row counts
+    """
+    horizon = cutoff(today)
+    hot, cold = Expense._meta.db_table, ArchivedExpense._meta.db_table
+    alias = router.db_for_write(Expense)
+    connection = connections[alias]
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        if horizon is None:
+            archived = 0
+            restored = _move(cursor, connection, cold, hot, user_id)
+        else:
+            archived = _move(cursor, connection, hot, cold, user_id, '<', horizon)
+            restored = _move(cursor, connection, cold, hot, user_id, '>=', horizon)
+        if archived or restored:
+            versions.touch(user_id)
+    return archived, restored
+
+
+def pending_counts(user_id=None, today=None):
+    """
+    Returns how many expenses ``archive_user`` would archive and restore.
+
+    Returns:
+        tuple: (to archive, to restore) row counts
+    """
+    horizon = cutoff(today)
+    hot, cold = Expense.objects.all(), ArchivedExpense.objects.all()
+    if user_id is not None:
+        hot, cold = hot.filter(user_id=user_id), cold.filter(user_id=user_id)
+    if horizon is None:
+        return 0, cold.count()
+    return hot.filter(date__lt=horizon).count(), cold.filter(date__gte=horizon).count()
+
+
+def create_history_view(connection):
+    """(Re)creates the ExpenseHistory view if both of its tables exist."""
+    drop_history_view(connection)
+    if not router.allow_migrate_model(connection.alias, ArchivedExpense):
+        return
+    tables = connection.introspection.table_names()
+    if Expense._meta.db_table not in tables or ArchivedExpense._meta.db_table not in tables:
+        return
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIEW {quote(ExpenseHistory._meta.db_table)} AS '
+            f'SELECT {columns} FROM {quote(Expense._meta.db_table)} '
+            f'UNION ALL SELECT {columns} FROM {quote(ArchivedExpense._meta.db_table)}'
+        )
+
+
+def drop_history_view(connection):
+    """Drops the ExpenseHistory view, if present."""
+    if not router.allow_migrate_model(connection.alias, ArchivedExpense):
+        # A replica follows the primary's schema
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP VIEW IF EXISTS {connection.ops.quote_name(ExpenseHistory._meta.db_table)}')
+
+
+@receiver(pre_migrate, dispatch_uid='expense_history_view_drop')
+def before_migrate(sender, using='default', **kwargs):
+    """Drops the history view so migrations can alter the tables under it."""
+    if sender.name == 'expenses':
+        drop_history_view(connections[using])
+
+
+@receiver(post_migrate, dispatch_uid='expense_history_view_create')
+def after_migrate(sender, using='default', **kwargs):
+    """Recreates the history view over the migrated tables."""
+    if sender.name == 'expenses':
+        create_history_view(connections[using])
@@ -0,0 +1,320 @@
+"""
+Static asset pipeline: content-hashed, minified and precompressed files,
+served with far-future cache headers.
+
+Bootstrap (CSS and JS), Popper and the Bootstrap Icons the templates use are
+vendored under expenses/static/expenses/vendor instead of being loaded from
+a CDN, so pages depend on no third-party host and its extra connection.
+
+``collectstatic`` (through ``CompressedManifestStaticFilesStorage``, the
+``staticfiles`` storage) copies every file to STATIC_ROOT a second time
+under a name containing a hash of its contents (bootstrap.min.3a7e9d1c4b05.css),
+which is the URL ``{% static %}`` renders. On the way it minifies the app's
+own stylesheets (the vendored files are already minified builds) and writes
+a Brotli (.br) and a gzip (.gz, by zopfli when installed) copy of every
+compressible hashed file next to it, so nothing is compressed per request.
+
+``StaticFilesMiddleware`` serves STATIC_ROOT from the Django workers. It
+picks the smallest copy the client's Accept-Encoding allows and marks
+hashed files ``immutable`` for a year: browsers reuse them without asking,
+and a changed file gets a new name. Files requested by their plain name
+are cached for STATIC_MAX_AGE and revalidated with If-Modified-Since.
+
+Until collectstatic has run (development, the test runner) ``{% static %}``
+renders plain names, which runserver serves from the app directories.
+
+Settings:
+    STATIC_MAX_AGE: Browser cache lifetime, in seconds, of files requested
+        without a content hash in their name (default one hour)
+"""
+
+import gzip
+import mimetypes
+import os
+import re
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # Only .gz copies are written
+    brotli = None
+
+try:
+    from zopfli import gzip as zopfli_gzip
+except ImportError:  # gzip at level 9: a few percent larger
+    zopfli_gzip = None
+
+# Extensions of files worth compressing; images and fonts such as PNG and
+# WOFF2 are compressed already
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ttf', '.otf', '.ico')
+
+# Smaller files gain less than the Content-Encoding and Vary headers cost
+MIN_COMPRESS_SIZE = 512
+
+# A compressed copy is only kept if it saves at least this share of the size
+MIN_SAVING = 0.05
+
+# Content codings, in order of preference, and the suffix of their copies
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Stylesheets minified by collectstatic: the app's own, not third-party ones
+MINIFIED_CSS_PREFIXES = ('expenses/css/',)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+DEFAULT_MAX_AGE = 60 * 60
+
+
+def minify_css(text):
+    """
+    Removes comments and the whitespace CSS does not need.
+
+    Deliberately conservative: whitespace is only dropped around braces,
+    semicolons and after colons in declarations, never inside selectors, so
+    it is safe for the app's hand-written stylesheets (it does not try to
+    handle strings containing those characters).
+    """
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};])\s*', r'\1', text)
+    text = re.sub(r'([{;][\w-]+):\s+', r'\1:', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+
+def compress(data):
+    """
+    Compresses ``data`` with every available coding.
+
+    Args:
+        data: File contents (bytes)
+
+    Returns:
+        dict: {suffix: compressed bytes} of the copies worth keeping (see
+        MIN_COMPRESS_SIZE and MIN_SAVING), possibly empty
+    """
+    if len(data) < MIN_COMPRESS_SIZE:
+        return {}
+    copies = {}
+    if brotli is not None:
+        copies['.br'] = brotli.compress(data, quality=11)
+    if zopfli_gzip is not None:
+        copies['.gz'] = zopfli_gzip.compress(data)
+    else:
+        copies['.gz'] = gzip.compress(data, compresslevel=9, mtime=0)
+    limit = len(data) * (1 - MIN_SAVING)
+    return {suffix: copy for suffix, copy in copies.items() if len(copy) <= limit}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also minifies the app's stylesheets and
+    writes precompressed copies of the hashed files (see the module
+    docstring).
+
+    Names missing from the manifest fall back to the plain name instead of
+    raising, so templates render before collectstatic has run.
+    """
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected: served as it is, by runserver or the middleware
+            return name
+
+    def _save(self, name, content):
+        if name.endswith('.css') and name.startswith(MINIFIED_CSS_PREFIXES):
+            content.seek(0)
+            content = ContentFile(minify_css(content.read().decode('utf-8')).encode('utf-8'))
+        return super()._save(name, content)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            self.write_compressed(name)
+
+    def write_compressed(self, name):
+        """
+        Writes the .br and .gz copies of the hashed file ``name``. A hashed
+        name always holds the same contents, so existing copies are kept.
+        """
+        if not name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+            return
+        missing = [suffix for _, suffix in ENCODINGS if not self.exists(name + suffix)]
+        if not missing:
+            return
+        with self.open(name) as original:
+            data = original.read()
+        for suffix, copy in compress(data).items():
+            if suffix in missing:
+                self._save(name + suffix, ContentFile(copy))
+
+
+def accepted_encodings(header):
+    """
+    Returns the content codings an Accept-Encoding header allows: those
+    listed without q=0 ('*' stands for any coding).
+    """
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = re.search(r'q\s*=\s*([0-9.]+)', params)
+        try:
+            if quality and float(quality.group(1)) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding)
+    return accepted
+
+
+class StaticFile:
+    """
+    A file under STATIC_ROOT and its precompressed copies.
+
+    Attributes:
+        path (str): Filesystem path of the file
+        content_type (str): Its Content-Type
+        size (int): Its size in bytes
+        modified (float): Its modification time
+        variants (list): (coding, path, size) of each compressed copy, in
+            order of preference
+        immutable (bool): Whether its name contains a content hash
+    """
+
+    def __init__(self, path, immutable):
+        self.path = path
+        content_type, _ = mimetypes.guess_type(path)
+        self.content_type = content_type or 'application/octet-stream'
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.modified = stat.st_mtime
+        self.immutable = immutable
+        self.variants = []
+        for coding, suffix in ENCODINGS:
+            try:
+                self.variants.append((coding, path + suffix, os.stat(path + suffix).st_size))
+            except FileNotFoundError:
+                pass
+
+    def select(self, accept_encoding):
+        """Returns (coding or None, path, size) of the copy to send."""
+        accepted = accepted_encodings(accept_encoding)
+        for coding, path, size in self.variants:
+            if coding in accepted or '*' in accepted:
+                return coding, path, size
+        return None, self.path, self.size
+
+
+class StaticFilesMiddleware:
+    """
+    Serves the files collected into STATIC_ROOT (see the module docstring).
+
+    Keep it first in MIDDLEWARE: static requests then skip sessions,
+    authentication and the profiling and metrics middleware. Dropped from
+    the chain when STATIC_URL points at another host.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        prefix = urlsplit(settings.STATIC_URL or '')
+        if not settings.STATIC_ROOT or prefix.netloc:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = '/' + prefix.path.lstrip('/')
+        self.root = settings.STATIC_ROOT
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', DEFAULT_MAX_AGE)
+        # Files found so far, by name; collectstatic runs before the workers
+        # start, so they are not looked at again
+        self.files = {}
+        self.hashed_names = None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        # Under ASGI a FileResponse would be read through a sync iterator
+        # (with a warning per request); static files are small, so they are
+        # read in one go
+        response = self.serve(request, buffered=True)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+    def find(self, name):
+        """Returns the StaticFile for ``name``, or None if there is none."""
+        static_file = self.files.get(name)
+        if static_file is None:
+            try:
+                path = safe_join(self.root, name)
+            except SuspiciousFileOperation:  # Outside STATIC_ROOT
+                return None
+            if not os.path.isfile(path) or path.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                return None
+            if self.hashed_names is None:
+                self.hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+            static_file = self.files[name] = StaticFile(path, name in self.hashed_names)
+        return static_file
+
+    def serve(self, request, buffered=False):
+        """
+        Returns the response to a request for a static file, or None if
+        ``request`` is not for one (or the file does not exist, which the
+        URL resolver then answers with a 404).
+        """
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        static_file = self.find(request.path_info[len(self.prefix):])
+        if static_file is None:
+            return None
+
+        if not static_file.immutable and not was_modified_since(
+                request.headers.get('If-Modified-Since'), static_file.modified):
+            response = HttpResponseNotModified()
+        else:
+            coding, path, size = static_file.select(request.headers.get('Accept-Encoding', ''))
+            if buffered:
+                with open(path, 'rb') as f:
+                    response = HttpResponse(f.read(), content_type=static_file.content_type)
+            else:
+                response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+                response.headers.pop('Content-Disposition', None)
+            response['Content-Length'] = size
+            if coding:
+                response['Content-Encoding'] = coding
+        response['Last-Modified'] = http_date(static_file.modified)
+        if static_file.variants:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        if static_file.immutable:
+            response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response['Cache-Control'] = f'public, max-age={self.max_age}'
+        # Ahead of SecurityMiddleware, which would otherwise add it
+        response['X-Content-Type-Options'] = 'nosniff'
+        return response
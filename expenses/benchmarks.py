@@ -0,0 +1,370 @@
+"""
+End-to-end performance benchmarks for every view.
+
+``run_suite`` seeds a dataset (users x expenses per user x categories, see
+expenses/synthetic.py), drives every URL of expenses/urls.py through the
+Django test client and reports for each scenario:
+
+* p50 and p95 latency over the timed runs, in milliseconds
+* queries per request (instrumentation.record_queries, the most seen)
+* peak Python memory allocated while serving one request, from a separate
+  tracemalloc run so tracing does not slow down the timed runs
+* response size in bytes (streamed responses are read to the end)
+
+PDF bills are benchmarked through generate_bill (mode=sync) at several sizes,
+100, 10k and 100k rows by default, each for a user with exactly that many
+expenses.
+
+``compare`` checks a report against a stored baseline: a scenario regresses
+when its p50 or p95 latency or its peak memory grows by more than the
+threshold (and by more than the noise floor), or when it runs more queries.
+
+Use the ``benchmark_views`` management command, which runs the suite on a
+throwaway copy of the test database; the numbers are only comparable
+between runs on the same machine and database engine.
+"""
+
+import json
+import math
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from urllib.parse import urlencode
+
+import django
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import jobs, pagination, synthetic, views
+from .filters import ExpenseFilters
+from .instrumentation import record_queries
+from .models import BillJob, Expense
+
+# Report format version, bumped when metrics change meaning
+REPORT_VERSION = 1
+
+DEFAULT_USERS = 3
+DEFAULT_EXPENSES_PER_USER = 5000
+DEFAULT_CATEGORIES = 9
+DEFAULT_REPEAT = 20
+DEFAULT_WARMUP = 2
+
+# PDF bill sizes benchmarked, in rows
+DEFAULT_PDF_ROWS = (100, 10_000, 100_000)
+
+# Rows rendered per PDF scenario across its timed runs, so the largest bills
+# are only rendered once or twice
+PDF_ROW_BUDGET = 50_000
+
+# Relative growth over the baseline that counts as a regression
+DEFAULT_THRESHOLD = 0.20
+
+# Absolute growth below which a change is noise, whatever the ratio
+NOISE_FLOORS = {'p50_ms': 1.0, 'p95_ms': 2.0, 'peak_memory_kb': 64}
+
+# Rows of the CSV uploaded by the import scenario
+IMPORT_ROWS = 100
+
+# Loans evaluated at once by the calculator API scenario
+CALCULATOR_LOANS = 100
+
+USER_PREFIX = 'bench'
+
+
+class BenchmarkData:
+    """
+    What the scenarios need: the benchmark user and objects to point at.
+
+    Attributes:
+        user: User whose expenses the scenarios read and write
+        expense_id (int): One of the user's expenses
+        cursor (str): Cursor of the expense list's second page
+        job_id (int): A finished bill job of the user
+        search_term (str): A word found in many expense titles
+    """
+
+    def __init__(self, user, expense_id, cursor, job_id, search_term):
+        self.user = user
+        self.expense_id = expense_id
+        self.cursor = cursor
+        self.job_id = job_id
+        self.search_term = search_term
+
+
+class Scenario:
+    """
+    One request to benchmark.
+
+    Attributes:
+        name (str): Unique name, used as the key in reports
+        url_name (str): Name of the URL pattern exercised (expenses namespace)
+        build (callable): Takes BenchmarkData and returns (method, path,
+            client keyword arguments). Called before every run, outside the
+            timing, so it can create what the request consumes (e.g. an
+            expense to delete).
+    """
+
+    def __init__(self, name, url_name, build):
+        self.name = name
+        self.url_name = url_name
+        self.build = build
+
+
+def _path(url_name, *args, **query):
+    path = reverse(f'expenses:{url_name}', args=args)
+    return f'{path}?{urlencode(query)}' if query else path
+
+
+def _get(url_name, *args, **query):
+    """A scenario builder for a plain GET of ``url_name``."""
+    return lambda data: ('get', _path(url_name, *args, **query), {})
+
+
+def _import_upload(data):
+    today = timezone.localdate()
+    lines = ['date,title,amount,category']
+    lines += [f'{today - timedelta(days=i % 90)},Imported {i},{i % 500 + 1}.25,Food' for i in range(IMPORT_ROWS)]
+    upload = SimpleUploadedFile('bench.csv', '\n'.join(lines).encode(), content_type='text/csv')
+    return 'post', _path('import_expenses', format='json'), {'data': {'file': upload}}
+
+
+def _delete_expense(data):
+    expense = Expense.objects.create(
+        user=data.user, title='To delete', amount='10.00', date=timezone.localdate(), time='12:00'
+    )
+    return 'post', _path('delete_expense', expense.pk), {}
+
+
+def _queue_bill(data):
+    # Clear the queue so every run takes the enqueue path, not the "too many" one
+    BillJob.objects.filter(user=data.user, status=BillJob.Status.QUEUED).delete()
+    return 'get', _path('generate_bill'), {}
+
+
+def _new_expense():
+    return {'title': 'Benchmark', 'amount': '123.45', 'date': timezone.localdate().isoformat(), 'time': '12:00'}
+
+
+def scenarios():
+    """Returns the request scenarios; together they cover every URL in expenses/urls.py."""
+    return [
+        Scenario('home', 'home', _get('home')),
+        Scenario('expense_list', 'expense_list', _get('expense_list')),
+        Scenario('expense_list sort=-amount', 'expense_list', _get('expense_list', sort='-amount')),
+        Scenario('expense_list search', 'expense_list', lambda d: _get('expense_list', q=d.search_term)(d)),
+        Scenario('expense_list_page', 'expense_list_page', lambda d: _get('expense_list_page', cursor=d.cursor)(d)),
+        Scenario('add_expense GET', 'add_expense', _get('add_expense')),
+        Scenario('import_expenses GET', 'import_expenses', _get('import_expenses')),
+        Scenario('export_expenses csv', 'export_expenses', _get('export_expenses', 'csv')),
+        Scenario('export_expenses ndjson', 'export_expenses', _get('export_expenses', 'ndjson')),
+        Scenario('analytics', 'analytics', _get('analytics')),
+        Scenario('calculators', 'calculators', _get('calculators')),
+        Scenario('generate_bill queue', 'generate_bill', _queue_bill),
+        Scenario('generate_bill sync', 'generate_bill', _get('generate_bill', mode='sync')),
+        Scenario('bill_job_status', 'bill_job_status', lambda d: _get('bill_job_status', d.job_id)(d)),
+        Scenario('bill_job_download', 'bill_job_download', lambda d: _get('bill_job_download', d.job_id)(d)),
+        Scenario('api_expenses GET', 'api_expenses', _get('api_expenses')),
+        Scenario('api_expense_detail', 'api_expense_detail', lambda d: _get('api_expense_detail', d.expense_id)(d)),
+        Scenario('api_categories', 'api_categories', _get('api_categories')),
+        Scenario('api_totals', 'api_totals', _get('api_totals')),
+        Scenario('api_analytics', 'api_analytics', _get('api_analytics')),
+        Scenario(f'api_calculate emi x{CALCULATOR_LOANS}', 'api_calculate', lambda d: (
+            'post', _path('api_calculate', 'emi'), {
+                'data': json.dumps({
+                    'principal': [100000 + 5000 * i for i in range(CALCULATOR_LOANS)],
+                    'annual_rate': 9.5,
+                    'months': 240,
+                }),
+                'content_type': 'application/json',
+            },
+        )),
+        # Writes last, so every read above sees the same data
+        Scenario('add_expense POST', 'add_expense',
+                 lambda d: ('post', _path('add_expense'), {'data': _new_expense()})),
+        Scenario(f'import_expenses POST {IMPORT_ROWS} rows', 'import_expenses', _import_upload),
+        Scenario('delete_expense', 'delete_expense', _delete_expense),
+        Scenario('api_expenses POST', 'api_expenses', lambda d: (
+            'post', _path('api_expenses'), {'data': json.dumps(_new_expense()), 'content_type': 'application/json'}
+        )),
+    ]
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of ``values`` (``fraction`` in 0-1)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _send(client, method, path, kwargs):
+    """Sends one request and reads the whole response; returns (status, size)."""
+    response = getattr(client, method)(path, **kwargs)
+    try:
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+    finally:
+        response.close()
+    return response.status_code, size
+
+
+def measure(client, build, data, repeat, warmup):
+    """
+    Runs one scenario ``warmup`` times untimed, ``repeat`` times timed and
+    once more under tracemalloc.
+
+    Returns:
+        dict: p50_ms, p95_ms, runs, queries, peak_memory_kb, response_bytes
+        and status
+    """
+    for _ in range(warmup):
+        _send(client, *build(data))
+
+    latencies, query_counts = [], []
+    for _ in range(repeat):
+        request = build(data)
+        with record_queries() as stats:
+            started = time.perf_counter()
+            status, size = _send(client, *request)
+            latencies.append(time.perf_counter() - started)
+        query_counts.append(stats.count)
+
+    request = build(data)
+    tracemalloc.start()
+    try:
+        _send(client, *request)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'runs': repeat,
+        'queries': max(query_counts),
+        'peak_memory_kb': round(peak / 1024),
+        'response_bytes': size,
+        'status': status,
+    }
+
+
+def prepare(users, expenses_per_user, category_count, seed, end_date):
+    """
+    Seeds the benchmark dataset, ending on ``end_date``, and returns the
+    BenchmarkData of its first user.
+    """
+    pool = synthetic.categories(category_count)
+    bench_users = synthetic.create_users(users, prefix=USER_PREFIX)
+    for user in bench_users:
+        synthetic.seed_user(user, expenses_per_user, pool, seed=seed, end_date=end_date)
+    user = bench_users[0]
+
+    page = pagination.paginate(views.list_queryset(user), pagination.DEFAULT_SORT)
+    job = jobs.enqueue_bill_job(user, ExpenseFilters(date_from=end_date - timedelta(days=30)))
+    BillJob.objects.filter(pk=job.pk).update(status=BillJob.Status.RUNNING)
+    jobs.run_job(job.pk)
+    return BenchmarkData(
+        user=user,
+        expense_id=page.items[0].pk if page.items else 0,
+        cursor=page.next_cursor or '',
+        job_id=job.pk,
+        search_term=random.Random(seed).choice(synthetic.TITLES).split()[0].lower(),
+    )
+
+
+def run_suite(users=DEFAULT_USERS, expenses_per_user=DEFAULT_EXPENSES_PER_USER, categories=DEFAULT_CATEGORIES,
+              repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP, pdf_rows=DEFAULT_PDF_ROWS, seed=0,
+              end_date=None, only=None, progress=None):
+    """
+    Seeds the dataset into the current database and benchmarks every scenario.
+
+    Args:
+        users, expenses_per_user, categories: Dataset size
+        repeat: Timed runs per scenario
+        warmup: Untimed runs before the timed ones
+        pdf_rows: Bill sizes (in rows) to benchmark PDF generation at
+        seed: Seed of the generated data
+        end_date: Last day of the generated data (default today); runs
+            compared with each other need the same seed and end date
+        only: Optional substring; only scenarios whose name contains it run
+        progress: Optional callable receiving (name, result) after each scenario
+
+    Returns:
+        dict: The report, ready to be written as JSON
+    """
+    end_date = end_date or timezone.localdate()
+    report = {
+        'version': REPORT_VERSION,
+        'created_at': timezone.now().isoformat(),
+        'environment': {
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        },
+        'dataset': {
+            'users': users, 'expenses_per_user': expenses_per_user, 'categories': categories, 'seed': seed,
+            'end_date': end_date.isoformat(),
+        },
+        'repeat': repeat,
+        'scenarios': {},
+    }
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        data = prepare(users, expenses_per_user, categories, seed, end_date)
+        client = Client()
+        client.force_login(data.user)
+        for scenario in scenarios():
+            if only and only not in scenario.name:
+                continue
+            result = measure(client, scenario.build, data, repeat, warmup)
+            report['scenarios'][scenario.name] = result
+            if progress:
+                progress(scenario.name, result)
+
+        pool = synthetic.categories(categories)
+        for rows in pdf_rows:
+            name = f'generate_bill pdf {rows} rows'
+            if only and only not in name:
+                continue
+            user = synthetic.create_users(1, prefix=f'{USER_PREFIX}-pdf-{rows}')[0]
+            synthetic.seed_user(user, rows, pool, seed=seed, end_date=end_date)
+            pdf_client = Client()
+            pdf_client.force_login(user)
+            runs = max(1, min(repeat, PDF_ROW_BUDGET // rows))
+            result = measure(pdf_client, _get('generate_bill', mode='sync'), None, runs, min(warmup, 1))
+            report['scenarios'][name] = result
+            if progress:
+                progress(name, result)
+    return report
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Lists the regressions of ``report`` against ``baseline``.
+
+    Scenarios missing from either report are ignored, so adding or renaming
+    a scenario does not fail the comparison.
+
+    Returns:
+        list: Human-readable regressions, empty if there are none
+    """
+    regressions = []
+    for name, result in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for metric, floor in NOISE_FLOORS.items():
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append(f'{name}: {metric} {old} -> {new} (+{(new - old) / old:.0%})' if old
+                                   else f'{name}: {metric} {old} -> {new}')
+        if result.get('queries', 0) > before.get('queries', result.get('queries', 0)):
+            regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+    return regressions
@@ -0,0 +1,385 @@
+"""
+PDF bill generation for the Expense Tracker application.
+
+The bill is laid out with ReportLab's platypus engine. Expense rows are read
+lazily from a database iterator and emitted as page-sized tables that each
+repeat the column header, and flowables are only created as the layout engine
+asks for them. Peak memory therefore depends on the chunk size rather than on
+the number of expenses being billed.
+"""
+
+import time
+from io import BytesIO
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from django.db.models import Sum
+from reportlab.graphics import renderPDF
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Flowable, Spacer
+from svglib.svglib import svg2rlg
+
+from . import archive, catalog, metrics, summaries
+from .currency import format_amounts, format_indian_currency
+
+# Number of expense rows per table chunk - roughly one A4 page
+ROWS_PER_TABLE = 35
+
+# Number of rows fetched from the database per round trip
+DB_CHUNK_SIZE = 2000
+
+# Columns loaded for each billed expense
+BILL_FIELDS = ('date', 'time', 'title', 'description', 'amount', 'category')
+
+# Column layout shared by every table chunk so the chunks line up
+TABLE_HEADER = ['Date', 'Time', 'Title', 'Category', 'Description', 'Amount (Rs.)']
+COL_WIDTHS = [80, 80, 100, 80, 150, 80]
+
+# Logo SVG content with white fill
+LOGO_SVG = '''<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="white" class="bi bi-currency-exchange" viewBox="0 0 16 16">
+  <path d="M0 5a5 5 0 0 0 4.027 4.905 6.5 6.5 0 0 1 .544-2.073C3.695 7.536 3.132 6.864 3 5.91h-.5v-.426h.466V5.05q-.001-.07.004-.135H2.5v-.427h.511C3.236 3.24 4.213 2.5 5.681 2.5c.316 0 .59.031.819.085v.733a3.5 3.5 0 0 0-.815-.082c-.919 0-1.538.466-1.734 1.252h1.917v.427h-1.98q-.004.07-.003.147v.422h1.983v.427H3.93c.118.602.468 1.03 1.005 1.229a6.5 6.5 0 0 1 4.97-3.113A5.002 5.002 0 0 0 0 5m16 5.5a5.5 5.5 0 1 1-11 0 5.5 5.5 0 0 1 11 0m-7.75 1.322c.069.835.746 1.485 1.964 1.562V14h.54v-.62c1.259-.086 1.996-.74 1.996-1.69 0-.865-.563-1.31-1.57-1.54l-.426-.1V8.374c.54.06.884.347.966.745h.948c-.07-.804-.779-1.433-1.914-1.502V7h-.54v.629c-1.076.103-1.808.732-1.808 1.622 0 .787.544 1.288 1.45 1.493l.358.085v1.78c-.554-.08-.92-.376-1.003-.787zm1.96-1.895c-.532-.12-.82-.364-.82-.732 0-.41.311-.719.824-.809v1.54h-.005zm.622 1.044c.645.145.943.38.943.796 0 .474-.37.8-1.02.86v-1.674z"/>
+</svg>'''
+
+# Styling applied to every chunk of expense rows (header row + body rows)
+ROWS_TABLE_STYLE = TableStyle([
+    # Header style
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('TOPPADDING', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+    # Body style
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('TOPPADDING', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
+
+    # Grid style
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e0e0e0')),
+
+    # Alignment
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),  # Right align all amounts
+])
+
+# Styling for the single closing total row
+TOTAL_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#2c3e50')),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('TOPPADDING', (0, 0), (-1, -1), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e0e0e0')),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (-2, 0), (-1, -1), 'RIGHT'),  # Right align total row text
+])
+
+
+class SVGImage(Flowable):
+    """
+    Custom Flowable class for rendering SVG images in ReportLab PDFs
+    Inherits from Flowable to integrate with ReportLab's document building process
+
+    Features:
+    - Renders SVG with a circular background
+    - Supports custom dimensions
+    - Maintains aspect ratio
+    """
+
+    def __init__(self, svg_drawing, width=35, height=35):
+        """
+        Initialize SVG image with custom dimensions
+
+        Args:
+            svg_drawing: SVG drawing object from svglib
+            width: Width of the image (default: 35 points)
+            height: Height of the image (default: 35 points)
+        """
+        Flowable.__init__(self)
+        self.svg_drawing = svg_drawing
+        self.width = width
+        self.height = height
+
+    def draw(self):
+        """
+        Render the SVG image on the PDF canvas
+
+        Process:
+        1. Draws a circular red background
+        2. Places the SVG image on top
+        3. Handles proper positioning and state management
+        """
+        # Draw red circle background (matching --accent-color from base.html)
+        self.canv.setFillColor(colors.HexColor('#e74c3c'))
+        self.canv.circle(self.width/2, self.height/2, min(self.width, self.height)/2, fill=1)
+
+        # Draw the SVG on top in white
+        self.canv.saveState()  # Save current graphics state
+        self.canv.translate(2, 2)  # Offset by 2 points for better centering
+        renderPDF.draw(self.svg_drawing, self.canv, 0, 0)
+        self.canv.restoreState()  # Restore graphics state
+
+    def wrap(self, *args):
+        """
+        Define the space needed for this flowable
+
+        Returns:
+            tuple: (width, height) in points
+        """
+        return (self.width, self.height)
+
+
+class FlowableStream(list):
+    """
+    A list of flowables that is refilled lazily from an iterator.
+
+    ReportLab's ``build`` consumes flowables from the front of a list. This
+    list only ever holds a small lookahead window and pulls the next flowable
+    from ``source`` each time one is consumed, so the whole document never
+    has to exist in memory at once.
+    """
+
+    def __init__(self, source, lookahead=2):
+        super().__init__()
+        self._source = iter(source)
+        self._lookahead = lookahead
+        self._refill()
+
+    def _refill(self):
+        while len(self) < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                break
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._refill()
+
+
+def bill_rows(expenses, format_amounts):
+    """
+    Converts expenses into PDF table rows, one database chunk at a time.
+
+    Args:
+        expenses: Iterable of Expense objects (ideally a queryset iterator);
+            category names are looked up in the in-memory catalog
+        format_amounts: Callable turning a list of amounts into display
+            texts in one pass, e.g. ``currency.format_amounts``
+
+    Yields:
+        list: [date, time, title, category, description, amount] strings
+    """
+    expenses = iter(expenses)
+    while chunk := list(islice(expenses, DB_CHUNK_SIZE)):
+        amounts = format_amounts([expense.amount for expense in chunk])
+        for expense, amount in zip(chunk, amounts):
+            try:
+                formatted_date = expense.date.strftime('%d %b %Y')
+            except Exception:
+                formatted_date = str(expense.date) if expense.date else '-'
+            try:
+                formatted_time = expense.time.strftime('%I:%M %p')
+            except Exception:
+                formatted_time = str(expense.time) if expense.time else '-'
+            yield [
+                formatted_date,
+                formatted_time,
+                expense.title,
+                catalog.name(expense.category_id, '-'),
+                expense.description or '-',
+                amount,
+            ]
+
+
+def _row_tables(rows, rows_per_table):
+    """Groups rows into page-sized tables that each start with the header row."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == rows_per_table:
+            yield _rows_table(chunk)
+            chunk = []
+    if chunk:
+        yield _rows_table(chunk)
+
+
+def _rows_table(chunk):
+    table = Table([TABLE_HEADER] + chunk, colWidths=COL_WIDTHS, repeatRows=1)
+    table.setStyle(ROWS_TABLE_STYLE)
+    return table
+
+
+def _header_flowables(user, generated_on, subtitle):
+    """Builds the logo, title and bill details shown above the expense rows."""
+    drawing = svg2rlg(BytesIO(LOGO_SVG.encode('utf-8')))
+
+    # Create header
+    styles = getSampleStyleSheet()
+    header_style = ParagraphStyle(
+        'CustomHeader',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        fontName='Helvetica-Bold'
+    )
+
+    # Scale the drawing for better visibility
+    drawing.scale(1.2, 1.2)
+
+    # Create table for logo and EXPO text side by side
+    header_table = Table([
+        [SVGImage(drawing), Paragraph("EXPO", header_style)]
+    ], colWidths=[35, None])
+
+    header_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+    ]))
+
+    yield header_table
+    yield Spacer(1, 30)  # Add 30 points of vertical space after logo
+    yield Paragraph("Expense Bill", styles['Heading1'])
+    yield Spacer(1, 20)  # Add 20 points of vertical space after title
+    # Paragraphs parse their text as markup: user input is escaped
+    yield Paragraph(f"User: {escape(user.username)}", styles['Normal'])
+    yield Paragraph(f"Generated: {generated_on}", styles['Normal'])
+    if subtitle:
+        yield Paragraph(f"Filters: {escape(subtitle)}", styles['Normal'])
+    yield Spacer(1, 20)  # Add 20 points of vertical space before table
+
+
+def _footer_flowables(total):
+    """Builds the total row and closing note shown after the expense rows."""
+    total_table = Table([['', '', '', '', 'Total Amount', total]], colWidths=COL_WIDTHS)
+    total_table.setStyle(TOTAL_TABLE_STYLE)
+    yield total_table
+    yield Spacer(1, 30)  # Add 30 points of vertical space after table
+
+    # Add footer
+    styles = getSampleStyleSheet()
+    footer_style = ParagraphStyle(
+        'CustomFooter',
+        parent=styles['Normal'],
+        textColor=colors.gray,
+        fontSize=10,
+        spaceAfter=30,
+        fontName='Helvetica',
+        alignment=1  # Center alignment
+    )
+    yield Paragraph("<br/><br/>Thank you for using Expense Tracker", footer_style)
+
+
+def write_bill_pdf(output, user, rows, total, generated_on, subtitle=None,
+                   rows_per_table=ROWS_PER_TABLE):
+    """
+    Lays out a bill and writes the finished PDF to ``output``.
+
+    Args:
+        output: Writable binary file object (or a filename)
+        user: User the bill is generated for
+        rows: Iterable of table rows, typically ``bill_rows(...)``
+        total: Pre-formatted total amount string
+        generated_on: Date shown as the generation date
+        subtitle: Optional description of the filters applied
+        rows_per_table: Number of expense rows per table chunk
+    """
+    doc = SimpleDocTemplate(output, pagesize=A4, topMargin=50, bottomMargin=50, leftMargin=40, rightMargin=40)
+
+    def flowables():
+        yield from _header_flowables(user, generated_on, subtitle)
+        yield from _row_tables(rows, rows_per_table)
+        yield from _footer_flowables(total)
+
+    doc.build(FlowableStream(flowables()))
+
+
+def bill_context(user, filters, generated_on):
+    """
+    Collects everything needed to render a bill for ``user``.
+
+    The total is aggregated in SQL (from the summary table when no date or
+    amount filters apply) and the expenses are returned as a lazy
+    server-side iterator, so nothing is loaded until the PDF is laid out.
+    On PostgreSQL the iterator must be consumed inside a transaction.
+
+    Args:
+        user: User the bill is generated for
+        filters: ExpenseFilters restricting which expenses are billed
+        generated_on: Date shown as the generation date
+
+    Returns:
+        dict: Context with 'user', 'expenses', 'total', 'today' and 'filters'
+    """
+    # Get the user's matching expenses ordered by date and time (newest first),
+    # including archived ones unless the date range stays within recent months
+    source = archive.expenses_for(user, filters.date_from, whole_history=True)
+    expenses = filters.apply(source).order_by('-date', '-time')
+
+    # Calculate total amount of the matching expenses, 0 if there are none.
+    # Whole-history bills (optionally per category) read the summary table.
+    if filters.date_from is None and filters.date_to is None \
+            and filters.min_amount is None and filters.max_amount is None \
+            and not filters.search_terms:
+        total_raw = summaries.user_total(user, category=filters.category)
+    else:
+        total_raw = expenses.aggregate(total=Sum('amount'))['total'] or 0
+
+    return {
+        'expenses': (
+            expenses.only(*BILL_FIELDS)
+            .iterator(chunk_size=DB_CHUNK_SIZE)
+        ),
+        'total': format_indian_currency(total_raw),   # string like "(Rs. 1,234.56)"
+        'user': user,
+        'today': generated_on,
+        'filters': filters,
+    }
+
+
+def write_bill(output, context):
+    """
+    Renders a bill context (see ``bill_context``) as a PDF into ``output``,
+    and records its build time, rows and size in the metrics.
+
+    Args:
+        output: Writable binary file object
+        context: Dictionary with keys 'user', 'expenses', 'total', 'today'
+            and optionally 'filters'
+
+    Returns:
+        int: Number of expense rows in the bill
+    """
+    filters = context.get('filters')
+    rendered = 0
+
+    def counted(rows):
+        nonlocal rendered
+        for row in rows:
+            rendered += 1
+            yield row
+
+    started = time.perf_counter()
+    start_offset = output.tell()
+    write_bill_pdf(
+        output,
+        user=context['user'],
+        rows=counted(bill_rows(context['expenses'], format_amounts)),
+        total=context['total'],
+        generated_on=context['today'],
+        subtitle=filters.describe() if filters else None,
+    )
+    metrics.record_bill(rendered, output.tell() - start_offset, time.perf_counter() - started)
+    return rendered
@@ -0,0 +1,157 @@
+"""
+Process-wide cache of the expense categories.
+
+The category set is seeded by migrations and only ever changed through the
+admin, yet nearly every page needs it: for select boxes, to show category
+names next to expenses and to resolve names during imports. Instead of
+reading the table (or joining it) on every request, each worker process
+keeps a ``CategoryCatalog`` in memory, backed by Django's cache framework:
+
+* the in-process copy is used as is for LOCAL_TTL seconds;
+* after that the shared cache entry is consulted, which is cheap, and the
+  database is only read when that entry is missing;
+* saving or deleting a Category (including through CategoryAdmin) drops
+  both the shared entry and this process' copy, again once the transaction
+  commits so a concurrent reload cannot cache the old state.
+
+Other processes see a change within LOCAL_TTL seconds when CACHES points at
+a shared backend (Redis, Memcached, the database); with the default
+per-process LocMemCache they see it once their cache entry expires after
+CATEGORY_CATALOG_TIMEOUT seconds.
+
+A category id that is not in the catalog (created by another process a
+moment ago) triggers one reload instead of being reported as unknown.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Expense
+
+CACHE_KEY = 'expenses:category_catalog'
+
+# Seconds a worker trusts its in-process copy before checking the shared cache
+LOCAL_TTL = 5
+
+
+class CategoryCatalog:
+    """
+    An immutable snapshot of all categories.
+
+    Attributes:
+        categories (list): Category instances ordered by name
+        names (dict): id -> name
+        ids (dict): case-folded name -> id
+    """
+
+    def __init__(self, rows):
+        self.rows = tuple(rows)
+        self.categories = sorted(
+            (Category(id=pk, name=name) for pk, name in self.rows), key=lambda c: c.name.casefold()
+        )
+        self.by_id = {category.pk: category for category in self.categories}
+        self.names = {category.pk: category.name for category in self.categories}
+        self.ids = {category.name.strip().casefold(): category.pk for category in self.categories}
+
+    def __contains__(self, category_id):
+        return category_id in self.by_id
+
+
+# This process' copy: (catalog, time it was last checked against the cache).
+# Catalogs are never modified, so replacing the tuple is thread-safe.
+_local = (None, 0.0)
+
+
+def _timeout():
+    return getattr(settings, 'CATEGORY_CATALOG_TIMEOUT', 300)
+
+
+def get_catalog(refresh=False):
+    """
+    Returns the current CategoryCatalog.
+
+    Args:
+        refresh: Reload from the database, bypassing both cache levels
+    """
+    global _local
+    catalog, checked_at = _local
+    now = time.monotonic()
+    if not refresh and catalog is not None and now - checked_at < LOCAL_TTL:
+        return catalog
+
+    rows = None if refresh else cache.get(CACHE_KEY)
+    if rows is None:
+        rows = list(Category.objects.values_list('id', 'name'))
+        cache.set(CACHE_KEY, rows, _timeout())
+    if catalog is None or catalog.rows != tuple(rows):
+        catalog = CategoryCatalog(rows)
+    _local = (catalog, now)
+    return catalog
+
+
+def categories():
+    """Returns all categories, ordered by name, for select boxes."""
+    return get_catalog().categories
+
+
+def get(category_id):
+    """
+    Returns the Category with ``category_id``, or None if it does not exist.
+
+    An id missing from the catalog causes one reload, in case the category
+    was created since the catalog was cached.
+    """
+    if category_id is None:
+        return None
+    catalog = get_catalog()
+    if category_id not in catalog:
+        catalog = get_catalog(refresh=True)
+    return catalog.by_id.get(category_id)
+
+
+def name(category_id, default=None):
+    """Returns the name of a category id, or ``default`` for None/unknown ids."""
+    category = get(category_id)
+    return category.name if category else default
+
+
+def id_for_name(category_name):
+    """Returns the id of the category called ``category_name`` (case-insensitive), or None."""
+    return get_catalog().ids.get((category_name or '').strip().casefold())
+
+
+def attach(expenses):
+    """
+    Fills in ``expense.category`` from the catalog for each expense, so
+    templates and renderers can use it without a query or a join.
+
+    Args:
+        expenses: Expense instances loaded with their category_id
+
+    Returns:
+        The same expenses, for chaining
+    """
+    field = Expense._meta.get_field('category')
+    for expense in expenses:
+        field.set_cached_value(expense, get(expense.category_id))
+    return expenses
+
+
+def invalidate():
+    """Forgets the cached catalog in this process and in the shared cache."""
+    global _local
+    cache.delete(CACHE_KEY)
+    _local = (None, 0.0)
+
+
+@receiver(post_save, sender=Category, dispatch_uid='category_catalog_save')
+@receiver(post_delete, sender=Category, dispatch_uid='category_catalog_delete')
+def category_changed(sender, raw=False, **kwargs):
+    """Drops the cached catalog now and again after the change is committed."""
+    invalidate()
+    transaction.on_commit(invalidate)
@@ -0,0 +1,265 @@
+"""
+Brotli and gzip compression of HTML, JSON, CSV and PDF responses.
+
+``ResponseCompressionMiddleware`` compresses a response when all of these
+hold:
+
+* the client accepts br or gzip (Brotli is preferred, when installed)
+* its Content-Type is one of COMPRESSIBLE_TYPES, and it has no
+  Content-Encoding yet (the precompressed static files of
+  expenses/assets.py)
+* it has at least COMPRESSION_MIN_SIZE bytes, when its size is known
+* unless it is streaming (see below), a sample of its first SAMPLE_SIZE
+  bytes compresses well, which rules out content compressed already, such as
+  PDFs of scanned receipts
+* its view does not opt out in COMPRESSION_VIEWS
+
+Streaming responses (CSV and NDJSON exports) stay streaming: the compressor
+is fed one chunk at a time and what it emits is sent on, flushed at least
+every FLUSH_BYTES of input so slow exports keep reaching the client. They
+are never read ahead to take a sample: that would run the export's query
+before the headers go out, and under ASGI iterate a sync generator on the
+event loop. Whether they are compressed is decided by content type alone
+(STREAMED_TYPES, all text formats), so streamed PDFs, which ReportLab
+compresses already, are sent as they are.
+
+Settings:
+    COMPRESSION_MIN_SIZE: Smallest response compressed, in bytes (default
+        1024)
+    COMPRESSION_VIEWS: Per-view overrides, by URL name ('expenses:home'):
+        False to never compress the view's responses, or a dict with any
+        of 'min_size', 'brotli_quality' and 'gzip_level'
+"""
+
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Content types compressed (parameters such as charset are ignored)
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/csv', 'text/css', 'text/javascript', 'text/xml',
+    'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml',
+    'application/pdf', 'image/svg+xml',
+}
+
+# Content types of streaming responses compressed without sampling them:
+# text formats, which always compress well
+STREAMED_TYPES = COMPRESSIBLE_TYPES - {'application/pdf'}
+
+DEFAULT_MIN_SIZE = 1024
+
+# Brotli quality 4 compresses about as fast as gzip level 6 and 10-20%
+# smaller; the higher qualities are meant for static files, not per request
+DEFAULT_BROTLI_QUALITY = 4
+DEFAULT_GZIP_LEVEL = 6
+
+# Bytes of a response test-compressed to decide whether compressing it pays
+SAMPLE_SIZE = 16 * 1024
+# Compressed below this share of the sample's size, or the response is sent
+# as it is
+SAMPLE_MAX_RATIO = 0.9
+
+# Streaming responses are flushed to the client at least this often
+FLUSH_BYTES = 64 * 1024
+
+_CONTENT_TYPE = re.compile(r'^\s*([^;\s]+)')
+
+
+class GzipEncoder:
+    """Incremental gzip compressor (see BrotliEncoder for the interface)."""
+
+    coding = 'gzip'
+
+    def __init__(self, level):
+        # wbits 31: a gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    """
+    Incremental Brotli compressor.
+
+    ``compress`` returns whatever output is ready (possibly nothing),
+    ``flush`` everything for the data given so far, and ``finish`` the end
+    of the stream.
+    """
+
+    coding = 'br'
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def compresses_well(sample):
+    """Whether a fast compression of ``sample`` saves enough to bother."""
+    return len(zlib.compress(sample, 1)) < len(sample) * SAMPLE_MAX_RATIO
+
+
+def compress_chunks(chunks, encoder):
+    """Compresses an iterable of byte strings as it is consumed."""
+    pending = 0
+    for chunk in chunks:
+        data = encoder.compress(chunk)
+        pending += len(chunk)
+        if pending >= FLUSH_BYTES:
+            data += encoder.flush()
+            pending = 0
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+async def acompress_chunks(chunks, encoder):
+    """Async version of ``compress_chunks``, for async iterables."""
+    pending = 0
+    async for chunk in chunks:
+        data = encoder.compress(chunk)
+        pending += len(chunk)
+        if pending >= FLUSH_BYTES:
+            data += encoder.flush()
+            pending = 0
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+class ResponseCompressionMiddleware:
+    """
+    Compresses responses with Brotli or gzip (see the module docstring).
+
+    Place it after the profiling and metrics middleware, so compressing
+    counts towards request times, and before any middleware that reads or
+    changes response bodies.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+        self.views = getattr(settings, 'COMPRESSION_VIEWS', {})
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        encoder = self.encoder(request, response)
+        if encoder is None:
+            return response
+        return self.compress(response, encoder)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        encoder = self.encoder(request, response)
+        if encoder is None:
+            return response
+        return self.compress(response, encoder)
+
+    def options(self, request):
+        """Returns the compression options of the request's view, or None to leave it alone."""
+        match = getattr(request, 'resolver_match', None)
+        options = self.views.get(match.view_name) if match else None
+        if options is False:
+            return None
+        return options or {}
+
+    def encoder(self, request, response):
+        """Returns the encoder to compress ``response`` with, or None to send it as it is."""
+        if response.has_header('Content-Encoding') or response.has_header('Content-Range'):
+            return None
+        if 'no-transform' in response.get('Cache-Control', ''):
+            return None
+        match = _CONTENT_TYPE.match(response.get('Content-Type', ''))
+        types = STREAMED_TYPES if response.streaming else COMPRESSIBLE_TYPES
+        if not match or match.group(1).lower() not in types:
+            return None
+        options = self.options(request)
+        if options is None:
+            return None
+        min_size = options.get('min_size', self.min_size)
+        if response.streaming:
+            length = response.get('Content-Length')
+            if length is not None and int(length) < min_size:
+                return None
+        elif len(response.content) < min_size:
+            return None
+
+        # The response depends on Accept-Encoding whether compressed or not
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        if brotli is not None and 'br' in accepted:
+            return BrotliEncoder(options.get('brotli_quality', DEFAULT_BROTLI_QUALITY))
+        if 'gzip' in accepted:
+            return GzipEncoder(options.get('gzip_level', DEFAULT_GZIP_LEVEL))
+        return None
+
+    def compress(self, response, encoder):
+        """
+        Compresses a response, unless its content turns out not to compress
+        well. Streams are wrapped without reading any of them (see the module
+        docstring), sync or async alike.
+        """
+        if not response.streaming:
+            return self.compress_content(response, encoder)
+        if response.is_async:
+            response.streaming_content = acompress_chunks(response.streaming_content, encoder)
+        else:
+            response.streaming_content = compress_chunks(response.streaming_content, encoder)
+        return self.mark(response, encoder)
+
+    def compress_content(self, response, encoder):
+        """Compresses a non-streaming response in place, if that makes it smaller."""
+        content = response.content
+        if not compresses_well(content[:SAMPLE_SIZE]):
+            return response
+        compressed = encoder.compress(content) + encoder.finish()
+        if len(compressed) >= len(content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        return self.mark(response, encoder)
+
+    @staticmethod
+    def mark(response, encoder):
+        """Sets the headers of a compressed response."""
+        response['Content-Encoding'] = encoder.coding
+        if response.streaming:
+            # The compressed size is only known once it has been sent
+            response.headers.pop('Content-Length', None)
+        # The compressed body differs byte for byte, so a strong ETag would
+        # be wrong for it
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
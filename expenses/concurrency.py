@@ -0,0 +1,171 @@
+"""
+Helpers for async views: resolving the user and running independent
+queries at the same time.
+
+Django's async ORM (``aget``, ``aaggregate``, ``async for``) hands every
+query to the request's own thread through sync_to_async, one after the
+other: awaiting several of them with asyncio.gather frees the event loop
+for other requests but does not make them overlap, since they share that
+thread and its database connection. ``gather`` gets them to overlap by
+running sync callables on a pool of ASYNC_QUERY_THREADS threads, each with
+a connection of its own (kept for CONN_MAX_AGE like a request's), while
+coroutines it is given keep running on the request's thread. With the
+database a network round trip away, a view then waits for its slowest
+query rather than for the sum of them.
+
+Callables run with a copy of the request's context, so the read replica
+routing (expenses/routing.py) and the SQL timings of the profiling and
+metrics middleware follow them. They must only read: their connections
+are in autocommit mode, outside any transaction the request has open.
+
+While the request's connection is inside a transaction (in TestCase, or a
+view called from ``atomic``), other connections cannot see what it wrote,
+so everything runs on the request's thread instead, one after the other.
+
+Under ASGI, Django runs each request's sync code (the async ORM included)
+on a thread of its own that ends with the request, so a connection it
+opened could never be reused; ``close_request_connections`` closes them
+when the request finishes, while the pooled threads keep theirs for
+CONN_MAX_AGE. That is why CONN_MAX_AGE can stay on under ASGI, which Django
+otherwise advises against.
+
+Streaming responses (exports, PDF downloads) are built by sync views with
+sync iterators, which Django's ASGI handler reads in one go with
+``sync_to_async(list)``: the whole body in memory, and nothing sent before
+the last row. ``async_streaming`` gives them an async iterator instead that
+takes one chunk at a time from the sync one, on the request's thread.
+
+Settings:
+    ASYNC_QUERY_THREADS: Threads (and so database connections per
+        process) running queries for async views (default 8)
+"""
+
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
+from django.core.signals import request_finished
+from django.db import close_old_connections, connections
+from django.dispatch import receiver
+
+DEFAULT_QUERY_THREADS = 8
+
+# Created on first use, so each process (gunicorn forks after importing the
+# app) gets threads of its own
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """Returns the process' pool of query threads."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ASYNC_QUERY_THREADS', DEFAULT_QUERY_THREADS),
+                    thread_name_prefix='expenses-query',
+                )
+    return _executor
+
+
+async def authenticated_user(request):
+    """
+    Returns the requesting user (AnonymousUser if not logged in), loaded
+    with the async session and auth APIs.
+
+    Also stores it as ``request.user``, so sync code called later (template
+    context processors, ETag functions) gets it without a query of its own.
+    """
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+@receiver(request_finished, dispatch_uid='expenses_close_request_connections')
+def close_request_connections(sender, **kwargs):
+    """
+    Closes the database connections of an ASGI request's thread when it
+    finishes (see the module docstring).
+    """
+    if isinstance(sender, type) and issubclass(sender, ASGIHandler):
+        for connection in connections.all(initialized_only=True):
+            connection.close()
+
+
+def _in_transaction():
+    """Whether a connection of the current thread is inside an atomic block."""
+    return any(connection.in_atomic_block for connection in connections.all(initialized_only=True))
+
+
+def _run_pooled(call):
+    """Runs ``call`` on a pooled thread, maintaining its connections like a request does."""
+    close_old_connections()
+    try:
+        return call()
+    finally:
+        close_old_connections()
+
+
+async def fetch(queryset):
+    """Evaluates ``queryset`` with async iteration and returns its rows as a list."""
+    return [row async for row in queryset]
+
+
+async def gather(*work):
+    """
+    Runs independent reads at the same time and returns their results, in
+    order.
+
+    Args:
+        *work: Coroutines, awaited as they are (async ORM calls in them run
+            on the request's thread), and callables taking no arguments,
+            run on pooled threads with their own connections (see the
+            module docstring)
+
+    Returns:
+        list: The result of each item of ``work``
+    """
+    separate = not await sync_to_async(_in_transaction)()
+    awaitables = []
+    for item in work:
+        if inspect.isawaitable(item):
+            awaitables.append(item)
+        elif separate:
+            awaitables.append(sync_to_async(_run_pooled, thread_sensitive=False, executor=executor())(item))
+        else:
+            awaitables.append(sync_to_async(item)())
+    return await asyncio.gather(*awaitables)
+
+
+async def aiterate(iterable):
+    """
+    Iterates a sync iterable from async code, one item at a time.
+
+    Each item is read through sync_to_async on the request's thread, where
+    the view ran, so a generator reading a server-side cursor keeps using
+    the connection (and transaction) it opened.
+    """
+    iterator = iter(iterable)
+    done = object()
+    step = sync_to_async(next)
+    while (item := await step(iterator, done)) is not done:
+        yield item
+
+
+def async_streaming(request, response):
+    """
+    Returns ``response`` with an async iterator (``aiterate``) in place of
+    its sync one when ``request`` is served by ASGI (see the module
+    docstring); other responses are returned as they are.
+
+    The sync iterator is still closed by ``response.close()``, which Django
+    calls once the body has been sent or the client has gone.
+    """
+    if isinstance(request, ASGIRequest) and response.streaming and not response.is_async:
+        response.streaming_content = aiterate(response.streaming_content)
+    return response
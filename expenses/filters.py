@@ -0,0 +1,130 @@
+"""
+Query-string filters for expense listings and reports.
+
+Filters are parsed once from the request and then applied to a queryset as
+SQL conditions, so only matching rows ever leave the database.
+"""
+
+from django import forms
+from django.core.exceptions import ValidationError
+
+from . import catalog, search
+
+# Query parameter names mapped to the form field used to clean each value
+FILTER_FIELDS = {
+    'date_from': forms.DateField(required=False),
+    'date_to': forms.DateField(required=False),
+    'category': forms.IntegerField(required=False, min_value=1),
+    'min_amount': forms.DecimalField(required=False, max_digits=10, decimal_places=2),
+    'max_amount': forms.DecimalField(required=False, max_digits=10, decimal_places=2),
+    'q': forms.CharField(required=False, max_length=search.MAX_QUERY_LENGTH),
+}
+
+
+class ExpenseFilters:
+    """
+    A validated set of expense filters.
+
+    Attributes:
+        date_from (date|None): Only include expenses on or after this date
+        date_to (date|None): Only include expenses on or before this date
+        category (int|None): Only include expenses in this category id
+        min_amount (Decimal|None): Only include expenses of at least this amount
+        max_amount (Decimal|None): Only include expenses of at most this amount
+        q (str|None): Full-text search query (see expenses/search.py)
+    """
+
+    def __init__(self, date_from=None, date_to=None, category=None,
+                 min_amount=None, max_amount=None, q=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.category = category
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        # Blank or punctuation-only queries do not filter anything
+        self.search_terms = search.parse_terms(q)
+        self.q = q.strip() if self.search_terms else None
+
+    @classmethod
+    def from_query(cls, params):
+        """
+        Parses filters from a QueryDict (or any mapping of strings).
+
+        Empty and missing parameters are ignored.
+
+        Raises:
+            ValidationError: If a value cannot be parsed or the ranges are inverted
+        """
+        values = {}
+        errors = []
+        for name, field in FILTER_FIELDS.items():
+            try:
+                values[name] = field.clean(params.get(name) or None)
+            except ValidationError as e:
+                errors.append(f"{name.replace('_', ' ').capitalize()}: {' '.join(e.messages)}")
+        if errors:
+            raise ValidationError(errors)
+
+        filters = cls(**values)
+        if filters.date_from and filters.date_to and filters.date_from > filters.date_to:
+            raise ValidationError('Start date must be on or before end date.')
+        if filters.min_amount is not None and filters.max_amount is not None \
+                and filters.min_amount > filters.max_amount:
+            raise ValidationError('Minimum amount must not exceed maximum amount.')
+        return filters
+
+    def __bool__(self):
+        """True if at least one filter is set."""
+        return any(value is not None for value in self.as_dict().values())
+
+    def as_dict(self):
+        """Returns the filters as a dictionary keyed by parameter name."""
+        return {name: getattr(self, name) for name in FILTER_FIELDS}
+
+    def as_query(self):
+        """Returns the non-empty filters as strings, suitable for a query string."""
+        return {
+            name: value.isoformat() if hasattr(value, 'isoformat') else str(value)
+            for name, value in self.as_dict().items()
+            if value is not None
+        }
+
+    def apply(self, queryset):
+        """Narrows an Expense queryset down to the rows matching these filters."""
+        if self.date_from:
+            queryset = queryset.filter(date__gte=self.date_from)
+        if self.date_to:
+            queryset = queryset.filter(date__lte=self.date_to)
+        if self.category:
+            queryset = queryset.filter(category_id=self.category)
+        if self.min_amount is not None:
+            queryset = queryset.filter(amount__gte=self.min_amount)
+        if self.max_amount is not None:
+            queryset = queryset.filter(amount__lte=self.max_amount)
+        if self.search_terms:
+            queryset = search.matching(queryset, self.search_terms)
+        return queryset
+
+    def describe(self):
+        """
+        Returns a short human-readable summary, e.g. for a report header.
+
+        Example:
+            "01 Apr 2025 to 30 Apr 2025, Category: Food"
+        """
+        parts = []
+        if self.date_from and self.date_to:
+            parts.append(f"{self.date_from.strftime('%d %b %Y')} to {self.date_to.strftime('%d %b %Y')}")
+        elif self.date_from:
+            parts.append(f"From {self.date_from.strftime('%d %b %Y')}")
+        elif self.date_to:
+            parts.append(f"Up to {self.date_to.strftime('%d %b %Y')}")
+        if self.category:
+            parts.append(f"Category: {catalog.name(self.category, 'Unknown')}")
+        if self.min_amount is not None:
+            parts.append(f"Min amount: {self.min_amount}")
+        if self.max_amount is not None:
+            parts.append(f"Max amount: {self.max_amount}")
+        if self.q:
+            parts.append(f'Matching "{self.q}"')
+        return ', '.join(parts)
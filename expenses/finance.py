@@ -0,0 +1,357 @@
+"""
+Financial calculators: EMI, amortization schedules, prepayment scenarios,
+GST breakdowns and bill splits.
+
+Every function takes scalars or NumPy arrays and broadcasts them against
+each other, so one call can evaluate thousands of loans, rates or amounts
+at once; back-office jobs use the functions directly and the calculators
+page and JSON API go through CALCULATORS, which validates a JSON payload
+and returns a JSON-serialisable result.
+
+Money is computed in floating point and rounded to paise on output, except
+for bill splits, which are done in integer paise so the shares add up to
+the total exactly.
+"""
+
+import numpy as np
+
+# Upper bounds on a single request, to keep the work per call bounded
+MAX_SCENARIOS = 100_000
+MAX_MONTHS = 600
+
+# GST slabs, in percent
+GST_RATES = (0, 3, 5, 12, 18, 28)
+
+
+class CalculatorError(ValueError):
+    """Raised for inputs a calculator cannot evaluate."""
+
+
+def to_array(value, name, minimum=None, maximum=None, integer=False):
+    """
+    Converts a scalar or (nested) list into a float or int64 array and checks its bounds.
+
+    Raises:
+        CalculatorError: If the value is not numeric, not finite, too large or out of range
+    """
+    try:
+        array = np.asarray(value, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise CalculatorError(f'{name} must be a number or a list of numbers')
+    if array.size > MAX_SCENARIOS:
+        raise CalculatorError(f'{name} has more than {MAX_SCENARIOS} values')
+    if not np.all(np.isfinite(array)):
+        raise CalculatorError(f'{name} must be finite')
+    if minimum is not None and np.any(array < minimum):
+        raise CalculatorError(f'{name} must be at least {minimum}')
+    if maximum is not None and np.any(array > maximum):
+        raise CalculatorError(f'{name} must be at most {maximum}')
+    if integer:
+        if np.any(array != np.floor(array)):
+            raise CalculatorError(f'{name} must be a whole number')
+        return array.astype(np.int64)
+    return array
+
+
+def money(values):
+    """Rounds to paise and returns plain Python numbers (or nested lists) for JSON."""
+    return np.round(values, 2).tolist()
+
+
+def monthly_rate(annual_rate):
+    """Annual percentage rate -> monthly rate as a fraction."""
+    return np.asarray(annual_rate, dtype=np.float64) / 12 / 100
+
+
+def emi(principal, annual_rate, months):
+    """
+    Equated monthly instalment of a loan: P·r·(1+r)^n / ((1+r)^n - 1), or
+    P / n for interest-free loans.
+    """
+    principal, months = np.broadcast_arrays(np.asarray(principal, dtype=np.float64), months)
+    rate = np.broadcast_to(monthly_rate(annual_rate), principal.shape)
+    growth = np.power(1 + rate, months)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amortizing = principal * rate * growth / (growth - 1)
+    return np.where(rate > 0, amortizing, principal / months)
+
+
+def balance_after(principal, rate, payment, k):
+    """Outstanding balance after ``k`` payments of ``payment`` at monthly ``rate``."""
+    if rate == 0:
+        return principal - payment * k
+    growth = np.power(1 + rate, k)
+    return principal * growth - payment * (growth - 1) / rate
+
+
+def amortization_schedule(principal, annual_rate, months, extra_monthly=0.0, lump_sums=None):
+    """
+    Month-by-month schedule of a single loan, with optional prepayments.
+
+    Balances are computed in closed form for each stretch between lump-sum
+    prepayments, so a 30-year schedule is a handful of array operations.
+    Prepayments shorten the loan; the instalment stays the same.
+
+    Args:
+        principal: Loan amount
+        annual_rate: Annual interest rate in percent
+        months: Original term in months
+        extra_monthly: Paid on top of every instalment
+        lump_sums: {month: amount} paid after that month's instalment
+
+    Returns:
+        dict of equally long arrays: month, payment, interest, principal,
+        prepayment and balance (after the month's payments), plus the
+        scalar 'emi'
+    """
+    rate = float(monthly_rate(annual_rate))
+    instalment = float(emi(principal, annual_rate, months))
+    payment = instalment + extra_monthly
+    lump_sums = {int(month): float(amount) for month, amount in (lump_sums or {}).items()
+                 if 0 < int(month) < months and amount > 0}
+
+    columns = {name: [] for name in ('month', 'payment', 'interest', 'principal', 'prepayment', 'balance')}
+    balance = float(principal)
+    start = 0
+    for end in sorted(lump_sums) + [months]:
+        if end <= start:
+            continue
+        k = np.arange(1, end - start + 1)
+        balances = balance_after(balance, rate, payment, k)
+        opening = np.concatenate(([balance], balances[:-1]))
+        payments = np.full(len(k), payment)
+
+        # The loan is repaid in the first month the balance would reach zero;
+        # that month's payment is whatever is left. Rounding can also leave a
+        # few paise after the last regular instalment.
+        paid_off = np.flatnonzero(balances <= 0.005)
+        if paid_off.size or end == months:
+            last = paid_off[0] if paid_off.size else len(k) - 1
+            k, opening, payments, balances = k[:last + 1], opening[:last + 1], payments[:last + 1], balances[:last + 1]
+            payments[-1] = opening[-1] * (1 + rate)
+            balances[-1] = 0.0
+
+        interest = opening * rate
+        prepayments = np.zeros(len(k))
+        if balances[-1] > 0 and end in lump_sums:
+            prepayments[-1] = min(lump_sums[end], balances[-1])
+            balances[-1] -= prepayments[-1]
+
+        for name, values in (('month', k + start), ('payment', payments), ('interest', interest),
+                             ('principal', payments - interest), ('prepayment', prepayments),
+                             ('balance', balances)):
+            columns[name].append(values)
+        balance = float(balances[-1])
+        start = end
+        if balance <= 0.005:
+            break
+
+    schedule = {name: np.concatenate(parts) for name, parts in columns.items()}
+    schedule['emi'] = instalment
+    return schedule
+
+
+def prepayment_scenarios(principal, annual_rate, months, extra_monthly):
+    """
+    Effect of paying ``extra_monthly`` on top of the instalment, for any
+    number of loans at once.
+
+    The payoff month n solves balance_after(P, r, EMI + extra, n) = 0, i.e.
+    n = -log(1 - r·P / payment) / log(1 + r), rounded up.
+
+    Returns:
+        dict of arrays: emi, months (to payoff), months_saved,
+        total_interest and interest_saved
+    """
+    principal, annual_rate, months, extra = np.broadcast_arrays(
+        np.asarray(principal, dtype=np.float64), annual_rate, months,
+        np.asarray(extra_monthly, dtype=np.float64),
+    )
+    rate = monthly_rate(annual_rate)
+    instalment = emi(principal, annual_rate, months)
+    payment = instalment + extra
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exact = np.where(
+            rate > 0,
+            -np.log1p(-rate * principal / payment) / np.log1p(rate),
+            principal / payment,
+        )
+    # Guard against 359.9999... becoming 360 + 1
+    payoff = np.minimum(np.ceil(np.round(exact, 9)), months).astype(np.int64)
+
+    # Everything before the last payment, plus the remainder with its interest
+    growth = np.power(1 + rate, payoff - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        remaining = np.where(rate > 0, principal * growth - payment * (growth - 1) / rate,
+                             principal - payment * (payoff - 1))
+    total_paid = payment * (payoff - 1) + remaining * (1 + rate)
+    total_interest = total_paid - principal
+    baseline_interest = instalment * months - principal
+    return {
+        'emi': instalment,
+        'months': payoff,
+        'months_saved': months - payoff,
+        'total_interest': total_interest,
+        'interest_saved': baseline_interest - total_interest,
+    }
+
+
+def gst_breakdown(amount, rate, inclusive=False, inter_state=False):
+    """
+    Splits amounts into base, GST and total.
+
+    Args:
+        amount: Base amount, or the GST-inclusive price when ``inclusive``
+        rate: GST rate in percent
+        inclusive: Whether ``amount`` already contains the GST
+        inter_state: IGST for supplies across states; otherwise the GST is
+            split equally into CGST and SGST
+
+    Returns:
+        dict of arrays: base, gst, total, cgst, sgst and igst
+    """
+    amount = np.asarray(amount, dtype=np.float64)
+    rate = np.asarray(rate, dtype=np.float64)
+    if inclusive:
+        base = amount * 100 / (100 + rate)
+    else:
+        base = np.broadcast_to(amount, np.broadcast_shapes(amount.shape, rate.shape))
+    gst = np.round(base * rate / 100, 2)
+    base = np.round(base, 2)
+    half = np.round(gst / 2, 2)
+    zero = np.zeros_like(gst)
+    return {
+        'base': base,
+        'gst': gst,
+        'total': base + gst,
+        'cgst': zero if inter_state else half,
+        'sgst': zero if inter_state else gst - half,
+        'igst': gst if inter_state else zero,
+    }
+
+
+def split_bill(total, weights):
+    """
+    Splits ``total`` in proportion to ``weights`` in whole paise.
+
+    Shares are rounded down and the paise left over go, one each, to the
+    largest remainders, so the shares always add up to the total exactly.
+
+    Returns:
+        float array of shares in rupees
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    paise = int(round(float(total) * 100))
+    exact = paise * weights / weights.sum()
+    shares = np.floor(exact).astype(np.int64)
+    leftover = paise - int(shares.sum())
+    if leftover:
+        shares[np.argsort(shares - exact, kind='stable')[:leftover]] += 1
+    return shares / 100
+
+
+# ------------------ JSON interface ------------------
+
+def _loan_inputs(payload):
+    return (
+        to_array(payload.get('principal'), 'principal', minimum=0.01),
+        to_array(payload.get('annual_rate', 0), 'annual_rate', minimum=0, maximum=100),
+        to_array(payload.get('months'), 'months', minimum=1, maximum=MAX_MONTHS, integer=True),
+    )
+
+
+def _broadcast(*arrays):
+    try:
+        return np.broadcast_arrays(*arrays)
+    except ValueError:
+        raise CalculatorError('List inputs must have the same length')
+
+
+def run_emi(payload):
+    """{principal, annual_rate, months} -> {emi, total_payment, total_interest}"""
+    principal, rate, months = _broadcast(*_loan_inputs(payload))
+    instalment = emi(principal, rate, months)
+    return {
+        'emi': money(instalment),
+        'total_payment': money(instalment * months),
+        'total_interest': money(instalment * months - principal),
+    }
+
+
+def run_schedule(payload):
+    """
+    {principal, annual_rate, months, extra_monthly?, lump_sums?: {month: amount}}
+    -> {emi, months, total_interest, total_paid, rows: {month, payment, ...}}
+    """
+    principal, rate, months = _loan_inputs(payload)
+    if principal.ndim or rate.ndim or months.ndim:
+        raise CalculatorError('A schedule is for a single loan; use prepayment for many')
+    extra = float(to_array(payload.get('extra_monthly', 0), 'extra_monthly', minimum=0))
+    lump_sums = payload.get('lump_sums') or {}
+    if not isinstance(lump_sums, dict):
+        raise CalculatorError('lump_sums must be an object of {month: amount}')
+    try:
+        lump_sums = {int(month): float(amount) for month, amount in lump_sums.items()}
+    except (TypeError, ValueError):
+        raise CalculatorError('lump_sums must be an object of {month: amount}')
+    schedule = amortization_schedule(float(principal), float(rate), int(months), extra, lump_sums)
+    instalment = schedule.pop('emi')
+    total_paid = schedule['payment'].sum() + schedule['prepayment'].sum()
+    return {
+        'emi': round(instalment, 2),
+        'months': len(schedule['month']),
+        'total_interest': round(float(schedule['interest'].sum()), 2),
+        'total_paid': round(float(total_paid), 2),
+        'rows': {
+            name: values.tolist() if name == 'month' else money(values)
+            for name, values in schedule.items()
+        },
+    }
+
+
+def run_prepayment(payload):
+    """{principal, annual_rate, months, extra_monthly} -> payoff and savings per scenario"""
+    principal, rate, months = _loan_inputs(payload)
+    extra = to_array(payload.get('extra_monthly', 0), 'extra_monthly', minimum=0)
+    principal, rate, months, extra = _broadcast(principal, rate, months, extra)
+    result = prepayment_scenarios(principal, rate, months, extra)
+    return {
+        name: values.tolist() if name in ('months', 'months_saved') else money(values)
+        for name, values in result.items()
+    }
+
+
+def run_gst(payload):
+    """{amount, rate, inclusive?, inter_state?} -> {base, gst, total, cgst, sgst, igst}"""
+    amount = to_array(payload.get('amount'), 'amount', minimum=0)
+    rate = to_array(payload.get('rate', 18), 'rate', minimum=0, maximum=100)
+    amount, rate = _broadcast(amount, rate)
+    result = gst_breakdown(amount, rate, bool(payload.get('inclusive')), bool(payload.get('inter_state')))
+    return {name: money(values) for name, values in result.items()}
+
+
+def run_split(payload):
+    """{total, people} or {total, weights: [...]} -> {shares: [...]}"""
+    total = to_array(payload.get('total'), 'total', minimum=0)
+    if total.ndim:
+        raise CalculatorError('total must be a single amount')
+    if payload.get('weights') is not None:
+        weights = to_array(payload['weights'], 'weights', minimum=0)
+        if weights.ndim != 1 or not weights.size or not weights.sum():
+            raise CalculatorError('weights must be a non-empty list with a positive sum')
+    else:
+        people = to_array(payload.get('people'), 'people', minimum=1, maximum=MAX_SCENARIOS, integer=True)
+        if people.ndim:
+            raise CalculatorError('people must be a single number')
+        weights = np.ones(int(people))
+    return {'total': round(float(total), 2), 'shares': money(split_bill(float(total), weights))}
+
+
+# Calculator name -> handler taking the JSON payload and returning the result
+CALCULATORS = {
+    'emi': run_emi,
+    'schedule': run_schedule,
+    'prepayment': run_prepayment,
+    'gst': run_gst,
+    'split': run_split,
+}
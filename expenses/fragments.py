@@ -0,0 +1,124 @@
+"""
+Per-user cache of rendered page fragments.
+
+The parts of the home page and the expense list that take queries (the
+recent expenses card, the totals cards and each page of table rows) depend
+on nothing but the user's own data. They are rendered once and cached under
+a key containing the user's data token, which changes on every write to
+their expenses (see expenses/versions.py). A write never has to find and
+delete the fragments it made stale: later requests look under new keys, and
+the old entries expire after FRAGMENT_CACHE_TIMEOUT or are culled first.
+
+The token comes from wherever the cache can be kept current:
+
+* With a per-process cache (LocMemCache, the default) it is the user's data
+  version, read from the database: another worker's write never reaches
+  this process's cache. A cached page costs that one primary key lookup
+  instead of its own queries.
+* With a cache shared by all workers (FileBasedCache, Redis, Memcached) it
+  is kept in that cache and replaced once a write has committed, so a page
+  whose fragments are cached is served with no database access beyond the
+  session and user lookups of authentication.
+
+Fragments are rendered without the request, so they never contain
+per-request values such as CSRF tokens. Keys also include the user's join
+time, so a reused user id cannot reach a deleted user's fragments, and a
+digest of the fragment's template, so a deploy that changes it does not
+serve the old markup.
+
+Settings:
+    FRAGMENT_CACHE_TIMEOUT: Lifetime of a cached fragment, in seconds
+        (default one day); 0 turns the fragment cache off
+"""
+
+import hashlib
+from functools import cache as memoize
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+
+from . import versions
+
+DEFAULT_TIMEOUT = 24 * 60 * 60
+
+KEY_PREFIX = 'expenses:fragment'
+
+
+def timeout():
+    """Returns FRAGMENT_CACHE_TIMEOUT, in seconds (0 when caching is off)."""
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+@memoize
+def template_digest(template_name):
+    """Returns a short hash of a template's source, read once per process."""
+    source = get_template(template_name).template.source
+    return hashlib.md5(source.encode(), usedforsecurity=False).hexdigest()[:12]
+
+
+def key(request, template_name, *vary):
+    """
+    Returns the cache key of the requesting user's fragment rendered from
+    ``template_name``.
+
+    Args:
+        request: HttpRequest of an authenticated user
+        template_name: Template the fragment is rendered from
+        *vary: Anything else the fragment depends on, such as the sort order
+            or the month
+
+    Returns:
+        str: A key of bounded length, whatever ``vary`` holds
+
+    May query the database for the user's data version (see the module
+    docstring).
+    """
+    user = request.user
+    parts = (user.pk, user.date_joined.timestamp(), versions.token(request), template_digest(template_name), *vary)
+    digest = hashlib.md5('|'.join(map(str, parts)).encode(), usedforsecurity=False).hexdigest()
+    return f'{KEY_PREFIX}:{user.pk}:{digest}'
+
+
+def cached(request, template_name, build, *vary):
+    """
+    Returns the requesting user's fragment rendered from ``template_name``,
+    building it only if it is not cached for their current data.
+
+    Args:
+        request: HttpRequest of an authenticated user
+        template_name: Template the fragment is rendered from (part of the
+            key, see ``key``)
+        build: Callable returning the fragment: its HTML, or a dict holding
+            the HTML and whatever else goes with it (such as the cursor of
+            the next page); it runs the fragment's queries
+        *vary: Anything else the fragment depends on
+
+    Returns:
+        What ``build`` returned, now or when the fragment was cached
+    """
+    if not timeout():
+        return build()
+    fragment_key = key(request, template_name, *vary)
+    fragment = cache.get(fragment_key)
+    if fragment is None:
+        fragment = build()
+        cache.set(fragment_key, fragment, timeout())
+    return fragment
+
+
+async def acached(request, template_name, build, *vary):
+    """
+    Async version of ``cached``, for async views: ``build`` is a coroutine
+    function, and the data version is read on a pooled thread when the
+    token needs it.
+    """
+    if not timeout():
+        return await build()
+    fragment_key = await sync_to_async(key)(request, template_name, *vary)
+    fragment = await cache.aget(fragment_key)
+    if fragment is None:
+        fragment = await build()
+        await cache.aset(fragment_key, fragment, timeout())
+    return fragment
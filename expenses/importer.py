@@ -0,0 +1,386 @@
+"""
+Bulk import of expenses from CSV files and bank statements.
+
+The file is parsed as a stream, one row at a time, so its size never has to
+fit in memory. Rows are validated in batches of ``BATCH_SIZE``; each batch
+of valid rows is then inserted with one multi-row INSERT (or a COPY on
+PostgreSQL) and its summary deltas applied, all in one short transaction.
+Invalid rows are collected with their line numbers and skipped, so a few
+bad lines never abort the rest of the file.
+
+Because every batch commits on its own, an import interrupted halfway keeps
+the batches that were already written.
+
+Recognised columns (header names are case-insensitive, see COLUMN_ALIASES):
+    date (required): YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY, DD/MM/YY or DD-Mon-YYYY
+    amount (required): e.g. 1234.50, "1,234.50" or "Rs. 1,234.50"
+    title (required): Up to 100 characters
+    category: Name of an existing category (blank for uncategorized)
+    time: HH:MM or HH:MM:SS (defaults to midnight)
+    description: Free text
+"""
+
+import csv
+import io
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator
+from django.db import connections, router, transaction
+
+from . import catalog, summaries, versions
+from .models import Expense
+from .money import to_paise
+
+# Rows validated and written per transaction
+BATCH_SIZE = 2000
+
+# At most this many invalid rows are reported individually
+MAX_REPORTED_ERRORS = 100
+
+# Header names accepted for each column, including common bank statement exports
+COLUMN_ALIASES = {
+    'date': ('date', 'transaction date', 'txn date', 'value date'),
+    'time': ('time',),
+    'title': ('title', 'name', 'payee', 'narration', 'particulars', 'details'),
+    'amount': ('amount', 'debit', 'withdrawal', 'withdrawal amt.', 'withdrawal amount', 'debit amount'),
+    'category': ('category',),
+    'description': ('description', 'notes', 'note', 'remarks', 'memo'),
+}
+REQUIRED_COLUMNS = ('date', 'title', 'amount')
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%b-%Y', '%d %b %Y')
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p')
+
+# Currency decorations stripped from amounts before parsing
+AMOUNT_NOISE = ('₹', 'Rs.', 'Rs', 'INR', ',', ' ')
+
+# Same limits as Expense.amount, checked without a full field clean per row
+AMOUNT_VALIDATOR = DecimalValidator(
+    Expense._meta.get_field('amount').max_digits, Expense._meta.get_field('amount').decimal_places
+)
+TITLE_MAX_LENGTH = Expense._meta.get_field('title').max_length
+
+# Expense columns written by COPY, in order
+COPY_COLUMNS = ('user_id', 'category_id', 'title', 'amount', 'description', 'date', 'time')
+
+
+class ImportFileError(ValueError):
+    """Raised when a file cannot be imported at all (e.g. missing columns)."""
+
+
+class ImportResult:
+    """
+    Outcome of an import.
+
+    Attributes:
+        imported (int): Number of expenses written
+        failed (int): Number of rows rejected
+        errors (list): (line number, message) for the first MAX_REPORTED_ERRORS rejected rows
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def as_dict(self):
+        """Returns the result as a JSON-serialisable dictionary."""
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors],
+        }
+
+
+class CategoryLookup:
+    """
+    Case-insensitive category name to id mapping, taken from the category
+    catalog once per import.
+
+    Example:
+        lookup = CategoryLookup()
+        lookup.resolve(' food ')  # -> id of "Food"
+    """
+
+    def __init__(self):
+        self.ids = catalog.get_catalog().ids
+
+    def resolve(self, name):
+        """
+        Returns the id of the category called ``name``, or None if blank.
+
+        Raises:
+            ValidationError: If no category has that name
+        """
+        name = (name or '').strip()
+        if not name:
+            return None
+        try:
+            return self.ids[name.casefold()]
+        except KeyError:
+            raise ValidationError(f"Unknown category '{name}'")
+
+
+def map_columns(header):
+    """
+    Maps the canonical column names to their positions in a CSV header.
+
+    Raises:
+        ImportFileError: If a required column is missing
+    """
+    positions = {}
+    normalized = [(name or '').strip().casefold() for name in header]
+    for column, aliases in COLUMN_ALIASES.items():
+        for index, name in enumerate(normalized):
+            if name in aliases:
+                positions[column] = index
+                break
+    missing = [column for column in REQUIRED_COLUMNS if column not in positions]
+    if missing:
+        raise ImportFileError(f"Missing required column(s): {', '.join(missing)}")
+    return positions
+
+
+@lru_cache(maxsize=4096)
+def _parse_with_formats(value, formats, kind):
+    # Statements repeat the same few dates and times on thousands of rows,
+    # so parsed values are cached by their text
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValidationError(f"Invalid {kind} '{value}'")
+
+
+def parse_date(value):
+    """Parses a date in any of DATE_FORMATS."""
+    value = (value or '').strip()
+    if not value:
+        raise ValidationError('Date is required')
+    return _parse_with_formats(value, DATE_FORMATS, 'date').date()
+
+
+def parse_time(value):
+    """Parses a time in any of TIME_FORMATS; blank means midnight."""
+    value = (value or '').strip()
+    if not value:
+        return time(0, 0)
+    return _parse_with_formats(value, TIME_FORMATS, 'time').time()
+
+
+def parse_amount(value):
+    """Strips currency symbols and thousands separators and validates the amount."""
+    value = value or ''
+    for noise in AMOUNT_NOISE:
+        if noise in value:
+            value = value.replace(noise, '')
+    if not value:
+        raise ValidationError('Amount is required')
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError(f"Invalid amount '{value}'")
+    AMOUNT_VALIDATOR(amount)
+    return amount
+
+
+def parse_title(value):
+    """Validates a title: required and at most TITLE_MAX_LENGTH characters."""
+    value = (value or '').strip()
+    if not value:
+        raise ValidationError('Title is required')
+    if len(value) > TITLE_MAX_LENGTH:
+        raise ValidationError(f'Title is longer than {TITLE_MAX_LENGTH} characters')
+    return value
+
+
+class ExpenseRowParser:
+    """
+    Turns CSV rows into unsaved Expense instances for one user.
+
+    Args:
+        user: Owner of the imported expenses
+        positions: Column positions from map_columns
+        categories: CategoryLookup used to resolve category names
+    """
+
+    def __init__(self, user, positions, categories):
+        self.user = user
+        self.positions = positions
+        # (label, column, parser) for each validated value
+        self.parsers = (
+            ('Date', 'date', parse_date),
+            ('Time', 'time', parse_time),
+            ('Title', 'title', parse_title),
+            ('Amount', 'amount', parse_amount),
+            ('Category', 'category', categories.resolve),
+        )
+        # Expenses are built from positional values in concrete field order,
+        # which skips the keyword handling of Model.__init__ on every row
+        self.attnames = [field.attname for field in Expense._meta.concrete_fields]
+
+    def value(self, row, column):
+        index = self.positions.get(column)
+        if index is None or index >= len(row):
+            return ''
+        return row[index]
+
+    def parse(self, row):
+        """
+        Returns an unsaved Expense for ``row``.
+
+        Raises:
+            ValidationError: Listing every problem found in the row
+        """
+        errors = []
+        values = {'id': None, 'user_id': self.user.pk, 'description': self.value(row, 'description').strip()}
+        for label, column, parser in self.parsers:
+            try:
+                values[column] = parser(self.value(row, column))
+            except ValidationError as e:
+                errors.append(f"{label}: {' '.join(e.messages)}")
+        if errors:
+            raise ValidationError(errors)
+        values['category_id'] = values.pop('category')
+        return Expense(*[values[name] for name in self.attnames])
+
+
+def copy_expenses(connection, expenses):
+    """
+    Inserts expenses with PostgreSQL COPY, which is several times faster than
+    a multi-row INSERT for large batches.
+    """
+    buffer = io.StringIO()
+    # Strings are quoted so an empty description stays an empty string; the
+    # csv module writes None as "" as well, which FORCE_NULL turns back into
+    # NULL for the category
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for expense in expenses:
+        writer.writerow([
+            expense.user_id,
+            expense.category_id,
+            expense.title,
+            to_paise(expense.amount),  # COPY bypasses the field, so write paise
+            expense.description,
+            expense.date.isoformat(),
+            expense.time.isoformat(),
+        ])
+    buffer.seek(0)
+    table = connection.ops.quote_name(Expense._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(name) for name in COPY_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {table} ({columns}) FROM STDIN '
+            f'WITH (FORMAT csv, FORCE_NULL ({connection.ops.quote_name("category_id")}))',
+            buffer,
+        )
+
+
+def supports_copy(connection):
+    """True for PostgreSQL through psycopg2, whose cursors provide copy_expert."""
+    return connection.vendor == 'postgresql' and connection.Database.__name__ == 'psycopg2'
+
+
+def write_batch(expenses, use_copy=None):
+    """
+    Inserts one batch of validated expenses, its summary deltas and the
+    owner's data version bump atomically.
+
+    Args:
+        expenses: List of unsaved Expense instances
+        use_copy: Force COPY on or off; by default it is used when supported
+    """
+    if not expenses:
+        return
+    alias = router.db_for_write(Expense)
+    connection = connections[alias]
+    if use_copy is None:
+        use_copy = supports_copy(connection)
+    with transaction.atomic(using=alias):
+        if use_copy:
+            copy_expenses(connection, expenses)
+        else:
+            Expense.objects.using(alias).bulk_create(expenses)
+        summaries.record_bulk_insert(expenses)
+        versions.touch(*{expense.user_id for expense in expenses})
+
+
+def import_rows(user, rows, batch_size=BATCH_SIZE, dry_run=False, use_copy=None):
+    """
+    Validates and imports an iterable of CSV rows (the first being the header).
+
+    Args:
+        user: Owner of the imported expenses
+        rows: Iterable of lists of strings, e.g. a csv.reader
+        batch_size: Rows validated and written per transaction
+        dry_run: Validate only, without writing anything
+        use_copy: See write_batch
+
+    Returns:
+        ImportResult: Counts and row errors
+
+    Raises:
+        ImportFileError: If the header is missing or lacks required columns
+    """
+    rows = iter(rows)
+    try:
+        header = next(rows)
+    except StopIteration:
+        raise ImportFileError('The file is empty')
+    parser = ExpenseRowParser(user, map_columns(header), CategoryLookup())
+
+    result = ImportResult()
+    batch = []
+    # Line 1 is the header
+    for line, row in enumerate(rows, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            batch.append(parser.parse(row))
+        except ValidationError as e:
+            result.add_error(line, '; '.join(e.messages))
+            continue
+        if len(batch) >= batch_size:
+            if not dry_run:
+                write_batch(batch, use_copy)
+            result.imported += len(batch)
+            batch = []
+    if batch and not dry_run:
+        write_batch(batch, use_copy)
+    result.imported += len(batch)
+    return result
+
+
+def import_csv(user, stream, **kwargs):
+    """
+    Imports expenses from a CSV file.
+
+    Args:
+        user: Owner of the imported expenses
+        stream: Binary file object (e.g. an uploaded file), read incrementally
+        **kwargs: Passed on to import_rows
+
+    Returns:
+        ImportResult: Counts and row errors
+
+    Raises:
+        ImportFileError: If the file is not UTF-8 CSV with the required columns
+    """
+    # utf-8-sig drops the byte order mark spreadsheet programs like to add
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        return import_rows(user, csv.reader(text), **kwargs)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFileError(f'Could not read the file as UTF-8 CSV: {e}')
+    finally:
+        # Leave the underlying upload open for its owner to close
+        text.detach()
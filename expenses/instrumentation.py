@@ -0,0 +1,280 @@
+"""
+Query instrumentation and per-view query budgets.
+
+``record_queries`` captures every SQL statement run while it is active,
+together with duplicate statement patterns (the signature of an N+1 query)
+and the number of model instances loaded from the database. Each view has a
+declarative ``QueryBudget`` in ``VIEW_QUERY_BUDGETS``; the test suite checks
+the views against those budgets with seeded data, and in development
+``QueryBudgetMiddleware`` logs every request that goes over its budget.
+
+Transaction control statements (BEGIN, COMMIT, SAVEPOINT, ...) are recorded
+but do not count as queries.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.models.signals import post_init
+
+from . import api, pagination
+
+logger = logging.getLogger(__name__)
+
+# Statements that manage transactions rather than read or write data
+TRANSACTION_CONTROL = re.compile(r'^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+
+# Placeholder lists of any length, so IN (...) queries compare equal
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+
+
+def query_pattern(sql):
+    """Normalises a parametrised SQL statement so repeated queries compare equal."""
+    return PLACEHOLDER_LIST.sub('(%s, ...)', ' '.join(sql.split()))
+
+
+class QueryStats:
+    """
+    What happened in the database while a recorder was active.
+
+    Attributes:
+        queries (list): (sql, params, duration in seconds) of every statement
+        rows_by_model (Counter): Model instances loaded, keyed by model label
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.rows_by_model = Counter()
+
+    @property
+    def data_queries(self):
+        """Statements excluding transaction control."""
+        return [q for q in self.queries if not TRANSACTION_CONTROL.match(q[0])]
+
+    @property
+    def count(self):
+        """Number of queries that read or wrote data."""
+        return len(self.data_queries)
+
+    @property
+    def duration(self):
+        """Total time spent executing statements, in seconds."""
+        return sum(q[2] for q in self.queries)
+
+    @property
+    def rows(self):
+        """Total number of model instances loaded."""
+        return sum(self.rows_by_model.values())
+
+    @property
+    def duplicates(self):
+        """Query patterns executed more than once, with their repeat counts."""
+        patterns = Counter(query_pattern(sql) for sql, _, _ in self.data_queries)
+        return {pattern: n for pattern, n in patterns.items() if n > 1}
+
+    def summary(self):
+        """Returns a one-line description suitable for logs."""
+        return (
+            f'{self.count} queries in {self.duration * 1000:.1f}ms, '
+            f'{self.rows} rows, {len(self.duplicates)} duplicated pattern(s)'
+        )
+
+
+class record_queries:
+    """
+    Context manager recording the queries run by the current thread.
+
+    Example:
+        with record_queries() as stats:
+            client.get('/list/')
+        assert stats.count <= 4
+    """
+
+    def __init__(self, using=None):
+        self.aliases = [using] if using else list(connections)
+        self.stats = QueryStats()
+        self._thread = None
+        self._wrappers = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper installed on each database connection."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.stats.queries.append((sql, params, time.perf_counter() - start))
+
+    def _count_instance(self, sender, **kwargs):
+        # Instances are only created this way when rows come back from a query
+        # or when code builds them itself; both cost memory in this request.
+        if threading.get_ident() == self._thread:
+            self.stats.rows_by_model[sender._meta.label] += 1
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        for alias in self.aliases:
+            wrapper = connections[alias].execute_wrapper(self)
+            wrapper.__enter__()
+            self._wrappers.append(wrapper)
+        post_init.connect(self._count_instance, weak=False)
+        return self.stats
+
+    def __exit__(self, *exc_info):
+        post_init.disconnect(self._count_instance)
+        while self._wrappers:
+            self._wrappers.pop().__exit__(*exc_info)
+        return False
+
+
+class QueryBudget:
+    """
+    The most database work a view may do, independent of how much data
+    the user has.
+
+    Attributes:
+        max_queries (int): Maximum number of data queries
+        max_duplicates (int): Maximum number of repeated query patterns (N+1)
+        max_rows (int|None): Maximum number of model instances loaded
+    """
+
+    def __init__(self, max_queries, max_duplicates=0, max_rows=None):
+        self.max_queries = max_queries
+        self.max_duplicates = max_duplicates
+        self.max_rows = max_rows
+
+    def violations(self, stats):
+        """Returns a list of human-readable budget violations (empty if within budget)."""
+        problems = []
+        if stats.count > self.max_queries:
+            problems.append(f'{stats.count} queries (budget {self.max_queries})')
+        duplicates = stats.duplicates
+        if len(duplicates) > self.max_duplicates:
+            problems.append(
+                f'{len(duplicates)} duplicated query pattern(s) (budget {self.max_duplicates}): '
+                + '; '.join(f'{n}x {pattern[:120]}' for pattern, n in duplicates.items())
+            )
+        if self.max_rows is not None and stats.rows > self.max_rows:
+            problems.append(f'{stats.rows} rows loaded (budget {self.max_rows}): {dict(stats.rows_by_model)}')
+        return problems
+
+
+# Session and user lookups done by the auth middleware for every logged-in
+# request, included in each budget below
+AUTH_QUERIES = 2
+AUTH_ROWS = 2
+
+# One page of the expense list plus the look-ahead row; categories come
+# from the in-memory catalog, not from the database
+PAGE_ROWS = pagination.DEFAULT_PAGE_SIZE + 1
+
+# The data version keying the fragment cache (expenses/fragments.py): with
+# a per-process cache it is read before anything else, and a page whose
+# fragments are all cached runs only that query
+VERSION_QUERIES = 1
+
+# Query budgets per URL name, enforced by the tests against seeded data.
+# Categories are served from the catalog (expenses/catalog.py), so none of
+# these include a category query once the catalog is warm. The home page and
+# list budgets are those of a fragment cache miss.
+VIEW_QUERY_BUDGETS = {
+    # recent expenses + this month's breakdown + overall total
+    'expenses:home': QueryBudget(
+        max_queries=AUTH_QUERIES + VERSION_QUERIES + 3,
+        max_rows=AUTH_ROWS + VERSION_QUERIES + 5,
+    ),
+    # category breakdown (which also gives the total) + one page
+    'expenses:expense_list': QueryBudget(
+        max_queries=AUTH_QUERIES + VERSION_QUERIES + 2,
+        max_rows=AUTH_ROWS + VERSION_QUERIES + PAGE_ROWS,
+    ),
+    'expenses:expense_list_page': QueryBudget(
+        max_queries=AUTH_QUERIES + VERSION_QUERIES + 1,
+        max_rows=AUTH_ROWS + VERSION_QUERIES + PAGE_ROWS,
+    ),
+    # GET: nothing; POST: insert, summary upsert and data version bump (each
+    # an UPDATE, plus an INSERT the first time)
+    'expenses:add_expense': QueryBudget(
+        max_queries=AUTH_QUERIES + 5,
+        max_rows=AUTH_ROWS + 2,
+    ),
+    # ownership lookup, delete, summary bucket lock + update + min/max
+    # refresh, data version bump
+    'expenses:delete_expense': QueryBudget(
+        max_queries=AUTH_QUERIES + 7,
+        max_rows=AUTH_ROWS + 3,
+    ),
+    # GET: data version + one page; POST: as add_expense
+    'expenses:api_expenses': QueryBudget(
+        max_queries=AUTH_QUERIES + 5,
+        max_rows=AUTH_ROWS + api.MAX_PAGE_SIZE + 1,
+    ),
+    # GET: data version + the expense; DELETE: as delete_expense
+    'expenses:api_expense_detail': QueryBudget(
+        max_queries=AUTH_QUERIES + 7,
+        max_rows=AUTH_ROWS + 3,
+    ),
+    'expenses:api_categories': QueryBudget(
+        max_queries=AUTH_QUERIES,
+        max_rows=AUTH_ROWS,
+    ),
+    # data version + breakdown from the summary table
+    'expenses:api_totals': QueryBudget(
+        max_queries=AUTH_QUERIES + 2,
+        max_rows=AUTH_ROWS,
+    ),
+    # One values_list query feeds every series; tuples are not model instances
+    'expenses:analytics': QueryBudget(
+        max_queries=AUTH_QUERIES + 1,
+        max_rows=AUTH_ROWS,
+    ),
+    # data version + the values_list query
+    'expenses:api_analytics': QueryBudget(
+        max_queries=AUTH_QUERIES + 2,
+        max_rows=AUTH_ROWS,
+    ),
+    # Pure computation
+    'expenses:api_calculate': QueryBudget(
+        max_queries=AUTH_QUERIES,
+        max_rows=AUTH_ROWS,
+    ),
+    # Rows stream through an iterator, so rendering a bill is a fixed number
+    # of queries; the rows themselves are bounded by the PDF chunking instead
+    'expenses:generate_bill': QueryBudget(
+        max_queries=AUTH_QUERIES + 3,
+    ),
+}
+
+
+class QueryBudgetMiddleware:
+    """
+    Records the queries of every request and logs budget violations.
+
+    Enabled when settings.QUERY_INSTRUMENTATION is true (defaults to DEBUG);
+    otherwise Django drops it from the middleware chain at startup, so it
+    costs nothing in production.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as stats:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        budget = VIEW_QUERY_BUDGETS.get(view_name)
+        problems = budget.violations(stats) if budget else []
+        if problems:
+            logger.warning('%s over query budget: %s', view_name, ' | '.join(problems))
+        else:
+            logger.debug('%s: %s', view_name, stats.summary())
+        return response
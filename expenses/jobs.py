@@ -0,0 +1,214 @@
+"""
+Database-backed background queue for PDF bill generation.
+
+Web requests only insert a BillJob row. A separate worker process (the
+``run_bill_worker`` management command) claims queued jobs, renders the PDF
+and stores it, so CPU-heavy ReportLab work never ties up web workers. No
+external broker is needed: the job table itself is the queue.
+
+Settings (all optional):
+    BILL_JOB_CONCURRENCY: Maximum number of jobs rendering at once (default 2)
+    BILL_JOB_MAX_ATTEMPTS: Attempts before a job is marked failed (default 3)
+    BILL_JOB_RETRY_DELAY: Seconds before the first retry, doubled per attempt (default 30)
+    BILL_JOB_TIMEOUT: Seconds after which a running job is presumed dead (default 600)
+    BILL_JOB_RESULT_TTL: Seconds a finished PDF is kept (default 86400)
+    BILL_JOB_MAX_PENDING_PER_USER: Queued/running jobs allowed per user (default 3)
+"""
+
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import bills, routing
+from .filters import ExpenseFilters
+from .models import BillJob
+
+logger = logging.getLogger(__name__)
+
+
+def get_setting(name, default):
+    """Returns a BILL_JOB_* setting, falling back to ``default``."""
+    return getattr(settings, f'BILL_JOB_{name}', default)
+
+
+# PostgreSQL advisory lock held while a worker claims a job (see
+# claim_next_job); any number unique to this queue will do
+CLAIM_LOCK_ID = 0x62696c6c
+
+
+class TooManyJobs(Exception):
+    """Raised when a user already has the maximum number of pending jobs."""
+
+
+def enqueue_bill_job(user, filters):
+    """
+    Queues a bill for ``user`` and returns immediately.
+
+    Args:
+        user: User the bill is generated for
+        filters: ExpenseFilters restricting which expenses are billed
+
+    Returns:
+        BillJob: The newly queued job
+
+    Raises:
+        TooManyJobs: If the user already has too many queued or running jobs
+    """
+    pending = BillJob.objects.filter(
+        user=user, status__in=[BillJob.Status.QUEUED, BillJob.Status.RUNNING]
+    ).count()
+    if pending >= get_setting('MAX_PENDING_PER_USER', 3):
+        raise TooManyJobs('You already have bills being generated. Please wait for them to finish.')
+    return BillJob.objects.create(user=user, filters=filters.as_query())
+
+
+def claim_next_job():
+    """
+    Atomically moves the oldest runnable queued job to the running state.
+
+    No job is claimed while BILL_JOB_CONCURRENCY jobs are already running
+    across all workers. Claims are serialised (see ``lock_claims``), so two
+    workers cannot both see a free slot and together exceed the limit; the
+    SKIP LOCKED on PostgreSQL additionally keeps them off the same job.
+
+    Returns:
+        BillJob or None: The claimed job, or None if nothing can run now
+    """
+    using = router.db_for_write(BillJob)
+    with transaction.atomic(using=using):
+        lock_claims(using)
+        running = BillJob.objects.filter(status=BillJob.Status.RUNNING).count()
+        if running >= get_setting('CONCURRENCY', 2):
+            return None
+
+        job = (
+            BillJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=BillJob.Status.QUEUED, run_after__lte=timezone.now())
+            .order_by('run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = BillJob.Status.RUNNING
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'started_at'])
+        return job
+
+
+def lock_claims(using):
+    """
+    Waits until no other worker is claiming a job, for the rest of the
+    current transaction.
+
+    PostgreSQL takes a transaction-level advisory lock. SQLite serialises
+    write transactions, so starting with a write (an UPDATE of the nonexistent row 0)
+    makes the claim wait for the database's write lock instead of counting
+    running jobs that another claim is about to change.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CLAIM_LOCK_ID])
+    else:
+        BillJob.objects.using(using).filter(pk=0).update(status=BillJob.Status.QUEUED)
+
+
+def run_job(job_id):
+    """
+    Renders the PDF for a claimed job and stores the result.
+
+    On failure the job is re-queued with exponential backoff until it has
+    used BILL_JOB_MAX_ATTEMPTS attempts, after which it is marked failed.
+
+    Args:
+        job_id: Primary key of a job in the running state
+
+    Returns:
+        str: The job's final status for this attempt
+    """
+    job = BillJob.objects.select_related('user').get(pk=job_id)
+    try:
+        filters = ExpenseFilters.from_query(job.filters)
+        with tempfile.TemporaryFile() as output:
+            # Read from the replica unless the user has just written, keeping
+            # the server-side cursor inside a transaction (see generate_bill)
+            with routing.replica_reads(job.user_id) as alias, transaction.atomic(using=alias):
+                bills.write_bill(output, bills.bill_context(job.user, filters, timezone.now().date()))
+            output.seek(0)
+            job.result.save(f'bill-{job.pk}.pdf', File(output), save=False)
+    except Exception as e:
+        logger.exception('Bill job %s failed (attempt %s)', job.pk, job.attempts)
+        job.error = str(e)
+        if job.attempts < get_setting('MAX_ATTEMPTS', 3):
+            delay = get_setting('RETRY_DELAY', 30) * 2 ** (job.attempts - 1)
+            job.status = BillJob.Status.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = BillJob.Status.FAILED
+            job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'run_after', 'finished_at'])
+        return job.status
+
+    now = timezone.now()
+    job.status = BillJob.Status.DONE
+    job.error = ''
+    job.finished_at = now
+    job.expires_at = now + timedelta(seconds=get_setting('RESULT_TTL', 24 * 60 * 60))
+    job.save(update_fields=['status', 'error', 'result', 'finished_at', 'expires_at'])
+    return job.status
+
+
+def requeue_stale_jobs():
+    """
+    Puts jobs back in the queue whose worker died mid-render.
+
+    A job still marked running after BILL_JOB_TIMEOUT seconds is assumed
+    abandoned; it is retried if it has attempts left, otherwise failed.
+
+    Returns:
+        int: Number of jobs recovered
+    """
+    cutoff = timezone.now() - timedelta(seconds=get_setting('TIMEOUT', 600))
+    stale = BillJob.objects.filter(status=BillJob.Status.RUNNING, started_at__lt=cutoff)
+    retried = stale.filter(attempts__lt=get_setting('MAX_ATTEMPTS', 3)).update(
+        status=BillJob.Status.QUEUED, error='Worker timed out', run_after=timezone.now()
+    )
+    failed = stale.update(
+        status=BillJob.Status.FAILED, error='Worker timed out', finished_at=timezone.now()
+    )
+    return retried + failed
+
+
+def expire_jobs():
+    """
+    Deletes stored PDFs whose retention period has passed.
+
+    Finished jobs are kept as 'expired' rows (without the file) so a stale
+    status page can still explain what happened; failed jobs are removed
+    once they are older than the retention period.
+
+    Returns:
+        int: Number of jobs expired or removed
+    """
+    now = timezone.now()
+    count = 0
+    for job in BillJob.objects.filter(status=BillJob.Status.DONE, expires_at__lte=now).iterator():
+        if job.result:
+            job.result.delete(save=False)
+        job.status = BillJob.Status.EXPIRED
+        job.save(update_fields=['status', 'result'])
+        count += 1
+
+    cutoff = now - timedelta(seconds=get_setting('RESULT_TTL', 24 * 60 * 60))
+    deleted, _ = BillJob.objects.filter(
+        status__in=[BillJob.Status.FAILED, BillJob.Status.EXPIRED], created_at__lt=cutoff
+    ).delete()
+    return count + deleted
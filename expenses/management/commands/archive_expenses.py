@@ -0,0 +1,50 @@
+"""
+Management command that moves old expenses into the archive table.
+
+Usage:
+    python manage.py archive_expenses            # archive every user's old expenses
+    python manage.py archive_expenses --user 42  # one user only
+    python manage.py archive_expenses --dry-run  # report what would move
+
+Expenses dated before the start of the month EXPENSE_ARCHIVE_MONTHS months
+ago are archived. Archived expenses that are no longer that old (because the
+setting was raised, or removed to switch archiving off) are moved back.
+Run it regularly, e.g. nightly; each user is moved in its own transaction.
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from expenses import archive
+
+
+class Command(BaseCommand):
+    help = 'Move expenses older than EXPENSE_ARCHIVE_MONTHS into the archive table (and newer ones back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only process the user with this id')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report how many expenses would be archived and restored without moving any',
+        )
+
+    def handle(self, *args, **options):
+        user_id = options['user']
+        horizon = archive.cutoff()
+        if horizon is None:
+            self.stdout.write('Archiving is off (EXPENSE_ARCHIVE_MONTHS); archived expenses will be restored')
+        else:
+            self.stdout.write(f'Archiving expenses dated before {horizon:%d %b %Y}')
+
+        if options['dry_run']:
+            to_archive, to_restore = archive.pending_counts(user_id)
+            self.stdout.write(f'Would archive {to_archive} and restore {to_restore} expense(s)')
+            return
+
+        user_ids = [user_id] if user_id else User.objects.values_list('id', flat=True).iterator()
+        archived = restored = 0
+        for uid in user_ids:
+            moved = archive.archive_user(uid)
+            archived += moved[0]
+            restored += moved[1]
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} and restored {restored} expense(s)'))
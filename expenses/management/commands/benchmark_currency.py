@@ -0,0 +1,66 @@
+"""
+Management command that times the currency formatter.
+
+Usage:
+    python manage.py benchmark_currency                  # 1,000,000 amounts
+    python manage.py benchmark_currency --count 100000 --seed 7
+
+Formats the same random amounts (Decimals with two places, as loaded from
+the database, spread like real expenses from a few rupees to a few lakhs)
+three ways and reports the time each took:
+
+* legacy: the ``f"(Rs. {float(amount):,.2f})"`` formatting used before the
+  lakh/crore formatter (Western grouping, through a float)
+* per amount: ``currency.format_indian_currency`` called once per amount,
+  as templates do through the inr filter
+* bulk: ``currency.format_amounts`` over the whole list, as the PDF bills do
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from expenses.currency import format_amounts, format_indian_currency
+from expenses.money import from_paise
+
+
+def legacy_format(amount):
+    """The float-based formatting the currency module replaced."""
+    amount = float(amount)
+    if amount < 0:
+        return f"-(Rs. {abs(amount):,.2f})"
+    return f"(Rs. {amount:,.2f})"
+
+
+def timed(function, amounts):
+    """Returns the seconds ``function`` takes to format ``amounts``."""
+    started = time.perf_counter()
+    function(amounts)
+    return time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = 'Time lakh/crore currency formatting against the float f-string it replaced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1_000_000, help='Number of amounts to format')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the random amounts')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        rng = random.Random(options['seed'])
+        # Median around Rs. 80, with a long tail into lakhs
+        amounts = [from_paise(int(rng.lognormvariate(9, 1.5))) for _ in range(count)]
+
+        results = [
+            ('legacy', timed(lambda values: [legacy_format(amount) for amount in values], amounts)),
+            ('per amount', timed(lambda values: [format_indian_currency(amount) for amount in values], amounts)),
+            ('bulk', timed(format_amounts, amounts)),
+        ]
+        baseline = results[0][1]
+        self.stdout.write(f'Formatted {count} amounts:')
+        for name, seconds in results:
+            per_amount = seconds * 1e9 / count if count else 0
+            speedup = baseline / seconds if seconds else 0
+            self.stdout.write(f'  {name:<11} {seconds:8.3f}s  {per_amount:6.0f} ns/amount  {speedup:4.1f}x')
@@ -0,0 +1,80 @@
+"""
+Management command comparing one worker's concurrent throughput through
+WSGI and through ASGI.
+
+Usage:
+    python manage.py benchmark_throughput                         # 32 clients, 20 ms per statement
+    python manage.py benchmark_throughput --clients 64 --requests 500 --threads 8
+    python manage.py benchmark_throughput --db-latency-ms 0 --only home
+    python manage.py benchmark_throughput --output throughput.json
+
+Runs on the test databases (created and destroyed like ``manage.py test``
+does, DEBUG off), never on the configured data. See expenses/throughput.py
+for the modes compared and why statements are delayed.
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from expenses import throughput
+
+
+class Command(BaseCommand):
+    help = 'Compare the concurrent throughput of one WSGI worker and one ASGI worker on the async views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expenses', type=int, default=throughput.DEFAULT_EXPENSES,
+                            help='Expenses of the benchmark user')
+        parser.add_argument('--categories', type=int, default=throughput.DEFAULT_CATEGORIES)
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data')
+        parser.add_argument('--requests', type=int, default=throughput.DEFAULT_REQUESTS,
+                            help='Requests per view and mode')
+        parser.add_argument('--clients', type=int, default=throughput.DEFAULT_CLIENTS, help='Concurrent clients')
+        parser.add_argument('--threads', type=int, default=throughput.DEFAULT_THREADS,
+                            help='Threads of the threaded WSGI worker')
+        parser.add_argument('--db-latency-ms', type=float, default=throughput.DEFAULT_DB_LATENCY_MS,
+                            help='Delay added to every SQL statement, standing in for a remote database')
+        parser.add_argument('--only', action='append', choices=throughput.VIEWS,
+                            help='Only measure this view (repeatable)')
+        parser.add_argument('--output', help='Also write the report here as JSON')
+
+    def handle(self, *args, **options):
+        for name in ('requests', 'clients', 'threads'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be at least 1')
+        if options['db_latency_ms'] < 0:
+            raise CommandError('--db-latency-ms cannot be negative')
+
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            report = throughput.run(
+                expenses=options['expenses'],
+                categories=options['categories'],
+                seed=options['seed'],
+                requests=options['requests'],
+                clients=options['clients'],
+                threads=options['threads'],
+                db_latency_ms=options['db_latency_ms'],
+                views=options['only'],
+                progress=self.report_progress,
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        for view, results in report['views'].items():
+            gain = results['asgi']['requests_per_second'] / max(results['wsgi-threads']['requests_per_second'], 0.1)
+            self.stdout.write(self.style.SUCCESS(f'{view}: ASGI serves {gain:.1f}x the requests of {options["threads"]} WSGI threads'))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def report_progress(self, view, mode, result):
+        self.stdout.write(
+            f"{view:<14} {mode:<13} {result['requests_per_second']:>8.1f} req/s  "
+            f"p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  status {result['status']}"
+        )
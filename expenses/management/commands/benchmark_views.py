@@ -0,0 +1,121 @@
+"""
+Management command that benchmarks every view end to end.
+
+Usage:
+    python manage.py benchmark_views                              # defaults, report to benchmark-results.json
+    python manage.py benchmark_views --users 5 --expenses 20000 --categories 12
+    python manage.py benchmark_views --baseline benchmarks/baseline.json
+    python manage.py benchmark_views --save-baseline benchmarks/baseline.json
+    python manage.py benchmark_views --only expense_list --pdf-rows ""
+    python manage.py benchmark_views --seed 3 --end-date 2025-06-30
+
+The suite runs on the test databases (created and destroyed like
+``manage.py test`` does, DEBUG off), never on the configured data. See
+expenses/benchmarks.py for what is measured. With --baseline the command
+fails (exit status 1) when a scenario regressed by more than --threshold,
+and seeds the data the baseline was measured on: its seed and end date are
+used unless --seed or --end-date say otherwise. Without a baseline the data
+ends today.
+"""
+
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from expenses import benchmarks
+
+
+def parse_rows(value):
+    """Parses a comma separated list of row counts ('' for none)."""
+    try:
+        return tuple(int(part) for part in value.split(',') if part.strip())
+    except ValueError:
+        raise CommandError(f"Invalid row counts '{value}'")
+
+
+def parse_date(value):
+    """Parses a YYYY-MM-DD date."""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every view (latency, queries, memory, response size) and compare against a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=benchmarks.DEFAULT_USERS)
+        parser.add_argument('--expenses', type=int, default=benchmarks.DEFAULT_EXPENSES_PER_USER,
+                            help='Expenses per user')
+        parser.add_argument('--categories', type=int, default=benchmarks.DEFAULT_CATEGORIES)
+        parser.add_argument('--repeat', type=int, default=benchmarks.DEFAULT_REPEAT, help='Timed runs per scenario')
+        parser.add_argument('--warmup', type=int, default=benchmarks.DEFAULT_WARMUP)
+        parser.add_argument('--seed', type=int, help="Seed of the generated data (default the baseline's, or 0)")
+        parser.add_argument('--end-date', type=parse_date,
+                            help="Last day of the generated data, YYYY-MM-DD (default the baseline's, or today)")
+        parser.add_argument('--pdf-rows', type=parse_rows,
+                            default=benchmarks.DEFAULT_PDF_ROWS,
+                            help='Comma separated bill sizes for the PDF benchmarks ("" to skip them)')
+        parser.add_argument('--only', help='Only run scenarios whose name contains this text')
+        parser.add_argument('--output', default='benchmark-results.json', help='Where to write the report')
+        parser.add_argument('--baseline', help='Report to compare against')
+        parser.add_argument('--threshold', type=float, default=benchmarks.DEFAULT_THRESHOLD,
+                            help='Allowed relative growth before a metric counts as a regression')
+        parser.add_argument('--save-baseline', help='Also write the report here, as the new baseline')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+        dataset = (baseline or {}).get('dataset', {})
+        seed = options['seed'] if options['seed'] is not None else dataset.get('seed', 0)
+        end_date = options['end_date']
+        if end_date is None and dataset.get('end_date'):
+            end_date = parse_date(dataset['end_date'])
+
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            report = benchmarks.run_suite(
+                users=options['users'],
+                expenses_per_user=options['expenses'],
+                categories=options['categories'],
+                repeat=options['repeat'],
+                warmup=options['warmup'],
+                pdf_rows=options['pdf_rows'],
+                seed=seed,
+                end_date=end_date,
+                only=options['only'],
+                progress=self.report_progress,
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        for path in filter(None, (options['output'], options['save_baseline'])):
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Report written to {path}')
+
+        if baseline is not None:
+            regressions = benchmarks.compare(report, baseline, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(f'  {regression}')
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["baseline"]}'))
+
+    def report_progress(self, name, result):
+        self.stdout.write(
+            f"{name:<34} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+            f"{result['queries']:>3} queries  {result['peak_memory_kb']:>7} KB  {result['response_bytes']:>9} B"
+        )
@@ -0,0 +1,108 @@
+"""
+Management command that fills the database with synthetic users and expenses.
+
+Usage:
+    python manage.py generate_expenses --users 100 --expenses 1000000
+    python manage.py generate_expenses --users 1000 --expenses 10000000 --workers 8 --seed 7
+    python manage.py generate_expenses --users 10 --expenses 50000 --prefix demo --batch-size 5000
+    python manage.py generate_expenses --users 100 --expenses 1000000 --end-date 2025-06-30
+
+Creates users named ``<prefix>-1`` ... ``<prefix>-N`` (without usable
+passwords) and splits the expenses between them unevenly, like real
+activity. Dates, times, categories (the seeded Category names) and amounts
+follow realistic distributions over the two years up to --end-date (today
+by default); see expenses/synthetic.py. The same seed and --end-date always
+produce the same data, whatever --workers and --batch-size are.
+
+Each user is written in its own transaction with chunked multi-row INSERTs,
+and their summaries and data version are brought up to date with it. --workers
+spreads the users over that many processes; SQLite allows a single writer
+at a time, so there the users are always seeded one after the other.
+"""
+
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from expenses import synthetic
+from expenses.models import Category
+
+
+def parse_date(value):
+    """Parses a YYYY-MM-DD date."""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = 'Create synthetic users and realistic expenses for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Number of users to create')
+        parser.add_argument('--expenses', type=int, default=1_000_000, help='Total number of expenses')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data')
+        parser.add_argument(
+            '--end-date', type=parse_date, default=None,
+            help='Last day of the generated history, YYYY-MM-DD (default today)',
+        )
+        parser.add_argument('--workers', type=int, default=1, help='Processes inserting in parallel')
+        parser.add_argument(
+            '--batch-size', type=int, default=synthetic.BATCH_SIZE,
+            help=f'Expenses per INSERT statement (default {synthetic.BATCH_SIZE})',
+        )
+        parser.add_argument('--prefix', default='synthetic', help='Prefix of the generated usernames')
+
+    def handle(self, *args, **options):
+        for name in ('users', 'workers', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+        if options['expenses'] < 0 or options['seed'] < 0:
+            raise CommandError('--expenses and --seed cannot be negative')
+
+        prefix = options['prefix']
+        usernames = [f'{prefix}-{number}' for number in range(1, options['users'] + 1)]
+        taken = User.objects.filter(username__in=usernames).count()
+        if taken:
+            raise CommandError(f"{taken} user(s) named '{prefix}-N' already exist; choose another --prefix")
+        pool = list(Category.objects.order_by('id'))
+        if not pool:
+            raise CommandError('There are no categories; run migrate first')
+
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stderr.write('SQLite allows one writer at a time; seeding with a single process')
+            workers = 1
+
+        users = synthetic.create_users(options['users'], prefix=prefix)
+        if not all(user.pk for user in users):
+            # Backends that do not return ids from bulk inserts
+            users = list(User.objects.filter(username__in=usernames).order_by('id'))
+        counts = synthetic.split_counts(options['expenses'], len(users), seed=options['seed'])
+
+        self.started = time.perf_counter()
+        self.written = 0
+        self.total = options['expenses']
+        synthetic.generate(
+            users, counts, pool,
+            seed=options['seed'],
+            end_date=options['end_date'] or timezone.localdate(),
+            workers=workers,
+            batch_size=options['batch_size'],
+            progress=self.report_progress,
+        )
+        seconds = time.perf_counter() - self.started
+        rate = self.total / seconds if seconds else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} user(s) and {self.total} expense(s) in {seconds:.1f}s ({rate:,.0f} rows/s)'
+        ))
+
+    def report_progress(self, user_id, count):
+        self.written += count
+        seconds = time.perf_counter() - self.started
+        self.stdout.write(f'  user {user_id}: {count} expense(s)  [{self.written}/{self.total}, {seconds:.1f}s]')
@@ -0,0 +1,56 @@
+"""
+Management command that bulk-imports expenses for a user from a CSV file.
+
+Usage:
+    python manage.py import_expenses statement.csv --user alice
+    python manage.py import_expenses statement.csv --user alice --dry-run
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses import importer
+
+
+class Command(BaseCommand):
+    help = 'Import expenses for a user from a CSV file or bank statement export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import')
+        parser.add_argument('--user', required=True, help='Username of the owner of the expenses')
+        parser.add_argument(
+            '--batch-size', type=int, default=importer.BATCH_SIZE,
+            help=f'Rows validated and written per transaction (default {importer.BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Validate the file and report errors without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = importer.import_csv(
+                    user, stream, batch_size=options['batch_size'], dry_run=options['dry_run'],
+                )
+        except OSError as e:
+            raise CommandError(f'Could not open {options["path"]}: {e}')
+        except importer.ImportFileError as e:
+            raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stderr.write(f'line {line}: {message}')
+        if result.failed > len(result.errors):
+            self.stderr.write(f'... and {result.failed - len(result.errors)} more invalid row(s)')
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.imported} expense(s) for {user.username}; {result.failed} row(s) skipped'
+        ))
@@ -0,0 +1,47 @@
+"""
+Management command that rebuilds or verifies the ExpenseSummary table.
+
+Usage:
+    python manage.py rebuild_expense_summaries            # rebuild every user
+    python manage.py rebuild_expense_summaries --user 42  # rebuild one user
+    python manage.py rebuild_expense_summaries --check    # report drift only
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses import summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user monthly/category expense summaries, or check them for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only process the user with this id')
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Report buckets that differ from the expenses without changing anything; '
+                 'exits with an error if drift is found',
+        )
+
+    def handle(self, *args, **options):
+        user_id = options['user']
+
+        if options['check']:
+            drift = summaries.find_drift(user_id)
+            for (uid, month, category_id), stored, expected in drift:
+                self.stdout.write(
+                    f'user={uid} month={month:%Y-%m} category={category_id}: '
+                    f'stored={stored} expected={expected}'
+                )
+            if drift:
+                raise CommandError(f'{len(drift)} summary bucket(s) out of date')
+            self.stdout.write(self.style.SUCCESS('Expense summaries are up to date'))
+            return
+
+        user_ids = [user_id] if user_id else User.objects.values_list('id', flat=True).iterator()
+        count = 0
+        for uid in user_ids:
+            summaries.rebuild_user(uid)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt expense summaries for {count} user(s)'))
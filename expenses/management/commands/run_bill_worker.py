@@ -0,0 +1,91 @@
+"""
+Management command that processes queued PDF bill jobs.
+
+Usage:
+    python manage.py run_bill_worker                 # run forever
+    python manage.py run_bill_worker --once          # drain the queue and exit
+    python manage.py run_bill_worker --concurrency 4 # render up to 4 bills at once
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from expenses import jobs
+
+
+def _init_process():
+    """Prepares a pool process: Django must be set up and no DB connection shared."""
+    django.setup()
+    connections.close_all()
+
+
+def _run_job(job_id):
+    try:
+        return jobs.run_job(job_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Render queued PDF bills in background processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'BILL_JOB_CONCURRENCY', 2),
+            help='Number of bills rendered in parallel by this worker',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='Seconds to wait between queue checks when idle',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is empty instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        running = {}
+        last_maintenance = 0
+
+        # Pool processes must not inherit this process's open connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=concurrency, initializer=_init_process) as pool:
+            while True:
+                # Recover crashed jobs and delete expired PDFs once a minute
+                if time.monotonic() - last_maintenance > 60:
+                    recovered = jobs.requeue_stale_jobs()
+                    expired = jobs.expire_jobs()
+                    if recovered or expired:
+                        self.stdout.write(f'Recovered {recovered} stale job(s), expired {expired} job(s)')
+                    last_maintenance = time.monotonic()
+
+                # Fill free slots with newly claimed jobs
+                while len(running) < concurrency:
+                    job = jobs.claim_next_job()
+                    if job is None:
+                        break
+                    self.stdout.write(f'Rendering bill job #{job.pk} (attempt {job.attempts})')
+                    running[pool.submit(_run_job, job.pk)] = job.pk
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        status = f'crashed ({e})'
+                    self.stdout.write(f'Bill job #{job_id}: {status}')
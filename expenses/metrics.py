@@ -0,0 +1,434 @@
+"""
+Request and PDF metrics, merged across processes and served in the
+Prometheus text format.
+
+Every process (each gunicorn worker, the bill worker) aggregates counters
+and histograms in memory (``registry``):
+
+* requests per URL name, method and status code, with latency histograms
+  per URL name (``MetricsMiddleware``)
+* SQL time per request and statements executed, per URL name
+* PDF bills: build time, rows rendered and bytes produced (``record_bill``,
+  called by bills.write_bill)
+
+Processes share their numbers through a directory, settings.METRICS_DIR
+(under the system temporary directory unless configured; a tmpfs is
+ideal): a background thread writes the values of its process to
+``<pid>-<token>.json`` every METRICS_FLUSH_SECONDS (and at exit), replacing
+the file atomically. The ``/metrics`` view adds up the files of every
+process, with live values for its own, so whichever worker answers a scrape
+reports all of them. Files of processes that have exited are folded into
+``exited.json`` while collecting, so totals keep growing across worker
+restarts (gunicorn --max-requests) without the directory filling up.
+
+Counters and histograms only grow, as Prometheus expects; use ``rate()`` and
+``histogram_quantile()`` on the scraped series. Without METRICS_DIR each
+process only reports itself.
+
+Outside DEBUG, ``/metrics`` answers only scrapers sending METRICS_TOKEN or,
+without one, connecting from METRICS_ALLOWED_IPS (see ``metrics_view``).
+"""
+
+import atexit
+import hmac
+import ipaddress
+import json
+import os
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from .profiling import time_statements
+
+try:
+    import fcntl
+except ImportError:  # Windows: exited processes' files are kept as they are
+    fcntl = None
+
+# Prefix of every exported metric name
+PREFIX = 'expense_tracker_'
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+PDF_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Exported metrics: name -> (type, help text, histogram buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by URL name, method and status code', None),
+    'http_request_duration_seconds': ('histogram', 'Time to produce a response, by URL name', LATENCY_BUCKETS),
+    'db_query_duration_seconds': ('histogram', 'Time spent executing SQL per request, by URL name', DB_BUCKETS),
+    'db_queries_total': ('counter', 'SQL statements executed, by URL name', None),
+    'pdf_build_duration_seconds': ('histogram', 'Time to lay out and write a PDF bill', PDF_BUCKETS),
+    'pdf_rows_total': ('counter', 'Expense rows rendered into PDF bills', None),
+    'pdf_bytes_total': ('counter', 'Bytes of PDF bills produced', None),
+}
+
+# Label of requests that did not resolve to a URL name (paths would make
+# the number of series unbounded)
+UNMATCHED_VIEW = 'unmatched'
+
+# Methods recorded as themselves; anything else is recorded as 'other'
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# File in METRICS_DIR holding the totals of processes that have exited
+EXITED_FILE = 'exited.json'
+LOCK_FILE = '.lock'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Networks allowed to scrape /metrics without METRICS_TOKEN: the local host
+DEFAULT_ALLOWED_IPS = ('127.0.0.1/32', '::1/128')
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    """
+    Counters and histograms of one process.
+
+    Values are kept per (metric name, labels); a process forked from one
+    that already recorded values starts again from zero, since the parent
+    reports its own.
+
+    Args:
+        autoflush: Write the values to METRICS_DIR periodically and at exit
+            (the process-wide ``registry`` does)
+    """
+
+    def __init__(self, autoflush=False):
+        self.autoflush = autoflush
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.filename = f'{self.pid}-{secrets.token_hex(4)}.json'
+        self.values = {}
+        self.dirty = False
+        self._flusher = None
+
+    def _changed(self):
+        # Called with the lock held
+        self.dirty = True
+        if self.autoflush and self._flusher is None and getattr(settings, 'METRICS_DIR', None):
+            self._flusher = threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def _current(self):
+        if os.getpid() != self.pid:
+            self._reset()
+        return self.values
+
+    def inc(self, name, amount=1, **labels):
+        """Adds ``amount`` to a counter."""
+        key = _key(name, labels)
+        with self._lock:
+            values = self._current()
+            values[key] = values.get(key, 0) + amount
+            self._changed()
+
+    def observe(self, name, value, **labels):
+        """Records ``value`` in a histogram."""
+        buckets = METRICS[name][2]
+        key = _key(name, labels)
+        with self._lock:
+            values = self._current()
+            state = values.get(key)
+            if state is None:
+                state = values[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            state[0][bisect_left(buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+            self._changed()
+
+    def snapshot(self):
+        """Returns this process's values as a JSON-serialisable list."""
+        with self._lock:
+            entries = []
+            for (name, labels), state in self._current().items():
+                entry = {'name': name, 'labels': dict(labels)}
+                if METRICS[name][0] == 'histogram':
+                    bounds = [_number(bound) for bound in METRICS[name][2]] + ['+Inf']
+                    entry.update(buckets=dict(zip(bounds, state[0])), sum=state[1], count=state[2])
+                else:
+                    entry['value'] = state
+                entries.append(entry)
+            return entries
+
+    def flush(self):
+        """Writes this process's values to METRICS_DIR, if configured."""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        self.dirty = False
+        entries = self.snapshot()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(entries, f)
+        os.replace(f'{path}.tmp', path)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(getattr(settings, 'METRICS_FLUSH_SECONDS', 5))
+            if self.dirty:
+                try:
+                    self.flush()
+                except OSError:
+                    self.dirty = True  # Try again next time
+
+    def collect(self):
+        """Returns the merged values of every process (see ``merge``)."""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        snapshots = [self.snapshot()]
+        if not directory or not os.path.isdir(directory):
+            return merge(snapshots)
+        with _locked(directory):
+            _fold_exited(directory)
+            for name in os.listdir(directory):
+                if name.endswith('.json') and name != self.filename:
+                    snapshots.append(_read(os.path.join(directory, name)))
+        return merge(snapshots)
+
+
+def _number(value):
+    """Formats a bucket bound the way Prometheus clients do (1 -> '1.0')."""
+    return repr(float(value)) if not float(value).is_integer() else f'{float(value):.1f}'
+
+
+def merge(snapshots):
+    """
+    Adds up snapshots of several processes.
+
+    Returns:
+        dict: {(name, labels): counter value, or (buckets dict, sum, count)}
+    """
+    merged = {}
+    for entries in snapshots:
+        for entry in entries:
+            if entry['name'] not in METRICS:
+                continue  # Dropped since that process wrote it
+            key = _key(entry['name'], entry['labels'])
+            if 'buckets' in entry:
+                buckets, total, count = merged.get(key, ({}, 0.0, 0))
+                for bound, n in entry['buckets'].items():
+                    buckets[bound] = buckets.get(bound, 0) + n
+                merged[key] = (buckets, total + entry['sum'], count + entry['count'])
+            else:
+                merged[key] = merged.get(key, 0) + entry['value']
+    return merged
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []  # Removed or replaced while listing; next scrape has it
+
+
+@contextmanager
+def _locked(directory):
+    """Serialises collecting between processes (a no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists, owned by someone else
+    return True
+
+
+def _fold_exited(directory):
+    """Moves the values of exited processes into EXITED_FILE. Call with the lock held."""
+    if fcntl is None:
+        return
+    exited = []
+    for name in os.listdir(directory):
+        pid = name.split('-', 1)[0]
+        if name.endswith('.json') and pid.isdigit() and not _alive(int(pid)):
+            exited.append(os.path.join(directory, name))
+    if not exited:
+        return
+    path = os.path.join(directory, EXITED_FILE)
+    totals = merge([_read(path)] + [_read(name) for name in exited])
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(_entries(totals), f)
+    os.replace(f'{path}.tmp', path)
+    for name in exited:
+        os.remove(name)
+
+
+def _entries(merged):
+    """Turns ``merge`` output back into snapshot entries."""
+    entries = []
+    for (name, labels), value in merged.items():
+        entry = {'name': name, 'labels': dict(labels)}
+        if isinstance(value, tuple):
+            entry.update(buckets=value[0], sum=value[1], count=value[2])
+        else:
+            entry['value'] = value
+        entries.append(entry)
+    return entries
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render(merged):
+    """Formats merged values in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, description, _) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in merged.items() if metric == name)
+        full_name = PREFIX + name
+        lines.append(f'# HELP {full_name} {description}')
+        lines.append(f'# TYPE {full_name} {kind}')
+        for labels, value in series:
+            if kind == 'histogram':
+                buckets, total, count = value
+                cumulative = 0
+                bounds = sorted((bound for bound in buckets if bound != '+Inf'), key=float) + ['+Inf']
+                for bound in bounds:
+                    cumulative += buckets.get(bound, 0)
+                    lines.append(f'{full_name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{full_name}_sum{_labels(labels)} {total!r}')
+                lines.append(f'{full_name}_count{_labels(labels)} {count}')
+            else:
+                lines.append(f'{full_name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry(autoflush=True)
+
+
+def record_bill(rows, size, seconds):
+    """Records one PDF bill of ``rows`` expenses and ``size`` bytes, built in ``seconds``."""
+    registry.observe('pdf_build_duration_seconds', seconds)
+    registry.inc('pdf_rows_total', rows)
+    registry.inc('pdf_bytes_total', size)
+
+
+class _QueryTimer:
+    """Adds up the SQL time and statements of one request (see profiling.time_statements)."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, seconds):
+        with self._lock:
+            self.seconds += seconds
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and records their latency and SQL time per URL name.
+
+    Enabled unless settings.METRICS_ENABLED is false. Handles both sync and
+    async requests.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = _QueryTimer()
+        started = time.perf_counter()
+        with time_statements(queries):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = _QueryTimer()
+        started = time.perf_counter()
+        with time_statements(queries):
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    @staticmethod
+    def record(request, response, elapsed, queries):
+        """Records one handled request in the registry."""
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else UNMATCHED_VIEW
+        method = request.method if request.method in METHODS else 'other'
+        registry.inc('http_requests_total', view=view, method=method, status=str(response.status_code))
+        registry.observe('http_request_duration_seconds', elapsed, view=view)
+        registry.observe('db_query_duration_seconds', queries.seconds, view=view)
+        registry.inc('db_queries_total', queries.count, view=view)
+
+
+def allowed_address(address):
+    """Whether ``address`` (REMOTE_ADDR) is in one of METRICS_ALLOWED_IPS' networks."""
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in getattr(settings, 'METRICS_ALLOWED_IPS', DEFAULT_ALLOWED_IPS)
+    )
+
+
+def metrics_view(request):
+    """
+    Serves the metrics of every process in the Prometheus text format.
+
+    The metrics name every view and show its traffic, so they are not
+    public: when settings.METRICS_TOKEN is set, scrapers must send it as
+    ``Authorization: Bearer <token>``; otherwise only clients in
+    METRICS_ALLOWED_IPS (the local host by default) get them, or anyone
+    while DEBUG is on.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    elif not settings.DEBUG and not allowed_address(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponse('Forbidden: set METRICS_TOKEN to scrape from elsewhere\n', status=403,
+                            content_type='text/plain')
+    return HttpResponse(render(registry.collect()), content_type=CONTENT_TYPE)
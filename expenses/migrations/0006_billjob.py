@@ -0,0 +1,36 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0005_expense_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('expired', 'Expired')], default='queued', help_text='Current state of the job', max_length=10)),
+                ('filters', models.JSONField(blank=True, default=dict, help_text='Filters applied to the billed expenses')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='Number of rendering attempts')),
+                ('error', models.TextField(blank=True, help_text='Last rendering error')),
+                ('result', models.FileField(blank=True, help_text='Rendered PDF', upload_to='bills/%Y/%m/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(help_text='User the bill is generated for', on_delete=django.db.models.deletion.CASCADE, related_name='bill_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='billjob_status_run_after_idx')],
+            },
+        ),
+    ]
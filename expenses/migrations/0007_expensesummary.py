@@ -0,0 +1,62 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+
+def build_summaries(apps, schema_editor):
+    """Aggregates the existing expenses into summary rows."""
+    Expense = apps.get_model('expenses', 'Expense')
+    ExpenseSummary = apps.get_model('expenses', 'ExpenseSummary')
+    rows = (
+        Expense.objects
+        .annotate(month=TruncMonth('date'))
+        .values('user_id', 'month', 'category_id')
+        .annotate(
+            count=models.Count('id'),
+            total=models.Sum('amount'),
+            low=models.Min('amount'),
+            high=models.Max('amount'),
+        )
+        .order_by()
+    )
+    ExpenseSummary.objects.bulk_create([
+        ExpenseSummary(
+            user_id=row['user_id'], month=row['month'], category_id=row['category_id'],
+            count=row['count'], total=row['total'], min_amount=row['low'], max_amount=row['high'],
+        )
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0006_billjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the summarised month')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('min_amount', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('max_amount', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Expense summaries',
+                'ordering': ['-month'],
+                'constraints': [
+                    models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('user', 'month', 'category'), name='expense_summary_bucket_uniq'),
+                    models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('user', 'month'), name='expense_summary_uncat_uniq'),
+                ],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# PostgreSQL: a generated tsvector column, so the index can never go stale,
+# with a GIN index for @@ matches. Adding a stored generated column rewrites
+# the table once.
+POSTGRES_FORWARD = (
+    """
+    ALTER TABLE expenses_expense ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    'CREATE INDEX expense_search_idx ON expenses_expense USING GIN (search_vector)',
+)
+POSTGRES_REVERSE = (
+    'DROP INDEX IF EXISTS expense_search_idx',
+    'ALTER TABLE expenses_expense DROP COLUMN IF EXISTS search_vector',
+)
+
+# SQLite: an FTS5 index over the expense table's own rows. The triggers that
+# keep it in sync, and the initial build, are installed after migrate by
+# expenses.search.install_sqlite_triggers, because SQLite drops triggers
+# whenever a later migration rebuilds the expense table.
+SQLITE_FORWARD = (
+    """
+    CREATE VIRTUAL TABLE expenses_expense_fts USING fts5(
+        title, description,
+        content='expenses_expense', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+)
+SQLITE_REVERSE = (
+    'DROP TRIGGER IF EXISTS expenses_expense_fts_insert',
+    'DROP TRIGGER IF EXISTS expenses_expense_fts_delete',
+    'DROP TRIGGER IF EXISTS expenses_expense_fts_update',
+    'DROP TABLE IF EXISTS expenses_expense_fts',
+)
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0008_userdataversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
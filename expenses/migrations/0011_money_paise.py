@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+import expenses.money
+
+
+# Amount columns that become integer paise: (model, field, field options)
+MONEY_COLUMNS = (
+    ('expense', 'amount', {'max_digits': 10}),
+    ('archivedexpense', 'amount', {'max_digits': 10}),
+    ('expensesummary', 'total', {'max_digits': 14, 'default': 0}),
+    ('expensesummary', 'min_amount', {'max_digits': 10, 'null': True}),
+    ('expensesummary', 'max_amount', {'max_digits': 10, 'null': True}),
+)
+
+# Tables and columns whose values are scaled between rupees and paise
+SCALED = {
+    'expenses_expense': ('amount',),
+    'expenses_archivedexpense': ('amount',),
+    'expenses_expensesummary': ('total', 'min_amount', 'max_amount'),
+}
+
+# Wide enough for any amount in paise while the columns are still decimal
+WIDE_DIGITS = 20
+
+
+def _update(expression):
+    return [
+        f'UPDATE {table} SET ' + ', '.join(f'{column} = {expression.format(column)}' for column in columns)
+        for table, columns in SCALED.items()
+    ]
+
+
+# Three steps that work the same on PostgreSQL and SQLite: widen the decimal
+# columns, multiply the values by 100 in place, then turn the (now integral)
+# columns into BIGINT. Each step is reversible. The expense history view
+# (ExpenseHistory) only needs its state updated; expenses.archive rebuilds it
+# after migrating.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0010_expense_archive'),
+    ]
+
+    operations = [
+        *[
+            migrations.AlterField(
+                model_name=model, name=field,
+                field=models.DecimalField(decimal_places=2, **{**options, 'max_digits': WIDE_DIGITS}),
+            )
+            for model, field, options in MONEY_COLUMNS
+        ],
+        migrations.RunSQL(_update('ROUND({} * 100)'), reverse_sql=_update('{} / 100.0')),
+        *[
+            migrations.AlterField(model_name=model, name=field, field=expenses.money.MoneyField(**options))
+            for model, field, options in MONEY_COLUMNS
+        ],
+        migrations.AlterField(
+            model_name='expensehistory',
+            name='amount',
+            field=expenses.money.MoneyField(max_digits=10),
+        ),
+    ]
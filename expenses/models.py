@@ -4,10 +4,13 @@ It includes models for expense categories and individual expenses, with proper
 relationships and formatting methods for display purposes.
 """
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .currency import format_rupees
+from .money import MoneyField
+
 
 class Category(models.Model):
     """
@@ -37,7 +40,8 @@ class Expense(models.Model):
     
     Attributes:
         title (CharField): Title/name of the expense, limited to 100 characters
-        amount (DecimalField): Monetary amount with up to 10 digits and 2 decimal places
+        amount (MoneyField): Monetary amount with up to 10 digits and 2 decimal
+            places, stored as integer paise
         description (TextField): Optional detailed description of the expense
         user (ForeignKey): Reference to the Django User who created the expense
         category (ForeignKey): Optional reference to expense Category
@@ -45,9 +49,8 @@ class Expense(models.Model):
         time (TimeField): Time of the expense, defaults to current time
     """
     title = models.CharField(max_length=100, help_text='Title of the expense')
-    amount = models.DecimalField(
-        max_digits=10, 
-        decimal_places=2,
+    amount = MoneyField(
+        max_digits=10,
         help_text='Amount in Indian Rupees (₹)'
     )
     description = models.TextField(
@@ -76,6 +79,38 @@ class Expense(models.Model):
 
     class Meta:
         ordering = ['-date', '-time']  # Sort expenses by newest first
+        indexes = [
+            # Default newest-first listing (home, expense_list, generate_bill)
+            models.Index(fields=['user', '-date', '-time', '-id'], name='expense_user_date_idx'),
+            # Per-category listings and reports within a date range
+            models.Index(fields=['user', 'category', '-date'], name='expense_user_cat_date_idx'),
+            # Amount sort and covering index for the per-user Sum('amount')
+            models.Index(fields=['user', 'amount', 'date', 'time', 'id'], name='expense_user_amount_idx'),
+        ]
+
+    # Fields whose previous values are needed to keep ExpenseSummary in sync
+    SUMMARY_FIELDS = ('user_id', 'category_id', 'date', 'amount')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the values loaded from the database.
+
+        The summary bookkeeping (see expenses/summaries.py) needs an expense's
+        previous user, category, date and amount when it is updated, and this
+        avoids re-reading the row just to find them.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.SUMMARY_FIELDS
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Saves the expense and its summary bookkeeping in one transaction."""
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         """Returns a string representation combining title and formatted amount."""
@@ -86,23 +121,19 @@ class Expense(models.Model):
         Formats the expense amount in Indian currency format with ₹ symbol.
         
         Returns:
-            str: Formatted amount string (e.g., "₹1,234.56" or "-₹1,234.56")
+            str: Formatted amount string with lakh/crore grouping (e.g.
+                "₹12,34,567.89" or "-₹1,234.56").
                 Returns "₹0.00" if amount is invalid.
         
         Examples:
-            >>> expense = Expense(amount=1234.56)
+            >>> expense = Expense(amount=1234567.89)
             >>> expense.formatted_amount()
-            '₹1,234.56'
+            '₹12,34,567.89'
             >>> expense = Expense(amount=-1234.56)
             >>> expense.formatted_amount()
             '-₹1,234.56'
         """
-        try:
-            if self.amount < 0:
-                return f"-₹{abs(float(self.amount)):,.2f}"
-            return f"₹{float(self.amount):,.2f}"
-        except (ValueError, TypeError):
-            return "₹0.00"
+        return format_rupees(self.amount)
             
     def formatted_datetime(self):
         """
@@ -129,3 +160,216 @@ class Expense(models.Model):
                 return "No date"
         except (AttributeError, ValueError):
             return "No date"
+
+
+class ArchivedExpense(models.Model):
+    """
+    An expense moved out of the main table into cold storage.
+
+    Expenses older than the archive horizon are moved here by the
+    ``archive_expenses`` management command (see expenses/archive.py), so
+    the main table and its indexes only hold recent data. Rows keep their
+    original ids and still count towards the user's summaries. The table is
+    deliberately compact: one index, serving per-user date-ordered reads.
+
+    Attributes:
+        id (BigIntegerField): The expense's original primary key
+        title, amount, description, user, category, date, time: As on Expense
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=100)
+    amount = MoneyField(max_digits=10)
+    description = models.TextField(blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_expenses')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='+')
+    date = models.DateField()
+    time = models.TimeField()
+
+    class Meta:
+        ordering = ['-date', '-time']
+        indexes = [
+            models.Index(fields=['user', '-date', '-time', '-id'], name='archived_user_date_idx'),
+        ]
+
+    def __str__(self):
+        """Returns a string representation with the title and date."""
+        return f"{self.title} ({self.date}, archived)"
+
+
+class ExpenseHistory(models.Model):
+    """
+    Read-only view over every expense, recent and archived.
+
+    Backed by the ``expenses_expense_history`` database view, a UNION ALL of
+    the Expense and ArchivedExpense tables, so it can be filtered, ordered,
+    paginated and aggregated exactly like Expense. Filters on the user and
+    date are pushed down into both tables and served by their indexes.
+    Queries only use it when they reach past the archive horizon (see
+    expenses/archive.py).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=100)
+    amount = MoneyField(max_digits=10)
+    description = models.TextField(blank=True)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    category = models.ForeignKey(
+        Category, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+'
+    )
+    date = models.DateField()
+    time = models.TimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'expenses_expense_history'
+        ordering = ['-date', '-time']
+        verbose_name_plural = 'Expense history'
+
+    # Displayed like the expenses they are
+    __str__ = Expense.__str__
+    formatted_amount = Expense.formatted_amount
+    formatted_datetime = Expense.formatted_datetime
+
+
+class ExpenseSummary(models.Model):
+    """
+    Pre-aggregated expense statistics per user, month and category.
+
+    Rows are maintained incrementally in the same transaction as every
+    Expense create, update and delete (see expenses/summaries.py), so totals
+    and category breakdowns can be read from a handful of rows instead of
+    aggregating a user's whole expense history.
+
+    Attributes:
+        user (ForeignKey): Owner of the summarised expenses
+        month (DateField): First day of the summarised month
+        category (ForeignKey): Summarised category (NULL for uncategorized)
+        count (PositiveIntegerField): Number of expenses in the bucket
+        total (MoneyField): Sum of the amounts in the bucket
+        min_amount (MoneyField): Smallest amount in the bucket
+        max_amount (MoneyField): Largest amount in the bucket
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_summaries')
+    month = models.DateField(help_text='First day of the summarised month')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total = MoneyField(max_digits=14, default=0)
+    min_amount = MoneyField(max_digits=10, null=True)
+    max_amount = MoneyField(max_digits=10, null=True)
+
+    class Meta:
+        ordering = ['-month']
+        verbose_name_plural = 'Expense summaries'
+        constraints = [
+            # One row per bucket; NULL categories need their own constraint
+            # because NULLs never compare equal in a unique index
+            models.UniqueConstraint(
+                fields=['user', 'month', 'category'],
+                condition=models.Q(category__isnull=False),
+                name='expense_summary_bucket_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'month'],
+                condition=models.Q(category__isnull=True),
+                name='expense_summary_uncat_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        """Returns a string representation with the bucket and its total."""
+        return f"{self.user} {self.month:%b %Y} {self.category or 'Uncategorized'}: {self.total}"
+
+
+class BillJob(models.Model):
+    """
+    A queued request to render a PDF bill in the background.
+
+    Bill jobs are created by the generate_bill view and picked up by the
+    ``run_bill_worker`` management command, so slow PDF rendering never runs
+    inside a web request. The finished PDF is stored on the default storage
+    and removed again once the job expires.
+
+    Attributes:
+        user (ForeignKey): User the bill is generated for
+        status (CharField): Current state of the job (see Status)
+        filters (JSONField): Query-string filters the bill was requested with
+        attempts (PositiveSmallIntegerField): Number of times rendering was started
+        error (TextField): Last error message, if rendering failed
+        result (FileField): The rendered PDF once the job is done
+        created_at (DateTimeField): When the job was queued
+        run_after (DateTimeField): Earliest time the job may be (re)tried
+        started_at (DateTimeField): When the current/last attempt started
+        finished_at (DateTimeField): When the job completed or failed for good
+        expires_at (DateTimeField): When the stored PDF will be deleted
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+        EXPIRED = 'expired', 'Expired'
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='bill_jobs',
+        help_text='User the bill is generated for'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.QUEUED,
+        help_text='Current state of the job'
+    )
+    filters = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Filters applied to the billed expenses'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, help_text='Number of rendering attempts')
+    error = models.TextField(blank=True, help_text='Last rendering error')
+    result = models.FileField(upload_to='bills/%Y/%m/', blank=True, help_text='Rendered PDF')
+    created_at = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The worker claims the oldest runnable job of a given status
+            models.Index(fields=['status', 'run_after'], name='billjob_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        """Returns a string representation with the job id, owner and status."""
+        return f"Bill job #{self.pk} for {self.user} ({self.status})"
+
+
+class UserDataVersion(models.Model):
+    """
+    Change marker for everything derived from one user's expenses.
+
+    The version is incremented in the same transaction as every write to the
+    user's expenses (see expenses/versions.py), so it can serve as a cheap
+    validator: if the version has not moved, neither has any list, total or
+    breakdown computed from those expenses.
+
+    Attributes:
+        user (OneToOneField): Owner of the expenses, also the primary key
+        version (PositiveBigIntegerField): Incremented on every change
+        changed_at (DateTimeField): Time of the latest change
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='data_version',
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        """Returns a string representation with the owner and version."""
+        return f"{self.user} v{self.version}"
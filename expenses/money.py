@@ -0,0 +1,165 @@
+"""
+Money amounts stored as integer paise.
+
+Every amount column (expense amounts and the summary totals) is a MoneyField:
+a BIGINT holding whole paise, so sums, comparisons and the amount index all
+work on integers in the database and totals are exact however many rows they
+add up. In Python the amounts stay what they always were - Decimal rupees
+with two decimal places - so forms, the JSON API, exports, filters and
+cursors are unchanged; the conversion happens only when values cross into or
+out of the database.
+
+Code that only needs the integer (analytics) can skip the Decimal round
+trip: ``to_paise`` converts Python values and ``Paise`` reads a column or
+aggregate as a plain int.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django import forms
+from django.core import exceptions
+from django.core.exceptions import FullResultSet
+from django.core.validators import DecimalValidator
+from django.db import models
+from django.db.models.lookups import GreaterThanOrEqual, IntegerFieldOverflow, LessThan
+from django.utils.functional import cached_property
+
+# Amounts are rupees with this many decimal places, i.e. stored in paise
+DECIMAL_PLACES = 2
+
+PAISE_PER_RUPEE = 10 ** DECIMAL_PLACES
+
+_ONE_PAISA = Decimal(1).scaleb(-DECIMAL_PLACES)
+
+
+def to_rupees(amount):
+    """
+    Converts an amount in rupees (Decimal, int, float or numeric string) to
+    a Decimal, exactly: floats go through their shortest repr, so 0.1 stays
+    0.1 rather than its binary approximation.
+
+    Raises:
+        decimal.InvalidOperation: If ``amount`` is not a number
+    """
+    if isinstance(amount, Decimal):
+        return amount
+    if isinstance(amount, float):
+        amount = repr(amount)
+    return Decimal(amount)
+
+
+def to_paise(amount):
+    """
+    Converts an amount in rupees to whole paise.
+
+    Args:
+        amount: Decimal, int, float or numeric string in rupees; fractions of
+            a paisa are rounded half to even, as DecimalField did
+
+    Returns:
+        int: The amount in paise
+
+    Raises:
+        decimal.InvalidOperation: If ``amount`` is not a number
+        ValueError, OverflowError: For NaN and infinite amounts
+    """
+    if isinstance(amount, int):
+        return amount * PAISE_PER_RUPEE
+    return int(to_rupees(amount).quantize(_ONE_PAISA).scaleb(DECIMAL_PLACES))
+
+
+def from_paise(paise):
+    """Converts whole paise (an int, or a Decimal sum) to Decimal rupees."""
+    return Decimal(paise).scaleb(-DECIMAL_PLACES)
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    An amount in rupees, stored as integer paise.
+
+    Python values are Decimals with two decimal places, exactly like a
+    ``DecimalField(decimal_places=2)``; lookups, ``Value`` expressions and
+    aggregates (Sum, Min, Max) convert to and from paise automatically.
+    Expressions that mix a MoneyField with plain numbers need the numbers
+    wrapped as ``Value(amount, output_field=MoneyField())``.
+
+    Args:
+        max_digits: Optional limit on the digits of an amount (including the
+            two decimal places), validated like DecimalField's
+    """
+    description = 'Amount of money in rupees, stored as integer paise'
+
+    decimal_places = DECIMAL_PLACES
+
+    def __init__(self, *args, max_digits=None, **kwargs):
+        self.max_digits = max_digits
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.max_digits is not None:
+            kwargs['max_digits'] = self.max_digits
+        return name, path, args, kwargs
+
+    @cached_property
+    def validators(self):
+        # The integer range checks of BigIntegerField would compare rupees
+        # with a paise range; the digit limits are the meaningful ones here
+        return [*self._validators, DecimalValidator(self.max_digits, self.decimal_places)]
+
+    def to_python(self, value):
+        if value is None:
+            return value
+        try:
+            return to_rupees(value)
+        except (InvalidOperation, TypeError, ValueError):
+            raise exceptions.ValidationError(
+                self.error_messages['invalid'], code='invalid', params={'value': value}
+            )
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        return to_paise(self.to_python(value))
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return from_paise(value)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{
+            'form_class': forms.DecimalField,
+            'max_digits': self.max_digits,
+            'decimal_places': self.decimal_places,
+            **kwargs,
+        })
+
+
+# IntegerField rounds float values of ``gte`` and ``lt`` up to a whole number
+# before get_prep_value sees them, which for rupees would turn 12.5 into 13.
+# These versions leave the rupees alone, so they are converted to paise exactly.
+
+@MoneyField.register_lookup
+class MoneyGreaterThanOrEqual(IntegerFieldOverflow, GreaterThanOrEqual):
+    underflow_exception = FullResultSet
+
+
+@MoneyField.register_lookup
+class MoneyLessThan(IntegerFieldOverflow, LessThan):
+    overflow_exception = FullResultSet
+
+
+class Paise(models.ExpressionWrapper):
+    """
+    Reads a money column or aggregate as whole paise (int) instead of Decimal.
+
+    Example:
+        >>> Expense.objects.values_list('date', Paise('amount'))
+    """
+
+    def __init__(self, expression):
+        if isinstance(expression, str):
+            expression = models.F(expression)
+        super().__init__(expression, output_field=models.BigIntegerField())
@@ -0,0 +1,240 @@
+"""
+Keyset (cursor) pagination for expense listings.
+
+Offset pagination makes the database walk and discard every row before the
+requested page, so deep pages get slower as a user's history grows. Keyset
+pagination instead remembers the sort key of the last row that was shown and
+asks for rows strictly "after" it, which lets the database seek straight to
+the next page through an index.
+
+Every sort option exposed by the expense list is made total (no ties) by
+appending ``date, time, id`` tie-breakers in the same direction as the sort
+itself (the default is ``(-date, -time, -id)``), so a cursor always
+identifies exactly one position in the result set and a single composite
+index can serve both the ascending and the descending variant.
+"""
+
+from datetime import date, time
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+
+from .models import Expense
+
+# Default number of rows rendered per page / fragment
+DEFAULT_PAGE_SIZE = 50
+
+# Salt used when signing cursors so they cannot be reused by other signers
+CURSOR_SALT = 'expenses.pagination.cursor'
+
+# Tie-breaking orderings shared by every sort option
+TIE_BREAKERS = ('-date', '-time', '-id')
+ASC_TIE_BREAKERS = ('date', 'time', 'id')
+
+# Full, deterministic ordering for each user-facing sort option
+SORT_ORDERINGS = {
+    '-date': TIE_BREAKERS,
+    'date': ASC_TIE_BREAKERS,
+    'amount': ('amount',) + ASC_TIE_BREAKERS,
+    '-amount': ('-amount',) + TIE_BREAKERS,
+    'title': ('title',) + ASC_TIE_BREAKERS,
+    '-title': ('-title',) + TIE_BREAKERS,
+    'category': ('category_sort',) + ASC_TIE_BREAKERS,
+    '-category': ('-category_sort',) + TIE_BREAKERS,
+    # Best search matches first; only offered while searching
+    'relevance': ('-search_rank',) + TIE_BREAKERS,
+}
+
+DEFAULT_SORT = '-date'
+RELEVANCE_SORT = 'relevance'
+
+# Sort keys computed by annotations rather than stored in a column
+ANNOTATED_KEYS = ('category_sort', 'search_rank')
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor is malformed, tampered with or for another sort."""
+
+
+class Page:
+    """
+    A single page of a keyset-paginated queryset.
+
+    Attributes:
+        items (list): Model instances on this page
+        has_more (bool): Whether more rows exist after this page
+        next_cursor (str|None): Opaque cursor for the following page
+    """
+
+    def __init__(self, items, has_more, next_cursor):
+        self.items = items
+        self.has_more = has_more
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def normalize_sort(sort_by, searching=False):
+    """
+    Returns ``sort_by`` if it is a supported sort option, else the default.
+
+    While searching the default is relevance; otherwise relevance is not
+    available, as there is no search rank to sort by.
+    """
+    if sort_by == RELEVANCE_SORT and not searching:
+        return DEFAULT_SORT
+    if sort_by in SORT_ORDERINGS:
+        return sort_by
+    return RELEVANCE_SORT if searching else DEFAULT_SORT
+
+
+def sorted_queryset(queryset, sort_by):
+    """
+    Applies the deterministic ordering for ``sort_by`` to ``queryset``.
+
+    Category sorting is done on the category name, with uncategorized
+    expenses sorted as an empty name so the cursor never has to compare NULLs.
+    Relevance sorting needs the ``search_rank`` annotation of
+    search.with_rank on ``queryset``.
+    """
+    sort_by = normalize_sort(sort_by, searching='search_rank' in queryset.query.annotations)
+    if 'category' in sort_by:
+        queryset = queryset.annotate(
+            category_sort=Coalesce('category__name', Value(''))
+        )
+    return queryset.order_by(*SORT_ORDERINGS[sort_by])
+
+
+def _encode_value(value):
+    """Converts a sort key value into a JSON-serialisable form."""
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _decode_value(key, value):
+    """Converts a JSON cursor value back into the Python type of its field."""
+    if key == 'category_sort':
+        return str(value)
+    if key == 'search_rank':
+        return float(value)
+    return Expense._meta.get_field(key).to_python(value)
+
+
+def encode_cursor(sort_by, obj):
+    """
+    Builds an opaque, signed cursor pointing just after ``obj``.
+
+    Args:
+        sort_by: The sort option the page was produced with
+        obj: The last Expense shown on the page
+
+    Returns:
+        str: URL-safe cursor string
+    """
+    keys = [key.lstrip('-') for key in SORT_ORDERINGS[sort_by]]
+    values = [_encode_value(getattr(obj, key)) for key in keys]
+    return signing.dumps({'s': sort_by, 'v': values}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(sort_by, cursor):
+    """
+    Validates ``cursor`` and returns the decoded sort key values.
+
+    Raises:
+        InvalidCursor: If the signature is bad or the cursor was produced
+            for a different sort option.
+    """
+    try:
+        payload = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature as e:
+        raise InvalidCursor('Invalid pagination cursor') from e
+
+    keys = [key.lstrip('-') for key in SORT_ORDERINGS[sort_by]]
+    if not isinstance(payload, dict) or payload.get('s') != sort_by \
+            or len(payload.get('v') or []) != len(keys):
+        raise InvalidCursor('Cursor does not match the requested sort order')
+
+    try:
+        return [_decode_value(key, value) for key, value in zip(keys, payload['v'])]
+    except Exception as e:
+        raise InvalidCursor('Invalid pagination cursor') from e
+
+
+def _after_filter(ordering, values):
+    """
+    Builds the keyset predicate "row comes strictly after ``values``".
+
+    For an ordering ``(k1, k2, ..., kn)`` this expands the lexicographic
+    comparison into::
+
+        k1 > v1 OR (k1 = v1 AND k2 > v2) OR ... (k1..kn-1 = v AND kn > vn)
+
+    with ``>`` flipped to ``<`` for descending keys.
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for key, value in zip(ordering, values):
+        field = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        condition |= equal_so_far & Q(**{f'{field}__{lookup}': value})
+        equal_so_far &= Q(**{field: value})
+    return condition
+
+
+def _page_queryset(queryset, sort_by, cursor, page_size):
+    """Returns (sort_by, the query for one page); raises InvalidCursor."""
+    sort_by = normalize_sort(sort_by, searching='search_rank' in queryset.query.annotations)
+    queryset = sorted_queryset(queryset, sort_by)
+
+    if cursor:
+        values = decode_cursor(sort_by, cursor)
+        queryset = queryset.filter(_after_filter(SORT_ORDERINGS[sort_by], values))
+
+    # Fetch one extra row to learn whether another page exists
+    return sort_by, queryset[:page_size + 1]
+
+
+def _page(rows, sort_by, page_size):
+    """Builds the Page from the rows of _page_queryset."""
+    has_more = len(rows) > page_size
+    items = rows[:page_size]
+    next_cursor = encode_cursor(sort_by, items[-1]) if has_more else None
+    return Page(items, has_more, next_cursor)
+
+
+def paginate(queryset, sort_by, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Returns one keyset page of ``queryset`` ordered by ``sort_by``.
+
+    Latency stays flat regardless of how deep the page is, because the query
+    only ever reads ``page_size + 1`` rows starting from the cursor position.
+
+    Args:
+        queryset: Base Expense queryset (already filtered by user)
+        sort_by: One of the keys of SORT_ORDERINGS
+        cursor: Cursor returned by a previous page, or None for the first page
+        page_size: Maximum number of rows on the page
+
+    Returns:
+        Page: The requested page
+
+    Raises:
+        InvalidCursor: If ``cursor`` cannot be decoded
+    """
+    sort_by, queryset = _page_queryset(queryset, sort_by, cursor, page_size)
+    return _page(list(queryset), sort_by, page_size)
+
+
+async def apaginate(queryset, sort_by, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Like ``paginate``, reading the page with the async ORM."""
+    sort_by, queryset = _page_queryset(queryset, sort_by, cursor, page_size)
+    return _page([row async for row in queryset], sort_by, page_size)
@@ -0,0 +1,405 @@
+"""
+Per-request timing breakdown, reported as a Server-Timing header and logs.
+
+When settings.REQUEST_PROFILING is true, ``RequestProfilingMiddleware``
+measures for every request:
+
+* db: time spent executing SQL, and the number of statements, on any
+  connection and thread (see ``time_statements``); statements that async
+  views run concurrently each count in full
+* tpl: time spent rendering templates (top-level renders through the
+  ``ProfiledTemplates`` backend; includes are part of their parent)
+* pdf: time spent building PDF bills with ReportLab (``span('pdf')`` in
+  views.render_to_pdf)
+* view: time from the view being called until its response is ready
+* total: time spent in the whole middleware chain
+
+db, tpl and pdf happen inside the view, so they overlap with it and with
+each other (a bill's rows are fetched while the PDF is built). Streaming
+responses are measured until the response object is returned, not until
+the last byte is sent.
+
+The breakdown goes out as a ``Server-Timing`` header, which browser
+developer tools display next to the request, and as one ``key=value`` log
+line per request on the ``expenses.profiling`` logger (INFO, or WARNING for
+requests slower than REQUEST_PROFILE_THRESHOLD_MS); the same values are
+attached to the log record as ``request_timings`` for structured handlers.
+
+Setting REQUEST_PROFILER to 'cprofile' or 'sample' also profiles each
+request and writes the profile of the slow ones to REQUEST_PROFILE_DIR:
+a pstats file (``.prof``, open with ``python -m pstats`` or snakeviz), or
+collapsed stacks sampled every REQUEST_SAMPLE_INTERVAL_MS (``.folded``, for
+flamegraph.pl or speedscope). Sampling costs far less than cProfile and is
+the one to leave on in a shared environment.
+
+The middleware handles both sync and async requests. Under ASGI the
+profilers only see the event loop thread, not the threads the ORM and
+templates run on.
+
+With REQUEST_PROFILING off, Django drops the middleware at startup; what is
+left is one context variable lookup per template render, PDF and SQL
+statement.
+"""
+
+import contextvars
+import cProfile
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# Profilers REQUEST_PROFILER can name
+PROFILERS = ('cprofile', 'sample')
+
+# Server-Timing metrics of the spans measured outside the middleware, in
+# header order, with their descriptions
+SPANS = {
+    'tpl': 'Templates',
+    'pdf': 'PDF build',
+}
+
+# Characters kept from view names in profile file names
+UNSAFE_FILENAME = re.compile(r'[^\w.-]+')
+
+# Timings of the request being handled, when profiling is on
+_current = contextvars.ContextVar('request_timings', default=None)
+
+# Callables receiving the duration of each SQL statement run for the current
+# request (see time_statements)
+_statement_timers = contextvars.ContextVar('statement_timers', default=())
+
+
+class RequestTimings:
+    """
+    Where the time of one request went.
+
+    Attributes:
+        queries (int): SQL statements executed
+        sql (float): Seconds spent executing them
+        spans (dict): Seconds per span name (see SPANS)
+        view (float|None): Seconds spent in the view, if one was called
+        total (float): Seconds spent in the middleware chain
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.spans = {}
+        self.view = None
+        self.total = 0.0
+        self.view_started = None
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds):
+        """Counts one SQL statement that took ``seconds``."""
+        with self._lock:
+            self.sql += seconds
+            self.queries += 1
+
+    def add(self, name, seconds):
+        """Adds ``seconds`` to the span ``name``."""
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def header(self):
+        """Returns the Server-Timing header value (durations in milliseconds)."""
+        metrics = [f'db;dur={self.sql * 1000:.1f};desc="SQL ({self.queries} queries)"']
+        for name, description in SPANS.items():
+            if name in self.spans:
+                metrics.append(f'{name};dur={self.spans[name] * 1000:.1f};desc="{description}"')
+        if self.view is not None:
+            metrics.append(f'view;dur={self.view * 1000:.1f};desc="View"')
+        metrics.append(f'total;dur={self.total * 1000:.1f};desc="Total"')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        """Returns the timings in milliseconds, keyed like the log line."""
+        values = {'total_ms': round(self.total * 1000, 1)}
+        if self.view is not None:
+            values['view_ms'] = round(self.view * 1000, 1)
+        values['db_ms'] = round(self.sql * 1000, 1)
+        values['db_queries'] = self.queries
+        for name in SPANS:
+            if name in self.spans:
+                values[f'{name}_ms'] = round(self.spans[name] * 1000, 1)
+        return values
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block as span ``name`` of the current request.
+
+    Does nothing (beyond one context variable lookup) outside a profiled
+    request.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+@contextmanager
+def time_statements(timer):
+    """
+    Calls ``timer(seconds)`` after every SQL statement run by the enclosed
+    block.
+
+    Unlike a connection's execute_wrapper, which only sees the connection of
+    the current thread, this follows the block's context: statements of the
+    async ORM and of pooled threads (see expenses/concurrency.py) run in
+    other threads with a copy of it. Timers may therefore be called from
+    several threads at once.
+    """
+    token = _statement_timers.set(_statement_timers.get() + (timer,))
+    try:
+        yield
+    finally:
+        _statement_timers.reset(token)
+
+
+def _time_statement(execute, sql, params, many, context):
+    """Execute wrapper reporting each statement's duration to the active timers."""
+    timers = _statement_timers.get()
+    if not timers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for timer in timers:
+            timer(elapsed)
+
+
+@receiver(connection_created, dispatch_uid='expenses_time_statements')
+def install_statement_timer(sender, connection, **kwargs):
+    """Installs _time_statement on every connection, in every thread, once."""
+    if _time_statement not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _time_statement)
+
+
+class ProfiledTemplate(Template):
+    """A Django template whose renders count towards the 'tpl' span."""
+
+    def render(self, context=None, request=None):
+        with span('tpl'):
+            return super().render(context, request)
+
+
+class ProfiledTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each render for the request profile.
+
+    Configured as the TEMPLATES backend in settings; behaves exactly like
+    'django.template.backends.django.DjangoTemplates' otherwise.
+    """
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(super().get_template(template_name).template, self)
+
+
+class FunctionProfiler:
+    """cProfile, behind the same start/stop/dump interface as StackSampler."""
+
+    extension = '.prof'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        """Writes the statistics in pstats format."""
+        self.profile.dump_stats(path)
+
+
+class StackSampler:
+    """
+    Samples the call stack of one thread at a fixed interval, from a
+    background thread, without tracing every call like cProfile does.
+
+    Stacks are kept in collapsed form: frames from the outermost call,
+    separated by semicolons, each as ``function (file:first line)``.
+    """
+
+    extension = '.folded'
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        """Writes the samples as collapsed stacks ('stack count' lines)."""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class RequestProfilingMiddleware:
+    """
+    Measures SQL, template, PDF and view time of every request (see the
+    module docstring), optionally profiling it.
+
+    Enabled when settings.REQUEST_PROFILING is true (defaults to DEBUG);
+    otherwise Django drops it from the middleware chain at startup. Keep it
+    first in MIDDLEWARE so the total covers the other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.profiler = getattr(settings, 'REQUEST_PROFILER', None)
+        if self.profiler and self.profiler not in PROFILERS:
+            raise ImproperlyConfigured(
+                f"REQUEST_PROFILER must be one of {', '.join(PROFILERS)} or None, not {self.profiler!r}"
+            )
+        self.threshold = getattr(settings, 'REQUEST_PROFILE_THRESHOLD_MS', 500) / 1000
+        self.directory = getattr(settings, 'REQUEST_PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+        self.interval = getattr(settings, 'REQUEST_SAMPLE_INTERVAL_MS', 5) / 1000
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profile = self.start_profile()
+        started = time.perf_counter()
+        try:
+            with time_statements(timings.add_query):
+                response = self.get_response(request)
+        finally:
+            finished = time.perf_counter()
+            _current.reset(token)
+            if profile is not None:
+                profile.stop()
+        return self.finish(request, response, timings, profile, started, finished)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profile = self.start_profile()
+        started = time.perf_counter()
+        try:
+            with time_statements(timings.add_query):
+                response = await self.get_response(request)
+        finally:
+            finished = time.perf_counter()
+            _current.reset(token)
+            if profile is not None:
+                profile.stop()
+        return self.finish(request, response, timings, profile, started, finished)
+
+    def finish(self, request, response, timings, profile, started, finished):
+        """Reports the timings of a handled request and saves its profile if it was slow."""
+        timings.total = finished - started
+        if timings.view_started is not None:
+            timings.view = finished - timings.view_started
+        response['Server-Timing'] = timings.header()
+        self.log(request, response, timings)
+        if profile is not None and timings.total >= self.threshold:
+            self.save_profile(request, profile, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = _current.get()
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+
+    def start_profile(self):
+        """Starts the configured profiler for this request, if any."""
+        if self.profiler == 'cprofile':
+            profile = FunctionProfiler()
+        elif self.profiler == 'sample':
+            profile = StackSampler(threading.get_ident(), self.interval)
+        else:
+            return None
+        try:
+            profile.start()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return None
+        return profile
+
+    def log(self, request, response, timings):
+        """Logs one key=value line with the request and its timings."""
+        level = logging.WARNING if timings.total >= self.threshold else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'view': _view_name(request),
+            'status': response.status_code,
+            **timings.as_dict(),
+        }
+        logger.log(level, ' '.join(f'{key}={value}' for key, value in fields.items()),
+                   extra={'request_timings': fields})
+
+    def save_profile(self, request, profile, timings):
+        """Writes the profile of a slow request to REQUEST_PROFILE_DIR."""
+        os.makedirs(self.directory, exist_ok=True)
+        name = UNSAFE_FILENAME.sub('_', _view_name(request)).strip('_')
+        path = os.path.join(
+            self.directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{timings.total * 1000:.0f}ms{profile.extension}",
+        )
+        profile.dump(path)
+        logger.warning('Profile of %s %s written to %s', request.method, request.path, path)
+
+
+def _view_name(request):
+    """The URL name of the request's view, or its path if it did not resolve."""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else request.path
@@ -0,0 +1,254 @@
+"""
+Database routing between the primary and an optional read replica.
+
+Read-heavy pages and reports (the expense list, exports, analytics, bills and
+the JSON list and aggregate endpoints) are wrapped in ``read_replica``. While
+such a view runs, reads of the expenses app's tables go to the replica named
+by settings.DATABASE_REPLICA. Everything else, including every write,
+sessions, users and the bill job queue, stays on the primary ('default').
+
+Reading your own writes: a request that writes expense data pins its user to
+the primary for PRIMARY_PIN_SECONDS (longer than the replica should ever
+lag), so the list they are redirected to already shows the change. Pins live
+in the default cache, which therefore has to be shared by every process (web
+workers, the bill worker): a system check refuses a replica alongside a
+per-process cache such as the default LocMemCache (set CACHE_DIR, or point
+CACHES at Redis or Memcached).
+
+Without DATABASE_REPLICA, or when that alias is missing from DATABASES, every
+query goes to the primary and none of this does any work.
+
+Settings:
+    DATABASE_REPLICA: Alias of the replica in DATABASES (default None)
+    PRIMARY_PIN_SECONDS: How long a user reads from the primary after a
+        write (default 10)
+
+Trying it locally: add a second SQLite database as the replica and copy the
+primary's file over it after migrating; the replica is never migrated. Set
+CACHE_DIR as well, for the check above.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+# Apps whose tables are replicated and may be read from the replica
+REPLICA_APPS = ('expenses',)
+
+# Models that must always be read from the primary: the bill job queue is
+# claimed and polled right after it is written
+PRIMARY_ONLY_MODELS = ('expenses.billjob',)
+
+DEFAULT_PIN_SECONDS = 10
+
+PIN_KEY = 'expenses:primary-pin:{}'
+
+
+class RoutingState:
+    """
+    Routing decisions for the current request (or worker job).
+
+    Attributes:
+        replica (str|None): Alias reads are sent to, None for the primary
+        wrote (bool): Whether replicated data has been written
+    """
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+_state = ContextVar('expenses_routing', default=None)
+
+
+def replica_alias():
+    """Returns the configured replica alias, or None if there is no replica."""
+    alias = getattr(settings, 'DATABASE_REPLICA', None)
+    return alias if alias and alias in settings.DATABASES else None
+
+
+def replicated(model):
+    """Whether ``model`` may be read from the replica."""
+    return model._meta.app_label in REPLICA_APPS and model._meta.label_lower not in PRIMARY_ONLY_MODELS
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_pin_cache(app_configs=None, **kwargs):
+    """
+    Reports a replica configured with a per-process cache, where a pin set by
+    one worker would not reach the others and users could read stale data
+    right after writing.
+    """
+    from .versions import shared_cache
+
+    if replica_alias() is None or shared_cache():
+        return []
+    return [checks.Error(
+        'DATABASE_REPLICA needs a cache shared by all processes for its read-your-writes pins.',
+        hint='Set CACHE_DIR, or point CACHES at Redis or Memcached.',
+        obj='DATABASE_REPLICA',
+        id='expenses.E001',
+    )]
+
+
+def pin_to_primary(user_id):
+    """Sends ``user_id``'s reads to the primary for PRIMARY_PIN_SECONDS."""
+    cache.set(PIN_KEY.format(user_id), True, getattr(settings, 'PRIMARY_PIN_SECONDS', DEFAULT_PIN_SECONDS))
+
+
+def is_pinned(user_id):
+    """Whether ``user_id`` wrote recently enough to be reading from the primary."""
+    return cache.get(PIN_KEY.format(user_id), False)
+
+
+async def ais_pinned(user_id):
+    """Async version of ``is_pinned``."""
+    return await cache.aget(PIN_KEY.format(user_id), False)
+
+
+@contextmanager
+def _reading_from(alias):
+    """Sends reads of replicated tables to ``alias`` (None: the primary) while active."""
+    state = _state.get()
+    token = None
+    if state is None:
+        state = RoutingState()
+        token = _state.set(state)
+    previous = state.replica
+    state.replica = alias
+    try:
+        yield alias or DEFAULT_DB_ALIAS
+    finally:
+        state.replica = previous
+        if token is not None:
+            _state.reset(token)
+
+
+@contextmanager
+def replica_reads(user_id):
+    """
+    Sends reads of replicated tables to the replica while active, unless
+    ``user_id`` is pinned to the primary or data is written meanwhile.
+
+    Yields:
+        str: The alias reads go to, for querysets and transactions that
+        outlive the block (server-side cursors, streamed responses)
+    """
+    alias = replica_alias()
+    with _reading_from(alias if alias and not is_pinned(user_id) else None) as using:
+        yield using
+
+
+def read_replica(view):
+    """
+    View decorator: GET and HEAD requests read from the replica (see
+    ``replica_reads``). Apply it below login_required. Works on sync and
+    async views; the routing follows an async view's queries into the
+    threads they run on.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+            alias = replica_alias()
+            if alias:
+                user = await request.auser()
+                if await ais_pinned(user.pk):
+                    alias = None
+            with _reading_from(alias):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        with replica_reads(request.user.pk):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Routes reads of replicated tables to the replica inside ``replica_reads``
+    and everything else to the primary.
+
+    Writes always go to the primary, even for instances loaded from the
+    replica, and mark the request so its later reads stay on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica and not state.wrote and replicated(model):
+            return state.replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and replicated(model):
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica follows the primary's schema; it is never migrated
+        if db == replica_alias():
+            return False
+        return None
+
+
+class PrimaryPinMiddleware:
+    """
+    Pins users to the primary after requests that wrote expense data.
+
+    Must come after AuthenticationMiddleware. Dropped from the middleware
+    chain at startup when no replica is configured. Handles both sync and
+    async requests.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if replica_alias() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and request.user.is_authenticated:
+            pin_to_primary(request.user.pk)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            user = await request.auser()
+            if user.is_authenticated:
+                await sync_to_async(pin_to_primary)(user.pk)
+        return response
@@ -0,0 +1,222 @@
+"""
+Ranked full-text search over expense titles and descriptions.
+
+The index lives next to the expense table and is maintained by the database
+itself, so every write path (the ORM, bulk inserts, COPY imports, raw
+deletes) keeps it current:
+
+* PostgreSQL: a stored generated ``search_vector`` tsvector column (titles
+  weighted above descriptions) with a GIN index, added by migration 0009.
+  Ranking uses ts_rank.
+* SQLite (tests and local development): an external-content FTS5 table,
+  ``expenses_expense_fts``, kept in sync by triggers. Rebuilding a table,
+  which SQLite migrations do for most schema changes, drops its triggers,
+  so they are (re)installed after every ``migrate`` by
+  ``install_sqlite_triggers``. Ranking uses bm25, which depends on the
+  whole index, so ranks can shift slightly as other rows change.
+
+Queries are split into words; every word has to appear in the title or the
+description, and each matches as a prefix ("groc" finds "Groceries").
+Any other database, and ExpenseHistory querysets (archived expenses are not
+indexed, see expenses/archive.py), fall back to case-insensitive substring
+matching.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Expense
+
+# Longest accepted query and the number of words used from it
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 8
+
+# Text search configuration: no stemming or stop words, since titles are
+# short, often not English, and mostly names
+TS_CONFIG = 'simple'
+
+SEARCH_COLUMN = 'search_vector'
+FTS_TABLE = 'expenses_expense_fts'
+
+# bm25 weights of the FTS5 columns (title, description)
+FTS_WEIGHTS = (2.0, 1.0)
+
+WORD = re.compile(r'\w+')
+
+# Triggers keeping the FTS5 table in sync with expenses_expense
+SQLITE_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON expenses_expense BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON expenses_expense BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, description ON expenses_expense BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+)
+
+
+def parse_terms(query):
+    """
+    Splits a search query into at most MAX_TERMS distinct lower-case words.
+
+    Punctuation and search operators are dropped, so the result is always
+    safe to embed in a full-text query.
+    """
+    terms = []
+    for word in WORD.findall((query or '')[:MAX_QUERY_LENGTH].casefold()):
+        if word not in terms:
+            terms.append(word)
+    return terms[:MAX_TERMS]
+
+
+def _table(connection):
+    return connection.ops.quote_name(Expense._meta.db_table)
+
+
+def _pg_query(terms):
+    from django.contrib.postgres.search import SearchQuery
+
+    return SearchQuery(' & '.join(f'{term}:*' for term in terms), config=TS_CONFIG, search_type='raw')
+
+
+def _pg_vector(connection):
+    from django.contrib.postgres.search import SearchVectorField
+
+    return RawSQL(f'{_table(connection)}.{SEARCH_COLUMN}', (), output_field=SearchVectorField())
+
+
+def _fts_match(terms):
+    # Quoted prefix tokens, implicitly ANDed
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _index_vendor(queryset):
+    """Returns the vendor of the full-text index ``queryset`` can use, if any."""
+    vendor = connections[queryset.db].vendor
+    if queryset.model is Expense and vendor in ('postgresql', 'sqlite'):
+        return vendor
+    return None
+
+
+def matching(queryset, terms):
+    """
+    Narrows an Expense queryset down to the rows containing every term.
+
+    Args:
+        queryset: Expense (or ExpenseHistory) queryset, usually already
+            filtered by user
+        terms: Words from parse_terms; an empty list matches everything
+    """
+    if not terms:
+        return queryset
+    vendor = _index_vendor(queryset)
+    if vendor == 'postgresql':
+        connection = connections[queryset.db]
+        return queryset.alias(search_vector=_pg_vector(connection)).filter(search_vector=_pg_query(terms))
+    if vendor == 'sqlite':
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (_fts_match(terms),)
+        ))
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(description__icontains=term)
+    return queryset.filter(condition)
+
+
+def with_rank(queryset, terms):
+    """
+    Annotates ``search_rank`` (higher is more relevant) on a queryset
+    already narrowed down by ``matching``. Without a full-text index every
+    row gets the same rank.
+    """
+    vendor = _index_vendor(queryset) if terms else None
+    connection = connections[queryset.db]
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchRank
+
+        return queryset.annotate(search_rank=SearchRank(_pg_vector(connection), _pg_query(terms)))
+    if vendor == 'sqlite':
+        # bm25() only works against the row being matched, so the index is
+        # joined rather than queried per row
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {_table(connection)}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[_fts_match(terms)],
+        ).annotate(search_rank=RawSQL(f'-bm25({FTS_TABLE}, {weights})', (), output_field=FloatField()))
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def highlight(text, terms):
+    """
+    Returns ``text`` HTML-escaped, with the words matching ``terms`` wrapped
+    in <mark> tags.
+
+    Matching mirrors the search: case-insensitive, at the start of a word.
+    """
+    text = text or ''
+    if not terms:
+        return escape(text)
+    pattern = re.compile(
+        r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE
+    )
+    parts = []
+    position = 0
+    for match in pattern.finditer(text):
+        parts.append(escape(text[position:match.start()]))
+        parts.append(f'<mark>{escape(match.group())}</mark>')
+        position = match.end()
+    parts.append(escape(text[position:]))
+    return mark_safe(''.join(parts))
+
+
+def install_sqlite_triggers(connection):
+    """
+    Creates the FTS5 sync triggers if they are missing and, in that case,
+    rebuilds the index from the expense table.
+
+    Returns:
+        bool: Whether anything had to be installed
+    """
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        if FTS_TABLE not in tables:
+            return False
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            (f'{FTS_TABLE}_%',),
+        )
+        if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+            return False
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+@receiver(post_migrate, dispatch_uid='expense_search_triggers')
+def ensure_search_index(sender, using='default', **kwargs):
+    """Reinstalls the SQLite search triggers after migrations (see module docstring)."""
+    if sender.name != 'expenses':
+        return
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        install_sqlite_triggers(connection)
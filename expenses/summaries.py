@@ -0,0 +1,301 @@
+"""
+Incremental maintenance of the ExpenseSummary table.
+
+Every Expense write is turned into deltas against one (user, month, category)
+bucket: a create adds the expense, a delete removes it and an update removes
+the old values and adds the new ones. The deltas are applied from model
+signals, inside the transaction that wrote the expense, so the summary never
+commits without the expense change (or vice versa).
+
+Writes that bypass model signals - ``QuerySet.update()``, ``bulk_create()``
+and raw SQL - must call ``record_bulk_insert`` or be followed by a rebuild
+with the ``rebuild_expense_summaries`` management command, which can also
+report drift. They must also bump the owners' data versions with
+``versions.touch``.
+"""
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least, TruncMonth
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import archive, catalog
+from .models import Category, Expense, ExpenseHistory, ExpenseSummary
+from .money import MoneyField
+
+ZERO = Decimal('0.00')
+
+
+def month_start(value):
+    """Returns the first day of the month containing ``value``."""
+    return date(value.year, value.month, 1)
+
+
+def _bucket(user_id, month, category_id):
+    return ExpenseSummary.objects.filter(user_id=user_id, month=month, category_id=category_id)
+
+
+def _expense_state(instance):
+    """
+    Returns the (user_id, category_id, date, amount) of an expense instance,
+    coercing values assigned from forms (e.g. date strings) to Python types.
+    """
+    return (
+        instance.user_id,
+        instance.category_id,
+        Expense._meta.get_field('date').to_python(instance.date),
+        Expense._meta.get_field('amount').to_python(instance.amount),
+    )
+
+
+def add_to_bucket(user_id, month, category_id, count, total, min_amount, max_amount):
+    """
+    Adds ``count`` expenses summing to ``total`` to a bucket, creating it if needed.
+
+    The update is a single atomic UPDATE, so concurrent writers for the same
+    bucket cannot lose increments. If the bucket does not exist yet it is
+    inserted; losing that race to another writer falls back to the UPDATE.
+    """
+    # Amounts go into the SQL as paise, like the columns they are compared with
+    added, low, high = (Value(amount, output_field=MoneyField()) for amount in (total, min_amount, max_amount))
+    changes = {
+        'count': F('count') + count,
+        'total': F('total') + added,
+        'min_amount': Least(Coalesce(F('min_amount'), low), low),
+        'max_amount': Greatest(Coalesce(F('max_amount'), high), high),
+    }
+    if _bucket(user_id, month, category_id).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            ExpenseSummary.objects.create(
+                user_id=user_id, month=month, category_id=category_id,
+                count=count, total=total, min_amount=min_amount, max_amount=max_amount,
+            )
+    except IntegrityError:
+        _bucket(user_id, month, category_id).update(**changes)
+
+
+def remove_from_bucket(user_id, month, category_id, amount):
+    """
+    Removes one expense of ``amount`` from a bucket.
+
+    Count and total are decremented in place. The bucket is deleted once it
+    is empty, and min/max are recomputed from the (indexed) expense rows of
+    that month only when the removed amount was one of the extremes.
+    """
+    bucket = _bucket(user_id, month, category_id).select_for_update().first()
+    if bucket is None:
+        return
+    if bucket.count <= 1:
+        bucket.delete()
+        return
+
+    bucket.count -= 1
+    bucket.total -= amount
+    if amount in (bucket.min_amount, bucket.max_amount):
+        next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        source = ExpenseHistory if archive.reaches_archive(month) else Expense
+        extremes = source.objects.filter(
+            user_id=user_id, category_id=category_id, date__gte=month, date__lt=next_month
+        ).aggregate(min_amount=Min('amount'), max_amount=Max('amount'))
+        bucket.min_amount = extremes['min_amount']
+        bucket.max_amount = extremes['max_amount']
+    bucket.save(update_fields=['count', 'total', 'min_amount', 'max_amount'])
+
+
+def record_bulk_insert(expenses):
+    """
+    Applies summary deltas for expenses inserted without model signals.
+
+    Expenses are grouped by bucket first, so each bucket is touched once no
+    matter how many rows were inserted. Call this in the same transaction as
+    the ``bulk_create``.
+
+    Args:
+        expenses: Iterable of saved Expense instances (or objects with the same
+            user_id, category_id, date and amount attributes)
+    """
+    buckets = defaultdict(lambda: [0, ZERO, None, None])
+    for expense in expenses:
+        user_id, category_id, expense_date, amount = _expense_state(expense)
+        bucket = buckets[(user_id, month_start(expense_date), category_id)]
+        bucket[0] += 1
+        bucket[1] += amount
+        bucket[2] = amount if bucket[2] is None else min(bucket[2], amount)
+        bucket[3] = amount if bucket[3] is None else max(bucket[3], amount)
+    for (user_id, month, category_id), (count, total, low, high) in buckets.items():
+        add_to_bucket(user_id, month, category_id, count, total, low, high)
+
+
+@receiver(post_save, sender=Expense, dispatch_uid='expense_summary_save')
+def expense_saved(sender, instance, created, raw=False, **kwargs):
+    """Moves an expense's contribution from its old bucket to its new one."""
+    if raw:
+        # Fixture loading: summaries are rebuilt separately
+        return
+    user_id, category_id, expense_date, amount = _expense_state(instance)
+    previous = getattr(instance, '_loaded_values', None)
+
+    if not created:
+        if previous is None or len(previous) < len(Expense.SUMMARY_FIELDS):
+            # Instance was not loaded from the database (e.g. constructed with
+            # a pk), so the old values are unknown - fall back to a rebuild
+            rebuild_user(user_id)
+            return
+        old = (previous['user_id'], previous['category_id'], previous['date'], previous['amount'])
+        if old == (user_id, category_id, expense_date, amount):
+            return
+        remove_from_bucket(old[0], month_start(old[2]), old[1], old[3])
+
+    add_to_bucket(user_id, month_start(expense_date), category_id, 1, amount, amount, amount)
+    instance._loaded_values = dict(
+        previous or {}, user_id=user_id, category_id=category_id, date=expense_date, amount=amount
+    )
+
+
+@receiver(post_delete, sender=Expense, dispatch_uid='expense_summary_delete')
+def expense_deleted(sender, instance, **kwargs):
+    """Removes a deleted expense from its bucket."""
+    previous = getattr(instance, '_loaded_values', None)
+    if previous is not None and len(previous) == len(Expense.SUMMARY_FIELDS):
+        user_id, category_id, expense_date, amount = (
+            previous['user_id'], previous['category_id'], previous['date'], previous['amount']
+        )
+    else:
+        user_id, category_id, expense_date, amount = _expense_state(instance)
+    remove_from_bucket(user_id, month_start(expense_date), category_id, amount)
+
+
+@receiver(pre_delete, sender=Category, dispatch_uid='expense_summary_category_delete')
+def category_deleted(sender, instance, **kwargs):
+    """
+    Folds a deleted category's buckets into the uncategorized buckets.
+
+    Deleting a category sets its expenses' category to NULL without sending
+    Expense signals, so the summaries are moved over here. The original rows
+    are then removed by the cascade.
+    """
+    for bucket in ExpenseSummary.objects.filter(category=instance):
+        add_to_bucket(
+            bucket.user_id, bucket.month, None,
+            bucket.count, bucket.total, bucket.min_amount, bucket.max_amount,
+        )
+
+
+def compute_buckets(user_id=None):
+    """
+    Aggregates buckets straight from the expenses, archived ones included.
+
+    Returns:
+        dict: {(user_id, month, category_id): (count, total, min, max)}
+    """
+    expenses = ExpenseHistory.objects.all()
+    if user_id is not None:
+        expenses = expenses.filter(user_id=user_id)
+    rows = (
+        expenses
+        .annotate(month=TruncMonth('date'))
+        .values('user_id', 'month', 'category_id')
+        .annotate(count=Count('id'), total=Sum('amount'), low=Min('amount'), high=Max('amount'))
+        .order_by()
+    )
+    return {
+        (row['user_id'], row['month'], row['category_id']):
+            (row['count'], row['total'], row['low'], row['high'])
+        for row in rows
+    }
+
+
+def stored_buckets(user_id=None):
+    """Returns the summary table contents in the same shape as compute_buckets."""
+    summaries = ExpenseSummary.objects.all()
+    if user_id is not None:
+        summaries = summaries.filter(user_id=user_id)
+    return {
+        (s.user_id, s.month, s.category_id): (s.count, s.total, s.min_amount, s.max_amount)
+        for s in summaries
+    }
+
+
+def find_drift(user_id=None):
+    """
+    Compares the summary table with a fresh aggregation of the expenses.
+
+    Returns:
+        list: (bucket key, stored values, expected values) for every bucket
+        that differs; missing buckets are reported as None
+    """
+    expected = compute_buckets(user_id)
+    stored = stored_buckets(user_id)
+    return [
+        (key, stored.get(key), expected.get(key))
+        for key in sorted(set(expected) | set(stored), key=str)
+        if stored.get(key) != expected.get(key)
+    ]
+
+
+@transaction.atomic
+def rebuild_user(user_id):
+    """Recomputes every bucket of one user from their expenses."""
+    ExpenseSummary.objects.filter(user_id=user_id).delete()
+    ExpenseSummary.objects.bulk_create([
+        ExpenseSummary(
+            user_id=user_id, month=month, category_id=category_id,
+            count=count, total=total, min_amount=low, max_amount=high,
+        )
+        for (_, month, category_id), (count, total, low, high) in compute_buckets(user_id).items()
+    ])
+
+
+def user_total(user, category=None):
+    """
+    Returns the total amount of a user's expenses from the summary table.
+
+    Args:
+        user: User whose expenses are totalled
+        category: Optional category id to restrict the total to
+
+    Returns:
+        Decimal: Sum of the user's expense amounts (0 if none)
+    """
+    summaries = ExpenseSummary.objects.filter(user=user)
+    if category is not None:
+        summaries = summaries.filter(category_id=category)
+    return summaries.aggregate(total=Sum('total'))['total'] or ZERO
+
+
+def category_breakdown(user, month=None):
+    """
+    Returns a user's spending per category, largest first.
+
+    Args:
+        user: User whose expenses are broken down
+        month: Optional date; only that month is included when given
+
+    Returns:
+        list: Dicts with 'category' (name, from the category catalog),
+        'count' and 'total'
+    """
+    summaries = ExpenseSummary.objects.filter(user=user)
+    if month is not None:
+        summaries = summaries.filter(month=month_start(month))
+    rows = (
+        summaries
+        .values('category_id')
+        .annotate(count=Sum('count'), total=Sum('total'))
+        .order_by('-total')
+    )
+    return [
+        {
+            'category': catalog.name(row['category_id'], 'Uncategorized'),
+            'count': row['count'],
+            'total': row['total'],
+        }
+        for row in rows
+    ]
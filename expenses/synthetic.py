@@ -0,0 +1,354 @@
+"""
+Synthetic expense data for benchmarks and load tests.
+
+Everything generated here is deterministic for a given seed and end date
+(the last day of the history), so two runs (or a run and its baseline) given
+the same ones work on identical data; the end date defaults to today. Users are created
+without usable passwords; benchmarks log them in with ``force_login``.
+
+The data is shaped like real spending rather than uniform noise:
+
+* categories follow CATEGORY_PROFILES, keyed by the names seeded by
+  migrations 0002 and 0004 (food and transport are frequent and cheap,
+  education and investments rare and expensive); other categories get
+  DEFAULT_PROFILE and some expenses have no category at all
+* amounts are log-normal around each category's median, scaled per user
+  (some users simply spend more) and rounded like real prices
+* dates favour weekends and the festive months, and start when the user
+  "joined", somewhere in the first half of the history; times of day
+  follow HOUR_WEIGHTS, with peaks around meals and the evening
+* users differ in how many expenses they have (``split_counts``)
+
+Values are drawn with numpy, in chunks of GENERATION_CHUNK expenses that
+each get their own random stream. The output therefore depends only on the
+seed, the user's stream number and the counts, not on the insert batch
+size or on how many worker processes share the work.
+
+Rows are written as plain column values (amounts in paise, see
+expenses/money.py) with multi-row INSERT statements: the statements
+bulk_create would send, without building and compiling a model instance per
+row, which took most of bulk_create's time. The search index is maintained
+by the database itself (see expenses/search.py). Writes bypass model
+signals, so the owners' summaries are rebuilt and their data versions bumped
+after seeding, as expenses/summaries.py requires. ``python manage.py generate_expenses`` drives ``generate`` from
+the command line.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, time, timedelta
+from itertools import chain, islice
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import summaries, versions
+from .models import Category, Expense
+
+# Expenses inserted per INSERT statement, at most (SQLite allows fewer)
+BATCH_SIZE = 2000
+
+# Columns written by build_rows/insert_rows, in order (the same as the
+# importer's COPY)
+COLUMNS = ('user_id', 'category_id', 'title', 'amount', 'description', 'date', 'time')
+
+# Expenses drawn per random stream; changing it changes the generated data
+GENERATION_CHUNK = 10_000
+
+# Days of history generated, ending on the end date
+HISTORY_DAYS = 730
+
+# Per category: (share of expenses, median amount in rupees, spread of the
+# log-normal amounts, rounding in paise, titles)
+CATEGORY_PROFILES = {
+    'Food': (30, 220, 0.8, 100, (
+        'Groceries', 'Coffee', 'Lunch', 'Dinner out', 'Snacks', 'Food delivery', 'Vegetables', 'Milk',
+    )),
+    'Transportation': (16, 140, 0.9, 100, ('Taxi', 'Metro card', 'Fuel', 'Auto rickshaw', 'Bus pass', 'Parking')),
+    'Shopping': (12, 1_200, 1.0, 100, ('Clothes', 'Online order', 'Shoes', 'Electronics', 'Household items')),
+    'Bills': (9, 1_500, 0.7, 100, (
+        'Electricity bill', 'Mobile recharge', 'Internet bill', 'Rent', 'Water bill', 'Gas cylinder',
+    )),
+    'Entertainment': (8, 550, 0.8, 100, ('Movie tickets', 'Streaming subscription', 'Concert', 'Games')),
+    'Healthcare': (5, 700, 1.1, 100, ('Pharmacy', 'Doctor visit', 'Lab tests', 'Gym membership')),
+    'Education': (4, 2_500, 1.2, 100, ('Books', 'Course fee', 'Stationery', 'Tuition')),
+    'Investments': (3, 5_000, 0.8, 50_000, ('Mutual fund SIP', 'Fixed deposit', 'Gold', 'Stocks')),
+    'Other': (6, 350, 1.3, 1, ('Gift', 'Donation', 'Haircut', 'Laundry', 'Miscellaneous')),
+}
+
+# Profile of categories not listed above, and of expenses without a category
+DEFAULT_PROFILE = (2, 400, 1.2, 1, ('Miscellaneous', 'Cash withdrawal', 'Payment'))
+
+# Share of expenses (relative to the category shares, which add up to 95)
+# left uncategorized
+UNCATEGORIZED_SHARE = 5
+
+# Titles used anywhere in the generated data
+TITLES = tuple(dict.fromkeys(chain.from_iterable(
+    profile[4] for profile in (*CATEGORY_PROFILES.values(), DEFAULT_PROFILE)
+)))
+
+# Relative number of expenses per hour of the day, from midnight
+HOUR_WEIGHTS = (1, 0.5, 0.3, 0.2, 0.2, 0.5, 2, 5, 8, 9, 7, 6, 8, 9, 6, 5, 5, 7, 9, 10, 9, 7, 4, 2)
+
+# Relative number of expenses per weekday, from Monday
+WEEKDAY_WEIGHTS = (0.9, 0.9, 0.95, 1.0, 1.15, 1.35, 1.25)
+
+# Relative number of expenses per month, from January (festive season in
+# October and November, year end in December)
+MONTH_WEIGHTS = (1.0, 0.9, 1.0, 1.0, 1.05, 1.0, 0.95, 1.0, 1.05, 1.25, 1.3, 1.15)
+
+# Spread of the per-user spending level and activity (log-normal sigmas)
+USER_SPEND_SPREAD = 0.5
+USER_ACTIVITY_SPREAD = 0.6
+
+# Share of expenses with a description, and the descriptions used
+DESCRIBED_SHARE = 0.4
+DESCRIPTIONS = (
+    'Paid by UPI', 'Paid by card', 'Paid in cash', 'Split with friends', 'Monthly payment',
+    'Reimbursable', 'Weekend trip', 'Family', 'Office', 'Discount applied',
+)
+
+# Amounts are kept between Rs. 1 and Rs. 1 crore (the field allows more)
+MIN_PAISE = 100
+MAX_PAISE = 10 ** 9
+
+
+def categories(count):
+    """
+    Returns ``count`` categories: the seeded ones first (by id), then
+    'Category N' rows created as needed.
+    """
+    existing = list(Category.objects.order_by('id')[:count])
+    for number in range(len(existing) + 1, count + 1):
+        existing.append(Category.objects.get_or_create(name=f'Category {number}')[0])
+    return existing
+
+
+def create_users(count, prefix='synthetic'):
+    """Creates ``count`` users named ``<prefix>-<n>`` without usable passwords."""
+    users = []
+    for number in range(1, count + 1):
+        user = User(username=f'{prefix}-{number}')
+        user.set_unusable_password()
+        users.append(user)
+    return User.objects.bulk_create(users)
+
+
+def split_counts(total, users, seed=0):
+    """
+    Splits ``total`` expenses between ``users`` users unevenly, the way
+    activity varies between real users.
+
+    Returns:
+        list: ``users`` non-negative counts adding up to ``total``
+    """
+    if users < 1:
+        return []
+    weights = np.random.default_rng([seed, 0]).lognormal(0, USER_ACTIVITY_SPREAD, users)
+    shares = weights / weights.sum() * total
+    counts = np.floor(shares).astype(np.int64)
+    # Hand out what rounding down left over, largest remainders first
+    for index in np.argsort(counts - shares, kind='stable')[:total - int(counts.sum())]:
+        counts[index] += 1
+    return counts.tolist()
+
+
+def _profiles(category_pool):
+    """
+    Returns (category ids, shares, log medians in paise, spreads, roundings,
+    titles) for the pool, with None (uncategorized) last.
+    """
+    rows = [
+        (category.pk, *CATEGORY_PROFILES.get(category.name, DEFAULT_PROFILE))
+        for category in category_pool
+    ]
+    rows.append((None, UNCATEGORIZED_SHARE, *DEFAULT_PROFILE[1:]))
+    ids, shares, medians, spreads, roundings, titles = zip(*rows)
+    shares = np.array(shares, dtype=float)
+    return (
+        ids,
+        shares / shares.sum(),
+        np.log(np.array(medians, dtype=float) * 100),
+        np.array(spreads),
+        np.array(roundings),
+        titles,
+    )
+
+
+def _day_weights(first_day):
+    """Relative number of expenses on each of the HISTORY_DAYS days from ``first_day``."""
+    days = [first_day + timedelta(days=offset) for offset in range(HISTORY_DAYS)]
+    return np.array([WEEKDAY_WEIGHTS[day.weekday()] * MONTH_WEIGHTS[day.month - 1] for day in days])
+
+
+def build_rows(user_id, count, category_pool, seed=0, stream=None, end_date=None):
+    """
+    Yields ``count`` generated expenses for a user, spread over the last
+    HISTORY_DAYS days, as tuples of database values in COLUMNS order.
+
+    Args:
+        user_id: Id of the owner of the expenses
+        count: Number of expenses
+        category_pool: Categories to pick from, matched to CATEGORY_PROFILES
+            by name
+        seed: Seed of the random values
+        stream: Which independent stream of the seed to use; defaults to
+            the user id, so each user gets different expenses
+        end_date: Last day of the generated history (defaults to today);
+            the expenses depend on it as much as on the seed
+    """
+    stream = user_id if stream is None else stream
+    end_date = end_date or timezone.localdate()
+    first_day = end_date - timedelta(days=HISTORY_DAYS - 1)
+
+    ids, shares, log_medians, spreads, roundings, titles = _profiles(category_pool)
+    user_rng = np.random.default_rng([seed, stream])
+    log_medians = log_medians + user_rng.normal(0, USER_SPEND_SPREAD)
+    day_weights = _day_weights(first_day)
+    # Nothing before the user joined
+    day_weights[:user_rng.integers(HISTORY_DAYS // 2)] = 0
+    day_weights /= day_weights.sum()
+    hour_weights = np.array(HOUR_WEIGHTS) / sum(HOUR_WEIGHTS)
+    first_ordinal = first_day.toordinal()
+
+    for chunk, start in enumerate(range(0, count, GENERATION_CHUNK)):
+        size = min(GENERATION_CHUNK, count - start)
+        rng = np.random.default_rng([seed, stream, chunk + 1])
+        picked = rng.choice(len(ids), size, p=shares)
+        paise = np.exp(rng.normal(log_medians[picked], spreads[picked]))
+        paise = np.clip(np.round(paise / roundings[picked]) * roundings[picked], MIN_PAISE, MAX_PAISE)
+        days = rng.choice(HISTORY_DAYS, size, p=day_weights) + first_ordinal
+        hours = rng.choice(24, size, p=hour_weights)
+        seconds = rng.integers(3600, size=size)
+        title_positions = rng.random(size)
+        described = rng.random(size) < DESCRIBED_SHARE
+        notes = rng.integers(len(DESCRIPTIONS), size=size)
+
+        for category, amount, day, hour, second, position, has_description, note in zip(
+            picked.tolist(), paise.astype(np.int64).tolist(), days.tolist(), hours.tolist(),
+            seconds.tolist(), title_positions.tolist(), described.tolist(), notes.tolist(),
+        ):
+            options = titles[category]
+            yield (
+                user_id,
+                ids[category],
+                options[int(position * len(options))],
+                amount,
+                DESCRIPTIONS[note] if has_description else '',
+                date.fromordinal(day).isoformat(),
+                time(hour, second // 60, second % 60).isoformat(),
+            )
+
+
+def insert_rows(rows, batch_size=BATCH_SIZE, using='default'):
+    """
+    Inserts rows from ``build_rows`` with multi-row INSERT statements of up
+    to ``batch_size`` rows (fewer where the database limits the number of
+    query parameters, as bulk_create does).
+
+    Returns:
+        int: Number of rows inserted
+    """
+    connection = connections[using]
+    ops = connection.ops
+    if connection.features.max_query_params:
+        batch_size = max(1, min(batch_size, connection.features.max_query_params // len(COLUMNS)))
+    table = ops.quote_name(Expense._meta.db_table)
+    columns = ', '.join(ops.quote_name(column) for column in COLUMNS)
+    placeholder = f"({', '.join(['%s'] * len(COLUMNS))})"
+    rows = iter(rows)
+    inserted = 0
+    with connection.cursor() as cursor:
+        while batch := list(islice(rows, batch_size)):
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([placeholder] * len(batch))}",
+                list(chain.from_iterable(batch)),
+            )
+            inserted += len(batch)
+    return inserted
+
+
+def seed_user(user, count, category_pool, seed=0, stream=None, batch_size=BATCH_SIZE, end_date=None):
+    """
+    Inserts ``count`` generated expenses for ``user`` in batches and brings
+    the user's summaries and data version up to date, in one transaction.
+
+    Args:
+        user: Owner of the expenses (a User or a user id)
+        count: Number of expenses
+        category_pool: Categories to pick from
+        seed: Seed of the random values
+        stream: Random stream of the seed (see ``build_rows``)
+        batch_size: Expenses per INSERT statement
+        end_date: Last day of the generated history (defaults to today)
+    """
+    user_id = getattr(user, 'pk', user)
+    with transaction.atomic():
+        rows = build_rows(user_id, count, category_pool, seed=seed, stream=stream, end_date=end_date)
+        insert_rows(rows, batch_size)
+        summaries.rebuild_user(user_id)
+        versions.touch(user_id)
+
+
+def _start_worker():
+    """Initializes a worker process: Django apps, and no connections shared with the parent."""
+    import django
+
+    django.setup()
+    connections.close_all()
+
+
+def _seed_task(task):
+    """
+    Runs ``seed_user`` for one (user id, count, category ids, seed, stream,
+    batch size, end date) task.
+    """
+    user_id, count, category_ids, seed, stream, batch_size, end_date = task
+    pool = list(Category.objects.filter(pk__in=category_ids).order_by('id'))
+    seed_user(user_id, count, pool, seed=seed, stream=stream, batch_size=batch_size, end_date=end_date)
+    return user_id, count
+
+
+def generate(users, counts, category_pool, seed=0, workers=1, batch_size=BATCH_SIZE, progress=None,
+             end_date=None):
+    """
+    Seeds every user with its count of expenses, optionally in parallel.
+
+    Each user is seeded in its own transaction, and the n-th user (from 1)
+    always draws from stream n, so the data is the same whatever the number
+    of workers. Work is handed out largest user first to balance the workers.
+
+    Args:
+        users: Users to seed, in a stable order
+        counts: Number of expenses of each user (e.g. from ``split_counts``)
+        category_pool: Categories to pick from
+        seed: Seed of the random values
+        workers: Processes inserting at the same time; 1 seeds in this process
+        batch_size: Expenses per INSERT statement
+        progress: Optional callable receiving (user id, count) as users finish
+        end_date: Last day of the generated history; defaults to today, read
+            once here so every worker uses the same day
+    """
+    category_ids = [category.pk for category in category_pool]
+    end_date = end_date or timezone.localdate()
+    tasks = sorted(
+        ((user.pk, count, category_ids, seed, stream, batch_size, end_date)
+         for stream, (user, count) in enumerate(zip(users, counts), start=1)),
+        key=lambda task: -task[1],
+    )
+    if workers <= 1:
+        finished = map(_seed_task, tasks)
+    else:
+        # Workers open their own connections; inherited ones must not be reused
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_start_worker)
+        finished = executor.map(_seed_task, tasks)
+    try:
+        for user_id, count in finished:
+            if progress:
+                progress(user_id, count)
+    finally:
+        if workers > 1:
+            executor.shutdown(cancel_futures=True)
@@ -0,0 +1,33 @@
+"""
+Template filters for showing amounts in Indian Rupees.
+
+Usage:
+    {% load currency %}
+    {{ expense.amount|inr }}           -> (Rs. 12,34,567.89)
+    {{ expense.amount|inr:"symbol" }}  -> ₹12,34,567.89
+
+Views pass raw amounts (Decimals, or floats from the analytics results) and
+the templates format them while rendering, so only what is actually shown
+is formatted and no model instance has to be mutated beforehand.
+"""
+
+from django import template
+
+from ..currency import format_indian_currency, format_rupees
+
+register = template.Library()
+
+
+@register.filter(is_safe=True)
+def inr(amount, style=None):
+    """
+    Formats an amount in rupees with Indian digit grouping.
+
+    Args:
+        amount: Amount in rupees (Decimal, int, float or numeric string)
+        style: 'symbol' for the ₹ sign; by default the "(Rs. X)" form used
+            on the pages and in the PDF bills
+    """
+    if style == 'symbol':
+        return format_rupees(amount)
+    return format_indian_currency(amount)
@@ -1,3 +1,2403 @@
-from django.test import TestCase
+"""
+Tests for the Expense Tracker application.
 
-# Create your tests here.
+The query plan tests seed a few thousand expenses, drive the views through the
+test client, capture every query they run against the expense table and run
+EXPLAIN on it. A plan that falls back to a sequential scan or needs a separate
+sort step means an index no longer matches that access path.
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+import zlib
+from datetime import date, time, timedelta
+from decimal import Decimal
+from functools import partial
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core import signing
+from django.core.management.base import CommandError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, router
+from django.db.models import Sum
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader
+
+from .currency import format_amounts, format_indian_currency, indian_number
+from .exports import export_record
+from .filters import ExpenseFilters
+from .models import ArchivedExpense, BillJob, Category, Expense, ExpenseHistory, ExpenseSummary, UserDataVersion
+from .money import Paise, to_paise
+from . import analytics, archive, assets, benchmarks, bills, catalog, compression, concurrency, exports, finance, fragments, importer, jobs, metrics, pagination, profiling, routing, search, summaries, synthetic, urls, versions, views
+from .instrumentation import AUTH_QUERIES, VERSION_QUERIES, VIEW_QUERY_BUDGETS, record_queries
+
+
+def seed_expenses(user, count, categories, start=date(2024, 1, 1)):
+    """Bulk-inserts ``count`` deterministic expenses for ``user``."""
+    Expense.objects.bulk_create([
+        Expense(
+            user=user,
+            title=f'Expense {i}',
+            amount=Decimal(i % 997) + Decimal('0.50'),
+            category=categories[i % len(categories)],
+            description='Seeded expense' if i % 3 else '',
+            date=start + timedelta(days=i % 700),
+            time=time(i % 24, i % 60),
+        )
+        for i in range(count)
+    ], batch_size=500)
+
+
+def explain(sql, params=()):
+    """
+    Returns the query plan for ``sql`` as a list of lines.
+
+    On PostgreSQL sequential scans and explicit sorts are disabled for the
+    transaction, so the planner only picks them when no index can serve the
+    query - which is exactly what these tests want to detect on small data.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """Returns the lines of ``plan`` that show a full table scan or a sort step."""
+    table = Expense._meta.db_table
+    if connection.vendor == 'postgresql':
+        patterns = [rf'Seq Scan on {table}\b', r'\bSort\s+\(']
+    else:
+        patterns = [rf'^SCAN {table}\b', r'USE TEMP B-TREE FOR .*ORDER BY']
+    return [line for line in plan if any(re.search(p, line.strip()) for p in patterns)]
+
+
+class KeysetPaginationTests(TestCase):
+    """Every sort order pages through all expenses exactly once, and bad cursors are refused."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='pager', password='pass12345')
+        categories = [None, *Category.objects.all()[:2]]
+        # Few distinct dates, times, amounts, titles and categories, so every
+        # sort key has long runs of ties for the tie-breakers to settle
+        Expense.objects.bulk_create([
+            Expense(
+                user=cls.user,
+                title=f'Expense {i % 3}',
+                amount=Decimal(i % 4) + Decimal('0.50'),
+                category=categories[i % 3],
+                description='Seeded expense',
+                date=date(2024, 1, 1) + timedelta(days=i % 5),
+                time=time(9, 30 * (i % 2)),
+            )
+            for i in range(130)
+        ])
+        cls.other = User.objects.create_user(username='other', password='pass12345')
+        seed_expenses(cls.other, 20, categories[1:])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Loaded once per process, outside the requests
+        catalog.get_catalog(refresh=True)
+
+    @staticmethod
+    def row_ids(html):
+        return [int(pk) for pk in re.findall(r'/delete/(\d+)/', html)]
+
+    def expected_ids(self, sort_by, search_terms=()):
+        queryset = views.list_queryset(self.user, search_terms, sort_by)
+        return list(pagination.sorted_queryset(queryset, sort_by).values_list('pk', flat=True))
+
+    def walk(self, sort_by):
+        """Returns the ids on every page the list view and the page endpoint serve, in order."""
+        first = self.client.get(reverse('expenses:expense_list'), {'sort': sort_by})
+        self.assertEqual(first.context['current_sort'], sort_by)
+        ids = self.row_ids(first.context['rows']['html'])
+        cursor = first.context['rows']['next_cursor']
+        while cursor:
+            response = self.client.get(reverse('expenses:expense_list_page'), {'sort': sort_by, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            ids.extend(self.row_ids(body['html']))
+            cursor = body['next_cursor']
+        return ids
+
+    def test_views_page_through_every_sort_order(self):
+        for sort_by in pagination.SORT_ORDERINGS:
+            if sort_by == pagination.RELEVANCE_SORT:
+                continue
+            with self.subTest(sort=sort_by):
+                ids = self.walk(sort_by)
+                self.assertEqual(len(ids), 130)
+                self.assertEqual(ids, self.expected_ids(sort_by))
+
+    def test_page_boundaries_inside_runs_of_ties(self):
+        terms = search.parse_terms('seeded')
+        for sort_by in pagination.SORT_ORDERINGS:
+            for page_size in (1, 7, 26):
+                with self.subTest(sort=sort_by, page_size=page_size):
+                    queryset = views.list_queryset(self.user, terms, sort_by)
+                    ids, cursor = [], None
+                    while True:
+                        page = pagination.paginate(queryset, sort_by, cursor, page_size=page_size)
+                        ids.extend(expense.pk for expense in page)
+                        if not page.has_more:
+                            break
+                        self.assertEqual(len(page), page_size)
+                        cursor = page.next_cursor
+                    self.assertEqual(ids, self.expected_ids(sort_by, terms))
+                    self.assertEqual(len(set(ids)), 130)
+
+    def test_invalid_cursors(self):
+        first = self.client.get(reverse('expenses:expense_list'), {'sort': 'amount'})
+        cursor = first.context['rows']['next_cursor']
+        tampered = cursor[:-2] + ('AA' if cursor[-2:] != 'AA' else 'BB')
+        forged = signing.dumps({'s': 'amount', 'v': ['x'] * 5}, salt='another salt', compress=True)
+        cases = [
+            ('amount', tampered),
+            ('amount', 'not-a-cursor'),
+            ('amount', forged),
+            # A valid cursor, but for another sort order
+            ('-date', cursor),
+            ('title', cursor),
+        ]
+        for sort_by, bad in cases:
+            with self.subTest(sort=sort_by, cursor=bad):
+                page = self.client.get(reverse('expenses:expense_list_page'), {'sort': sort_by, 'cursor': bad})
+                self.assertEqual(page.status_code, 400)
+                self.assertIn('error', page.json())
+                with self.assertRaises(pagination.InvalidCursor):
+                    pagination.decode_cursor(sort_by, bad)
+
+                # The list view starts over from the first page instead
+                response = self.client.get(reverse('expenses:expense_list'), {'sort': sort_by, 'cursor': bad})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.row_ids(response.context['rows']['html']),
+                                 self.expected_ids(sort_by)[:pagination.DEFAULT_PAGE_SIZE])
+
+
+@override_settings(EXPENSE_ARCHIVE_MONTHS=None)
+class ExpenseQueryPlanTests(TestCase):
+    """
+    Every expense query issued by the views must be served by an index.
+
+    Archiving is off, so every query reads the main table;
+    test_archive_history_queries covers the queries that reach the archive.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = list(Category.objects.all())
+        cls.user = User.objects.create_user(username='planner', password='pass12345')
+        seed_expenses(cls.user, 3000, categories)
+        # A second user so the per-user filter is actually selective
+        other = User.objects.create_user(username='other', password='pass12345')
+        seed_expenses(other, 3000, categories)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Cached fragments would skip the queries under test
+        cache.clear()
+
+    def expense_queries(self, url, params=None, table=Expense._meta.db_table):
+        """Requests ``url`` and returns the SQL of every SELECT on ``table``."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        queries = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].lstrip().upper().startswith('SELECT') and f'"{table}"' in q['sql']
+        ]
+        self.assertTrue(queries, f'{url} issued no expense queries')
+        return queries
+
+    def assertIndexedPlans(self, url, params=None):
+        for sql in self.expense_queries(url, params):
+            plan = explain(sql)
+            problems = plan_problems(plan)
+            self.assertFalse(
+                problems,
+                f'Unindexed plan for {url} {params or ""}:\n{sql}\n\n' + '\n'.join(plan)
+            )
+
+    def test_home(self):
+        self.assertIndexedPlans(reverse('expenses:home'))
+
+    def test_expense_list_default_sort(self):
+        self.assertIndexedPlans(reverse('expenses:expense_list'))
+
+    def test_expense_list_date_sorts(self):
+        for sort in ('date', '-date'):
+            with self.subTest(sort=sort):
+                self.assertIndexedPlans(reverse('expenses:expense_list'), {'sort': sort})
+
+    def test_expense_list_amount_sorts(self):
+        for sort in ('amount', '-amount'):
+            with self.subTest(sort=sort):
+                self.assertIndexedPlans(reverse('expenses:expense_list'), {'sort': sort})
+
+    def test_expense_list_next_page(self):
+        for sort in ('-date', 'amount'):
+            with self.subTest(sort=sort):
+                page = pagination.paginate(Expense.objects.filter(user=self.user), sort)
+                self.assertIndexedPlans(
+                    reverse('expenses:expense_list_page'),
+                    {'sort': sort, 'cursor': page.next_cursor},
+                )
+
+    def test_generate_bill(self):
+        self.assertIndexedPlans(reverse('expenses:generate_bill'), {'mode': 'sync'})
+
+    def test_export(self):
+        self.assertIndexedPlans(reverse('expenses:export_expenses', args=['csv']))
+
+    def test_analytics(self):
+        self.assertIndexedPlans(reverse('expenses:analytics'))
+        self.assertIndexedPlans(reverse('expenses:analytics'), {'months': 'all'})
+
+    @override_settings(EXPENSE_ARCHIVE_MONTHS=12)
+    def test_archive_history_queries(self):
+        # Both tables under the history view must be searched by index; on
+        # SQLite merging the two ordered branches still takes a sort step
+        archive.archive_user(self.user.pk, today=date(2025, 6, 1))
+        view = ExpenseHistory._meta.db_table
+        tables = (Expense._meta.db_table, ArchivedExpense._meta.db_table)
+        for url, params in (
+            (reverse('expenses:generate_bill'), {'mode': 'sync'}),
+            (reverse('expenses:export_expenses', args=['csv']), {}),
+            (reverse('expenses:analytics'), {'months': 'all'}),
+            (reverse('expenses:api_expenses'), {'date_from': '2024-01-01'}),
+        ):
+            for sql in self.expense_queries(url, params, table=view):
+                plan = explain(sql)
+                scans = [line for line in plan for table in tables
+                         if re.search(rf'^SCAN {table}\b|Seq Scan on {table}\b', line.strip())]
+                self.assertFalse(scans, f'Unindexed plan for {url}:\n{sql}\n\n' + '\n'.join(plan))
+
+    def test_category_date_range(self):
+        category = Category.objects.first()
+        queryset = Expense.objects.filter(
+            user=self.user, category=category, date__gte=date(2024, 6, 1)
+        ).order_by('-date')
+        plan = explain(*queryset.query.sql_with_params())
+        self.assertFalse(plan_problems(plan), '\n'.join(plan))
+
+
+class BillGenerationTests(TestCase):
+    """Bills hold exactly the filtered expenses, in page-sized tables, with a matching total."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='billed', password='pass12345')
+        cls.food, cls.travel = Category.objects.all()[:2]
+        cls.expenses = [
+            Expense.objects.create(
+                user=cls.user, title=f'Bill item {i}', amount=Decimal(10 * i) + Decimal('0.25'),
+                category=(cls.food, cls.travel, None)[i % 3], description='' if i % 2 else 'Noted',
+                date=date(2024, 1, 1) + timedelta(days=i), time=time(8 + i % 12, 15),
+            )
+            for i in range(80)
+        ]
+        other = User.objects.create_user(username='other', password='pass12345')
+        seed_expenses(other, 10, [cls.food])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def billed(self, **params):
+        """Returns (titles of the billed rows, formatted total) for the filters in ``params``."""
+        context = bills.bill_context(self.user, ExpenseFilters.from_query(params), date(2025, 1, 1))
+        rows = list(bills.bill_rows(context['expenses'], format_amounts))
+        return [row[2] for row in rows], context['total']
+
+    def expected(self, match):
+        """Returns what ``billed`` should for the expenses ``match`` accepts, newest first."""
+        matching = sorted((e for e in self.expenses if match(e)), key=lambda e: (e.date, e.time), reverse=True)
+        return [e.title for e in matching], format_indian_currency(sum(e.amount for e in matching))
+
+    def test_filters_restrict_rows_and_total(self):
+        cases = [
+            ({}, lambda e: True),
+            ({'category': self.food.pk}, lambda e: e.category_id == self.food.pk),
+            ({'date_from': '2024-02-01', 'date_to': '2024-02-29'}, lambda e: e.date.month == 2),
+            ({'date_from': '2024-03-01'}, lambda e: e.date >= date(2024, 3, 1)),
+            ({'min_amount': '100.25', 'max_amount': '300'}, lambda e: Decimal('100.25') <= e.amount <= 300),
+            ({'category': self.travel.pk, 'date_to': '2024-01-31', 'min_amount': '50'},
+             lambda e: e.category_id == self.travel.pk and e.date.month == 1 and e.amount >= 50),
+            ({'date_from': '2030-01-01'}, lambda e: False),
+        ]
+        for params, match in cases:
+            with self.subTest(params=params):
+                self.assertEqual(self.billed(**params), self.expected(match))
+
+    def test_row_formatting(self):
+        expense = self.expenses[1]
+        context = bills.bill_context(self.user, ExpenseFilters(date_from=expense.date, date_to=expense.date),
+                                     date(2025, 1, 1))
+        self.assertEqual(list(bills.bill_rows(context['expenses'], format_amounts)), [
+            ['02 Jan 2024', '09:15 AM', 'Bill item 1', self.travel.name, '-', '(Rs. 10.25)'],
+        ])
+
+    def test_invalid_filters_redirect_with_a_message(self):
+        for params in ({'date_from': 'yesterday'}, {'min_amount': 'lots'}, {'category': '0'},
+                       {'date_from': '2024-02-01', 'date_to': '2024-01-01'},
+                       {'min_amount': '10', 'max_amount': '5'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('expenses:generate_bill'), {'mode': 'sync', **params})
+                self.assertRedirects(response, reverse('expenses:expense_list'), fetch_redirect_response=False)
+                self.assertTrue(list(get_messages(response.wsgi_request)))
+
+    def test_rows_are_split_into_tables_with_headers(self):
+        rows = [[str(i)] * len(bills.TABLE_HEADER) for i in range(2 * bills.ROWS_PER_TABLE + 10)]
+        tables = list(bills._row_tables(iter(rows), bills.ROWS_PER_TABLE))
+        self.assertEqual([len(table._cellvalues) - 1 for table in tables], [bills.ROWS_PER_TABLE] * 2 + [10])
+        for table in tables:
+            self.assertEqual(table._cellvalues[0], bills.TABLE_HEADER)
+            # Repeated on the next page too if a table does not fit on one
+            self.assertEqual(table.repeatRows, 1)
+        self.assertEqual([row for table in tables for row in table._cellvalues[1:]], rows)
+        self.assertEqual(list(bills._row_tables(iter([]), bills.ROWS_PER_TABLE)), [])
+
+        total, *_ = bills._footer_flowables('(Rs. 1.00)')
+        self.assertEqual(total._cellvalues, [['', '', '', '', 'Total Amount', '(Rs. 1.00)']])
+
+    def test_sync_pdf(self):
+        response = self.client.get(reverse('expenses:generate_bill'), {'mode': 'sync', 'date_from': '2024-01-11'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('expense_bill.pdf', response['Content-Disposition'])
+        pages = [page.extract_text() for page in PdfReader(io.BytesIO(b''.join(response.streaming_content))).pages]
+        self.assertGreater(len(pages), 1)
+
+        titles, total = self.expected(lambda e: e.date >= date(2024, 1, 11))
+        text = '\n'.join(pages)
+        self.assertEqual(re.findall(r'Bill item \d+', text), titles)
+        self.assertIn('Filters: From 11 Jan 2024', pages[0])
+        # Every page with rows on it starts them with the column header
+        for page in pages:
+            if 'Bill item' in page:
+                self.assertLess(page.index('Amount (Rs.)'), page.index('Bill item'))
+        self.assertIn(f'Total Amount\n{total}', pages[-1])
+        self.assertNotIn('Seeded expense', text)
+
+
+class BillJobQueueTests(TestCase):
+    """Queued bills are claimed, rendered, retried and expired by the worker functions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='biller', password='pass12345')
+        seed_expenses(cls.user, 60, list(Category.objects.all()))
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.user)
+
+    def test_generate_bill_enqueues_and_returns_immediately(self):
+        response = self.client.get(reverse('expenses:generate_bill'), {'format': 'json', 'category': 1})
+        self.assertEqual(response.status_code, 202)
+        job = BillJob.objects.get(pk=response.json()['id'])
+        self.assertEqual(job.status, BillJob.Status.QUEUED)
+        self.assertEqual(job.filters, {'category': '1'})
+
+    def test_search_markup_in_the_bill_header(self):
+        # The filters line is escaped before ReportLab parses it as markup
+        response = self.client.get(reverse('expenses:generate_bill'), {'mode': 'sync', 'q': '<b> & <font color="x">'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+        job = jobs.enqueue_bill_job(self.user, ExpenseFilters.from_query({'q': 'tea & <cake'}))
+        self.assertEqual(jobs.claim_next_job(), job)
+        self.assertEqual(jobs.run_job(job.pk), BillJob.Status.DONE)
+
+    def test_worker_renders_and_stores_pdf(self):
+        job = jobs.enqueue_bill_job(self.user, ExpenseFilters())
+        self.assertEqual(jobs.claim_next_job(), job)
+        self.assertEqual(jobs.run_job(job.pk), BillJob.Status.DONE)
+
+        response = self.client.get(reverse('expenses:bill_job_download', args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    @override_settings(BILL_JOB_CONCURRENCY=1)
+    def test_concurrency_limit(self):
+        jobs.enqueue_bill_job(self.user, ExpenseFilters())
+        jobs.enqueue_bill_job(self.user, ExpenseFilters())
+        self.assertIsNotNone(jobs.claim_next_job())
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_claims_are_serialised(self):
+        # The claim takes the database's write lock before counting running jobs
+        jobs.enqueue_bill_job(self.user, ExpenseFilters())
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIsNotNone(jobs.claim_next_job())
+        statements = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertTrue(statements[0].startswith('UPDATE'), statements[0])
+        self.assertIn('COUNT(', statements[1])
+
+    @override_settings(BILL_JOB_MAX_ATTEMPTS=2, BILL_JOB_RETRY_DELAY=0)
+    def test_failed_job_is_retried_then_failed(self):
+        job = jobs.enqueue_bill_job(self.user, ExpenseFilters())
+        with mock.patch('expenses.bills.write_bill', side_effect=RuntimeError('boom')), \
+                self.assertLogs('expenses.jobs', 'ERROR'):
+            jobs.claim_next_job()
+            self.assertEqual(jobs.run_job(job.pk), BillJob.Status.QUEUED)
+            jobs.claim_next_job()
+            self.assertEqual(jobs.run_job(job.pk), BillJob.Status.FAILED)
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.error), (2, 'boom'))
+
+    def test_expired_results_are_deleted(self):
+        job = jobs.enqueue_bill_job(self.user, ExpenseFilters())
+        jobs.claim_next_job()
+        jobs.run_job(job.pk)
+        BillJob.objects.filter(pk=job.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        job.refresh_from_db()
+        path = job.result.path
+
+        self.assertEqual(jobs.expire_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, BillJob.Status.EXPIRED)
+        self.assertFalse(job.result)
+        self.assertFalse(os.path.exists(path))
+
+
+class ExpenseSummaryTests(TestCase):
+    """The summary table follows every expense write without drifting."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='summer', password='pass12345')
+        cls.food, cls.bills = Category.objects.filter(name__in=['Food', 'Bills']).order_by('name')[::-1]
+
+    def assertNoDrift(self):
+        self.assertEqual(summaries.find_drift(), [])
+
+    def add(self, amount, day=date(2025, 3, 10), category=None):
+        return Expense.objects.create(
+            user=self.user, title='x', amount=amount, date=day, time=time(9, 0),
+            category=category or self.food,
+        )
+
+    def test_create_update_delete(self):
+        first = self.add(Decimal('10.00'))
+        second = self.add(Decimal('25.50'))
+        self.add(Decimal('4.00'), day=date(2025, 4, 1))
+        self.assertNoDrift()
+        bucket = ExpenseSummary.objects.get(user=self.user, month=date(2025, 3, 1), category=self.food)
+        self.assertEqual(
+            (bucket.count, bucket.total, bucket.min_amount, bucket.max_amount),
+            (2, Decimal('35.50'), Decimal('10.00'), Decimal('25.50')),
+        )
+
+        # Moving an expense to another month and category updates both buckets
+        second = Expense.objects.get(pk=second.pk)
+        second.category = self.bills
+        second.date = date(2025, 5, 2)
+        second.save()
+        self.assertNoDrift()
+
+        # Deleting the extreme value recomputes min/max; deleting the last empties the bucket
+        Expense.objects.get(pk=first.pk).delete()
+        self.assertNoDrift()
+        self.assertFalse(ExpenseSummary.objects.filter(month=date(2025, 3, 1)).exists())
+
+    def test_views_keep_summaries_in_sync(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('expenses:add_expense'), {
+            'title': 'Lunch', 'amount': '120.00', 'category': self.food.pk,
+            'date': '2025-06-01', 'time': '13:00',
+        })
+        expense = Expense.objects.get(title='Lunch')
+        self.assertNoDrift()
+        self.assertEqual(summaries.user_total(self.user), Decimal('120.00'))
+
+        self.client.post(reverse('expenses:delete_expense', args=[expense.pk]))
+        self.assertNoDrift()
+        self.assertEqual(summaries.user_total(self.user), Decimal('0'))
+
+    def test_deleting_category_moves_totals_to_uncategorized(self):
+        category = Category.objects.create(name='Temporary')
+        self.add(Decimal('7.00'), category=category)
+        self.add(Decimal('3.00'), category=None)
+        category.delete()
+        self.assertNoDrift()
+
+    def test_check_and_rebuild_command(self):
+        self.add(Decimal('10.00'))
+        Expense.objects.update(amount=Decimal('99.00'))  # bypasses signals
+        with self.assertRaises(CommandError):
+            call_command('rebuild_expense_summaries', check=True, stdout=StringIO())
+        call_command('rebuild_expense_summaries', stdout=StringIO())
+        call_command('rebuild_expense_summaries', check=True, stdout=StringIO())
+
+
+class MoneyStorageTests(TestCase):
+    """Amounts are stored, summed and formatted as integer paise, with Decimals at the edges."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='moneybags', password='pass12345')
+
+    def add(self, amount):
+        return Expense.objects.create(user=self.user, title='x', amount=amount, date=date(2025, 3, 10), time=time(9, 0))
+
+    def test_stored_as_paise_and_read_as_decimal(self):
+        expense = self.add('1234.56')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT amount FROM expenses_expense WHERE id = %s', [expense.pk])
+            self.assertEqual(cursor.fetchone()[0], 123456)
+        amount = Expense.objects.get(pk=expense.pk).amount
+        self.assertIsInstance(amount, Decimal)
+        self.assertEqual(str(amount), '1234.56')
+        self.assertEqual(
+            list(Expense.objects.filter(amount__gte=Decimal('1234.56'), amount__lt=1235).values_list('pk', flat=True)),
+            [expense.pk],
+        )
+
+    def test_lookups_compare_exact_amounts(self):
+        pks = {amount: self.add(amount).pk for amount in ('12.49', '12.50', '12.51', '13.00')}
+
+        def matching(**lookup):
+            return {amount for amount, pk in pks.items() if Expense.objects.filter(pk=pk, **lookup).exists()}
+
+        for value in (Decimal('12.5'), 12.5, '12.50'):
+            with self.subTest(value=value):
+                self.assertEqual(matching(amount=value), {'12.50'})
+                self.assertEqual(matching(amount__gte=value), {'12.50', '12.51', '13.00'})
+                self.assertEqual(matching(amount__gt=value), {'12.51', '13.00'})
+                self.assertEqual(matching(amount__lt=value), {'12.49'})
+                self.assertEqual(matching(amount__lte=value), {'12.49', '12.50'})
+                self.assertEqual(matching(amount__range=(value, 13)), {'12.50', '12.51', '13.00'})
+        self.assertEqual(matching(amount__gte=13), {'13.00'})
+        self.assertEqual(matching(amount__lt=13), {'12.49', '12.50', '12.51'})
+        self.assertEqual(matching(amount__gte=12.501), {'12.50', '12.51', '13.00'})
+        self.assertEqual(matching(amount__in=[12.5, Decimal('13')]), {'12.50', '13.00'})
+
+    def test_aggregates_are_exact(self):
+        Expense.objects.bulk_create([
+            Expense(user=self.user, title='x', amount=Decimal('0.10'), date=date(2025, 3, 10), time=time(9, 0))
+            for _ in range(1000)
+        ])
+        self.add(Decimal('0.01'))
+        totals = Expense.objects.filter(user=self.user).aggregate(total=Sum('amount'), paise=Paise(Sum('amount')))
+        self.assertEqual(totals, {'total': Decimal('100.01'), 'paise': 10001})
+        summaries.rebuild_user(self.user.pk)
+        self.assertEqual(summaries.user_total(self.user), Decimal('100.01'))
+
+    def test_exact_formatting(self):
+        self.assertEqual(to_paise(0.1 + 0.2), 30)
+        self.assertEqual(format_indian_currency(Decimal('99999999999999.99')), '(Rs. 9,99,99,99,99,99,999.99)')
+        self.assertEqual(format_indian_currency('-1234.5'), '-(Rs. 1,234.50)')
+        self.assertEqual(format_indian_currency(7), '(Rs. 7.00)')
+        self.assertEqual(format_indian_currency('invalid'), '(Rs. 0.00)')
+        self.assertEqual(Expense(amount=Decimal('-1234.56')).formatted_amount(), '-₹1,234.56')
+        self.assertEqual(Expense(amount=None).formatted_amount(), '₹0.00')
+
+
+class CurrencyFormattingTests(TestCase):
+    """Amounts use lakh/crore grouping, whether formatted singly, in bulk or in templates."""
+
+    def test_lakh_crore_grouping(self):
+        cases = {
+            '0.05': '0.05', '999.99': '999.99', '1000': '1,000.00', '123456.78': '1,23,456.78',
+            '1234567.89': '12,34,567.89', '10000000': '1,00,00,000.00', '-12345.6': '-12,345.60',
+        }
+        for amount, expected in cases.items():
+            self.assertEqual(indian_number(Decimal(amount)), expected)
+        self.assertEqual(format_indian_currency(Decimal('-1234567.89')), '-(Rs. 12,34,567.89)')
+        self.assertEqual(Expense(amount=Decimal('1234567.89')).formatted_amount(), '₹12,34,567.89')
+
+    def test_bulk_matches_single(self):
+        amounts = [Decimal('1234567.89'), Decimal('12.50'), Decimal('-100.00'), Decimal('5'), 2.5, 'x', None]
+        self.assertEqual(format_amounts(amounts), [format_indian_currency(amount) for amount in amounts])
+
+    def test_template_filter(self):
+        rendered = Template('{% load currency %}{{ amount|inr }} {{ amount|inr:"symbol" }}').render(
+            Context({'amount': Decimal('123456.00')})
+        )
+        self.assertEqual(rendered, '(Rs. 1,23,456.00) ₹1,23,456.00')
+
+    def test_pages_render_grouped_amounts(self):
+        user = User.objects.create_user(username='lakhpati', password='pass12345')
+        Expense.objects.create(user=user, title='Car', amount=Decimal('850000.00'), date=date(2025, 3, 1), time=time(9, 0))
+        self.client.force_login(user)
+        for name in ('expenses:home', 'expenses:expense_list'):
+            self.assertContains(self.client.get(reverse(name)), '(Rs. 8,50,000.00)')
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_currency', count=1000, stdout=out)
+        self.assertIn('Formatted 1000 amounts', out.getvalue())
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Each view stays within its declared query budget, and issues exactly the
+    same number of queries for a user with a handful of expenses as for a
+    user with hundreds.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = list(Category.objects.all())
+        cls.small = User.objects.create_user(username='small', password='pass12345')
+        cls.large = User.objects.create_user(username='large', password='pass12345')
+        for user, count in ((cls.small, 5), (cls.large, 400)):
+            seed_expenses(user, count, categories)
+            summaries.rebuild_user(user.pk)
+
+    def setUp(self):
+        # Budgets describe the steady state, with the category catalog loaded
+        # and the page's fragments not cached yet
+        catalog.get_catalog(refresh=True)
+        cache.clear()
+
+    def measure(self, user, view_name, method='get', args=None, data=None):
+        """Runs one request as ``user`` and returns its QueryStats."""
+        self.client.force_login(user)
+        url = reverse(view_name, args=args)
+        with record_queries() as stats:
+            response = getattr(self.client, method)(url, data or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        return stats
+
+    def assertWithinBudget(self, view_name, **kwargs):
+        budget = VIEW_QUERY_BUDGETS[view_name]
+        counts = []
+        for user in (self.small, self.large):
+            stats = self.measure(user, view_name, **kwargs)
+            self.assertEqual(budget.violations(stats), [], f'{view_name} as {user}')
+            counts.append(stats.count)
+        self.assertEqual(counts[0], counts[1], f'{view_name} query count depends on row count')
+
+    def test_home(self):
+        self.assertWithinBudget('expenses:home')
+
+    def test_expense_list(self):
+        for sort in pagination.SORT_ORDERINGS:
+            with self.subTest(sort=sort):
+                self.assertWithinBudget('expenses:expense_list', data={'sort': sort})
+                self.assertWithinBudget('expenses:expense_list', data={'sort': sort, 'q': 'expense 1'})
+
+    def test_expense_list_page(self):
+        page = pagination.paginate(Expense.objects.filter(user=self.large), '-date', page_size=3)
+        self.assertWithinBudget('expenses:expense_list_page', data={'cursor': page.next_cursor})
+
+    def test_add_expense(self):
+        self.assertWithinBudget('expenses:add_expense')
+        # Into a summary bucket both users already have, so neither has to create one
+        self.assertWithinBudget('expenses:add_expense', method='post', data={
+            'title': 'Tea', 'amount': '15.00', 'category': Category.objects.all()[0].pk,
+            'date': '2024-01-01', 'time': '10:00',
+        })
+
+    def test_generate_bill(self):
+        self.assertWithinBudget('expenses:generate_bill', data={'mode': 'sync'})
+        self.assertWithinBudget('expenses:generate_bill', data={'mode': 'sync', 'date_from': '2024-03-01'})
+        self.assertWithinBudget('expenses:generate_bill')
+
+    def test_api(self):
+        self.assertWithinBudget('expenses:api_expenses', data={'limit': 200})
+        self.assertWithinBudget('expenses:api_totals')
+        self.assertWithinBudget('expenses:api_categories')
+        self.assertWithinBudget('expenses:api_analytics', data={'months': 'all'})
+
+    def test_analytics(self):
+        self.assertWithinBudget('expenses:analytics')
+        self.assertWithinBudget('expenses:analytics', data={'months': 'all'})
+
+    def test_delete_expense(self):
+        budget = VIEW_QUERY_BUDGETS['expenses:delete_expense']
+        for user in (self.small, self.large):
+            expense = Expense.objects.filter(user=user).order_by('amount').first()
+            stats = self.measure(user, 'expenses:delete_expense', method='post', args=[expense.pk])
+            self.assertFalse(Expense.objects.filter(pk=expense.pk).exists())
+            self.assertEqual(budget.violations(stats), [])
+
+    def test_n_plus_one_is_detected(self):
+        with record_queries() as stats:
+            for expense in Expense.objects.filter(user=self.large)[:10]:
+                expense.category.name
+        self.assertEqual(list(stats.duplicates.values()), [10])
+        self.assertTrue(VIEW_QUERY_BUDGETS['expenses:expense_list'].violations(stats))
+
+
+@override_settings(REQUEST_PROFILING=True, REQUEST_PROFILER=None)
+class RequestProfilingTests(TestCase):
+    """Requests report SQL, template, PDF and view time, and slow ones can be profiled."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='profiled', password='pass12345')
+        seed_expenses(cls.user, 30, list(Category.objects.all()))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def metrics(response):
+        """Returns {name: duration} from a Server-Timing header."""
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            metrics[name] = float(dict(param.split('=', 1) for param in params)['dur'])
+        return metrics
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('expenses.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('expenses:home'))
+        metrics = self.metrics(response)
+        self.assertEqual(set(metrics), {'db', 'tpl', 'view', 'total'})
+        self.assertGreater(metrics['tpl'], 0)
+        self.assertLessEqual(metrics['view'], metrics['total'])
+        self.assertIn('queries)"', response['Server-Timing'])
+        self.assertIn('view=expenses:home status=200', logs.output[0])
+        self.assertEqual(logs.records[0].request_timings['view'], 'expenses:home')
+        self.assertGreater(logs.records[0].request_timings['db_queries'], 0)
+
+    def test_pdf_span(self):
+        response = self.client.get(reverse('expenses:generate_bill'), {'mode': 'sync'})
+        b''.join(response.streaming_content)
+        self.assertGreater(self.metrics(response)['pdf'], 0)
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('expenses:home'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_slow_requests_are_profiled(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for profiler, extension in (('cprofile', '.prof'), ('sample', '.folded')):
+            with self.subTest(profiler=profiler), \
+                    override_settings(REQUEST_PROFILER=profiler, REQUEST_PROFILE_THRESHOLD_MS=0,
+                                      REQUEST_SAMPLE_INTERVAL_MS=1, REQUEST_PROFILE_DIR=directory), \
+                    self.assertLogs('expenses.profiling', 'WARNING'):
+                self.client = self.client_class()
+                self.client.force_login(self.user)
+                self.client.get(reverse('expenses:expense_list'))
+                paths = [name for name in os.listdir(directory) if name.endswith(extension)]
+                self.assertEqual(len(paths), 1)
+                self.assertIn('expenses_expense_list', paths[0])
+        stats = pstats.Stats(os.path.join(directory, next(n for n in os.listdir(directory) if n.endswith('.prof'))))
+        self.assertTrue(any(function == 'expense_list' for _, _, function in stats.stats))
+
+    def test_threshold(self):
+        with override_settings(REQUEST_PROFILE_THRESHOLD_MS=60_000), \
+                self.assertLogs('expenses.profiling', 'INFO') as logs:
+            self.client.get(reverse('expenses:home'))
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+
+
+class MetricsTests(TestCase):
+    """Requests and bills are counted per process and merged across processes at /metrics."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='measured', password='pass12345')
+        seed_expenses(cls.user, 12, list(Category.objects.all()))
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings_override = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def sample(text, series):
+        """Returns the value of one exported series (0 if absent)."""
+        for line in text.splitlines():
+            if line.startswith(series + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_requests_and_bills_are_counted(self):
+        requests = 'expense_tracker_http_requests_total{method="GET",status="200",view="expenses:home"}'
+        latency = 'expense_tracker_http_request_duration_seconds_count{view="expenses:home"}'
+        before = self.scrape()
+        self.client.get(reverse('expenses:home'))
+        self.client.get(reverse('expenses:home'))
+        response = self.client.get(reverse('expenses:generate_bill'), {'mode': 'sync'})
+        size = len(b''.join(response.streaming_content))
+        after = self.scrape()
+
+        self.assertEqual(self.sample(after, requests) - self.sample(before, requests), 2)
+        self.assertEqual(self.sample(after, latency) - self.sample(before, latency), 2)
+        self.assertIn('expense_tracker_http_request_duration_seconds_bucket{view="expenses:home",le="+Inf"}', after)
+        self.assertGreater(self.sample(after, 'expense_tracker_db_queries_total{view="expenses:home"}'), 0)
+        for series, delta in (('expense_tracker_pdf_rows_total', 12), ('expense_tracker_pdf_bytes_total', size),
+                              ('expense_tracker_pdf_build_duration_seconds_count', 1)):
+            self.assertEqual(self.sample(after, series) - self.sample(before, series), delta, series)
+
+    def test_merges_other_processes_and_folds_exited_ones(self):
+        other = metrics.Registry()
+        other.inc('pdf_rows_total', 40)
+        other.observe('pdf_build_duration_seconds', 0.3)
+        other.filename = '999999999-dead.json'  # No such process
+        other.flush()
+        live = metrics.Registry()
+        live.inc('pdf_rows_total', 2)
+        live.filename = f'{os.getpid()}-live.json'
+        live.flush()
+
+        own = metrics.merge([metrics.registry.snapshot()]).get(('pdf_rows_total', ()), 0)
+        # Folding the exited process into EXITED_FILE keeps the total as it was
+        for _ in range(2):
+            self.assertEqual(self.sample(self.scrape(), 'expense_tracker_pdf_rows_total'), own + 42)
+        files = os.listdir(self.directory)
+        self.assertIn(metrics.EXITED_FILE, files)
+        self.assertNotIn('999999999-dead.json', files)
+        self.assertIn(f'{os.getpid()}-live.json', files)
+
+        merged = metrics.merge([other.snapshot(), other.snapshot()])
+        buckets, total, count = merged[('pdf_build_duration_seconds', ())]
+        self.assertEqual((buckets['0.5'], buckets['0.25'], count), (2, 0, 2))
+        self.assertAlmostEqual(total, 0.6)
+
+    def test_render_format(self):
+        registry = metrics.Registry()
+        registry.inc('http_requests_total', view='a"b', method='GET', status='200')
+        for value in (0.002, 0.02, 50):
+            registry.observe('http_request_duration_seconds', value, view='x')
+        text = metrics.render(metrics.merge([registry.snapshot()]))
+        self.assertIn('# TYPE expense_tracker_http_request_duration_seconds histogram', text)
+        self.assertIn('expense_tracker_http_requests_total{method="GET",status="200",view="a\\"b"} 1', text)
+        self.assertIn('expense_tracker_http_request_duration_seconds_bucket{view="x",le="0.005"} 1', text)
+        self.assertIn('expense_tracker_http_request_duration_seconds_bucket{view="x",le="0.025"} 2', text)
+        self.assertIn('expense_tracker_http_request_duration_seconds_bucket{view="x",le="30.0"} 2', text)
+        self.assertIn('expense_tracker_http_request_duration_seconds_bucket{view="x",le="+Inf"} 3', text)
+        self.assertIn('expense_tracker_http_request_duration_seconds_count{view="x"} 3', text)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret', REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 200)
+
+    def test_without_a_token_only_allowed_addresses_scrape(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 200)  # 127.0.0.1
+        response = self.client.get(url, REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn(b'expense_tracker_', response.content)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.5').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='not an address').status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.5').status_code, 200)
+
+
+class ExpenseImportTests(TestCase):
+    """CSV imports insert valid rows in batches and report the invalid ones."""
+
+    STATEMENT = (
+        'Txn Date,Narration,Withdrawal Amt.,Category,Remarks\n'
+        '01/03/2025,Groceries,"1,250.50",food,weekly\n'
+        '2025-03-02,Bus pass,Rs. 300,Transportation,\n'
+        '31/02/2025,Bad date,10,Food,\n'
+        '03/03/2025,,abc,Nope,\n'
+        '\n'
+        '04-Mar-2025,Rent,15000,,\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='importer', password='pass12345')
+
+    def run_import(self, text, **kwargs):
+        return importer.import_csv(self.user, io.BytesIO(text.encode('utf-8-sig')), **kwargs)
+
+    def test_valid_rows_are_imported_and_invalid_rows_reported(self):
+        result = self.run_import(self.STATEMENT, batch_size=2)
+        self.assertEqual((result.imported, result.failed), (3, 2))
+        self.assertEqual([line for line, _ in result.errors], [4, 5])
+        self.assertIn('Invalid date', result.errors[0][1])
+        self.assertIn("Unknown category 'Nope'", result.errors[1][1])
+        self.assertIn('Title', result.errors[1][1])
+
+        groceries = Expense.objects.get(user=self.user, title='Groceries')
+        self.assertEqual(groceries.category.name, 'Food')
+        self.assertEqual((groceries.amount, groceries.date), (Decimal('1250.50'), date(2025, 3, 1)))
+        self.assertIsNone(Expense.objects.get(title='Rent').category)
+        self.assertEqual(summaries.find_drift(), [])
+
+    def test_dry_run_and_missing_columns(self):
+        result = self.run_import(self.STATEMENT, dry_run=True)
+        self.assertEqual(result.imported, 3)
+        self.assertFalse(Expense.objects.exists())
+        with self.assertRaises(importer.ImportFileError):
+            self.run_import('Date,Title\n2025-01-01,Tea\n')
+
+    def test_batch_costs_a_fixed_number_of_queries(self):
+        rows = ''.join(f'2025-01-{i % 28 + 1:02d},Item {i},{i}.00,Food,\n' for i in range(500))
+        with CaptureQueriesContext(connection) as queries:
+            self.run_import('date,title,amount,category,description\n' + rows, batch_size=500)
+        # The category lookup, the INSERTs and one bucket upsert; never a query per row
+        self.assertLess(len(queries), 30)
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 500)
+
+    def test_copy_payload(self):
+        expense = Expense(
+            user=self.user, title='Tea, "masala"', amount=Decimal('15.00'), description='',
+            category=None, date=date(2025, 1, 2), time=time(9, 30),
+        )
+        cursor = mock.MagicMock()
+        fake = mock.MagicMock(ops=connection.ops)
+        fake.cursor.return_value.__enter__.return_value = cursor
+        importer.copy_expenses(fake, [expense])
+        sql, buffer = cursor.copy_expert.call_args.args
+        self.assertIn('FORCE_NULL', sql)
+        self.assertEqual(
+            buffer.getvalue(),
+            f'{self.user.pk},"","Tea, ""masala""",1500,"","2025-01-02","09:30:00"\r\n',
+        )
+
+    def test_upload_endpoint(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('statement.csv', self.STATEMENT.encode(), content_type='text/csv')
+        response = self.client.post(reverse('expenses:import_expenses') + '?format=json', {'file': upload})
+        self.assertEqual(response.json()['imported'], 3)
+        self.assertEqual(response.json()['errors'][0]['line'], 4)
+
+        response = self.client.post(reverse('expenses:import_expenses'), {})
+        self.assertContains(response, 'Please choose a CSV file')
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.STATEMENT)
+        self.addCleanup(os.remove, f.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_expenses', f.name, user='importer', stdout=out, stderr=err)
+        self.assertIn('Imported 3 expense(s)', out.getvalue())
+        self.assertIn('line 4:', err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('import_expenses', f.name, user='nobody', stdout=out)
+
+
+class ExpenseExportTests(TestCase):
+    """Exports stream filtered rows without loading them all first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='exporter', password='pass12345')
+        cls.other = User.objects.create_user(username='other', password='pass12345')
+        categories = list(Category.objects.all())
+        seed_expenses(cls.user, 1200, categories)
+        seed_expenses(cls.other, 10, categories)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, fmt, **params):
+        response = self.client.get(reverse('expenses:export_expenses', args=[fmt]), params)
+        self.assertTrue(response.streaming)
+        return response
+
+    def test_csv_export_round_trips_through_the_importer(self):
+        response = self.export('csv')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(tuple(rows[0]), exports.EXPORT_COLUMNS)
+        self.assertEqual(len(rows), 1201)
+
+        newest = Expense.objects.filter(user=self.user).order_by('-date', '-time', '-id').first()
+        self.assertEqual(rows[1][:4], [
+            newest.date.isoformat(), newest.time.strftime('%H:%M:%S'), newest.title, str(newest.amount),
+        ])
+        self.assertEqual(rows[1][4], format_indian_currency(newest.amount))
+
+        other = User.objects.get(username='other')
+        result = importer.import_rows(other, rows, dry_run=True)
+        self.assertEqual((result.imported, result.failed), (1200, 0))
+
+    def test_ndjson_export_applies_filters(self):
+        food = Category.objects.get(name='Food')
+        response = self.export('ndjson', category=food.pk, date_from='2024-06-01')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        expected = Expense.objects.filter(user=self.user, category=food, date__gte=date(2024, 6, 1))
+        self.assertEqual(len(records), expected.count())
+        self.assertTrue(all(r['category'] == 'Food' and r['date'] >= '2024-06-01' for r in records))
+
+    def test_header_is_sent_before_the_query_and_rows_are_streamed(self):
+        response = self.export('csv')
+        chunks = iter(response.streaming_content)
+        with CaptureQueriesContext(connection) as queries:
+            next(chunks)
+        self.assertEqual(len(queries), 0)
+        with CaptureQueriesContext(connection) as queries:
+            remaining = list(chunks)
+        # One row alone, then blocks of ROWS_PER_WRITE
+        self.assertEqual(len(remaining), 1 + -(-1199 // exports.ROWS_PER_WRITE))
+        self.assertEqual(len([q for q in queries if 'expenses_expense' in q['sql']]), 1)
+
+    def test_invalid_format_and_filters(self):
+        self.assertEqual(self.client.get(reverse('expenses:export_expenses', args=['xml'])).status_code, 404)
+        response = self.client.get(reverse('expenses:export_expenses', args=['csv']), {'date_from': 'nope'})
+        self.assertRedirects(response, reverse('expenses:expense_list'))
+
+
+class ExpenseApiTests(TestCase):
+    """The JSON API pages, validates, and answers 304 from the data version alone."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='mobile', password='pass12345')
+        cls.other = User.objects.create_user(username='other', password='pass12345')
+        categories = list(Category.objects.all())
+        seed_expenses(cls.user, 120, categories)
+        seed_expenses(cls.other, 5, categories)
+        # Seeding bypasses the model signals
+        summaries.rebuild_user(cls.user.pk)
+        versions.touch(cls.user.pk)
+        cls.food = Category.objects.get(name='Food')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post_json(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_list_pages_through_every_expense_with_selected_fields(self):
+        url = reverse('expenses:api_expenses')
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 50, 'fields': 'id,amount,category_name', 'sort': 'amount'}
+            if cursor:
+                params['cursor'] = cursor
+            body = self.client.get(url, params).json()
+            seen.extend(body['results'])
+            cursor = body['next_cursor']
+            if not body['has_more']:
+                break
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(len({row['id'] for row in seen}), 120)
+        self.assertEqual(set(seen[0]), {'id', 'amount', 'category_name'})
+        amounts = [Decimal(row['amount']) for row in seen]
+        self.assertEqual(amounts, sorted(amounts))
+
+        self.assertEqual(self.client.get(url, {'fields': 'secret'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 1000}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': 'bogus'}).status_code, 400)
+
+    def test_unchanged_list_returns_304_without_querying_expenses(self):
+        url = reverse('expenses:api_expenses')
+        first = self.client.get(url)
+        self.assertIn('no-cache', first['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries if '"expenses_expense"' in q['sql']])
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # A different query string is a different representation
+        response = self.client.get(url, {'sort': 'amount'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_change_the_etag(self):
+        url = reverse('expenses:api_expenses')
+        etag = self.client.get(url)['ETag']
+
+        response = self.post_json(url, {'title': 'Chai', 'amount': '20.00', 'category': self.food.pk})
+        self.assertEqual(response.status_code, 201)
+        created = response.json()
+        self.assertEqual((created['category_name'], created['amount']), ('Food', '20.00'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)['ETag']
+        response = self.client.delete(response['Location'])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Bulk imports bypass model signals but still move the version
+        etag = self.client.get(url)['ETag']
+        importer.import_rows(self.user, [['date', 'title', 'amount'], ['2025-01-01', 'Imported', '5']])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Renaming a category changes what every user sees
+        self.addCleanup(catalog.invalidate)
+        etag = self.client.get(url)['ETag']
+        self.food.name = 'Food & Drinks'
+        self.food.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_create_validation_and_ownership(self):
+        url = reverse('expenses:api_expenses')
+        response = self.post_json(url, {'title': '', 'amount': 'lots'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'title', 'amount'})
+        self.assertEqual(self.client.post(url, 'not json', content_type='application/json').status_code, 400)
+
+        foreign = Expense.objects.filter(user=self.other).first()
+        detail = reverse('expenses:api_expense_detail', args=[foreign.pk])
+        self.assertEqual(self.client.get(detail).status_code, 404)
+        self.assertEqual(self.client.delete(detail).status_code, 404)
+        self.assertTrue(Expense.objects.filter(pk=foreign.pk).exists())
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_categories_and_totals(self):
+        response = self.client.get(reverse('expenses:api_categories'))
+        names = [c['name'] for c in response.json()['results']]
+        self.assertEqual(names, sorted(names))
+        response = self.client.get(reverse('expenses:api_categories'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        body = self.client.get(reverse('expenses:api_totals')).json()
+        self.assertEqual(Decimal(body['total']), summaries.user_total(self.user))
+        self.assertEqual(body['count'], 120)
+        body = self.client.get(reverse('expenses:api_totals'), {'month': '2024-01'}).json()
+        self.assertEqual(body['count'], Expense.objects.filter(user=self.user, date__month=1, date__year=2024).count())
+        self.assertEqual(self.client.get(reverse('expenses:api_totals'), {'month': 'jan'}).status_code, 400)
+
+    def test_version_bumps(self):
+        self.assertEqual(versions.current(self.other), (0, None))
+        versions.touch(self.other.pk)
+        versions.touch(self.other.pk)
+        self.assertEqual(versions.current(self.other)[0], 2)
+
+    def test_deleting_a_user_with_expenses(self):
+        versions.touch(self.other.pk)
+        self.other.delete()
+        # The cascade removes the version row before the expenses; their
+        # signals must not create it again for the deleted user
+        connection.check_constraints()
+        self.assertFalse(UserDataVersion.objects.filter(user_id=self.other.pk).exists())
+        self.assertFalse(Expense.objects.filter(user_id=self.other.pk).exists())
+
+
+class CategoryCatalogTests(TestCase):
+    """Categories are served from memory and reloaded when they change."""
+
+    def setUp(self):
+        self.addCleanup(catalog.invalidate)
+        catalog.get_catalog(refresh=True)
+
+    def test_lookups_do_not_query(self):
+        food = Category.objects.get(name='Food')
+        expense = Expense(category_id=food.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(catalog.name(food.pk), 'Food')
+            self.assertEqual(catalog.id_for_name(' FOOD '), food.pk)
+            self.assertEqual([c.name for c in catalog.categories()],
+                             sorted((c.name for c in catalog.categories()), key=str.casefold))
+            catalog.attach([expense])
+            self.assertEqual(expense.category.name, 'Food')
+        self.assertEqual(len(queries), 0)
+
+    def test_saving_and_deleting_categories_invalidates(self):
+        travel = Category.objects.create(name='Travel')
+        self.assertEqual(catalog.id_for_name('travel'), travel.pk)
+        travel.name = 'Trips'
+        travel.save()
+        self.assertEqual(catalog.name(travel.pk), 'Trips')
+        travel.delete()
+        self.assertIsNone(catalog.id_for_name('trips'))
+
+    def test_unknown_id_reloads_once(self):
+        # Created behind the catalog's back, as another process would
+        Category.objects.bulk_create([Category(name='Gifts')])
+        gifts = Category.objects.get(name='Gifts')
+        self.assertEqual(catalog.name(gifts.pk), 'Gifts')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(catalog.get(10 ** 9))
+        self.assertEqual(len(queries), 1)
+
+
+class SpendingAnalyticsTests(TestCase):
+    """Vectorized analytics agree with a straightforward per-expense computation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='pass12345')
+        cls.food = Category.objects.get(name='Food')
+        cls.today = date(2024, 3, 10)
+        rows = [
+            (date(2023, 12, 31), '100.00', cls.food),  # before a 3 month period
+            (date(2024, 1, 1), '10.25', cls.food),
+            (date(2024, 1, 1), '4.00', None),
+            (date(2024, 1, 15), '40.00', None),
+            (date(2024, 2, 20), '30.75', cls.food),
+            (date(2024, 3, 1), '12.00', cls.food),
+            (date(2024, 3, 9), '8.00', None),
+            (date(2024, 3, 11), '999.00', cls.food),  # after today
+        ]
+        Expense.objects.bulk_create([
+            Expense(user=cls.user, title='x', amount=Decimal(amount), category=category,
+                    date=day, time=time(9, 0))
+            for day, amount, category in rows
+        ])
+        cls.expenses = [(day, Decimal(amount), category) for day, amount, category in rows]
+        versions.touch(cls.user.pk)
+
+    def reference_daily(self, start, end):
+        totals = {}
+        for day, amount, _ in self.expenses:
+            if start <= day <= end:
+                totals[day] = totals.get(day, 0) + amount
+        return [float(totals.get(start + timedelta(days=i), 0)) for i in range((end - start).days + 1)]
+
+    def test_series_match_reference(self):
+        result = analytics.analyze(self.user, months=3, today=self.today).as_dict()
+        start = date(2024, 1, 1)
+        self.assertEqual(result['start'], '2024-01-01')
+        self.assertEqual(result['count'], 6)
+        self.assertEqual(result['total'], 105.0)
+        daily = self.reference_daily(start, self.today)
+        self.assertEqual(result['daily']['totals'], daily)
+
+        # The rolling average reaches back before the period
+        padded = self.reference_daily(start - timedelta(days=29), self.today)
+        for window in analytics.ROLLING_WINDOWS:
+            expected = [sum(padded[i + 30 - window:i + 30]) / window for i in range(len(daily))]
+            for actual, value in zip(result['daily'][f'rolling_{window}'], expected, strict=True):
+                self.assertAlmostEqual(actual, value, delta=0.005 + 1e-9)
+
+        self.assertEqual([(m['month'], m['total'], m['change'], m['change_percent']) for m in result['monthly']], [
+            ('2024-01', 54.25, None, None),
+            ('2024-02', 30.75, -23.5, -43.32),
+            ('2024-03', 20.0, -10.75, -34.96),
+        ])
+        weekly = {w['week_start']: w['total'] for w in result['weekly']}
+        self.assertEqual(result['weekly'][0]['week_start'], '2024-01-01')  # a Monday
+        self.assertEqual(weekly['2024-01-15'], 40.0)
+        self.assertEqual(weekly['2024-02-26'], 12.0)
+        self.assertEqual(sum(weekly.values()), 105.0)
+
+        self.assertEqual(result['categories'], [
+            {'category_id': self.food.pk, 'category': 'Food', 'total': 53.0, 'share': 50.48},
+            {'category_id': None, 'category': 'Uncategorized', 'total': 52.0, 'share': 49.52},
+        ])
+
+    def test_projection(self):
+        projection = analytics.analyze(self.user, today=self.today).as_dict()['projection']
+        # 20.00 so far in March; 30-day average up to the 10th is (30.75 + 20) / 30
+        rate = (30.75 + 20) / 30
+        self.assertEqual(projection['month_to_date'], 20.0)
+        self.assertEqual(projection['daily_rate'], round(rate, 2))
+        self.assertEqual(projection['projected_total'], round(20 + rate * 21, 2))
+
+    def test_all_history_and_empty_user(self):
+        result = analytics.analyze(self.user, months=None, today=self.today).as_dict()
+        self.assertEqual(result['start'], '2023-12-31')
+        self.assertEqual(result['total'], 205.0)
+        empty = User.objects.create_user(username='nobody', password='pass12345')
+        result = analytics.analyze(empty, months=None, today=self.today).as_dict()
+        self.assertEqual((result['total'], result['count'], result['categories']), (0.0, 0, []))
+        self.assertEqual(result['daily']['totals'], [0.0])
+
+    def test_five_years_in_one_query(self):
+        user = User.objects.create_user(username='longtime', password='pass12345')
+        seed_expenses(user, 6000, list(Category.objects.all()), start=date(2019, 6, 1))
+        with CaptureQueriesContext(connection) as queries:
+            result = analytics.analyze(user, months=60, today=date(2024, 5, 31))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(result.months), 60)
+        self.assertEqual(result.total, sum(
+            int(amount * 100) for amount in Expense.objects.filter(user=user).values_list('amount', flat=True)
+        ))
+
+    def test_parse_months(self):
+        self.assertEqual(analytics.parse_months(''), analytics.DEFAULT_MONTHS)
+        self.assertEqual(analytics.parse_months('24'), 24)
+        self.assertIsNone(analytics.parse_months('All'))
+        self.assertEqual(analytics.parse_months(str(analytics.MAX_MONTHS)), analytics.MAX_MONTHS)
+        for value in ('0', '-3', 'soon', str(analytics.MAX_MONTHS + 1), '30000'):
+            with self.assertRaises(ValueError):
+                analytics.parse_months(value)
+
+    def test_dashboard_and_json_endpoint(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('expenses:analytics'), {'months': 'all'})
+        self.assertContains(response, 'Spending Analytics')
+        self.assertContains(response, 'Uncategorized')
+
+        url = reverse('expenses:api_analytics')
+        response = self.client.get(url, {'months': 'all'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('projection', response.json())
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(url, {'months': 'all'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertFalse([q for q in queries if Expense._meta.db_table in q['sql']])
+        self.assertEqual(self.client.get(url, {'months': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'months': '30000'}).status_code, 400)
+        response = self.client.get(reverse('expenses:analytics'), {'months': '30000'})
+        self.assertContains(response, 'Invalid period.')
+
+
+class FinancialCalculatorTests(TestCase):
+    """Vectorized calculators agree with month-by-month reference computations."""
+
+    def reference_loan(self, principal, annual_rate, months, extra=0.0, lump_sums=None):
+        """Simulates the loan one month at a time; returns (months, total interest)."""
+        rate = annual_rate / 1200
+        payment = float(finance.emi(principal, annual_rate, months)) + extra
+        balance, interest, month = principal, 0.0, 0
+        while balance > 0.005:
+            month += 1
+            interest += balance * rate
+            balance += balance * rate - min(payment, balance * (1 + rate))
+            balance -= min(balance, (lump_sums or {}).get(month, 0))
+        return month, interest
+
+    def test_emi(self):
+        result = finance.run_emi({'principal': [100000, 12000], 'annual_rate': [10, 0], 'months': 12})
+        self.assertEqual(result['emi'], [8791.59, 1000.0])
+        self.assertEqual(result['total_interest'], [5499.06, 0.0])
+
+    def test_schedule_matches_reference(self):
+        lumps = {12: 200000, 60: 500000}
+        result = finance.run_schedule({
+            'principal': 5000000, 'annual_rate': 8.5, 'months': 360,
+            'extra_monthly': 5000, 'lump_sums': {str(k): v for k, v in lumps.items()},
+        })
+        months, interest = self.reference_loan(5000000, 8.5, 360, 5000, lumps)
+        self.assertEqual(result['months'], months)
+        self.assertAlmostEqual(result['total_interest'], interest, places=1)
+        rows = result['rows']
+        self.assertEqual(rows['month'], list(range(1, months + 1)))
+        self.assertEqual(rows['balance'][-1], 0.0)
+        self.assertEqual(sum(rows['prepayment']), 700000.0)
+        self.assertAlmostEqual(sum(rows['principal']) + sum(rows['prepayment']), 5000000, places=0)
+
+        plain = finance.run_schedule({'principal': 5000000, 'annual_rate': 8.5, 'months': 360})
+        self.assertEqual(plain['months'], 360)
+        self.assertAlmostEqual(plain['total_interest'], self.reference_loan(5000000, 8.5, 360)[1], places=1)
+
+    def test_prepayment_scenarios_match_schedules(self):
+        loans = [(5000000, 8.5, 360, 0), (5000000, 8.5, 360, 5000), (250000, 12, 36, 1500), (90000, 0, 18, 500)]
+        principal, rate, months, extra = (list(column) for column in zip(*loans))
+        result = finance.run_prepayment({
+            'principal': principal, 'annual_rate': rate, 'months': months, 'extra_monthly': extra,
+        })
+        for i, loan in enumerate(loans):
+            with self.subTest(loan=loan):
+                payoff, interest = self.reference_loan(*loan)
+                self.assertEqual(result['months'][i], payoff)
+                self.assertEqual(result['months_saved'][i], loan[2] - payoff)
+                self.assertAlmostEqual(result['total_interest'][i], interest, places=1)
+
+        # Thousands of scenarios in one call
+        count = 5000
+        many = finance.prepayment_scenarios([1000000] * count, 9.0, 240, [i * 10 for i in range(count)])
+        self.assertEqual(many['months'].shape, (count,))
+        self.assertTrue((many['interest_saved'][1:] > 0).all())
+
+    def test_gst_and_split(self):
+        gst = finance.run_gst({'amount': [100, 118], 'rate': 18, 'inclusive': True})
+        self.assertEqual(gst['base'], [84.75, 100.0])
+        self.assertEqual(gst['cgst'], [7.62, 9.0])
+        self.assertEqual(gst['sgst'], [7.63, 9.0])
+        self.assertEqual(finance.run_gst({'amount': 1000, 'rate': 12, 'inter_state': True})['igst'], 120.0)
+
+        self.assertEqual(finance.run_split({'total': 100, 'people': 3})['shares'], [33.34, 33.33, 33.33])
+        shares = finance.run_split({'total': 1000.01, 'weights': [1, 2, 3, 4]})['shares']
+        self.assertEqual(round(sum(shares), 2), 1000.01)
+
+    def test_endpoint(self):
+        user = User.objects.create_user(username='banker', password='pass12345')
+        self.client.force_login(user)
+        url = reverse('expenses:api_calculate', args=['schedule'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, json.dumps({'principal': 500000, 'annual_rate': 9, 'months': 240}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['rows']['month']), 240)
+        self.assertLessEqual(len(queries), VIEW_QUERY_BUDGETS['expenses:api_calculate'].max_queries)
+
+        for name, body in (('schedule', {'principal': 'lots', 'months': 12}),
+                           ('emi', {'principal': 1000, 'months': 0}),
+                           ('split', {'total': 10, 'people': 2.5})):
+            response = self.client.post(reverse('expenses:api_calculate', args=[name]), json.dumps(body),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, name)
+        response = self.client.post(reverse('expenses:api_calculate', args=['mortgage']), '{}',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertContains(self.client.get(reverse('expenses:calculators')), 'Show Full Schedule')
+
+
+class ExpenseSearchTests(TestCase):
+    """Full-text search matches word prefixes, ranks titles first and stays in sync."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher', password='pass12345')
+        cls.other = User.objects.create_user(username='other', password='pass12345')
+        categories = list(Category.objects.all())
+        seed_expenses(cls.user, 60, categories)
+        cls.food = Category.objects.get(name='Food')
+        cls.in_title = Expense.objects.create(
+            user=cls.user, title='Groceries at FreshMart', amount=Decimal('850.00'), category=cls.food,
+            description='Weekly vegetables', date=date(2025, 2, 1),
+        )
+        cls.in_description = Expense.objects.create(
+            user=cls.user, title='Supermarket run', amount=Decimal('420.00'), category=cls.food,
+            description='Groceries and <b>snacks</b>', date=date(2025, 2, 3),
+        )
+        Expense.objects.create(
+            user=cls.other, title='Groceries for someone else', amount=Decimal('99.00'), date=date(2025, 2, 2),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, query, sort_by=None):
+        terms = search.parse_terms(query)
+        sort_by = pagination.normalize_sort(sort_by, searching=bool(terms))
+        from .views import list_queryset
+        return list(pagination.paginate(list_queryset(self.user, terms, sort_by), sort_by).items)
+
+    def test_parse_terms(self):
+        self.assertEqual(search.parse_terms('  Groc* & "snacks" groc '), ['groc', 'snacks'])
+        self.assertEqual(search.parse_terms('-- ()'), [])
+        self.assertEqual(len(search.parse_terms(' '.join(f'w{i}' for i in range(20)))), search.MAX_TERMS)
+
+    def test_prefix_match_ranks_titles_first_and_is_per_user(self):
+        self.assertEqual(self.search('groc'), [self.in_title, self.in_description])
+        self.assertEqual(self.search('GROCERIES snack'), [self.in_description])
+        self.assertEqual(self.search('groceries', sort_by='-amount'), [self.in_title, self.in_description])
+        self.assertEqual(self.search('nothing matches this'), [])
+        # Relevance is only a valid order while searching
+        self.assertEqual(pagination.normalize_sort('relevance'), '-date')
+
+    def test_index_follows_updates_and_deletes(self):
+        self.in_title.title = 'Fuel refill'
+        self.in_title.save()
+        self.assertEqual(self.search('groc'), [self.in_description])
+        self.assertEqual(self.search('fuel'), [self.in_title])
+        self.in_description.delete()
+        self.assertEqual(self.search('groc'), [])
+
+    def test_highlight_escapes_html(self):
+        html = search.highlight('Groceries and <b>snacks</b>', ['snack'])
+        self.assertEqual(html, 'Groceries and &lt;b&gt;<mark>snacks</mark>&lt;/b&gt;')
+        self.assertEqual(search.highlight('a < b', []), 'a &lt; b')
+
+    def test_list_view_and_infinite_scroll(self):
+        response = self.client.get(reverse('expenses:expense_list'), {'q': 'groc'})
+        self.assertContains(response, '<mark>Groceries</mark> at FreshMart', html=False)
+        self.assertContains(response, '&lt;b&gt;snacks&lt;/b&gt;')
+        self.assertNotContains(response, 'someone else')
+        self.assertEqual(response.context['current_sort'], pagination.RELEVANCE_SORT)
+
+        # Paging through the seeded rows by relevance visits each exactly once
+        url = reverse('expenses:expense_list_page')
+        first = self.client.get(reverse('expenses:expense_list'), {'q': 'expense'})
+        seen = [int(pk) for pk in re.findall(r'/delete/(\d+)/', first.content.decode())]
+        cursor = first.context['rows']['next_cursor']
+        while cursor:
+            body = self.client.get(url, {'q': 'expense', 'sort': 'relevance', 'cursor': cursor}).json()
+            seen.extend(int(pk) for pk in re.findall(r'/delete/(\d+)/', body['html']))
+            cursor = body['next_cursor']
+        self.assertEqual(sorted(seen), sorted(Expense.objects.filter(user=self.user, title__startswith='Expense')
+                                              .values_list('pk', flat=True)))
+
+    def test_api_and_filters(self):
+        body = self.client.get(reverse('expenses:api_expenses'), {'q': 'groc', 'fields': 'id,title'}).json()
+        self.assertEqual([row['id'] for row in body['results']], [self.in_title.pk, self.in_description.pk])
+        body = self.client.get(reverse('expenses:api_expenses'), {'q': 'groc', 'sort': 'amount'}).json()
+        self.assertEqual([row['id'] for row in body['results']], [self.in_description.pk, self.in_title.pk])
+
+        filters = ExpenseFilters.from_query({'q': 'groceries', 'min_amount': '500'})
+        self.assertEqual(list(filters.apply(Expense.objects.filter(user=self.user))), [self.in_title])
+        self.assertIn('Matching "groceries"', filters.describe())
+
+        response = self.client.get(reverse('expenses:export_expenses', args=['ndjson']), {'q': 'snacks'})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([r['title'] for r in records], ['Supermarket run'])
+
+    def test_admin_search(self):
+        admin = User.objects.create_superuser(username='boss', password='pass12345')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:expenses_expense_changelist'), {'q': 'groc'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+class BenchmarkSuiteTests(TestCase):
+    """The view benchmarks cover every URL, run cleanly and flag regressions."""
+
+    def test_scenarios_cover_every_url(self):
+        covered = {scenario.url_name for scenario in benchmarks.scenarios()}
+        self.assertEqual(covered, {pattern.name for pattern in urls.urlpatterns})
+
+    def test_small_run(self):
+        report = benchmarks.run_suite(users=1, expenses_per_user=60, categories=3, repeat=2, warmup=0, pdf_rows=(20,),
+                                      end_date=date(2024, 6, 30))
+        self.assertEqual(report['dataset']['expenses_per_user'], 60)
+        self.assertEqual(report['dataset']['end_date'], '2024-06-30')
+        # The generated expenses; the write scenarios add some dated today
+        generated = Expense.objects.filter(title__in=synthetic.TITLES)
+        self.assertLessEqual(generated.latest('date').date, date(2024, 6, 30))
+        self.assertGreater(generated.earliest('date').date, date(2024, 6, 30) - timedelta(days=synthetic.HISTORY_DAYS))
+        self.assertIn('generate_bill pdf 20 rows', report['scenarios'])
+        for name, result in report['scenarios'].items():
+            self.assertLess(result['status'], 400, name)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'], name)
+            self.assertGreater(result['peak_memory_kb'], 0, name)
+        self.assertGreater(report['scenarios']['export_expenses csv']['response_bytes'], 0)
+        self.assertEqual(benchmarks.compare(report, report), [])
+
+    def test_compare_flags_regressions_beyond_threshold_and_noise(self):
+        def report(p50, queries=3):
+            return {'scenarios': {'home': {'p50_ms': p50, 'p95_ms': p50, 'peak_memory_kb': 100, 'queries': queries}}}
+        self.assertEqual(benchmarks.compare(report(11), report(10)), [])    # within 20%
+        self.assertEqual(benchmarks.compare(report(0.5), report(0.2)), [])  # below the noise floor
+        self.assertEqual(len(benchmarks.compare(report(15), report(10))), 2)
+        self.assertEqual(benchmarks.compare(report(10, queries=4), report(10)), ['home: queries 3 -> 4'])
+        self.assertEqual(benchmarks.compare({'scenarios': {'new': {'p50_ms': 5}}}, report(1)), [])
+
+
+class SyntheticDataTests(TestCase):
+    """Generated data is deterministic, realistic in shape and consistent once written."""
+
+    def test_rows_depend_only_on_seed_and_stream(self):
+        pool = list(Category.objects.order_by('id'))
+        today = date(2024, 6, 30)
+        rows = list(synthetic.build_rows(1, 2500, pool, seed=3, stream=2, end_date=today))
+        self.assertEqual(rows, list(synthetic.build_rows(1, 2500, pool, seed=3, stream=2, end_date=today)))
+        self.assertNotEqual(rows, list(synthetic.build_rows(1, 2500, pool, seed=3, stream=4, end_date=today)))
+
+        category_ids = {category.pk for category in pool} | {None}
+        for user_id, category_id, title, paise, description, day, moment in rows:
+            self.assertIn(category_id, category_ids)
+            self.assertIn(title, synthetic.TITLES)
+            self.assertTrue(synthetic.MIN_PAISE <= paise <= synthetic.MAX_PAISE)
+            self.assertTrue(str(today - timedelta(days=synthetic.HISTORY_DAYS)) < day <= str(today))
+        food = Category.objects.get(name='Food').pk
+        investments = Category.objects.get(name='Investments').pk
+        picked = [row[1] for row in rows]
+        self.assertGreater(picked.count(food), picked.count(investments))
+
+    def test_split_counts(self):
+        counts = synthetic.split_counts(1000, 7, seed=1)
+        self.assertEqual(len(counts), 7)
+        self.assertEqual(sum(counts), 1000)
+        self.assertGreater(len(set(counts)), 1)
+        self.assertEqual(counts, synthetic.split_counts(1000, 7, seed=1))
+
+    def test_command_writes_consistent_data(self):
+        out = StringIO()
+        end_date = date(2024, 6, 30)
+        call_command('generate_expenses', users=3, expenses=1200, seed=5, prefix='load', end_date=end_date,
+                     stdout=out)
+        self.assertIn('Created 3 user(s) and 1200 expense(s)', out.getvalue())
+        users = list(User.objects.filter(username__startswith='load-').order_by('id'))
+        self.assertEqual(len(users), 3)
+        self.assertEqual(Expense.objects.filter(user__in=users).count(), 1200)
+        for user in users:
+            self.assertTrue(ExpenseSummary.objects.filter(user=user).exists())
+            self.assertEqual(summaries.find_drift(user.pk), [])
+            self.assertEqual(versions.current(user)[0], 1)
+        self.assertEqual(Expense.objects.filter(user__in=users).latest('date').date, end_date)
+
+        # Same seed and end date, smaller statements, another day: the same data
+        with mock.patch.object(timezone, 'localdate', return_value=end_date + timedelta(days=40)):
+            call_command('generate_expenses', '--end-date', end_date.isoformat(), users=3, expenses=1200, seed=5,
+                         prefix='again', batch_size=7, stdout=StringIO())
+        again = list(User.objects.filter(username__startswith='again-').order_by('id'))
+
+        def contents(user):
+            return list(Expense.objects.filter(user=user).order_by('id')
+                        .values_list('title', 'amount', 'date', 'time', 'category'))
+        for first, second in zip(users, again):
+            self.assertEqual(contents(first), contents(second))
+
+        with self.assertRaises(CommandError):
+            call_command('generate_expenses', users=1, expenses=10, prefix='load', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('generate_expenses', '--end-date', '30/06/2024', users=1, prefix='dated', stdout=StringIO())
+
+
+class ReplicaRoutingTests(TestCase):
+    """Reads go to the replica only inside read views and until the user writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='pass12345')
+        cls.other = User.objects.create_user(username='writer', password='pass12345')
+
+    def setUp(self):
+        self.addCleanup(cache.delete_many, [routing.PIN_KEY.format(user.pk) for user in (self.user, self.other)])
+
+    def test_router_decisions(self):
+        with mock.patch.object(routing, 'replica_alias', return_value='replica'):
+            self.assertEqual(router.db_for_read(Expense), 'default')
+            with routing.replica_reads(self.user.pk) as alias:
+                self.assertEqual(alias, 'replica')
+                self.assertEqual(router.db_for_read(Expense), 'replica')
+                self.assertEqual(router.db_for_read(ExpenseSummary), 'replica')
+                self.assertEqual(router.db_for_read(BillJob), 'default')
+                self.assertEqual(router.db_for_read(Session), 'default')
+                self.assertEqual(router.db_for_read(User), 'default')
+                # Writing sends the rest of the block to the primary
+                self.assertEqual(router.db_for_write(Expense), 'default')
+                self.assertEqual(router.db_for_read(Expense), 'default')
+
+            routing.pin_to_primary(self.user.pk)
+            with routing.replica_reads(self.user.pk) as alias:
+                self.assertEqual(alias, 'default')
+                self.assertEqual(router.db_for_read(Expense), 'default')
+            with routing.replica_reads(self.other.pk):
+                self.assertEqual(router.db_for_read(Expense), 'replica')
+
+            self.assertFalse(router.allow_migrate('replica', 'expenses'))
+            self.assertTrue(router.allow_migrate('default', 'expenses'))
+
+    def test_replica_requires_a_shared_cache(self):
+        self.assertEqual(routing.check_shared_pin_cache(), [])
+        with mock.patch.object(routing, 'replica_alias', return_value='replica'):
+            self.assertEqual([e.id for e in routing.check_shared_pin_cache()], ['expenses.E001'])
+            location = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+            with override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}):
+                self.assertEqual(routing.check_shared_pin_cache(), [])
+
+    def test_without_replica_nothing_is_routed(self):
+        self.assertIsNone(routing.replica_alias())
+        with routing.replica_reads(self.user.pk) as alias:
+            self.assertEqual(alias, 'default')
+            self.assertEqual(router.db_for_read(Expense), 'default')
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        # The replica mirrors the primary here, as it does for the test database
+        with mock.patch.object(routing, 'replica_alias', return_value='default'):
+            self.client.force_login(self.user)
+            self.assertEqual(self.client.get(reverse('expenses:expense_list')).status_code, 200)
+            self.assertFalse(routing.is_pinned(self.user.pk))
+            with override_settings(BILL_JOBS_ASYNC=True):
+                self.client.get(reverse('expenses:generate_bill'))
+            self.assertFalse(routing.is_pinned(self.user.pk))
+
+            self.client.post(reverse('expenses:add_expense'), {
+                'title': 'Tea', 'amount': '15.00', 'date': '2025-03-01', 'time': '09:30',
+            })
+            self.assertTrue(routing.is_pinned(self.user.pk))
+            self.assertFalse(routing.is_pinned(self.other.pk))
+            self.assertContains(self.client.get(reverse('expenses:expense_list')), 'Tea')
+
+            response = self.client.get(reverse('expenses:export_expenses', args=['csv']))
+            self.assertIn(b'Tea', b''.join(response.streaming_content))
+
+
+
+@override_settings(EXPENSE_ARCHIVE_MONTHS=12)
+class ExpenseArchiveTests(TestCase):
+    """Old expenses move to the archive without changing totals, and reports still see them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='archivist', password='pass12345')
+        seed_expenses(cls.user, 700, list(Category.objects.all()), start=date(2024, 11, 1))
+        summaries.rebuild_user(cls.user.pk)
+        cls.ids = set(Expense.objects.filter(user=cls.user).values_list('id', flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.cutoff = archive.cutoff()
+
+    def test_archiving_moves_old_expenses_and_keeps_totals(self):
+        total = summaries.user_total(self.user)
+        old = Expense.objects.filter(user=self.user, date__lt=self.cutoff).count()
+        self.assertEqual(archive.pending_counts(self.user.pk), (old, 0))
+
+        self.assertEqual(archive.archive_user(self.user.pk), (old, 0))
+        self.assertFalse(Expense.objects.filter(user=self.user, date__lt=self.cutoff).exists())
+        self.assertEqual(ArchivedExpense.objects.filter(user=self.user).count(), old)
+        self.assertEqual(set(ExpenseHistory.objects.filter(user=self.user).values_list('id', flat=True)), self.ids)
+        self.assertEqual(summaries.find_drift(self.user.pk), [])
+        self.assertEqual(summaries.user_total(self.user), total)
+        self.assertEqual(versions.current(self.user)[0], 1)
+        self.assertEqual(archive.archive_user(self.user.pk), (0, 0))
+        self.assertEqual(versions.current(self.user)[0], 1)
+
+        # The admin only lists archived rows: deleting them would skip the summaries
+        self.client.force_login(User.objects.create_superuser(username='boss', password='pass12345'))
+        archived = ArchivedExpense.objects.filter(user=self.user).first()
+        url = reverse('admin:expenses_archivedexpense_changelist')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'delete_selected')
+        self.client.post(url, {'action': 'delete_selected', '_selected_action': [archived.pk], 'post': 'yes'})
+        delete_url = reverse('admin:expenses_archivedexpense_delete', args=[archived.pk])
+        self.assertEqual(self.client.post(delete_url, {'post': 'yes'}).status_code, 403)
+        self.assertEqual(ArchivedExpense.objects.filter(user=self.user).count(), old)
+
+    def test_only_ranges_reaching_the_archive_read_it(self):
+        archive.archive_user(self.user.pk)
+        early = self.cutoff - timedelta(days=300)
+        self.assertIs(archive.expenses_for(self.user).model, Expense)
+        self.assertIs(archive.expenses_for(self.user, self.cutoff, whole_history=True).model, Expense)
+        self.assertIs(archive.expenses_for(self.user, early).model, ExpenseHistory)
+        self.assertIs(archive.expenses_for(self.user, whole_history=True).model, ExpenseHistory)
+
+        # The list and the unbounded API list only show the main table
+        response = self.client.get(reverse('expenses:expense_list'), {'sort': 'date'})
+        listed = [int(pk) for pk in re.findall(r'/delete/(\d+)/', response.content.decode())]
+        shown = Expense.objects.filter(pk__in=listed)
+        self.assertEqual(shown.count(), len(listed))
+        self.assertGreaterEqual(shown.earliest('date').date, self.cutoff)
+        url = reverse('expenses:api_expenses')
+        body = self.client.get(url, {'sort': 'date', 'fields': 'id,date'}).json()
+        self.assertGreaterEqual(body['results'][0]['date'], self.cutoff.isoformat())
+        body = self.client.get(url, {'sort': 'date', 'date_from': '2024-11-01', 'fields': 'id,date'}).json()
+        self.assertEqual(body['results'][0]['date'], '2024-11-01')
+
+        # Reports cover the whole history
+        response = self.client.get(reverse('expenses:export_expenses', args=['csv']))
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 701)
+        context = bills.bill_context(self.user, ExpenseFilters(), date(2026, 1, 1))
+        self.assertEqual(sum(1 for _ in context['expenses']), 700)
+        self.assertEqual(analytics.analyze(self.user, None).count, 700)
+
+        # Archived expenses are found by substring search over archive ranges
+        filters = ExpenseFilters.from_query({'q': 'expense 33', 'date_to': early.isoformat()})
+        self.assertEqual(
+            list(filters.apply(archive.expenses_for(self.user, early)).values_list('title', flat=True)),
+            ['Expense 33'],
+        )
+
+    def test_lengthening_or_disabling_the_horizon_restores(self):
+        archived, _ = archive.archive_user(self.user.pk)
+        with override_settings(EXPENSE_ARCHIVE_MONTHS=24):
+            self.assertEqual(archive.archive_user(self.user.pk), (0, archived))
+        archive.archive_user(self.user.pk)
+        with override_settings(EXPENSE_ARCHIVE_MONTHS=None):
+            self.assertFalse(archive.reaches_archive(whole_history=True))
+            self.assertEqual(archive.archive_user(self.user.pk), (0, archived))
+        self.assertEqual(set(Expense.objects.filter(user=self.user).values_list('id', flat=True)), self.ids)
+        self.assertEqual(summaries.find_drift(self.user.pk), [])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_expenses', '--dry-run', stdout=out)
+        self.assertIn('Would archive', out.getvalue())
+        self.assertFalse(ArchivedExpense.objects.exists())
+        call_command('archive_expenses', '--user', str(self.user.pk), stdout=out)
+        self.assertTrue(ArchivedExpense.objects.filter(user=self.user).exists())
+        self.assertIn('Archived', out.getvalue())
+
+
+@override_settings(ROOT_URLCONF='expense_tracker.urls_asgi')
+class AsyncViewTests(TestCase):
+    """Under ASGI the async views match the sync ones and overlap their queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='async', password='pass12345')
+        seed_expenses(cls.user, 80, list(Category.objects.all()), start=timezone.localdate() - timedelta(days=60))
+        # Seeding bypasses the model signals
+        summaries.rebuild_user(cls.user.pk)
+        versions.touch(cls.user.pk)
+
+    def setUp(self):
+        self.addCleanup(cache.delete, routing.PIN_KEY.format(self.user.pk))
+
+    def sync_context(self, name, params=None):
+        self.client.force_login(self.user)
+        with override_settings(ROOT_URLCONF='expense_tracker.urls'):
+            return self.client.get(reverse(f'expenses:{name}'), params).context
+
+    async def test_pages_match_the_sync_views(self):
+        # The cache is cleared in between, so each side renders its own fragments
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('expenses:home'))
+        self.assertEqual(response.status_code, 200)
+        await cache.aclear()
+        expected = await sync_to_async(self.sync_context)('home')
+        self.assertIn('Recent Expenses', response.context['recent_html'])
+        self.assertEqual(response.context['recent_html'], expected['recent_html'])
+        self.assertEqual(response.context['totals_html'], expected['totals_html'])
+
+        params = {'sort': 'amount', 'q': 'seeded'}
+        await cache.aclear()
+        response = await self.async_client.get(reverse('expenses:expense_list'), params)
+        self.assertEqual(response.status_code, 200)
+        await cache.aclear()
+        expected = await sync_to_async(self.sync_context)('expense_list', params)
+        self.assertIn('<mark>', response.context['rows']['html'])
+        self.assertEqual(response.context['rows'], expected['rows'])
+        self.assertEqual(response.context['totals_html'], expected['totals_html'])
+
+        await cache.aclear()
+        second = await self.async_client.get(reverse('expenses:expense_list'), {**params, 'cursor': 'bogus'})
+        self.assertEqual(second.context['rows']['html'], expected['rows']['html'])
+
+    async def test_totals_api(self):
+        url = reverse('expenses:api_totals')
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        total = sum(Decimal(row['total']) for row in response.json()['categories'])
+        self.assertEqual(total, await sync_to_async(summaries.user_total)(self.user))
+        self.assertEqual((await self.async_client.get(url, {'month': '2024-13'})).status_code, 400)
+
+        again = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    async def test_anonymous_pages(self):
+        self.assertEqual((await self.async_client.get(reverse('expenses:home'))).status_code, 200)
+        response = await self.async_client.get(reverse('expenses:expense_list'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_gather_overlaps_callables_on_pooled_threads(self):
+        # Every call waits for the others, so this only finishes if they overlap
+        barrier = threading.Barrier(3, timeout=5)
+
+        def work():
+            barrier.wait()
+            return threading.current_thread().name, router.db_for_read(Expense)
+
+        async def coroutine():
+            return 'coroutine'
+
+        with mock.patch.object(concurrency, '_in_transaction', return_value=False), \
+                mock.patch.object(routing, 'replica_alias', return_value='replica'):
+            with routing.replica_reads(self.user.pk):
+                results = await concurrency.gather(work, coroutine(), work, work)
+        self.assertEqual(results[1], 'coroutine')
+        for name, alias in results[:1] + results[2:]:
+            self.assertTrue(name.startswith('expenses-query'), name)
+            self.assertEqual(alias, 'replica')
+
+    async def test_gather_runs_in_order_inside_a_transaction(self):
+        calls = []
+
+        def work(n):
+            calls.append((n, threading.current_thread().name))
+            return n
+
+        self.assertEqual(await concurrency.gather(partial(work, 1), partial(work, 2)), [1, 2])
+        self.assertEqual([n for n, _ in calls], [1, 2])
+        self.assertFalse(any(name.startswith('expenses-query') for _, name in calls))
+
+    async def test_statement_timers_follow_pooled_queries(self):
+        timings = []
+
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        with mock.patch.object(concurrency, '_in_transaction', return_value=False):
+            with profiling.time_statements(timings.append):
+                await concurrency.gather(query, query)
+        self.assertEqual(len(timings), 2)
+
+    async def test_pinned_users_read_from_the_primary(self):
+        seen = []
+
+        @routing.read_replica
+        async def view(request):
+            seen.append(router.db_for_read(Expense))
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        with mock.patch.object(routing, 'replica_alias', return_value='replica'):
+            await view(request)
+            await sync_to_async(routing.pin_to_primary)(self.user.pk)
+            await view(request)
+        self.assertEqual(seen, ['replica', 'default'])
+
+
+class StaticAssetTests(TestCase):
+    """collectstatic hashes and precompresses the assets, which are served cacheable forever."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.directory, ignore_errors=True)
+        cls.enterClassContext(override_settings(STATIC_ROOT=cls.directory))
+        call_command('collectstatic', interactive=False, verbosity=0, ignore_patterns=['admin'])
+
+    def get(self, name, encoding=None, **headers):
+        if encoding is not None:
+            headers['Accept-Encoding'] = encoding
+        return self.client.get(settings.STATIC_URL + name, headers=headers)
+
+    @staticmethod
+    def body(response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_pages_use_vendored_hashed_assets(self):
+        content = self.client.get(reverse('login')).content.decode()
+        self.assertNotIn('cdn.jsdelivr.net', content)
+        hashed = staticfiles_storage.url('expenses/vendor/bootstrap-5.1.3/bootstrap.min.css')
+        self.assertRegex(hashed, r'/bootstrap\.min\.[0-9a-f]{12}\.css$')
+        self.assertIn(hashed, content)
+
+    def test_collectstatic_minifies_and_precompresses(self):
+        name = staticfiles_storage.stored_name('expenses/css/base.css')
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            data = f.read()
+        self.assertNotIn(b'/*', data)
+        self.assertNotIn(b'\n    ', data)
+        with open(os.path.join(self.directory, name + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), data)
+        if assets.brotli is not None:
+            with open(os.path.join(self.directory, name + '.br'), 'rb') as f:
+                self.assertEqual(assets.brotli.decompress(f.read()), data)
+        # PNGs are compressed already
+        png = staticfiles_storage.stored_name('expenses/images/logo.png')
+        self.assertFalse(os.path.exists(os.path.join(self.directory, png + '.gz')))
+
+    def test_serving_negotiates_encoding_and_caches_hashed_names(self):
+        name = staticfiles_storage.stored_name('expenses/vendor/bootstrap-5.1.3/bootstrap.min.js')
+        plain = self.get(name, encoding='')
+        self.assertEqual(plain.status_code, 200)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(plain['Content-Type'], 'text/javascript')
+        self.assertEqual(plain['Cache-Control'], f'public, max-age={assets.IMMUTABLE_MAX_AGE}, immutable')
+        self.assertEqual(plain['Vary'], 'Accept-Encoding')
+        original = self.body(plain)
+        self.assertEqual(int(plain['Content-Length']), len(original))
+
+        gzipped = self.get(name, encoding='gzip, deflate')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(self.body(gzipped)), original)
+        self.assertLess(int(gzipped['Content-Length']), len(original))
+        self.assertNotIn('Content-Encoding', self.get(name, encoding='gzip;q=0'))
+        if assets.brotli is not None:
+            compressed = self.get(name, encoding='gzip, deflate, br')
+            self.assertEqual(compressed['Content-Encoding'], 'br')
+            self.assertEqual(assets.brotli.decompress(self.body(compressed)), original)
+
+        # Plain names are revalidated instead
+        unhashed = self.get('expenses/vendor/bootstrap-5.1.3/bootstrap.min.js')
+        self.assertEqual(unhashed['Cache-Control'], f'public, max-age={settings.STATIC_MAX_AGE}')
+        self.assertEqual(self.get('expenses/vendor/bootstrap-5.1.3/bootstrap.min.js',
+                                  **{'If-Modified-Since': unhashed['Last-Modified']}).status_code, 304)
+
+        self.assertEqual(self.get('expenses/missing.css').status_code, 404)
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+        self.assertEqual(self.get(name + '.gz').status_code, 404)
+
+    def test_accepted_encodings(self):
+        self.assertEqual(assets.accepted_encodings('gzip, deflate, br;q=1.0'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(assets.accepted_encodings('br;q=0, gzip;q=0.5'), {'gzip'})
+        self.assertEqual(assets.accepted_encodings(''), set())
+        self.assertEqual(assets.minify_css('a:hover  b { color:  red ; } /* x */'), 'a:hover b{color:red}\n')
+
+
+class ResponseCompressionTests(TestCase):
+    """Responses are compressed by type and size, streaming ones without being buffered."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='mobile-user', password='pass12345')
+        seed_expenses(cls.user, 300, list(Category.objects.all()))
+        summaries.rebuild_user(cls.user.pk)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def body(response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    @staticmethod
+    def middleware(response, view_name='expenses:export_expenses'):
+        """Runs ``response`` through the middleware, for a request to ``view_name``."""
+        request = RequestFactory().get('/', headers={'Accept-Encoding': 'gzip'})
+        request.resolver_match = mock.Mock(view_name=view_name)
+        return compression.ResponseCompressionMiddleware(lambda request: response)(request)
+
+    def test_html_is_compressed_with_the_accepted_encoding(self):
+        url = reverse('expenses:expense_list')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(plain['Vary'].count('Accept-Encoding'), 1)
+
+        gzipped = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        html = gzip.decompress(gzipped.content)
+        self.assertIn(b'</html>', html)
+        self.assertLess(len(gzipped.content), len(html) / 3)
+        self.assertEqual(int(gzipped['Content-Length']), len(gzipped.content))
+
+        if compression.brotli is not None:
+            compressed = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate, br'})
+            self.assertEqual(compressed['Content-Encoding'], 'br')
+            self.assertIn(b'</html>', compression.brotli.decompress(compressed.content))
+
+    def test_small_responses_are_left_alone(self):
+        response = self.client.get(reverse('expenses:api_totals'), headers={'Accept-Encoding': 'gzip'})
+        self.assertLess(len(response.content), settings.COMPRESSION_MIN_SIZE)
+        self.assertNotIn('Content-Encoding', response)
+
+    @override_settings(COMPRESSION_VIEWS={'expenses:expense_list': False, 'expenses:api_totals': {'min_size': 10}})
+    def test_per_view_settings(self):
+        response = self.client.get(reverse('expenses:expense_list'), headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response)
+        response = self.client.get(reverse('expenses:api_totals'), headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        # The ETag no longer matches the bytes sent
+        self.assertTrue(response['ETag'].startswith('W/"'))
+
+    def test_streaming_export_stays_streaming(self):
+        url = reverse('expenses:export_expenses', args=['csv'])
+        plain = self.body(self.client.get(url))
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response)
+        self.assertEqual(gzip.decompress(self.body(response)), plain)
+
+    def test_export_query_waits_for_the_body(self):
+        # Streams are not sampled, so the headers go out before the export's query runs
+        url = reverse('expenses:export_expenses', args=['csv'])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse([q for q in ctx.captured_queries if Expense._meta.db_table in q['sql']])
+        self.assertEqual(gzip.decompress(self.body(response)).count(b'\n'), 301)
+
+    @override_settings(ROOT_URLCONF='expense_tracker.urls_asgi', QUERY_INSTRUMENTATION=False,
+                       REQUEST_PROFILING=False)
+    async def test_export_under_asgi(self):
+        # The middleware chain is async and the export's generator is sync
+        await self.async_client.aforce_login(self.user)
+        url = reverse('expenses:export_expenses', args=['csv'])
+        response = await self.async_client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(gzip.decompress(body).count(b'\n'), 301)
+
+    def test_streams_are_compressed_incrementally(self):
+        produced = []
+
+        def chunks():
+            for i in range(1000):
+                produced.append(i)
+                yield f'{i},Expense {i},Groceries,{i % 997}.50\n'.encode() * 100
+
+        response = self.middleware(StreamingHttpResponse(chunks(), content_type='text/csv'))
+        compressed = iter(response.streaming_content)
+        decompressor = zlib.decompressobj(31)
+        data = b''
+        while not data:
+            data = decompressor.decompress(next(compressed))
+        # Only the chunks needed for the first flush were read
+        self.assertLess(len(produced), 100)
+        data += b''.join(decompressor.decompress(chunk) for chunk in compressed)
+        self.assertEqual(len(produced), 1000)
+        self.assertEqual(data.count(b'\n'), 100 * 1000)
+
+    def test_compressed_content_is_skipped(self):
+        noise = os.urandom(64 * 1024)
+        response = self.middleware(HttpResponse(noise, content_type='application/pdf'))
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response.content, noise)
+
+        streamed = self.middleware(StreamingHttpResponse(
+            [noise[i:i + 1000] for i in range(0, len(noise), 1000)], content_type='application/pdf'))
+        self.assertNotIn('Content-Encoding', streamed)
+        self.assertEqual(self.body(streamed), noise)
+
+        encoded = HttpResponse(gzip.compress(b'x' * 5000), content_type='text/csv')
+        encoded['Content-Encoding'] = 'gzip'
+        self.assertEqual(self.middleware(encoded)['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Encoding', self.middleware(HttpResponse(b'x' * 5000, content_type='image/png')))
+
+    async def test_async_streams(self):
+        async def chunks():
+            for i in range(200):
+                yield b'{"id": %d, "title": "Expense"}\n' % i * 50
+
+        async def get_response(request):
+            return StreamingHttpResponse(chunks(), content_type='application/x-ndjson')
+
+        request = RequestFactory().get('/', headers={'Accept-Encoding': 'gzip'})
+        response = await compression.ResponseCompressionMiddleware(get_response)(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(gzip.decompress(body).count(b'\n'), 200 * 50)
+
+
+class AsgiStreamingTests(TestCase):
+    """Under ASGI, exports and PDFs are sent as they are produced, not read into memory first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='streamer', password='pass12345')
+        seed_expenses(cls.user, 3000, list(Category.objects.all()))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # As the test client does: the requests share the test's connection
+        # and transaction, which must stay open
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        request_finished.disconnect(dispatch_uid='expenses_close_request_connections')
+        self.addCleanup(
+            request_finished.connect, concurrency.close_request_connections,
+            dispatch_uid='expenses_close_request_connections',
+        )
+
+    async def asgi_get(self, path, on_body=None):
+        """
+        Requests ``path`` through Django's ASGI handler, as a server would,
+        calling ``on_body`` with each body message as it is sent.
+
+        Returns:
+            tuple: The status code and the whole body
+        """
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+            'headers': [
+                (b'host', b'testserver'),
+                (b'cookie', f'{settings.SESSION_COOKIE_NAME}={self.client.session.session_key}'.encode()),
+            ],
+        }
+        disconnected = asyncio.Event()
+        requested = False
+        messages = []
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+            if message['type'] == 'http.response.body' and message.get('body') and on_body:
+                on_body(message['body'])
+
+        await ASGIHandler()(scope, receive, send)
+        disconnected.set()
+        return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+    async def test_export_rows_are_sent_as_they_are_read(self):
+        read = []
+        sent = []
+
+        def record(row):
+            read.append(row)
+            return export_record(row)
+
+        with mock.patch.object(exports, 'export_record', side_effect=record):
+            status, body = await self.asgi_get(
+                reverse('expenses:export_expenses', args=['csv']), lambda body: sent.append(len(read)))
+        self.assertEqual(status, 200)
+        self.assertEqual(body.count(b'\n'), 3001)
+        # The header goes out before the first row is read, and each block of
+        # rows is sent before the next one is read: what is held in memory at
+        # once does not grow with the export
+        self.assertEqual(sent[0], 0)
+        self.assertEqual(sent[-1], 3000)
+        self.assertLessEqual(max(b - a for a, b in zip(sent, sent[1:])), exports.ROWS_PER_WRITE)
+
+    @override_settings(BILL_JOBS_ASYNC=False)
+    async def test_pdf_is_sent_as_it_is_read(self):
+        reads = []
+        sent = []
+
+        class SpooledFile(tempfile.SpooledTemporaryFile):
+            def read(self, *args):
+                data = super().read(*args)
+                reads.append(len(data))
+                return data
+
+        with mock.patch.object(tempfile, 'SpooledTemporaryFile', SpooledFile):
+            status, body = await self.asgi_get(
+                reverse('expenses:generate_bill'), lambda body: sent.append(len(reads)))
+        self.assertEqual(status, 200)
+        self.assertTrue(body.startswith(b'%PDF'))
+        # One block is read per message, not the whole file before the first
+        self.assertGreater(len(sent), 1)
+        self.assertEqual(sent, list(range(1, len(sent) + 1)))
+
+
+class FragmentCacheTests(TestCase):
+    """Home page and list fragments come from the cache until the user's data changes."""
+
+    # Queries of a page whose fragments are all cached: with the default
+    # per-process cache, the data version is read from the database
+    hit_queries = AUTH_QUERIES + VERSION_QUERIES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = list(Category.objects.all())
+        cls.user = User.objects.create_user(username='cached', password='pass12345')
+        cls.other = User.objects.create_user(username='other', password='pass12345')
+        seed_expenses(cls.user, 60, cls.categories, start=timezone.localdate() - timedelta(days=70))
+        summaries.rebuild_user(cls.user.pk)
+        versions.touch(cls.user.pk)
+
+    def setUp(self):
+        cache.clear()
+        catalog.get_catalog(refresh=True)
+        self.client.force_login(self.user)
+
+    def get(self, name, params=None):
+        """Requests a page and returns its response and number of queries."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(f'expenses:{name}'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx)
+
+    def fragments_of(self, response):
+        if 'rows' in response.context:
+            return response.context['rows']['html'], response.context['totals_html']
+        return response.context['recent_html'], response.context['totals_html']
+
+    def write(self, action, *args, **kwargs):
+        """Runs a write and the callbacks of its (captured) transaction commit."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return action(*args, **kwargs)
+
+    def add(self, title):
+        return Expense.objects.create(
+            user=self.user, title=title, amount=Decimal('123.00'), category=self.categories[0],
+            date=timezone.localdate(), time=time(9, 0),
+        )
+
+    def test_unchanged_pages_come_from_the_cache(self):
+        for name, params in (('home', None), ('expense_list', None), ('expense_list', {'sort': 'amount', 'q': 'expense'})):
+            with self.subTest(name=name, params=params):
+                first, misses = self.get(name, params)
+                second, hits = self.get(name, params)
+                self.assertEqual(hits, self.hit_queries)
+                self.assertGreater(misses, hits)
+                self.assertEqual(self.fragments_of(second), self.fragments_of(first))
+
+        first = self.get('expense_list')[0].context['rows']
+        url = reverse('expenses:expense_list_page')
+        page = self.client.get(url, {'cursor': first['next_cursor']}).json()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url, {'cursor': first['next_cursor']}).json(), page)
+        self.assertEqual(len(ctx), self.hit_queries)
+        self.assertEqual(self.client.get(url, {'cursor': 'bogus'}).status_code, 400)
+
+    def test_writes_replace_cached_fragments(self):
+        self.get('home')
+        self.get('expense_list')
+        expense = self.write(self.add, 'Fresh tea')
+        recent, totals = self.fragments_of(self.get('home')[0])
+        self.assertIn('Fresh tea', recent)
+        rows, _ = self.fragments_of(self.get('expense_list')[0])
+        self.assertIn('Fresh tea', rows)
+
+        self.write(expense.delete)
+        self.assertNotIn('Fresh tea', self.fragments_of(self.get('home')[0])[0])
+        self.assertNotIn('Fresh tea', self.fragments_of(self.get('expense_list')[0])[0])
+        self.assertNotEqual(self.fragments_of(self.get('home')[0])[1], totals)
+
+    def test_category_changes_reach_every_user(self):
+        self.get('expense_list')
+        category = self.categories[0]
+        category.name = 'Renamed category'
+        self.write(category.save)
+        catalog.get_catalog(refresh=True)
+        self.assertIn('Renamed category', self.fragments_of(self.get('expense_list')[0])[1])
+
+    def test_users_do_not_share_fragments(self):
+        self.get('home')
+        self.client.force_login(self.other)
+        recent, _ = self.fragments_of(self.get('home')[0])
+        self.assertNotIn('Recent Expenses', recent)
+        self.assertNotIn('<tr>', self.fragments_of(self.get('expense_list')[0])[0])
+
+    @override_settings(FRAGMENT_CACHE_TIMEOUT=0)
+    def test_cache_can_be_turned_off(self):
+        _, misses = self.get('home')
+        self.assertEqual(self.get('home')[1], misses)
+
+
+class SharedFragmentCacheTests(FragmentCacheTests):
+    """With a cache shared by all workers, cached pages need no query beyond authentication."""
+
+    hit_queries = AUTH_QUERIES
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        shared = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }})
+        shared.enable()
+        self.addCleanup(shared.disable)
+        super().setUp()
+
+    def test_tokens_change_on_commit(self):
+        stale = self.fragments_of(self.get('home')[0])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.add('Fresh tea')
+        # Not committed yet: other requests keep seeing the old data
+        self.assertEqual(self.fragments_of(self.get('home')[0]), stale)
+        for callback in callbacks:
+            callback()
+        self.assertIn('Fresh tea', self.fragments_of(self.get('home')[0])[0])
@@ -0,0 +1,304 @@
+"""
+Concurrent throughput of one worker, through WSGI and through ASGI.
+
+``run`` seeds a user (see expenses/synthetic.py) and drives the views that
+have async versions (home, the expense list and the totals API) through
+Django's own request handlers, in process, with CLIENTS clients each
+sending requests back to back:
+
+* wsgi: WSGIHandler serving one request at a time, like a gunicorn sync
+  worker, with the sync views (expense_tracker/urls.py)
+* wsgi-threads: the same on THREADS threads, like a gthread worker started
+  with --threads THREADS
+* asgi: ASGIHandler on one event loop, like a Uvicorn worker (see
+  expense_tracker/gunicorn_asgi.py), with the async views
+  (expense_tracker/urls_asgi.py)
+
+Each mode is one worker process, so its requests per second are the
+capacity of one worker. Latencies are as the clients see them, including
+time spent waiting for a free worker thread.
+
+The benchmark database is local and answers in microseconds, while the
+production database is a network round trip away; ``simulated_latency``
+delays every statement by --db-latency-ms to stand in for that round trip,
+which is the wait the async views overlap. With no latency the numbers
+only compare the handlers' own overhead.
+
+Use the ``benchmark_throughput`` management command, which runs on a
+throwaway copy of the test database like ``benchmark_views``.
+"""
+
+import asyncio
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from . import synthetic
+from .benchmarks import percentile
+
+# URL names (expenses namespace) of the views compared
+VIEWS = ('home', 'expense_list', 'api_totals')
+
+MODES = ('wsgi', 'wsgi-threads', 'asgi')
+
+# URL configurations each interface is served with
+WSGI_URLCONF = 'expense_tracker.urls'
+ASGI_URLCONF = 'expense_tracker.urls_asgi'
+
+DEFAULT_EXPENSES = 5000
+DEFAULT_CATEGORIES = 9
+DEFAULT_REQUESTS = 200
+DEFAULT_CLIENTS = 32
+DEFAULT_THREADS = 4
+DEFAULT_DB_LATENCY_MS = 20.0
+
+USER_PREFIX = 'throughput'
+
+
+@contextmanager
+def simulated_latency(seconds):
+    """
+    Delays every SQL statement by ``seconds`` while active, on every
+    connection of every thread, including connections opened meanwhile.
+    """
+    active = threading.Event()
+    active.set()
+
+    def delay(execute, sql, params, many, context):
+        if active.is_set():
+            time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    if seconds <= 0:
+        yield
+        return
+    for connection in connections.all(initialized_only=True):
+        install(None, connection)
+    connection_created.connect(install, weak=False)
+    try:
+        yield
+    finally:
+        # Connections kept by other threads keep the wrapper, switched off
+        active.clear()
+        connection_created.disconnect(install)
+        for connection in connections.all(initialized_only=True):
+            if delay in connection.execute_wrappers:
+                connection.execute_wrappers.remove(delay)
+
+
+def _wsgi_request(handler, path, query, cookie):
+    """Sends one GET through a WSGI handler; returns (status, size)."""
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_COOKIE': cookie,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    statuses = []
+    body = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        size = sum(len(chunk) for chunk in body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return int(statuses[0].split()[0]), size
+
+
+async def _asgi_request(handler, path, query, cookie):
+    """Sends one GET through an ASGI handler; returns (status, size)."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    finished = asyncio.Event()
+    sent = []
+    status = []
+
+    async def receive():
+        if not sent:
+            sent.append(True)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The handler listens for a disconnect while the view runs
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    size = 0
+
+    async def send(message):
+        nonlocal size
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            size += len(message.get('body', b''))
+            if not message.get('more_body', False):
+                finished.set()
+
+    await handler(scope, receive, send)
+    finished.set()
+    return status[0], size
+
+
+def _result(latencies, statuses, sizes, seconds):
+    """Summarises one mode's run."""
+    return {
+        'requests': len(latencies),
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(len(latencies) / seconds, 1) if seconds else 0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'status': max(statuses),
+        'response_bytes': max(sizes),
+    }
+
+
+def _shares(requests, clients):
+    """Splits ``requests`` between ``clients`` as evenly as possible."""
+    return [requests // clients + (1 if i < requests % clients else 0) for i in range(clients)]
+
+
+def run_wsgi(handler, path, query, cookie, requests, clients, threads):
+    """
+    Sends ``requests`` GETs from ``clients`` concurrent clients to a WSGI
+    worker serving ``threads`` requests at a time.
+    """
+    slots = threading.Semaphore(threads)
+    latencies, statuses, sizes = [], [], []
+
+    def client(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            with slots:
+                status, size = _wsgi_request(handler, path, query, cookie)
+            latencies.append(time.perf_counter() - started)
+            statuses.append(status)
+            sizes.append(size)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(client, count) for count in _shares(requests, clients)]:
+            future.result()
+    return _result(latencies, statuses, sizes, time.perf_counter() - started)
+
+
+def run_asgi(handler, path, query, cookie, requests, clients):
+    """Sends ``requests`` GETs from ``clients`` concurrent clients to an ASGI worker."""
+    latencies, statuses, sizes = [], [], []
+
+    async def client(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            status, size = await _asgi_request(handler, path, query, cookie)
+            latencies.append(time.perf_counter() - started)
+            statuses.append(status)
+            sizes.append(size)
+
+    async def main():
+        await asyncio.gather(*(client(count) for count in _shares(requests, clients)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return _result(latencies, statuses, sizes, time.perf_counter() - started)
+
+
+def prepare(expenses, categories, seed):
+    """Seeds the benchmark user and returns a Cookie header logging them in."""
+    pool = synthetic.categories(categories)
+    user = synthetic.create_users(1, prefix=USER_PREFIX)[0]
+    synthetic.seed_user(user, expenses, pool, seed=seed)
+    client = Client()
+    client.force_login(user)
+    return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+
+def run(expenses=DEFAULT_EXPENSES, categories=DEFAULT_CATEGORIES, seed=0, requests=DEFAULT_REQUESTS,
+        clients=DEFAULT_CLIENTS, threads=DEFAULT_THREADS, db_latency_ms=DEFAULT_DB_LATENCY_MS,
+        views=None, progress=None):
+    """
+    Seeds the dataset into the current database and measures every view in
+    every mode.
+
+    Args:
+        expenses, categories: Dataset size (one user)
+        seed: Seed of the generated data
+        requests: Requests per view and mode
+        clients: Concurrent clients
+        threads: Threads of the wsgi-threads worker
+        db_latency_ms: Delay added to every SQL statement
+        views: Optional URL names to measure (default: all of VIEWS)
+        progress: Optional callable receiving (view, mode, result)
+
+    Returns:
+        dict: {'settings': ..., 'views': {view: {mode: result}}}
+    """
+    cookie = prepare(expenses, categories, seed)
+    # Development-only middleware would distort both paths
+    with override_settings(QUERY_INSTRUMENTATION=False, REQUEST_PROFILING=False):
+        wsgi = WSGIHandler()
+        asgi = ASGIHandler()
+
+    report = {
+        'settings': {
+            'database': connections['default'].vendor,
+            'expenses': expenses, 'requests': requests, 'clients': clients, 'threads': threads,
+            'db_latency_ms': db_latency_ms,
+        },
+        'views': {},
+    }
+    # Every request runs its queries: cached fragments (expenses/fragments.py)
+    # would leave no database waits to overlap
+    with simulated_latency(db_latency_ms / 1000), override_settings(FRAGMENT_CACHE_TIMEOUT=0):
+        for view in VIEWS:
+            if views and view not in views:
+                continue
+            path, query = reverse(f'expenses:{view}', urlconf=WSGI_URLCONF), ''
+            with override_settings(ROOT_URLCONF=WSGI_URLCONF):
+                # Warm up caches (category catalog, templates) outside the timing
+                _wsgi_request(wsgi, path, query, cookie)
+                results = {
+                    'wsgi': run_wsgi(wsgi, path, query, cookie, requests, clients, 1),
+                    'wsgi-threads': run_wsgi(wsgi, path, query, cookie, requests, clients, threads),
+                }
+            with override_settings(ROOT_URLCONF=ASGI_URLCONF):
+                results['asgi'] = run_asgi(asgi, path, query, cookie, requests, clients)
+            report['views'][view] = results
+            if progress:
+                for mode in MODES:
+                    progress(view, mode, results[mode])
+    return report
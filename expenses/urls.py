@@ -7,7 +7,7 @@ The app_name provides a namespace for URL reversing.
 """
 
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'expenses'  # Namespace for URL pattern names
 
@@ -19,9 +19,21 @@ urlpatterns = [
     # List all expenses with sorting and filtering options
     path('list/', views.expense_list, name='expense_list'),
     
+    # Next page of expense rows for infinite scrolling (JSON fragment)
+    path('list/page/', views.expense_list_page, name='expense_list_page'),
+    
     # Add new expense form
     path('add/', views.add_expense, name='add_expense'),
     
+    # Bulk import from a CSV file or bank statement
+    path('import/', views.import_expenses, name='import_expenses'),
+    
+    # Streaming download of expenses (csv or ndjson), with optional filters
+    path('export/<str:fmt>/', views.export_expenses, name='export_expenses'),
+    
+    # Spending trends, category shares and month-end forecast
+    path('analytics/', views.analytics_dashboard, name='analytics'),
+    
     # Financial calculators page
     path('calculators/', views.calculators, name='calculators'),
     
@@ -30,6 +42,34 @@ urlpatterns = [
     
     # Generate PDF bill of expenses
     path('generate-bill/', views.generate_bill, name='generate_bill'),
+    
+    # Progress of a queued bill (HTML page or JSON for polling)
+    path('bills/<int:job_id>/', views.bill_job_status, name='bill_job_status'),
+    
+    # Download a finished bill
+    path('bills/<int:job_id>/download/', views.bill_job_download, name='bill_job_download'),
+    
+    # JSON API (see expenses/api.py)
+    path('api/expenses/', api.expenses, name='api_expenses'),
+    path('api/expenses/<int:expense_id>/', api.expense_detail, name='api_expense_detail'),
+    path('api/categories/', api.categories, name='api_categories'),
+    path('api/totals/', api.totals, name='api_totals'),
+    path('api/analytics/', api.spending_analytics, name='api_analytics'),
+    path('api/calculators/<str:name>/', api.calculate, name='api_calculate'),
+
+
+]
 
+# Async versions of the read-heavy views, which replace them when the site is
+# served over ASGI (see expense_tracker/urls_asgi.py)
+ASYNC_VIEWS = {
+    'home': views.ahome,
+    'expense_list': views.aexpense_list,
+    'api_totals': api.atotals,
+}
 
+async_urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in urlpatterns
 ]
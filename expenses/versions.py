@@ -0,0 +1,190 @@
+"""
+Per-user data versions, used to validate cached responses.
+
+Every write to a user's expenses increments that user's UserDataVersion in
+the same transaction, from model signals for ordinary saves and deletes and
+explicitly (``touch``) from bulk paths such as the CSV importer. A client or
+cache that stored a response together with the version it was built from
+can then tell whether it is still current with a single primary key lookup,
+without re-running the query behind it.
+
+Category renames and deletions change what every user sees, so they bump
+all versions at once.
+
+With a cache shared by all workers, each user also has a data token in that
+cache (``token``): a random string replaced once a transaction that bumped
+their version has committed. Code holding such a cache can then tell whether
+its entries are current without any database query at all; with a
+per-process cache another worker's write could not reach the token, so the
+token falls back to the version read from the database.
+"""
+
+import hashlib
+import uuid
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Category, Expense, UserDataVersion
+
+# Cache keys of the data tokens kept in a shared cache: one per user, and one
+# replaced when every user's data changes at once
+TOKEN_KEY = 'expenses:data-token:{}'
+ALL_TOKEN_KEY = 'expenses:data-token:all'
+
+
+def touch(*user_ids):
+    """
+    Increments the data version of the given users.
+
+    Call this inside the transaction that changed their expenses, so the new
+    version never becomes visible without the change (or vice versa).
+    """
+    now = timezone.now()
+    for user_id in set(user_ids):
+        changes = {'version': F('version') + 1, 'changed_at': now}
+        if UserDataVersion.objects.filter(user_id=user_id).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                UserDataVersion.objects.create(user_id=user_id, version=1, changed_at=now)
+        except IntegrityError:
+            # Another writer created the row first
+            UserDataVersion.objects.filter(user_id=user_id).update(**changes)
+    if shared_cache():
+        transaction.on_commit(partial(renew_tokens, set(user_ids)))
+
+
+def touch_all():
+    """Increments every user's data version (e.g. after a category change)."""
+    from django.contrib.auth.models import User
+
+    now = timezone.now()
+    with transaction.atomic():
+        UserDataVersion.objects.bulk_create(
+            [UserDataVersion(user_id=pk, changed_at=now)
+             for pk in User.objects.filter(data_version__isnull=True).values_list('pk', flat=True)],
+            ignore_conflicts=True,
+        )
+        UserDataVersion.objects.update(version=F('version') + 1, changed_at=now)
+    if shared_cache():
+        transaction.on_commit(partial(renew_tokens, all_users=True))
+
+
+def current(user):
+    """
+    Returns (version, changed_at) for ``user``.
+
+    Users who never changed anything since versions were introduced are at
+    version 0 with no known modification time.
+    """
+    row = UserDataVersion.objects.filter(user=user).values_list('version', 'changed_at').first()
+    return row or (0, None)
+
+
+def for_request(request):
+    """Returns current(request.user), looked up at most once per request."""
+    if not hasattr(request, '_data_version'):
+        request._data_version = current(request.user)
+    return request._data_version
+
+
+def shared_cache():
+    """Whether the default cache is shared by all worker processes."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def renew_tokens(user_ids=(), all_users=False):
+    """
+    Replaces the cached data tokens of ``user_ids`` (or the one shared by all
+    users). ``touch`` calls it once its transaction has committed, so a
+    reader never sees a new token before the data it stands for.
+    """
+    tokens = {TOKEN_KEY.format(user_id): uuid.uuid4().hex for user_id in user_ids}
+    if all_users:
+        tokens[ALL_TOKEN_KEY] = uuid.uuid4().hex
+    caches['default'].set_many(tokens, None)
+
+
+def token(request):
+    """
+    Returns a string that changes whenever the requesting user's data does.
+
+    With a shared cache it is read from that cache (see the module
+    docstring), where it is created on first use; ``add`` rather than
+    ``set`` lets a concurrent writer's token win. Otherwise it is the data
+    version and time of the last change, read from the database. Either way
+    it is looked up at most once per request.
+    """
+    if not hasattr(request, '_data_token'):
+        if shared_cache():
+            cache = caches['default']
+            keys = (TOKEN_KEY.format(request.user.pk), ALL_TOKEN_KEY)
+            tokens = cache.get_many(keys)
+            for key in keys:
+                if key not in tokens:
+                    cache.add(key, uuid.uuid4().hex, None)
+                    # Culled again already: a fresh token only costs misses
+                    tokens[key] = cache.get(key) or uuid.uuid4().hex
+            request._data_token = '.'.join(tokens[key] for key in keys)
+        else:
+            version, changed_at = for_request(request)
+            request._data_token = f'{version}.{changed_at.timestamp() if changed_at else 0}'
+    return request._data_token
+
+
+def etag(request, *parts):
+    """
+    Builds a strong ETag for a response derived from the user's expenses.
+
+    The tag covers the user, their data version, the full request path with
+    its query string and any extra ``parts`` (such as a serialisation
+    version), so different pages, filters or field selections never share
+    a tag.
+    """
+    version, _ = for_request(request)
+    key = '|'.join(str(p) for p in (request.user.pk, version, request.get_full_path(), *parts))
+    return '"%s"' % hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def last_modified(request):
+    """Returns the time of the user's latest change, or None if unknown."""
+    return for_request(request)[1]
+
+
+@receiver(post_save, sender=Expense, dispatch_uid='expense_version_save')
+@receiver(post_delete, sender=Expense, dispatch_uid='expense_version_delete')
+def expense_changed(sender, instance, raw=False, origin=None, **kwargs):
+    """
+    Bumps the version of the expense's owner.
+
+    Nothing is bumped when the expenses go because their owner is being
+    deleted: the cascade has already removed the owner's version row, and
+    ``touch`` would create it again for a user about to disappear.
+    """
+    if raw or owner_deleted(origin):
+        return
+    touch(instance.user_id)
+
+
+def owner_deleted(origin):
+    """Whether a delete started from ``origin`` is deleting users."""
+    user_model = get_user_model()
+    return isinstance(origin, user_model) or getattr(origin, 'model', None) is user_model
+
+
+@receiver(post_save, sender=Category, dispatch_uid='category_version_save')
+@receiver(post_delete, sender=Category, dispatch_uid='category_version_delete')
+def category_changed(sender, raw=False, **kwargs):
+    """Category names appear in every user's data, so all versions move."""
+    if raw:
+        return
+    touch_all()
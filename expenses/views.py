@@ -1,76 +1,24 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from django.http import HttpResponse
-from django.template.loader import get_template
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
 from django.conf import settings
-import os
-from io import BytesIO
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Flowable, Spacer
-from svglib.svglib import svg2rlg
-from reportlab.graphics import renderPDF
-
-class SVGImage(Flowable):
-    """
-    Custom Flowable class for rendering SVG images in ReportLab PDFs
-    Inherits from Flowable to integrate with ReportLab's document building process
-    
-    Features:
-    - Renders SVG with a circular background
-    - Supports custom dimensions
-    - Maintains aspect ratio
-    """
-    
-    def __init__(self, svg_drawing, width=35, height=35):
-        """
-        Initialize SVG image with custom dimensions
-        
-        Args:
-            svg_drawing: SVG drawing object from svglib
-            width: Width of the image (default: 35 points)
-            height: Height of the image (default: 35 points)
-        """
-        Flowable.__init__(self)
-        self.svg_drawing = svg_drawing
-        self.width = width
-        self.height = height
-        
-    def draw(self):
-        """
-        Render the SVG image on the PDF canvas
-        
-        Process:
-        1. Draws a circular red background
-        2. Places the SVG image on top
-        3. Handles proper positioning and state management
-        """
-        # Draw red circle background (matching --accent-color from base.html)
-        self.canv.setFillColor(colors.HexColor('#e74c3c'))
-        self.canv.circle(self.width/2, self.height/2, min(self.width, self.height)/2, fill=1)
-        
-        # Draw the SVG on top in white
-        self.canv.saveState()  # Save current graphics state
-        self.canv.translate(2, 2)  # Offset by 2 points for better centering
-        renderPDF.draw(self.svg_drawing, self.canv, 0, 0)
-        self.canv.restoreState()  # Restore graphics state
-
-    def wrap(self, *args):
-        """
-        Define the space needed for this flowable
-        
-        Returns:
-            tuple: (width, height) in points
-        """
-        return (self.width, self.height)
-from .models import Expense, Category
-from django.db.models import Sum
+from django.db import router, transaction
+from functools import partial
+from asgiref.sync import sync_to_async
+import tempfile
+from .models import Expense, Category, BillJob
+from . import (
+    analytics, archive, bills, catalog, concurrency, exports, fragments, importer, jobs, pagination, profiling, routing,
+    search, summaries,
+)
+from .filters import ExpenseFilters
+from django.db.models.functions import Left
+from django.urls import reverse
 from django.utils import timezone
 
 @login_required
@@ -120,6 +68,60 @@ def calculators(request):
     """
     return render(request, 'expenses/calculators.html')
 
+@login_required
+@routing.read_replica
+def analytics_dashboard(request):
+    """
+    Display spending trends, category shares and a month-end forecast.
+
+    All figures are computed by expenses/analytics.py from a single query
+    of the user's (date, amount, category) columns.
+
+    Query Parameters:
+        - months: Number of months to cover (default 12), or 'all'
+
+    Args:
+        request: HttpRequest object containing metadata about the request
+
+    Returns:
+        HttpResponse rendering the analytics.html template
+
+    Security:
+        - Requires user authentication (@login_required)
+        - Only analyses the current user's expenses
+    """
+    try:
+        months = analytics.parse_months(request.GET.get('months'))
+    except ValueError:
+        messages.error(request, 'Invalid period.')
+        months = analytics.DEFAULT_MONTHS
+    result = analytics.analyze(request.user, months=months)
+    data = result.as_dict()
+
+    # Bar widths relative to the largest month; amounts are formatted by the
+    # template's inr filter
+    monthly = data['monthly']
+    largest = max((row['total'] for row in monthly), default=0)
+    for row in monthly:
+        row['width'] = round(row['total'] * 100 / largest, 1) if largest else 0
+    projection = data['projection']
+    last_month = monthly[-2]['total'] if len(monthly) > 1 else None
+
+    context = {
+        'analytics': data,
+        'months': months,
+        'period_choices': [(choice or 'all', f'{choice} months' if choice else 'All time')
+                           for choice in analytics.PERIOD_CHOICES],
+        'selected_period': months or 'all',
+        'total': data['total'],
+        'month_to_date': projection['month_to_date'],
+        'projected_total': projection['projected_total'],
+        'daily_rate': projection['daily_rate'],
+        'last_month': last_month,
+        'weekly_average': sum(row['total'] for row in data['weekly']) / len(data['weekly']),
+    }
+    return render(request, 'expenses/analytics.html', context)
+
 def signup(request):
     """
     Handle user registration.
@@ -172,6 +174,7 @@ def signup(request):
 
     return render(request, 'expenses/signup.html')
 
+@routing.read_replica
 def home(request):
     """
     Display the home page dashboard.
@@ -181,103 +184,358 @@ def home(request):
     
     Features:
     - Displays 5 most recent expenses for logged-in users
-    - Formats currency amounts in Indian Rupee format
+    - Shows the overall total and this month's spending per category
+    - Amounts are formatted in Indian Rupee format while rendering
+    - Both cards are cached per user until their data changes (see
+      expenses/fragments.py), so an unchanged dashboard runs no queries
+      of its own
     
     Args:
         request: HttpRequest object containing metadata about the request
     
     Returns:
         HttpResponse rendering the home.html template with context
-        containing recent expenses (if user is authenticated)
+        containing the rendered recent expenses card and totals cards (if
+        user is authenticated)
     """
     context = {}
     if request.user.is_authenticated:
-        recent_expenses = Expense.objects.filter(user=request.user)[:5]
-        for expense in recent_expenses:
-            expense.formatted_amount = format_indian_currency(expense.amount)
-        context['expenses'] = recent_expenses
+        month = timezone.localdate()
+        context['recent_html'] = fragments.cached(
+            request, RECENT_EXPENSES_TEMPLATE, partial(recent_expenses_html, request.user))
+        context['totals_html'] = fragments.cached(
+            request, HOME_TOTALS_TEMPLATE, partial(home_totals_html, request.user, month), month.strftime('%Y-%m'))
     return render(request, 'expenses/home.html', context)
 
-def format_indian_currency(amount):
+@routing.read_replica
+async def ahome(request):
     """
-    Formats a numerical amount into Indian currency format with Rs. symbol
+    Async version of ``home``, served under ASGI (see
+    expense_tracker/urls_asgi.py).
+    
+    Cards missing from the fragment cache are built at the same time: the
+    recent expenses are read with the async ORM while this month's
+    breakdown and the overall total are read on pooled threads (see
+    expenses/concurrency.py), so the page waits for one database round trip
+    instead of three.
     
     Args:
-        amount: A numerical value (int/float) or string that can be converted to float
-        
+        request: HttpRequest object containing metadata about the request
+    
     Returns:
-        str: Formatted string in the format "(Rs. X,XXX.XX)"
-             For negative amounts: "-(Rs. X,XXX.XX)"
+        HttpResponse rendering the home.html template with the same context
+        as ``home``
+    """
+    user = await concurrency.authenticated_user(request)
+    context = {}
+    if user.is_authenticated:
+        month = timezone.localdate()
+        context['recent_html'], context['totals_html'] = await concurrency.gather(
+            fragments.acached(request, RECENT_EXPENSES_TEMPLATE, partial(arecent_expenses_html, user)),
+            fragments.acached(
+                request, HOME_TOTALS_TEMPLATE, partial(ahome_totals_html, user, month), month.strftime('%Y-%m')),
+        )
+    return await sync_to_async(render)(request, 'expenses/home.html', context)
+
+# Columns loaded for the recent expenses card on the home page
+HOME_FIELDS = ('title', 'amount', 'description', 'date', 'time')
+
+# Cached fragments of the home page and the expense list (see
+# expenses/fragments.py)
+RECENT_EXPENSES_TEMPLATE = 'expenses/_recent_expenses.html'
+HOME_TOTALS_TEMPLATE = 'expenses/_home_totals.html'
+LIST_TOTALS_TEMPLATE = 'expenses/_expense_totals.html'
+LIST_ROWS_TEMPLATE = 'expenses/_expense_rows.html'
+
+def recent_expenses_html(user):
+    """Renders the home page's card of the user's 5 most recent expenses."""
+    expenses = Expense.objects.filter(user=user).only(*HOME_FIELDS)[:5]
+    return render_to_string(RECENT_EXPENSES_TEMPLATE, {'expenses': expenses})
+
+async def arecent_expenses_html(user):
+    """Async version of ``recent_expenses_html``."""
+    expenses = await concurrency.fetch(Expense.objects.filter(user=user).only(*HOME_FIELDS)[:5])
+    return render_to_string(RECENT_EXPENSES_TEMPLATE, {'expenses': expenses})
+
+def home_totals_html(user, month):
+    """
+    Renders the home page's totals cards: the user's overall total and their
+    spending per category in the month of ``month``.
+    """
+    # Totals come from the monthly summary table, not the expense rows
+    breakdown = summaries.category_breakdown(user, month=month)
+    return render_home_totals(breakdown, summaries.user_total(user))
+
+async def ahome_totals_html(user, month):
+    """Async version of ``home_totals_html``, running both reads at once."""
+    breakdown, total = await concurrency.gather(
+        partial(summaries.category_breakdown, user, month=month),
+        partial(summaries.user_total, user),
+    )
+    return render_home_totals(breakdown, total)
+
+def render_home_totals(breakdown, total):
+    """Renders the home page's totals cards from what home_totals_html read."""
+    return render_to_string(HOME_TOTALS_TEMPLATE, {
+        'month_breakdown': breakdown,
+        'month_total': sum(row['total'] for row in breakdown),
+        'total': total,
+    })
+
+# Columns loaded for each row of the expense list; the description is only
+# shown truncated, so just a prefix of it is fetched
+LIST_FIELDS = ('title', 'amount', 'date', 'time', 'category')
+DESCRIPTION_PREVIEW_LENGTH = 200
+
+def list_queryset(user, search_terms=(), sort_by=None):
+    """
+    Returns the user's expenses projected to what the list rows display.
+    
+    Only the category id is loaded; the category itself comes from the
+    in-memory catalog (see catalog.attach) rather than a join. The
+    description is cut down to DESCRIPTION_PREVIEW_LENGTH characters in SQL
+    as 'description_preview'.
     
-    Example:
-        format_indian_currency(1234.56) -> "(Rs. 1,234.56)"
-        format_indian_currency(-1234.56) -> "-(Rs. 1,234.56)"
-        format_indian_currency("invalid") -> "(Rs. 0.00)"
+    With ``search_terms`` only matching expenses are included, ranked by
+    relevance when that is the sort order.
     """
-    try:
-        # Convert input to float (handles both string and numeric inputs)
-        amount = float(amount)
-        
-        # Handle negative amounts
-        if amount < 0:
-            return f"-(Rs. {abs(amount):,.2f})"  # Use abs() to show positive number after minus sign
-        
-        # Handle positive amounts
-        return f"(Rs. {amount:,.2f})"  # .2f ensures 2 decimal places
+    queryset = (
+        Expense.objects.filter(user=user)
+        .only(*LIST_FIELDS)
+        .annotate(description_preview=Left('description', DESCRIPTION_PREVIEW_LENGTH))
+    )
+    if search_terms:
+        queryset = search.matching(queryset, search_terms)
+        if sort_by == pagination.RELEVANCE_SORT:
+            queryset = search.with_rank(queryset, search_terms)
+    return queryset
+
+def prepare_rows(expenses, search_terms=()):
+    """
+    Attaches categories to the expenses on a page and, while searching,
+    highlights the matched words in titles and descriptions. Amounts are
+    formatted by the template's inr filter.
+    """
+    catalog.attach(expenses)
+    if search_terms:
+        for expense in expenses:
+            expense.title_html = search.highlight(expense.title, search_terms)
+            expense.description_html = search.highlight(expense.description_preview, search_terms)
+    return expenses
+
+def render_list_rows(page, search_terms):
+    """
+    Renders a page of the expense list as cached by the fragment cache.
     
-    except (ValueError, TypeError):
-        # Return default format if conversion fails
-        return "(Rs. 0.00)"
+    Returns:
+        dict: 'html' (the <tr> rows, empty if there are none), 'next_cursor'
+        and 'has_more'
+    """
+    html = ''
+    if page.items:
+        prepare_rows(page.items, search_terms)
+        html = render_to_string(LIST_ROWS_TEMPLATE, {'expenses': page.items})
+    return {'html': html, 'next_cursor': page.next_cursor, 'has_more': page.has_more}
+
+def list_rows(user, search_terms, sort_by, cursor=None):
+    """
+    Reads and renders the page of the user's expenses at ``cursor`` (see
+    render_list_rows). Raises pagination.InvalidCursor for a stale or
+    tampered cursor.
+    """
+    expenses = list_queryset(user, search_terms, sort_by)
+    return render_list_rows(pagination.paginate(expenses, sort_by, cursor), search_terms)
+
+async def alist_rows(user, search_terms, sort_by, cursor):
+    """
+    Async version of ``list_rows``, which falls back to the first page for a
+    stale or tampered cursor.
+    """
+    page = await alist_page(list_queryset(user, search_terms, sort_by), sort_by, cursor)
+    # Attaching categories may query, so it runs on a thread
+    return await sync_to_async(render_list_rows)(page, search_terms)
+
+def list_totals_html(user, archive_cutoff):
+    """Renders the expense list's total and per-category cards."""
+    # Exact total read from the monthly summaries (O(months), not O(expenses));
+    # the per-category breakdown already adds up to it
+    return render_list_totals(summaries.category_breakdown(user), archive_cutoff)
+
+async def alist_totals_html(user, archive_cutoff):
+    """Async version of ``list_totals_html``."""
+    breakdown = await sync_to_async(summaries.category_breakdown)(user)
+    return render_list_totals(breakdown, archive_cutoff)
+
+def render_list_totals(breakdown, archive_cutoff):
+    """Renders the expense list's totals cards from what list_totals_html read."""
+    return render_to_string(LIST_TOTALS_TEMPLATE, {
+        'total': sum(row['total'] for row in breakdown),
+        'breakdown': breakdown,
+        'archive_cutoff': archive_cutoff,
+    })
 
 @login_required
+@routing.read_replica
 def expense_list(request):
     """
-    Display a list of all expenses for the current user.
+    Display the first page of the current user's expenses.
     
     Features:
     - Dynamic sorting by multiple fields
-    - Total expenses calculation
+    - Ranked full-text search with highlighted matches
+    - Keyset (cursor) pagination so only one page of rows is loaded
+    - Infinite scroll via the expense_list_page fragment endpoint
+    - Exact total expenses calculation over the full history
+    - Rows and totals cached per user until their data changes (see
+      expenses/fragments.py)
+    - Served from the read replica, if configured (see expenses/routing.py)
     - Currency formatting for amounts
-    - Category filtering options
     
     Args:
         request: HttpRequest object containing metadata about the request
         - Optional query parameter 'sort' for specifying sort field
+        - Optional query parameter 'cursor' to start from a later page
+        - Optional query parameter 'q' to search titles and descriptions
     
     Returns:
         HttpResponse rendering the expense_list.html template with context:
-        - expenses: QuerySet of Expense objects
-        - total: Formatted total amount
+        - rows: The current page (see render_list_rows): its rendered rows
+          and the cursor for the next page (None on the last page)
+        - totals_html: Rendered total and per-category cards; expenses
+          archived before the archive cutoff count towards them but are not
+          listed
         - categories: Available expense categories
         - current_sort: Current sort field
+        - query: The search query, if any
     
     Security:
         - Requires user authentication (@login_required)
         - Only shows expenses belonging to the current user
     """
-    # Get the sort parameter from request, default to '-date'
-    sort_by = request.GET.get('sort', '-date')
-    valid_sort_fields = ['amount', '-amount', 'title', '-title', 'category', '-category', 'date', '-date']
-    if sort_by not in valid_sort_fields:
-        sort_by = '-date'
+    query = request.GET.get('q', '').strip()
+    search_terms = search.parse_terms(query)
+    # Sort by date (newest first) by default, or by relevance while searching
+    sort_by = pagination.normalize_sort(request.GET.get('sort'), searching=bool(search_terms))
+    cursor = request.GET.get('cursor')
+
+    try:
+        rows = fragments.cached(
+            request, LIST_ROWS_TEMPLATE, partial(list_rows, request.user, search_terms, sort_by, cursor),
+            sort_by, search_terms, cursor)
+    except pagination.InvalidCursor:
+        # Stale or tampered cursor - fall back to the first page
+        rows = fragments.cached(
+            request, LIST_ROWS_TEMPLATE, partial(list_rows, request.user, search_terms, sort_by),
+            sort_by, search_terms, None)
+
+    archive_cutoff = archive.cutoff()
+    totals_html = fragments.cached(
+        request, LIST_TOTALS_TEMPLATE, partial(list_totals_html, request.user, archive_cutoff), archive_cutoff)
+
+    return render(request, 'expenses/expense_list.html', {
+        'rows': rows,
+        'totals_html': totals_html,
+        'categories': catalog.categories(),
+        'current_sort': sort_by,
+        'query': query if search_terms else '',
+    })
 
-    expenses = Expense.objects.filter(user=request.user).order_by(sort_by)
+@login_required
+@routing.read_replica
+async def aexpense_list(request):
+    """
+    Async version of ``expense_list``, served under ASGI (see
+    expense_tracker/urls_asgi.py).
     
-    total = expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-    formatted_total = format_indian_currency(total)
-    categories = Category.objects.all()
+    Fragments missing from the cache are built at the same time: the page
+    of expenses is read with the async ORM while the per-category totals
+    and the categories are read on pooled threads (see
+    expenses/concurrency.py).
     
-    # Format amounts
-    for expense in expenses:
-        expense.formatted_amount = format_indian_currency(expense.amount)
+    Args:
+        request: HttpRequest object, with the query parameters of
+            ``expense_list``
     
-    return render(request, 'expenses/expense_list.html', {
-        'expenses': expenses,
-        'total': formatted_total,
+    Returns:
+        HttpResponse rendering the expense_list.html template with the same
+        context as ``expense_list``
+    """
+    query = request.GET.get('q', '').strip()
+    search_terms = search.parse_terms(query)
+    sort_by = pagination.normalize_sort(request.GET.get('sort'), searching=bool(search_terms))
+    cursor = request.GET.get('cursor')
+    archive_cutoff = archive.cutoff()
+
+    user = await concurrency.authenticated_user(request)
+    rows, totals_html, categories = await concurrency.gather(
+        fragments.acached(
+            request, LIST_ROWS_TEMPLATE, partial(alist_rows, user, search_terms, sort_by, cursor),
+            sort_by, search_terms, cursor),
+        fragments.acached(
+            request, LIST_TOTALS_TEMPLATE, partial(alist_totals_html, user, archive_cutoff), archive_cutoff),
+        catalog.categories,
+    )
+
+    # Context processors may query, so rendering runs on a thread
+    return await sync_to_async(render)(request, 'expenses/expense_list.html', {
+        'rows': rows,
+        'totals_html': totals_html,
         'categories': categories,
-        'current_sort': sort_by
+        'current_sort': sort_by,
+        'query': query if search_terms else '',
     })
 
+async def alist_page(expenses, sort_by, cursor):
+    """
+    Reads the page of ``expenses`` at ``cursor`` with the async ORM, or the
+    first page if the cursor is stale or has been tampered with.
+    """
+    try:
+        return await pagination.apaginate(expenses, sort_by, cursor)
+    except pagination.InvalidCursor:
+        return await pagination.apaginate(expenses, sort_by)
+
+@login_required
+@routing.read_replica
+def expense_list_page(request):
+    """
+    Return the next page of expenses for infinite scrolling.
+    
+    The response is a small JSON document containing the rendered table rows
+    and the cursor for the page after it, so the browser can append rows
+    without reloading the whole list. Pages are cached per user like the
+    first one (see expenses/fragments.py).
+    
+    Args:
+        request: HttpRequest object containing metadata about the request
+        - Query parameter 'sort' with the active sort field
+        - Query parameter 'cursor' returned by the previous page
+        - Query parameter 'q' with the active search, if any
+    
+    Returns:
+        JsonResponse with keys:
+        - html: Rendered <tr> rows for this page
+        - next_cursor: Cursor for the following page, or null
+        - has_more: Whether more rows remain
+        Responds with status 400 if the cursor is invalid.
+    
+    Security:
+        - Requires user authentication (@login_required)
+        - Only returns expenses belonging to the current user
+    """
+    search_terms = search.parse_terms(request.GET.get('q'))
+    sort_by = pagination.normalize_sort(request.GET.get('sort'), searching=bool(search_terms))
+    cursor = request.GET.get('cursor')
+
+    try:
+        rows = fragments.cached(
+            request, LIST_ROWS_TEMPLATE, partial(list_rows, request.user, search_terms, sort_by, cursor),
+            sort_by, search_terms, cursor)
+    except pagination.InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse(rows)
+
 @login_required
 def add_expense(request):
     """
@@ -321,7 +579,9 @@ def add_expense(request):
         time = request.POST.get('time', timezone.now().time().strftime('%H:%M'))
 
         try:
-            category = Category.objects.get(id=category_id) if category_id else None
+            category = catalog.get(int(category_id)) if category_id else None
+            if category_id and category is None:
+                raise Category.DoesNotExist('Selected category does not exist')
             expense = Expense.objects.create(
                 title=title,
                 amount=amount,
@@ -337,7 +597,7 @@ def add_expense(request):
             messages.error(request, f'Error adding expense: {str(e)}')
     
     now = timezone.now()
-    categories = Category.objects.all()
+    categories = catalog.categories()
     return render(request, 'expenses/add_expense.html', {
         'categories': categories,
         'today': now.date(),
@@ -345,205 +605,261 @@ def add_expense(request):
     })
 
 
+@login_required
+def import_expenses(request):
+    """
+    Bulk-import expenses from an uploaded CSV file or bank statement export.
+    
+    GET: Display the upload form with the accepted columns
+    POST: Stream-parse the upload and insert the valid rows in batches
+    
+    Features:
+    - Rows are validated and written in batches (see expenses/importer.py),
+      so large files take a handful of queries per few thousand rows
+    - Category names are matched case-insensitively against existing categories
+    - Invalid rows are reported with their line numbers and skipped
+    
+    Args:
+        request: HttpRequest object containing metadata about the request
+        
+    Form Fields:
+        - file: CSV file with date, title and amount columns (plus optional
+          time, category and description)
+    
+    Returns:
+        HttpResponse rendering import_expenses.html with the import result,
+        or JsonResponse with the result for JSON clients
+    
+    Security:
+        - Requires user authentication (@login_required)
+        - Expenses are always created for the requesting user
+    """
+    context = {'columns': importer.COLUMN_ALIASES, 'required': importer.REQUIRED_COLUMNS}
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        try:
+            if upload is None:
+                raise importer.ImportFileError('Please choose a CSV file to import.')
+            result = importer.import_csv(request.user, upload)
+        except importer.ImportFileError as e:
+            if wants_json(request):
+                return JsonResponse({'error': str(e)}, status=400)
+            messages.error(request, str(e))
+        else:
+            if wants_json(request):
+                return JsonResponse(result.as_dict())
+            if result.imported:
+                messages.success(request, f'Imported {result.imported} expense(s).')
+            if result.failed:
+                messages.warning(request, f'{result.failed} row(s) could not be imported.')
+            context['result'] = result
+    return render(request, 'expenses/import_expenses.html', context)
+
+
+@login_required
+@routing.read_replica
+def export_expenses(request, fmt):
+    """
+    Stream the user's expenses as a CSV or JSON Lines download.
+    
+    Rows are read from a server-side cursor and written out as they arrive
+    (see expenses/exports.py), so memory use does not grow with the size of
+    the export and the download starts immediately, under ASGI as well (see
+    concurrency.async_streaming).
+    
+    Args:
+        request: HttpRequest object containing metadata about the request
+        fmt: 'csv' or 'ndjson'
+    
+    Query Parameters (all optional):
+        - date_from / date_to: Inclusive date range (YYYY-MM-DD)
+        - category: Category id
+        - min_amount / max_amount: Inclusive amount range
+    
+    Returns:
+        StreamingHttpResponse with the export as an attachment, or a redirect
+        to the expense list with an error message if the filters are invalid
+    
+    Raises:
+        Http404: If the format is not supported
+    
+    Security:
+        - Requires user authentication (@login_required)
+        - Only exports the current user's expenses
+    """
+    if fmt not in exports.FORMATS:
+        raise Http404('Unsupported export format')
+    try:
+        filters = ExpenseFilters.from_query(request.GET)
+    except ValidationError as e:
+        messages.error(request, ' '.join(e.messages))
+        return redirect('expenses:expense_list')
+
+    content_type, extension = exports.FORMATS[fmt]
+    # Rows are read after the view returns, so bind the queryset to the
+    # database chosen for this request
+    queryset = exports.export_queryset(request.user, filters).using(router.db_for_read(Expense))
+    response = StreamingHttpResponse(exports.CHUNK_WRITERS[fmt](queryset), content_type=content_type)
+    filename = f"expenses-{timezone.now().date().isoformat()}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Tell reverse proxies such as nginx to pass chunks through unbuffered
+    response['X-Accel-Buffering'] = 'no'
+    return concurrency.async_streaming(request, response)
+
+
 # ------------------ BILL GENERATOR ------------------
 
-import os
-from PIL import Image
-from io import BytesIO
-from pypdf import PdfReader, PdfWriter
-from django.conf import settings
+# PDFs smaller than this stay in memory while they stream out; larger ones
+# are spooled to a temporary file on disk
+PDF_SPOOL_MAX_SIZE = 1024 * 1024
 
 def render_to_pdf(template_src, context_dict={}):
     """
     Generates a PDF document from a template and context data
     
+    The document is written once to a spooled temporary file and streamed to
+    the client from there, instead of being held in a BytesIO buffer and then
+    copied again into an HttpResponse.
+    
     Args:
         template_src: Template path (not used in current implementation)
         context_dict: Dictionary containing data for PDF generation
                      Required keys: 'user', 'expenses', 'total', 'today'
+                     Optional keys: 'filters' (ExpenseFilters applied)
     
     Returns:
-        HttpResponse: PDF file as a response with appropriate content type
-    """
-    # Create a buffer to receive PDF data
-    buffer = BytesIO()
-    
-    # Import necessary modules for PDF generation
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.pdfmetrics import registerFontFamily
-    from reportlab.lib.fonts import addMapping
-    
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=50, bottomMargin=50, leftMargin=40, rightMargin=40)
-    elements = []
-    
-    # Create logo SVG content with white fill
-    svg_content = '''<?xml version="1.0" encoding="UTF-8"?>
-<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="white" class="bi bi-currency-exchange" viewBox="0 0 16 16">
-  <path d="M0 5a5 5 0 0 0 4.027 4.905 6.5 6.5 0 0 1 .544-2.073C3.695 7.536 3.132 6.864 3 5.91h-.5v-.426h.466V5.05q-.001-.07.004-.135H2.5v-.427h.511C3.236 3.24 4.213 2.5 5.681 2.5c.316 0 .59.031.819.085v.733a3.5 3.5 0 0 0-.815-.082c-.919 0-1.538.466-1.734 1.252h1.917v.427h-1.98q-.004.07-.003.147v.422h1.983v.427H3.93c.118.602.468 1.03 1.005 1.229a6.5 6.5 0 0 1 4.97-3.113A5.002 5.002 0 0 0 0 5m16 5.5a5.5 5.5 0 1 1-11 0 5.5 5.5 0 0 1 11 0m-7.75 1.322c.069.835.746 1.485 1.964 1.562V14h.54v-.62c1.259-.086 1.996-.74 1.996-1.69 0-.865-.563-1.31-1.57-1.54l-.426-.1V8.374c.54.06.884.347.966.745h.948c-.07-.804-.779-1.433-1.914-1.502V7h-.54v.629c-1.076.103-1.808.732-1.808 1.622 0 .787.544 1.288 1.45 1.493l.358.085v1.78c-.554-.08-.92-.376-1.003-.787zm1.96-1.895c-.532-.12-.82-.364-.82-.732 0-.41.311-.719.824-.809v1.54h-.005zm.622 1.044c.645.145.943.38.943.796 0 .474-.37.8-1.02.86v-1.674z"/>
-</svg>'''
-    
-    # Save SVG to temporary file
-    svg_file = BytesIO(svg_content.encode('utf-8'))
-    drawing = svg2rlg(svg_file)
-    
-    # Create header
-    styles = getSampleStyleSheet()
-    header_style = ParagraphStyle(
-        'CustomHeader',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Scale the drawing for better visibility
-    drawing.scale(1.2, 1.2)
-    
-    # Create table for logo and EXPO text side by side
-    header_table = Table([
-        [SVGImage(drawing), Paragraph("EXPO", header_style)]
-    ], colWidths=[35, None])
-    
-    header_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ('TOPPADDING', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-    ]))
-    
-    elements.append(header_table)
-    elements.append(Spacer(1, 30))  # Add 30 points of vertical space after logo
-    elements.append(Paragraph(f"Expense Bill", styles['Heading1']))
-    elements.append(Spacer(1, 20))  # Add 20 points of vertical space after title
-    elements.append(Paragraph(f"User: {context_dict['user'].username}", styles['Normal']))
-    elements.append(Paragraph(f"Generated: {context_dict['today']}", styles['Normal']))
-    elements.append(Spacer(1, 20))  # Add 20 points of vertical space before table
-    
-    # Create table data
-    table_data = [['Date', 'Time', 'Title', 'Category', 'Description', 'Amount (Rs.)']]
-    
-    for expense in context_dict['expenses']:
-        table_data.append([
-            expense.formatted_date,
-            expense.formatted_time,
-            expense.title,
-            expense.category.name if expense.category else '-',
-            expense.description or '-',
-            expense.formatted_amount
-        ])
-    
-    # Add total row
-    table_data.append(['', '', '', '', 'Total Amount', context_dict['total']])
-    
-    # Set column widths proportionally
-    col_widths = [80, 80, 100, 80, 150, 80]
-    
-    # Create table and style it
-    table = Table(table_data, colWidths=col_widths)
-    table.setStyle(TableStyle([
-        # Header style
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('TOPPADDING', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        
-        # Body style
-        ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -2), 10),
-        ('TEXTCOLOR', (0, 1), (-1, -2), colors.black),
-        ('TOPPADDING', (0, 1), (-1, -2), 8),
-        ('BOTTOMPADDING', (0, 1), (-1, -2), 8),
-        ('BACKGROUND', (0, 1), (-1, -2), colors.white),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#f8f9fa')]),
-        
-        # Total row style
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#2c3e50')),
-        ('TEXTCOLOR', (0, -1), (-1, -1), colors.white),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('TOPPADDING', (0, -1), (-1, -1), 12),
-        ('BOTTOMPADDING', (0, -1), (-1, -1), 12),
-        
-        # Grid style
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e0e0e0')),
-        
-        # Alignment
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),  # Right align all amounts
-        ('ALIGN', (-2, -1), (-1, -1), 'RIGHT'),  # Right align total row text
-    ]))
-    
-    elements.append(table)
-    elements.append(Spacer(1, 30))  # Add 30 points of vertical space after table
-    
-    # Add footer
-    footer_style = ParagraphStyle(
-        'CustomFooter',
-        parent=styles['Normal'],
-        textColor=colors.gray,
-        fontSize=10,
-        spaceAfter=30,
-        fontName='Helvetica',
-        alignment=1  # Center alignment
-    )
-    elements.append(Paragraph("<br/><br/>Thank you for using Expense Tracker", footer_style))
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Get the value of the BytesIO buffer and write it to the response
-    pdf = buffer.getvalue()
-    buffer.close()
-    response = HttpResponse(content_type='application/pdf')
-    response.write(pdf)
-    return response
+        FileResponse: Streaming PDF response with appropriate content type
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_SIZE)
+    with profiling.span('pdf'):
+        bills.write_bill(output, context_dict)
+    output.seek(0)
+    return FileResponse(output, content_type='application/pdf', filename='expense_bill.pdf')
+
+def wants_json(request):
+    """Returns True if the client asked for a JSON rather than an HTML response."""
+    if request.GET.get('format') == 'json':
+        return True
+    accept = request.headers.get('Accept', '')
+    return 'application/json' in accept and 'text/html' not in accept
 
 @login_required
+@routing.read_replica
 def generate_bill(request):
     """
     View function to generate a PDF bill of user's expenses
     
-    Process:
-    1. Retrieves user's expenses from database
-    2. Formats all dates, times and amounts
-    3. Calculates total amount
-    4. Generates PDF using render_to_pdf function
+    When settings.BILL_JOBS_ASYNC is enabled (the default) the bill is queued
+    as a BillJob and rendered by the run_bill_worker command; the view returns
+    at once and the client polls bill_job_status. Passing mode=sync renders
+    the PDF inside the request instead.
+    
+    Process (synchronous mode, reading from the replica if configured):
+    1. Parses optional filters from the query string
+    2. Calculates the total amount of the matching expenses in SQL
+    3. Streams the matching expenses from a server-side cursor into the PDF
+    4. Returns the PDF as a streaming response
+    
+    Query Parameters (all optional):
+        - date_from / date_to: Inclusive date range (YYYY-MM-DD)
+        - category: Category id
+        - min_amount / max_amount: Inclusive amount range
+        - mode: 'sync' to render in the request, anything else to queue
     
     Returns:
-        HttpResponse: PDF file as response
+        - Asynchronous mode: redirect to the job status page, or a 202 JSON
+          response with the job id and status URL for JSON clients
+        - Synchronous mode: FileResponse with the PDF
+        - Redirect to the expense list with an error message if the filters
+          are invalid or too many bills are already pending
     """
-    # Get current user's expenses ordered by date and time (newest first)
-    expenses = Expense.objects.filter(user=request.user).order_by('-date', '-time')
-
-    # Calculate total amount of all expenses
-    # Uses aggregate with Sum, returns 0 if no expenses found
-    total_raw = expenses.aggregate(total=Sum('amount'))['total'] or 0
-
-    # prepare formatted fields for template
-    for exp in expenses:
-        # formatted amount like "₹1,234.56"
-        exp.formatted_amount = format_indian_currency(exp.amount)
+    try:
+        filters = ExpenseFilters.from_query(request.GET)
+    except ValidationError as e:
+        messages.error(request, ' '.join(e.messages))
+        return redirect('expenses:expense_list')
 
-        # formatted date/time for display
+    if getattr(settings, 'BILL_JOBS_ASYNC', False) and request.GET.get('mode') != 'sync':
         try:
-            exp.formatted_date = exp.date.strftime('%d %b %Y')
-        except Exception:
-            exp.formatted_date = str(exp.date) if exp.date else '-'
-        try:
-            exp.formatted_time = exp.time.strftime('%I:%M %p')
-        except Exception:
-            exp.formatted_time = str(exp.time) if exp.time else '-'
+            job = jobs.enqueue_bill_job(request.user, filters)
+        except jobs.TooManyJobs as e:
+            if wants_json(request):
+                return JsonResponse({'error': str(e)}, status=429)
+            messages.error(request, str(e))
+            return redirect('expenses:expense_list')
+        if wants_json(request):
+            return JsonResponse(bill_job_payload(job), status=202)
+        return redirect('expenses:bill_job_status', job_id=job.pk)
 
-    # formatted total for display
-    formatted_total = format_indian_currency(total_raw)
+    # Server-side cursors need a transaction when going through a
+    # transaction-mode connection pooler, so keep the build inside one, on
+    # the database the expenses are read from
+    with transaction.atomic(using=router.db_for_read(Expense)):
+        context = bills.bill_context(request.user, filters, timezone.now().date())
+        return concurrency.async_streaming(request, render_to_pdf('expenses/bill.html', context))
 
-    context = {
-        'expenses': expenses,
-        'total': formatted_total,   # string like "₹1,234.56"
-        'user': request.user,
-        'today': timezone.now().date()
+def bill_job_payload(job):
+    """Serialises a BillJob into the JSON document returned to pollers."""
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'attempts': job.attempts,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'status_url': reverse('expenses:bill_job_status', args=[job.pk]),
+        'download_url': (
+            reverse('expenses:bill_job_download', args=[job.pk])
+            if job.status == BillJob.Status.DONE else None
+        ),
     }
-    return render_to_pdf('expenses/bill.html', context)
+
+@login_required
+def bill_job_status(request, job_id):
+    """
+    Show the progress of a queued bill.
+    
+    Browsers get a page that polls this same URL for JSON until the PDF is
+    ready and then downloads it; JSON clients get the job status directly.
+    
+    Args:
+        request: HttpRequest object containing metadata about the request
+        job_id: Integer ID of the BillJob
+    
+    Returns:
+        JsonResponse with the job status, or HttpResponse rendering
+        bill_job.html
+    
+    Security:
+        - Requires user authentication (@login_required)
+        - Only exposes jobs belonging to the current user (404 otherwise)
+    """
+    job = get_object_or_404(BillJob, pk=job_id, user=request.user)
+    if wants_json(request):
+        return JsonResponse(bill_job_payload(job))
+    return render(request, 'expenses/bill_job.html', {'job': job})
+
+@login_required
+def bill_job_download(request, job_id):
+    """
+    Download the PDF produced by a finished bill job.
+    
+    Args:
+        request: HttpRequest object containing metadata about the request
+        job_id: Integer ID of the BillJob
+    
+    Returns:
+        FileResponse streaming the stored PDF
+    
+    Raises:
+        Http404: If the job does not belong to the user or is not done
+    
+    Security:
+        - Requires user authentication (@login_required)
+        - Only serves jobs belonging to the current user
+    """
+    job = get_object_or_404(BillJob, pk=job_id, user=request.user)
+    if job.status != BillJob.Status.DONE or not job.result:
+        raise Http404('Bill is not available')
+    response = FileResponse(job.result.open('rb'), content_type='application/pdf', filename='expense_bill.pdf')
+    return concurrency.async_streaming(request, response)